@@ -3,196 +3,179 @@
 import os
 import json
 import re
-import fitz  # PyMuPDF
+import itertools
+import threading
 from lxml import etree
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain.agents import AgentExecutor, create_openai_tools_agent
-from langchain.prompts import ChatPromptTemplate
-from langchain.tools import tool
-from decimal import Decimal, InvalidOperation
 
 # Importa a ferramenta de consulta NCM
-from tipi.consultartipi import consultar_ncm
+from tipi.consultartipi import consultar_ncm, consultar_ncms
+from esquemas_xml import TAGS_BLOCOS, TIPO_NFSE, esquema_do_documento, extrair_campos
+from persistencia import buscar_auditoria, salvar_auditoria
+from identificacao import identificar_arquivo
+from regras_auditoria import avaliar, grupo_documento, informacoes_ncm, resumir_achados
+from conclusao_auditoria import agendar_enriquecimento, gerar_conclusao
+import cache_extracao
+import metricas
+from extracao_pdf import CAMPOS_PDF, detectar_campos, extrair_textos_paginas, selecionar_trechos, versao_deteccao
 
 # --- Configuração do Agente LangChain ---
+# O LangChain (e o cliente da OpenAI) só é importado quando o LLM ou o agente
+# são usados pela primeira vez: a extração e a auditoria de XMLs, o dashboard e
+# os processos da ingestão em lote não pagam por essa importação.
 
 load_dotenv()
-openai_api_key = os.getenv("OPENAI_API_KEY")
-if not openai_api_key:
-    raise ValueError("A variável de ambiente OPENAI_API_KEY não foi encontrada.")
 
-llm = ChatOpenAI(api_key=openai_api_key, model="gpt-4-turbo", temperature=0)
+MODELO_LLM = "gpt-4-turbo"
+
+llm = None  # criado sob demanda por get_llm()
+agent_executor = None  # criado sob demanda por get_agent_executor()
+_lock_agente = threading.Lock()
+
+def get_llm():
+    """Modelo de chat do agente, criado na primeira chamada e reutilizado depois."""
+    global llm
+    if llm is None:
+        with _lock_agente:
+            if llm is None:
+                from langchain_openai import ChatOpenAI
+                from cache_llm import CACHE_LLM, criar_cache_llm
+
+                openai_api_key = os.getenv("OPENAI_API_KEY")
+                if not openai_api_key:
+                    raise ValueError("A variável de ambiente OPENAI_API_KEY não foi encontrada.")
+                # Com temperatura 0, respostas a prompts repetidos vêm do cache (ver cache_llm.py).
+                # Sem streaming, as chamadas do agente também passam pelo cache.
+                # Os tokens de cada chamada são contados nas métricas (ver metricas.py).
+                llm = ChatOpenAI(api_key=openai_api_key, model=MODELO_LLM, temperature=0,
+                                 cache=criar_cache_llm() if CACHE_LLM else None, disable_streaming=True,
+                                 callbacks=[metricas.criar_manipulador_tokens()])
+    return llm
 
 # --- LÓGICA DE AUDITORIA (MOVIMOS DE FERRAMENTAS_FISCAIS.PY) ---
+# As verificações são regras registradas em regras_auditoria.py.
 
-def _to_decimal(value_str):
-    """Converte uma string para Decimal, tratando formatos pt-BR e padrão."""
-    if not value_str:
-        return Decimal('0.0')
-    value_str = str(value_str).strip()
-    if ',' in value_str and '.' in value_str:
-        value_str = value_str.replace('.', '')
-    value_str = value_str.replace(',', '.')
-    return Decimal(value_str)
-
-def validar_cnpj(cnpj: str) -> bool:
-    cnpj = ''.join(filter(str.isdigit, cnpj))
-    if len(cnpj) != 14 or len(set(cnpj)) == 1:
-        return False
-    try:
-        pesos = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
-        soma = sum(int(d) * p for d, p in zip(cnpj[:12], pesos))
-        resto = soma % 11
-        dv1 = 0 if resto < 2 else 11 - resto
-        if dv1 != int(cnpj[12]): return False
-        pesos = [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
-        soma = sum(int(d) * p for d, p in zip(cnpj[:13], pesos))
-        resto = soma % 11
-        dv2 = 0 if resto < 2 else 11 - resto
-        if dv2 != int(cnpj[13]): return False
-        return True
-    except (ValueError, IndexError): return False
-
-def validar_cpf(cpf: str) -> bool:
-    cpf = ''.join(filter(str.isdigit, cpf))
-    if len(cpf) != 11 or len(set(cpf)) == 1: return False
-    try:
-        soma = sum(int(cpf[i]) * (10 - i) for i in range(9))
-        resto = (soma * 10) % 11
-        if resto == 10: resto = 0
-        if resto != int(cpf[9]): return False
-        soma = sum(int(cpf[i]) * (11 - i) for i in range(10))
-        resto = (soma * 10) % 11
-        if resto == 10: resto = 0
-        if resto != int(cpf[10]): return False
-        return True
-    except (ValueError, IndexError): return False
-
-VALID_CFOP_CODES = {"6102", "1101", "1102", "1201", "1202", "1401", "1403", "1904", "1916", "2101", "2102", "2201", "2202", "2401", "2403", "2904", "2916", "3101", "3102", "3201", "3202", "5101", "5102", "5116", "5117", "5401", "5403", "5405", "5656", "5904", "5929", "6101", "6108", "6401", "6403", "6404", "6656", "6904", "6929", "7101", "7102", "7127"}
-
-def _auditar_dados_nfs_ocr(dados: dict) -> tuple[list, list]:
-    errors = []
-    warnings = []
-    if not dados.get('emitente_cnpj'): 
-        errors.append("CNPJ do emitente não informado.")
-    elif not validar_cnpj(dados['emitente_cnpj']): 
-        errors.append(f"CNPJ do emitente '{dados['emitente_cnpj']}' é inválido.")
-    dest_doc = dados.get('destinatario_cnpj_cpf')
-    if not dest_doc: 
-        warnings.append("CPF/CNPJ do destinatário (tomador) não informado.")
-    elif len(''.join(filter(str.isdigit, dest_doc))) > 11 and not validar_cnpj(dest_doc):
-        errors.append(f"CNPJ do destinatário '{dest_doc}' é inválido.")
-    elif len(''.join(filter(str.isdigit, dest_doc))) <= 11 and not validar_cpf(dest_doc):
-        errors.append(f"CPF do destinatário '{dest_doc}' é inválido.")
-    if not dados.get('numero'): errors.append("Número da nota não informado.")
-    if not dados.get('data_emissao'): warnings.append("Data de emissão não informada.")
-    if not dados.get('valor_total_nota'): errors.append("Valor total da nota não informado.")
-    if not dados.get('discriminacao_servicos'): warnings.append("Discriminação dos serviços não informada ou vazia.")
-    return errors, warnings
-
-@tool
-def auditar_e_salvar_dados_fiscais(dados_json: str) -> str:
+TIPI_DB = 'tipi/tipi.db'
+
+# Campos que a auditoria acrescenta aos dados extraídos (os demais vêm da extração)
+CAMPOS_AUDITORIA = ('status_auditoria', 'erros_auditoria', 'avisos_auditoria', 'achados_auditoria',
+                    'conclusao_analise', 'conclusao_origem', 'informacoes_ncm')
+
+def aplicar_regras_auditoria(dados: dict, ncms: dict = None) -> tuple[str, list, list, list, list]:
     """
-    Recebe dados fiscais em JSON, executa uma auditoria, gera uma conclusão com IA, 
-    salva o resultado no banco de dados e retorna a conclusão.
+    Aplica as regras de auditoria aos dados extraídos e retorna
+    (status, erros, avisos, informacoes_ncm, achados). 'ncms' é um dicionário
+    {ncm informado: resultado de consultar_ncm} já resolvido (ex.: para todo o
+    acervo, na reauditoria); sem ele, os NCMs da nota são consultados aqui.
     """
-    try:
-        dados = json.loads(dados_json)
-    except json.JSONDecodeError as e:
-        return json.dumps({'status': 'ERRO', 'mensagem': f"JSON de entrada para auditoria é inválido. Erro: {e}. Entrada: {dados_json[:500]}"})
-
-    # Adicionado para tratar erros da etapa de extração
-    if 'erro' in dados:
-        return json.dumps({'status': 'ERRO', 'mensagem': f"A extração de dados falhou. Causa raiz: {dados['erro']}"})
-
-    issues = []
-    warnings = []
-    ncm_info = [] # Lista para armazenar informações dos NCMs encontrados
-    
-    if dados.get('formato') in ['ocr', 'ocr_ia']:
-        issues, warnings = _auditar_dados_nfs_ocr(dados)
-    else:
-        calculated_sum = Decimal('0.00')
-        if not dados.get('numero'): issues.append("Número do documento não informado.")
-        if not dados.get('emitente_cnpj') or not validar_cnpj(dados.get('emitente_cnpj', '')):
-            issues.append(f"CNPJ do emitente '{dados.get('emitente_cnpj', '')}' é inválido ou não informado.")
-        
-        items = dados.get('itens', [])
-        if not items: warnings.append("O documento não contém itens.")
-        
-        for i, item in enumerate(items, 1):
-            item_prefix = f"Item {i} ({item.get('codigo', 'S/C')}) - "
-            ncm = item.get('ncm')
-            if not ncm:
-                issues.append(f"{item_prefix}NCM não informado.")
-            else:
-                resultado_ncm = consultar_ncm(ncm, db_file='tipi/tipi.db')
-                if not resultado_ncm:
-                    issues.append(f"{item_prefix}NCM '{ncm}' é inválido ou não foi encontrado na Tabela TIPI.")
-                else:
-                    # Adiciona informações do NCM para a conclusão
-                    ncm_info.append(
-                        f"Item {item.get('codigo', 'S/C')} (NCM {resultado_ncm['ncm_encontrado']}): "
-                        f"Descrição: {resultado_ncm['descricao']}, "
-                        f"Alíquota IPI: {resultado_ncm['aliquota']}%"
-                    )
-                    try:
-                        pIPI_doc_str = item.get('pIPI') # Modificado para o novo formato simplificado
-                        if pIPI_doc_str is not None:
-                            pIPI_doc = _to_decimal(pIPI_doc_str)
-                            pIPI_tipi = _to_decimal(resultado_ncm.get('aliquota', '0'))
-                            if pIPI_doc != pIPI_tipi:
-                                warnings.append(f"{item_prefix}Alíquota de IPI ({pIPI_doc}%) diverge da Tabela TIPI ({pIPI_tipi}%).")
-                    except (InvalidOperation, TypeError):
-                        warnings.append(f"{item_prefix}Não foi possível validar a alíquota de IPI. Valor inválido no documento.")
-
-            if not item.get('cfop') or item.get('cfop') not in VALID_CFOP_CODES:
-                warnings.append(f"{item_prefix}CFOP '{item.get('cfop', '')}' não consta na lista de códigos válidos.")
-            
-            try:
-                calculated_sum += _to_decimal(item.get('valor_total', '0'))
-            except (InvalidOperation, TypeError):
-                issues.append(f"{item_prefix}Contém valor total inválido.")
-
-        doc_total = _to_decimal(dados.get('valor_total_nota', '0'))
-        if abs(calculated_sum - doc_total) > Decimal('0.01'):
-            issues.append(f"A soma dos itens ({calculated_sum:.2f}) difere do valor total da nota ({doc_total:.2f}).")
-
-    status = 'error' if issues else ('warning' if warnings else 'success')
-    
-    # --- GERAÇÃO DA CONCLUSÃO COM IA ---
-    if issues or warnings or ncm_info:
-        prompt_conclusao = ChatPromptTemplate.from_messages([
-            ("system", "Você é um assistente fiscal especialista. Sua tarefa é gerar uma conclusão clara e útil com base nos resultados de uma auditoria de documento fiscal. Analise os erros, avisos e as informações de NCM para gerar a conclusão. Na sua conclusão, além de mencionar os erros e avisos, liste explicitamente a descrição e a alíquota da TIPI para cada NCM encontrado."),
-            ("human", f"Por favor, gere uma conclusão para a seguinte auditoria:\n- Erros Encontrados: {json.dumps(issues)}\n- Avisos Emitidos: {json.dumps(warnings)}\n- Informações de NCM Encontradas: {json.dumps(ncm_info)}")
-        ])
-        chain_conclusao = prompt_conclusao | llm
-        conclusao_analise = chain_conclusao.invoke({}).content
-    else:
-        conclusao_analise = "Auditoria concluída com sucesso. Nenhuma inconsistência fiscal foi encontrada e todos os dados parecem estar em conformidade."
+    nfe = grupo_documento(dados) == 'NFE'
+    if ncms is None and nfe:
+        # Resolve todos os NCMs distintos da nota de uma só vez
+        with metricas.etapa('consulta_ncm'):
+            ncms = consultar_ncms((item.get('ncm') for item in dados.get('itens') or []), db_file=TIPI_DB)
+        metricas.contar('consultas_ncm', len(ncms))
+    achados = avaliar(dados, ncms)
+    return (*resumir_achados(achados), informacoes_ncm(dados, ncms) if nfe else [], achados)
+
+def montar_auditoria(dados: dict, status: str, issues: list, warnings: list, ncm_info: list, achados: list = ()) -> dict:
+    """Monta o registro da auditoria (resultado das regras, achados com o código de cada regra, conclusão e dados extraídos)."""
+    # --- CONCLUSÃO (REGRAS; A IA SÓ ENRIQUECE DEPOIS DE SALVO, SE ATIVADA) ---
+    conclusao_analise = gerar_conclusao(status, issues, warnings, ncm_info)
 
     audit_result = {
         'status_auditoria': status,
         'erros_auditoria': issues,
         'avisos_auditoria': warnings,
+        'achados_auditoria': list(achados),
         'conclusao_analise': conclusao_analise,
+        'conclusao_origem': 'regras',
     }
+    if ncm_info:
+        audit_result['informacoes_ncm'] = ncm_info
     audit_result.update(dados)
+    return audit_result
+
+@metricas.cronometrado('auditoria')
+def auditar_dados_fiscais(dados: dict) -> dict:
+    """
+    Executa a auditoria dos dados fiscais extraídos, com a conclusão montada
+    pelas regras (montar_auditoria); a IA só a enriquece depois, em segundo
+    plano (ver auditar_e_salvar).
+    Retorna o registro completo da auditoria (sem salvar).
+    """
+    return montar_auditoria(dados, *aplicar_regras_auditoria(dados))
+
+def auditoria_existente(identificacao: dict):
+    """
+    Procura uma auditoria já gravada para o documento pela chave de acesso ou
+    pelo hash do conteúdo ('chave_acesso'/'hash_conteudo' em 'identificacao').
+    Se houver, retorna o resultado gravado no formato de `auditar_e_salvar`,
+    com 'duplicado': True; senão, None.
+    """
+    existente = buscar_auditoria(identificacao.get('chave_acesso'), identificacao.get('hash_conteudo'))
+    if existente is None:
+        return None
+    motivo = f"chave de acesso {existente['chave_acesso']}" if existente.get('chave_acesso') else "mesmo conteúdo"
+    return {
+        "status": "SUCESSO",
+        "mensagem": f"Documento já auditado anteriormente ({motivo}); exibindo o resultado gravado.\n\n"
+                    f"{existente.get('conclusao_analise', '')}",
+        "auditoria": existente,
+        "referencia": None,
+        "duplicado": True,
+    }
+
+def com_identificacao(dados: dict, identificacao: dict) -> dict:
+    """Acrescenta aos dados extraídos o hash do conteúdo e, se faltar, a chave de acesso do arquivo."""
+    if 'erro' in dados:
+        return dados
+    dados['hash_conteudo'] = identificacao['hash_conteudo']
+    if not dados.get('chave_acesso') and identificacao.get('chave_acesso'):
+        dados['chave_acesso'] = identificacao['chave_acesso']
+    return dados
+
+def auditar_e_salvar(dados: dict, enriquecer: bool = True) -> dict:
+    """
+    Audita os dados extraídos, salva o resultado no banco de dados e retorna
+    {'status': 'SUCESSO' | 'ERRO', 'mensagem': ..., 'auditoria': registro salvo,
+    'referencia': retorno de salvar_auditoria}. Com 'enriquecer', agenda a
+    conclusão com IA em segundo plano (ver conclusao_auditoria.py).
+    """
+    # Adicionado para tratar erros da etapa de extração
+    if 'erro' in dados:
+        return {'status': 'ERRO', 'mensagem': f"A extração de dados falhou. Causa raiz: {dados['erro']}"}
+
+    duplicado = auditoria_existente(dados)
+    if duplicado is not None:
+        return duplicado
+
+    audit_result = auditar_dados_fiscais(dados)
 
     try:
-        banco_de_dados = []
-        if os.path.exists('db_documentos.json') and os.path.getsize('db_documentos.json') > 0:
-            with open('db_documentos.json', 'r', encoding='utf-8') as f:
-                banco_de_dados = json.load(f)
-        banco_de_dados.append(audit_result)
-        with open('db_documentos.json', 'w', encoding='utf-8') as f:
-            json.dump(banco_de_dados, f, indent=4, ensure_ascii=False)
-        
-        return json.dumps({"status": "SUCESSO", "mensagem": conclusao_analise})
+        with metricas.etapa('gravacao'):
+            referencia = salvar_auditoria(audit_result)
+        # O modelo só é criado se o enriquecimento for de fato agendado
+        if enriquecer:
+            agendar_enriquecimento(audit_result, referencia, get_llm)
+
+        return {"status": "SUCESSO", "mensagem": audit_result['conclusao_analise'], "auditoria": audit_result,
+                "referencia": referencia}
 
     except Exception as e:
-        return json.dumps({"status": "ERRO", "mensagem": f"Falha ao salvar o resultado da auditoria: {e}"})
+        return {"status": "ERRO", "mensagem": f"Falha ao salvar o resultado da auditoria: {e}", "auditoria": audit_result}
+
+def auditar_e_salvar_dados_fiscais(dados_json: str) -> str:
+    """
+    Recebe dados fiscais em JSON, executa uma auditoria, gera a conclusão,
+    salva o resultado no banco de dados e retorna a conclusão.
+    """
+    try:
+        dados = json.loads(dados_json)
+    except json.JSONDecodeError as e:
+        return json.dumps({'status': 'ERRO', 'mensagem': f"JSON de entrada para auditoria é inválido. Erro: {e}. Entrada: {dados_json[:500]}"})
+
+    resultado = auditar_e_salvar(dados)
+    return json.dumps({"status": resultado['status'], "mensagem": resultado['mensagem']})
 
 # --- Funções e Ferramentas do Agente ---
 
@@ -220,69 +203,125 @@ def element_to_dict(element):
         elif isinstance(d[tag], dict): d[tag]['text'] = element.text
     return d
 
-@tool
-def extrair_dados_xml(caminho_arquivo: str) -> str:
+ERRO_DADOS_ESSENCIAIS_XML = "Falha ao extrair dados essenciais do XML. O arquivo pode não ser um documento fiscal válido ou ter uma estrutura não suportada."
+
+def _montar_dados_xml(esquema, blocos, itens):
     """
-    Extrai dados detalhados de um arquivo XML de documento fiscal (NFe/CTe).
-    Recebe o caminho do arquivo e retorna uma string JSON com os dados extraídos.
+    Monta o dicionário final a partir dos campos extraídos de cada bloco de cabeçalho
+    ({tag: campos}), na ordem dos blocos no esquema.
+    """
+    dados = {"tipo_documento": esquema['tipo_documento']}
+    for tag in esquema['cabecalho']:
+        dados.update(blocos.get(tag, {}))
+    if esquema['itens'] is not None:
+        dados["itens"] = itens
+    # Validação de dados essenciais extraídos
+    if not dados.get("numero") or not dados.get("emitente_cnpj"):
+        return {"erro": ERRO_DADOS_ESSENCIAIS_XML}
+    return dados
+
+def ler_dados_xml(caminho_arquivo: str) -> dict:
+    """
+    Extrai os dados de um arquivo XML de documento fiscal (NFe, CTe ou NFS-e ABRASF)
+    como dicionário, conforme o esquema do tipo do documento (ver esquemas_xml.py).
+    Em caso de falha, retorna {'erro': mensagem}.
+    Carrega a árvore inteira em memória; o processamento usa ler_dados_xml_streaming,
+    que produz a mesma saída (ver benchmarks/bench_extracao_xml.py).
     """
     try:
         with open(caminho_arquivo, 'rb') as f: doc = etree.parse(f)
         root = doc.getroot()
-        ns = {'doc': root.nsmap.get(None)}
-        def get_text(element, path): 
-            node = element.find(path, ns) if element is not None else None
-            if node is not None and node.text is not None:
-                return node.text.strip()
-            return None
-
-        ide_node = doc.find('.//doc:ide', ns)
-        emit_node = doc.find('.//doc:emit', ns)
-        dest_node = doc.find('.//doc:dest', ns)
-        total_node = doc.find('.//doc:ICMSTot', ns)
-
-        dados = {
-            "tipo_documento": etree.QName(root).localname.replace('Proc', '').upper(),
-            "numero": get_text(ide_node, 'doc:nNF') or get_text(ide_node, 'doc:nCT'),
-            "data_emissao": get_text(ide_node, 'doc:dhEmi'),
-            "emitente_razao_social": get_text(emit_node, 'doc:xNome'),
-            "emitente_cnpj": get_text(emit_node, 'doc:CNPJ'),
-            "destinatario_razao_social": get_text(dest_node, 'doc:xNome'),
-            "destinatario_cnpj_cpf": get_text(dest_node, 'doc:CNPJ') or get_text(dest_node, 'doc:CPF'),
-            "valor_total_nota": get_text(total_node, 'doc:vNF'),
-            "itens": []
-        }
-
-        for det in doc.findall('.//doc:det', ns):
-            prod_node = det.find('doc:prod', ns)
-            imposto_node = det.find('doc:imposto', ns)
-            item = {
-                "codigo": get_text(prod_node, 'doc:cProd'), "descricao": get_text(prod_node, 'doc:xProd'),
-                "ncm": get_text(prod_node, 'doc:NCM'), "cfop": get_text(prod_node, 'doc:CFOP'),
-                "valor_total": get_text(prod_node, 'doc:vProd'),
-                # Extrai apenas o pIPI, que é o único campo usado na auditoria
-                "pIPI": get_text(imposto_node, './/doc:IPITrib/doc:pIPI')
-            }
-            dados["itens"].append(item)
-
-        # Validação de dados essenciais extraídos
-        if not dados.get("numero") or not dados.get("emitente_cnpj"):
-            return json.dumps({"erro": "Falha ao extrair dados essenciais do XML. O arquivo pode não ser um documento fiscal válido ou ter uma estrutura não suportada."})
-
-        return json.dumps({k: v for k, v in dados.items() if v is not None})
+        esquema = esquema_do_documento(root)
+        if esquema is None:
+            return {"erro": ERRO_DADOS_ESSENCIAIS_XML}
+
+        blocos = {}
+        for tag, (_, nomes, xpath) in esquema['cabecalho'].items():
+            bloco = next(root.iter(tag), None)
+            if bloco is not None:
+                blocos[tag] = extrair_campos(nomes, xpath, bloco)
+        itens = []
+        if esquema['itens'] is not None:
+            tag, nomes, xpath = esquema['itens']
+            itens = [extrair_campos(nomes, xpath, det) for det in root.iter(tag)]
+        return _montar_dados_xml(esquema, blocos, itens)
+    except etree.XMLSyntaxError as e:
+        return {"erro": f"O arquivo XML fornecido está mal formatado e não pode ser lido. Erro de sintaxe: {e}"}
+    except Exception as e:
+        return {"erro": f"Falha ao processar XML: {e}"}
+
+@metricas.cronometrado('extracao_xml')
+def ler_dados_xml_streaming(caminho_arquivo: str) -> dict:
+    """
+    Versão em streaming de ler_dados_xml (mesma saída): percorre o XML uma única vez
+    com etree.iterparse, extraindo os blocos do esquema à medida que terminam,
+    e descarta cada elemento já processado. A memória fica limitada mesmo em NFes com
+    milhares de itens (det) ou em envelopes com vários documentos.
+    """
+    try:
+        with open(caminho_arquivo, 'rb') as f:
+            # Só os blocos dos esquemas geram eventos; o namespace é conferido abaixo
+            contexto = etree.iterparse(f, events=('end',), tag=[f'{{*}}{bloco}' for bloco in TAGS_BLOCOS])
+            esquema = None
+            blocos = {}
+            itens = []
+            for _, elem in contexto:
+                if esquema is None:
+                    esquema = esquema_do_documento(elem.getroottree().getroot())
+                    if esquema is None:
+                        return {"erro": ERRO_DADOS_ESSENCIAIS_XML}
+                    tag_itens = esquema['itens'][0] if esquema['itens'] is not None else None
+
+                if elem.tag == tag_itens:
+                    itens.append(extrair_campos(*esquema['itens'][1:], elem))
+                    # Descarta o item processado e os anteriores
+                    elem.clear(keep_tail=True)
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
+                elif elem.tag in esquema['cabecalho']:
+                    if elem.tag not in blocos:
+                        blocos[elem.tag] = extrair_campos(*esquema['cabecalho'][elem.tag][1:], elem)
+                    # Descarta o bloco e tudo o que já foi lido antes dele, inclusive
+                    # documentos anteriores do mesmo envelope
+                    elem.clear(keep_tail=True)
+                    for no in itertools.chain((elem,), elem.iterancestors()):
+                        while no.getprevious() is not None:
+                            del no.getparent()[0]
+            root = contexto.root
+            del contexto
+
+        esquema = esquema or esquema_do_documento(root)
+        if esquema is None:
+            return {"erro": ERRO_DADOS_ESSENCIAIS_XML}
+        return _montar_dados_xml(esquema, blocos, itens)
     except etree.XMLSyntaxError as e:
-        return json.dumps({"erro": f"O arquivo XML fornecido está mal formatado e não pode ser lido. Erro de sintaxe: {e}"})
+        return {"erro": f"O arquivo XML fornecido está mal formatado e não pode ser lido. Erro de sintaxe: {e}"}
     except Exception as e:
-        return json.dumps({"erro": f"Falha ao processar XML: {e}"})
-
-def extrair_dados_com_ia(texto_cru: str, llm_instance) -> str:
-    """Usa IA para extrair dados de texto e garante retorno de JSON."""
-    prompt_extracao = ChatPromptTemplate.from_messages([
-        ("system", "Você é um especialista em extrair dados de OCR de notas fiscais. Extraia os campos solicitados e retorne APENAS o JSON. Campos: `cnpj_emitente`, `destinatario_cpf` (ou `destinatario_cnpj`), `numero`, `data_emissao`, `valor_total_nota`, `discriminacao_servicos`."),
-        ("human", "Extraia os dados do texto: \n\n{texto_documento}")
-    ])
-    chain_extracao = prompt_extracao | llm_instance
-    raw_output = chain_extracao.invoke({"texto_documento": texto_cru}).content
+        return {"erro": f"Falha ao processar XML: {e}"}
+
+def extrair_dados_xml(caminho_arquivo: str) -> str:
+    """
+    Extrai dados detalhados de um arquivo XML de documento fiscal (NFe/CTe).
+    Recebe o caminho do arquivo e retorna uma string JSON com os dados extraídos.
+    """
+    return json.dumps(ler_dados_xml_streaming(caminho_arquivo))
+
+MENSAGENS_EXTRACAO_PDF = [
+    ("system", "Você é um especialista em extrair dados de OCR de notas fiscais. Extraia os campos solicitados e retorne APENAS o JSON. Campos: {campos}. O campo `destinatario_cnpj_cpf` é o CPF ou CNPJ do tomador."),
+    ("human", "Extraia os dados do texto: \n\n{texto_documento}")
+]
+# Extrações em cache feitas com outro prompt, modelo ou detecção por regras não são reaproveitadas
+VERSAO_EXTRACAO_PDF = cache_extracao.versao_extracao(MODELO_LLM, *(texto for _, texto in MENSAGENS_EXTRACAO_PDF),
+                                                     *versao_deteccao())
+
+def _entradas_extracao_ia(texto_cru, campos):
+    return {
+        "texto_documento": texto_cru,
+        "campos": ", ".join(f"`{campo}`" for campo in campos),
+    }
+
+def _json_da_resposta(raw_output: str) -> str:
+    """Isola o JSON da resposta do LLM (bloco ```json ou trecho entre chaves)."""
     json_match = re.search(r"```json\n({.*?})\n```", raw_output, re.DOTALL)
     if json_match: return json_match.group(1)
     try:
@@ -292,31 +331,116 @@ def extrair_dados_com_ia(texto_cru: str, llm_instance) -> str:
     except ValueError: pass
     return raw_output
 
-@tool
-def extrair_dados_pdf(caminho_arquivo: str) -> str:
-    """Extrai dados de um PDF de documento fiscal usando IA."""
+@metricas.cronometrado('extracao_pdf_ia')
+def extrair_dados_com_ia(texto_cru: str, llm_instance, campos=CAMPOS_PDF) -> str:
+    """Usa IA para extrair os campos informados do texto e garante retorno de JSON."""
+    from langchain.prompts import ChatPromptTemplate
+
+    chain_extracao = ChatPromptTemplate.from_messages(MENSAGENS_EXTRACAO_PDF) | llm_instance
+    return _json_da_resposta(chain_extracao.invoke(_entradas_extracao_ia(texto_cru, campos)).content)
+
+@metricas.cronometrado('extracao_pdf_ia')
+async def aextrair_dados_com_ia(texto_cru: str, llm_instance, campos=CAMPOS_PDF) -> str:
+    """Versão assíncrona de extrair_dados_com_ia (usa ainvoke)."""
+    from langchain.prompts import ChatPromptTemplate
+
+    chain_extracao = ChatPromptTemplate.from_messages(MENSAGENS_EXTRACAO_PDF) | llm_instance
+    resposta = await chain_extracao.ainvoke(_entradas_extracao_ia(texto_cru, campos))
+    return _json_da_resposta(resposta.content)
+
+@metricas.cronometrado('extracao_pdf_texto')
+def iniciar_leitura_pdf(caminho_arquivo: str, paralelo: bool = True, hash_conteudo: str = None) -> dict:
+    """
+    Primeira etapa da leitura de um PDF, sem chamada à IA: consulta o cache e,
+    se o arquivo não estiver lá, extrai o texto e detecta os campos por regras.
+    Retorna {'hash', 'dados', 'faltantes', 'trechos', 'em_cache'}; 'trechos' é o
+    texto a enviar à IA para completar os campos faltantes. O hash do conteúdo
+    pode ser informado se já tiver sido calculado.
+    """
+    hash_conteudo = hash_conteudo or cache_extracao.hash_arquivo(caminho_arquivo)
+    em_cache = cache_extracao.obter(hash_conteudo, VERSAO_EXTRACAO_PDF)
+    metricas.contar('cache', cache='extracao', resultado='falha' if em_cache is None else 'acerto')
+    if em_cache is not None:
+        return {'hash': hash_conteudo, 'dados': em_cache, 'faltantes': [], 'trechos': None, 'em_cache': True}
+
+    textos_paginas = extrair_textos_paginas(caminho_arquivo, paralelo)
+    dados_extraidos = detectar_campos(textos_paginas)
+    faltantes = [campo for campo in CAMPOS_PDF if campo not in dados_extraidos]
+    trechos = selecionar_trechos(textos_paginas, faltantes) if faltantes else None
+    return {'hash': hash_conteudo, 'dados': dados_extraidos, 'faltantes': faltantes, 'trechos': trechos, 'em_cache': False}
+
+def concluir_leitura_pdf(leitura: dict, resposta_ia: str = None) -> dict:
+    """
+    Etapa final da leitura de um PDF: junta os campos da IA (JSON em 'resposta_ia')
+    aos das regras, normaliza os nomes dos campos e guarda o resultado no cache.
+    O hash do conteúdo vai junto nos dados, para a detecção de duplicatas.
+    """
+    if leitura['em_cache']:
+        return {**leitura['dados'], 'hash_conteudo': leitura['hash']}
+    dados_extraidos = dict(leitura['dados'])
+    if resposta_ia is not None:
+        # Os campos encontrados pelas regras prevalecem sobre os da IA
+        dados_extraidos = {**json.loads(resposta_ia), **dados_extraidos}
+    dados_extraidos['emitente_cnpj'] = dados_extraidos.pop('cnpj_emitente', None)
+    destinatario = [dados_extraidos.pop(campo, None) for campo in ('destinatario_cnpj_cpf', 'destinatario_cnpj', 'destinatario_cpf')]
+    dados_extraidos['destinatario_cnpj_cpf'] = next((doc for doc in destinatario if doc), None)
+    dados_extraidos['formato'] = 'ocr_ia' if leitura['faltantes'] else 'ocr'
+    dados_extraidos['tipo_documento'] = TIPO_NFSE
+    dados_extraidos['hash_conteudo'] = leitura['hash']
+    cache_extracao.guardar(leitura['hash'], VERSAO_EXTRACAO_PDF, dados_extraidos)
+    return dados_extraidos
+
+def ler_dados_pdf(caminho_arquivo: str, paralelo: bool = True, hash_conteudo: str = None) -> dict:
+    """
+    Extrai os dados de um PDF de documento fiscal como dicionário.
+    O texto é lido por página (em paralelo nos PDFs longos) e os campos são
+    procurados primeiro por regras (ver extracao_pdf.py); a IA recebe só os
+    campos que faltarem e as páginas que podem contê-los.
+    O resultado fica em cache pelo conteúdo do arquivo (ver cache_extracao.py):
+    o mesmo PDF enviado de novo é respondido sem chamada à API.
+    Em caso de falha, retorna {'erro': mensagem}.
+    """
     try:
-        with fitz.open(caminho_arquivo) as doc:
-            texto_completo = "".join(page.get_text() for page in doc)
-        json_extraido_str = extrair_dados_com_ia(texto_completo, llm)
-        dados_extraidos = json.loads(json_extraido_str)
-        dados_extraidos['emitente_cnpj'] = dados_extraidos.pop('cnpj_emitente', None)
-        dados_extraidos['destinatario_cnpj_cpf'] = dados_extraidos.pop('destinatario_cnpj', dados_extraidos.pop('destinatario_cpf', None))
-        dados_extraidos['formato'] = 'ocr_ia'
-        dados_extraidos['tipo_documento'] = 'NFS-e'
-        return json.dumps(dados_extraidos)
+        leitura = iniciar_leitura_pdf(caminho_arquivo, paralelo, hash_conteudo)
+        resposta_ia = None
+        if leitura['faltantes']:
+            resposta_ia = extrair_dados_com_ia(leitura['trechos'], get_llm(), leitura['faltantes'])
+        return concluir_leitura_pdf(leitura, resposta_ia)
     except Exception as e:
-        return json.dumps({"erro": f"Falha ao processar PDF: {e}"})
+        return {"erro": f"Falha ao processar PDF: {e}"}
+
+def extrair_dados_pdf(caminho_arquivo: str) -> str:
+    """Extrai dados de um PDF de documento fiscal usando IA."""
+    return json.dumps(ler_dados_pdf(caminho_arquivo))
 
-@tool
 def consultar_ncm_tool(ncm_codigo: str) -> str:
     """Consulta a alíquota de IPI para um código NCM específico."""
-    resultado = consultar_ncm(ncm_codigo, db_file='tipi/tipi.db')
+    resultado = consultar_ncm(ncm_codigo, db_file=TIPI_DB)
     return json.dumps(resultado if resultado else {"erro": f"NCM '{ncm_codigo}' não encontrado."})
 
-# --- Lista de Ferramentas e Prompt do Agente ---
+# --- Pipeline Determinístico (sem o agente) ---
 
-tools = [
+def processar_documento_xml(caminho_arquivo: str) -> dict:
+    """
+    Extrai, audita e salva um XML de NFe/CTe chamando as funções diretamente,
+    sem passar pelo agente (nenhuma ida e volta ao LLM para orquestração).
+    Um documento já auditado é reconhecido pela chave de acesso ou pelo hash
+    do arquivo antes da extração, e o resultado gravado é devolvido.
+    Retorna o mesmo dicionário de `auditar_e_salvar`.
+    """
+    with metricas.documento(os.path.basename(caminho_arquivo)):
+        with metricas.etapa('identificacao'):
+            identificacao = identificar_arquivo(caminho_arquivo)
+            duplicado = auditoria_existente(identificacao)
+        if duplicado is not None:
+            metricas.contar('documentos_duplicados')
+            return duplicado
+        return auditar_e_salvar(com_identificacao(ler_dados_xml_streaming(caminho_arquivo), identificacao))
+
+# --- Ferramentas e Prompt do Agente ---
+
+# Funções expostas ao agente como ferramentas (nome e docstring descrevem a ferramenta ao LLM)
+FERRAMENTAS = [
     extrair_dados_xml,
     extrair_dados_pdf,
     auditar_e_salvar_dados_fiscais,
@@ -335,11 +459,24 @@ Você é um assistente fiscal especialista. Sua função é processar, auditar,
     - Use `consultar_ncm_tool` para perguntas sobre IPI de NCM.
 '''
 
-prompt = ChatPromptTemplate.from_messages([
-    ("system", prompt_template),
-    ("human", "{input}"),
-    ("placeholder", "{agent_scratchpad}"),
-])
-
-agent = create_openai_tools_agent(llm, tools, prompt)
-agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
\ No newline at end of file
+def get_agent_executor():
+    """AgentExecutor com as ferramentas fiscais, criado na primeira chamada e reutilizado depois."""
+    global agent_executor
+    if agent_executor is None:
+        modelo = get_llm()
+        with _lock_agente:
+            if agent_executor is None:
+                from langchain.agents import AgentExecutor, create_openai_tools_agent
+                from langchain.prompts import ChatPromptTemplate
+                from langchain.tools import tool
+
+                # Cada chamada de ferramenta é medida como a etapa 'ferramenta_<nome>'
+                tools = [tool(metricas.cronometrado(f'ferramenta_{funcao.__name__}')(funcao)) for funcao in FERRAMENTAS]
+                prompt = ChatPromptTemplate.from_messages([
+                    ("system", prompt_template),
+                    ("human", "{input}"),
+                    ("placeholder", "{agent_scratchpad}"),
+                ])
+                agent = create_openai_tools_agent(modelo, tools, prompt)
+                agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
+    return agent_executor
@@ -2,36 +2,62 @@
 
 import streamlit as st
 import os
-import pandas as pd
-import json
-from agente_fiscal_langchain import agent_executor
-from tipi.atualizartipi import baixar_tipi_xlsx, processar_tipi_para_sqlite
+import uuid
+from agente_fiscal_langchain import auditoria_existente, get_agent_executor, processar_documento_xml
+from dados_dashboard import ORDENACOES, ItensPlanos, agregar, consultar_pagina
+from identificacao import identificar_arquivo
+from servico_auditoria import ServicoAuditoria
+import cache_extracao
+import cache_llm
+import metricas
 
 # --- ATUALIZAÇÃO AUTOMÁTICA DA TABELA TIPI ---
-print("Verificando e atualizando a tabela TIPI...")
-tentativa_de_download = baixar_tipi_xlsx(output_filename="tipi/tipi_download.xlsx")
-if tentativa_de_download and os.path.exists(tentativa_de_download):
-    processar_tipi_para_sqlite(tentativa_de_download, db_file="tipi/tipi.db")
-    print("Tabela TIPI atualizada com sucesso.")
-else:
-    print("Falha ao baixar a tabela TIPI. Usando a versão local, se existir.")
+@st.cache_resource
+def iniciar_atualizacao_tipi():
+    """
+    Inicia, uma única vez por processo, a sincronização da Tabela TIPI em
+    segundo plano (repetida a cada 24h). Enquanto isso, o app usa a versão local.
+    """
+    # Importado aqui: requests, BeautifulSoup e a leitura do XLSX só carregam uma vez por processo
+    from tipi.sincronizartipi import iniciar_sincronizacao_em_segundo_plano
+
+    print("Verificando e atualizando a tabela TIPI em segundo plano...")
+    return iniciar_sincronizacao_em_segundo_plano(intervalo_segundos=24 * 60 * 60)
+
+@st.cache_resource
+def iniciar_exportacao_metricas():
+    """
+    Expõe as métricas do processo em /metrics (formato do Prometheus), uma única
+    vez por processo, se AGENTE_FISCAL_METRICAS_PORTA estiver definida.
+    """
+    porta = os.getenv('AGENTE_FISCAL_METRICAS_PORTA')
+    return metricas.servir_prometheus(int(porta)) if porta else None
 
 # --- Funções de Lógica do App ---
 
-def ler_registros_do_banco() -> str:
+@st.cache_resource
+def obter_agent_executor():
+    """
+    Agente (LLM, ferramentas e prompt) compartilhado entre as sessões do processo.
+    Criado só quando um PDF é analisado pela primeira vez: o dashboard não paga por ele.
+    """
+    return get_agent_executor()
+
+@st.cache_resource
+def obter_itens_planos() -> ItensPlanos:
     """
-    Lê os registros do 'banco de dados' (atualmente um arquivo JSON)
-    e retorna como uma string JSON.
+    Tabela achatada de itens compartilhada entre as sessões do processo.
+    A cada execução do script só os documentos novos são incorporados.
     """
-    db_file = 'db_documentos.json'
-    if not os.path.exists(db_file):
-        return json.dumps([])
-    with open(db_file, 'r', encoding='utf-8') as f:
-        try:
-            data = json.load(f)
-        except json.JSONDecodeError:
-            data = []
-    return json.dumps(data)
+    return ItensPlanos()
+
+@st.cache_resource
+def obter_servico_auditoria() -> ServicoAuditoria:
+    """
+    Fila de processamento concorrente compartilhada entre as sessões do processo:
+    os documentos enviados em lote são processados em segundo plano.
+    """
+    return ServicoAuditoria()
 
 # --- Configuração da Página ---
 st.set_page_config(page_title="Agente Fiscal Inteligente", page_icon="🤖", layout="wide")
@@ -39,8 +65,26 @@ st.set_page_config(page_title="Agente Fiscal Inteligente", page_icon="🤖", lay
 st.title("🤖 Agente Fiscal Inteligente")
 st.caption("Uma solução de IA para automatizar a análise e o gerenciamento de documentos fiscais.")
 
+iniciar_atualizacao_tipi()
+iniciar_exportacao_metricas()
+
+# --- Caches das chamadas à IA ---
+with st.sidebar:
+    st.subheader("Caches da IA")
+    caches = [("Respostas do LLM", cache_llm.estatisticas)] if cache_llm.CACHE_LLM else []
+    caches.append(("Extrações de PDF", cache_extracao.estatisticas))
+    for nome, estatisticas in caches:
+        e = estatisticas()
+        st.caption(nome)
+        c1, c2 = st.columns(2)
+        c1.metric("Taxa de acerto", f"{e['taxa_acerto']:.0%}")
+        c2.metric("Entradas", e['entradas'])
+        st.caption(f"{e['acertos']} acertos, {e['falhas']} falhas, {e['descartes']} descartes | "
+                   f"{e['bytes'] / 2 ** 20:.1f} de {e['limite_bytes'] / 2 ** 20:.0f} MB")
+
 # --- ABAS DA APLICAÇÃO ---
-tab_processamento, tab_dashboard = st.tabs(["Processar Novo Documento", "Dashboard de Documentos"])
+tab_processamento, tab_dashboard, tab_performance = st.tabs(
+    ["Processar Novo Documento", "Dashboard de Documentos", "Performance"])
 
 
 # --- ABA 1: PROCESSAMENTO DE DOCUMENTOS ---
@@ -55,102 +99,185 @@ with tab_processamento:
         with open(file_path, "wb") as f: f.write(uploaded_file.getbuffer())
 
         if st.button("Analisar Documento", type="primary", use_container_width=True):
-            tarefa = f"Extraia, audite e salve no banco de dados o documento fiscal '{file_path}'"
+            if file_path.lower().endswith('.xml'):
+                # XML (NFe/CTe): pipeline determinístico, sem o agente
+                with st.spinner('Extraindo e auditando o documento...'):
+                    try:
+                        resultado = processar_documento_xml(file_path)
+                        if resultado['status'] == 'SUCESSO':
+                            st.subheader("✅ Análise Concluída")
+                            st.markdown(resultado['mensagem'])
+                        else:
+                            st.error(resultado['mensagem'])
+
+                        if resultado.get('auditoria'):
+                            with st.expander("Ver os detalhes da auditoria"):
+                                st.json(resultado['auditoria'])
+
+                    except Exception as e:
+                        st.error(f"Ocorreu um erro: {e}")
+            elif (duplicado := auditoria_existente(identificar_arquivo(file_path))) is not None:
+                # PDF já auditado (mesmo conteúdo): mostra o resultado gravado, sem o agente
+                st.subheader("✅ Análise Concluída")
+                st.markdown(duplicado['mensagem'])
+                with st.expander("Ver os detalhes da auditoria"):
+                    st.json(duplicado['auditoria'])
+            else:
+                # PDF (não estruturado): o agente decide como extrair os dados
+                tarefa = f"Extraia, audite e salve no banco de dados o documento fiscal '{file_path}'"
             
-            with st.spinner('O Agente está trabalhando...'):
-                try:
-                    resultado = agent_executor.invoke({"input": tarefa})
-                    st.subheader("✅ Análise Concluída")
-                    st.markdown(resultado["output"])
-                    st.cache_data.clear()
+                with st.spinner('O Agente está trabalhando...'):
+                    try:
+                        with metricas.documento(uploaded_file.name), metricas.etapa('agente'):
+                            resultado = obter_agent_executor().invoke({"input": tarefa})
+                        st.subheader("✅ Análise Concluída")
+                        st.markdown(resultado["output"])
                     
-                    with st.expander("Ver o raciocínio detalhado do Agente"):
-                        st.json(resultado)
+                        with st.expander("Ver o raciocínio detalhado do Agente"):
+                            st.json(resultado)
+
+                    except Exception as e:
+                        st.error(f"Ocorreu um erro: {e}")
 
-                except Exception as e:
-                    st.error(f"Ocorreu um erro: {e}")
+    # --- Processamento em lote (fila do serviço assíncrono) ---
+    st.divider()
+    st.header("Processamento em Lote")
+    servico = obter_servico_auditoria()
+    arquivos_lote = st.file_uploader("Selecione os documentos (XML ou PDF)", type=['xml', 'pdf'],
+                                     accept_multiple_files=True, key='arquivos_lote')
+    if arquivos_lote and st.button("Enviar para a fila", use_container_width=True):
+        temp_dir = "temp_uploads"
+        os.makedirs(temp_dir, exist_ok=True)
+        for arquivo in arquivos_lote:
+            # Prefixo único: arquivos com o mesmo nome não se sobrescrevem enquanto esperam na fila
+            caminho = os.path.join(temp_dir, f"{uuid.uuid4().hex[:12]}_{arquivo.name}")
+            with open(caminho, "wb") as f: f.write(arquivo.getbuffer())
+            servico.submeter(caminho, nome=arquivo.name)
+        st.success(f"{len(arquivos_lote)} documento(s) enviados para a fila.")
+
+    tarefas = servico.tarefas()
+    if tarefas:
+        st.button("Atualizar situação da fila")
+        e = servico.estatisticas()
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Na fila", e['na_fila'])
+        c2.metric("Processando", e['processando'])
+        c3.metric("Concluídas", e['concluida'])
+        c4.metric("Falhas", e['falhou'])
+        st.dataframe([{
+            'arquivo': t['nome'],
+            'situação': t['situacao'],
+            'auditoria': t['resultado']['auditoria']['status_auditoria'] if t['situacao'] == 'concluida' else None,
+            'erro': t['erro'],
+        } for t in reversed(tarefas)], use_container_width=True)
 
 # --- ABA 2: DASHBOARD (LÓGICA CORRIGIDA) ---
 with tab_dashboard:
     st.header("Documentos Fiscais Processados")
     
-    if st.button("Atualizar Dados", use_container_width=True):
-        st.cache_data.clear()
-
-    @st.cache_data(ttl=60)
-    def carregar_dados():
-        dados_json = ler_registros_do_banco()
-        return json.loads(dados_json)
-
-    dados = carregar_dados()
-
-    if isinstance(dados, list) and dados:
-        dados_planos = []
-        for doc_auditado in dados:
-            # A estrutura de dados agora é plana. Acessamos os campos diretamente.
-            if not doc_auditado: continue
-
-            info_base = {
-                'status_auditoria': doc_auditado.get('status_auditoria'),
-                'numero_nota': doc_auditado.get('numero'),
-                'conclusao_analise': doc_auditado.get('conclusao_analise'), # Nova coluna
-                'data_emissao': doc_auditado.get('data_emissao'),
-                'emitente': doc_auditado.get('emitente_razao_social'),
-                'emitente_cnpj': doc_auditado.get('emitente_cnpj'),
-                'destinatario': doc_auditado.get('destinatario_razao_social'),
-                'destinatario_cnpj_cpf': doc_auditado.get('destinatario_cnpj_cpf'),
-                'valor_total_nota': doc_auditado.get('valor_total_nota'),
-                'tipo_documento': doc_auditado.get('tipo_documento'),
-                'formato': doc_auditado.get('formato'),
-                'discriminacao_servicos': doc_auditado.get('discriminacao_servicos'),
-                'erros': ", ".join(doc_auditado.get('erros_auditoria', [])),
-                'avisos': ", ".join(doc_auditado.get('avisos_auditoria', []))
-            }
-            
-            itens = doc_auditado.get('itens', [])
-            if itens and isinstance(itens, list):
-                for item in itens:
-                    linha = info_base.copy()
-                    linha['item_codigo'] = item.get('codigo')
-                    linha['item_descricao'] = item.get('descricao')
-                    linha['item_ncm'] = item.get('ncm')
-                    linha['item_cfop'] = item.get('cfop')
-                    linha['item_valor_total'] = item.get('valor_total')
-                    dados_planos.append(linha)
-            else:
-                # Para documentos sem itens (como NFS-e de OCR), usa o valor total da nota como o valor do item.
-                info_base['item_valor_total'] = info_base.get('valor_total_nota')
-                dados_planos.append(info_base)
-
-        df = pd.DataFrame(dados_planos)
-
-        # Reordenar colunas para colocar a conclusão em terceiro
-        cols = df.columns.tolist()
-        if 'conclusao_analise' in cols:
-            cols.insert(2, cols.pop(cols.index('conclusao_analise')))
-            df = df[cols]
-
-        colunas_monetarias = ['valor_total_nota', 'item_valor_total']
-        for col in colunas_monetarias:
-            if col in df.columns:
-                # Limpa e converte o formato de moeda (R$ 1.234,56 -> 1234.56)
-                df[col] = df[col].astype(str).str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-
-        st.dataframe(df, use_container_width=True)
+    st.button("Atualizar Dados", use_container_width=True)
+
+    itens_planos = obter_itens_planos()
+
+    # --- Filtros e ordenação (aplicados no banco; só a página visível é carregada) ---
+    with st.expander("Filtros", expanded=False):
+        f1, f2, f3 = st.columns(3)
+        with f1:
+            periodo = st.date_input("Período de emissão", value=())
+            status = st.multiselect("Status", ['success', 'warning', 'error'])
+        with f2:
+            emitente_cnpj = st.text_input("CNPJ do emitente")
+            cfop = st.text_input("CFOP")
+        with f3:
+            ncm = st.text_input("NCM (prefixo)")
+            ordenar_por = st.selectbox("Ordenar por", list(ORDENACOES), index=0)
+            decrescente = st.toggle("Ordem decrescente", value=True)
+
+    filtros = {
+        'data_inicio': periodo[0] if len(periodo) > 0 else None,
+        'data_fim': periodo[1] if len(periodo) > 1 else None,
+        'emitente_cnpj': emitente_cnpj,
+        'status': status,
+        'cfop': cfop,
+        'ncm': ncm,
+    }
+
+    p1, p2 = st.columns([1, 3])
+    with p1:
+        tamanho_pagina = st.selectbox("Linhas por página", [25, 50, 100, 500], index=1)
+    with p2:
+        pagina = st.number_input("Página", min_value=1, value=1, step=1)
+
+    df, total = consultar_pagina(itens_planos, filtros, ordenar_por, decrescente, int(pagina), tamanho_pagina)
+
+    if total:
+        total_paginas = max(1, -(-total // tamanho_pagina))
+        st.caption(f"Página {int(pagina)} de {total_paginas} ({total} linhas)")
+        colunas_visiveis = [col for col in df.columns if not col.startswith('_')]
+        st.dataframe(df[colunas_visiveis], use_container_width=True)
         
         st.subheader("Análises Rápidas")
-        col1, col2 = st.columns(2)
+        col1, col2, col3 = st.columns(3)
         with col1:
-            if 'status_auditoria' in df.columns:
-                st.write("Status das Auditorias")
-                st.bar_chart(df['status_auditoria'].value_counts())
+            st.write("Status das Auditorias")
+            por_status = agregar(itens_planos, 'status', filtros)
+            st.bar_chart(por_status.set_index('grupo')['quantidade'])
         with col2:
-            if 'valor_total_nota' in df.columns:
-                valor_por_nota = df.drop_duplicates(subset=['numero_nota']).set_index('numero_nota')
-                st.bar_chart(valor_por_nota['valor_total_nota'])
+            st.write("Valor Total por Emitente (Top 20)")
+            por_emitente = agregar(itens_planos, 'emitente', filtros, limite=20)
+            st.bar_chart(por_emitente.set_index('grupo')['valor_total'])
+        with col3:
+            st.write("Valor Total por Mês de Emissão")
+            por_mes = agregar(itens_planos, 'mes', filtros)
+            st.bar_chart(por_mes.set_index('grupo')['valor_total'])
+
+    else:
+        st.info("Nenhum documento encontrado. Processe um documento na aba ao lado ou ajuste os filtros.")
+
+
+# --- ABA 3: PERFORMANCE (TEMPOS POR ETAPA E CONTADORES) ---
+with tab_performance:
+    st.header("Performance")
+    st.button("Atualizar métricas", use_container_width=True)
 
-    elif isinstance(dados, dict) and 'erro' in dados:
-        st.error(f"Erro ao carregar dados do banco: {dados['erro']}")
+    st.subheader("Tempos por etapa")
+    st.caption(f"Medições deste processo do app; p50/p95 sobre as últimas {metricas.METRICAS_JANELA} de cada etapa. "
+               "As etapas podem ser aninhadas (ex.: 'consulta_ncm' faz parte de 'auditoria').")
+    resumo = metricas.resumo_etapas()
+    if resumo:
+        st.dataframe([{
+            'etapa': r['etapa'],
+            'chamadas': r['chamadas'],
+            'média (ms)': round(r['media_ms'], 1),
+            'p50 (ms)': round(r['p50_ms'], 1),
+            'p95 (ms)': round(r['p95_ms'], 1),
+            'total (s)': round(r['total_s'], 2),
+        } for r in resumo], use_container_width=True)
     else:
-        st.info("Nenhum documento processado ainda. Processe um documento na aba ao lado.")
\ No newline at end of file
+        st.info("Nenhuma medição ainda. Processe um documento para ver os tempos por etapa.")
+
+    contadores = metricas.contadores()
+    c1, c2, c3, c4, c5 = st.columns(5)
+    c1.metric("Tokens (prompt)", contadores.get('tokens_llm_prompt', 0))
+    c2.metric("Tokens (resposta)", contadores.get('tokens_llm_completion', 0))
+    c3.metric("Respostas do LLM", contadores.get('respostas_llm', 0))
+    c4.metric("Acertos do cache do LLM", contadores.get('cache_llm_acerto', 0))
+    c5.metric("Consultas de NCM", contadores.get('consultas_ncm', 0))
+
+    st.subheader("Documentos recentes")
+    registros = metricas.ler_log(limite=20)
+    if registros:
+        st.dataframe([{
+            'momento': r['momento'],
+            'documento': r['documento'],
+            'situação': r['situacao'],
+            'duração (ms)': round(r['duracao'] * 1000, 1),
+            'etapas': ", ".join(f"{etapa} {segundos * 1000:.0f} ms" for etapa, segundos in r['etapas'].items()),
+            'consultas de NCM': r['contadores'].get('consultas_ncm', 0),
+            'tokens': r['contadores'].get('tokens_llm_prompt', 0) + r['contadores'].get('tokens_llm_completion', 0),
+        } for r in reversed(registros)], use_container_width=True)
+    else:
+        st.caption("O log de métricas por documento está vazio ou desativado (AGENTE_FISCAL_METRICAS_LOG).")
+
+    st.download_button("Baixar métricas (formato Prometheus)", metricas.exportar_prometheus(),
+                       file_name="metricas.prom", mime="text/plain")
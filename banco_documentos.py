@@ -0,0 +1,565 @@
+# Arquivo: banco_documentos.py (Armazenamento dos documentos auditados em SQLite)
+
+import json
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+DB_DOCUMENTOS = 'db_documentos.db'
+JSON_LEGADO = 'db_documentos.json'
+
+# Colunas do documento que ficam em colunas próprias (para filtros e índices).
+# O registro completo da auditoria é mantido em 'dados_json'.
+COLUNAS_DOCUMENTO = [
+    'status_auditoria', 'numero', 'data_emissao', 'emitente_razao_social', 'emitente_cnpj',
+    'destinatario_razao_social', 'destinatario_cnpj_cpf', 'valor_total_nota',
+    'tipo_documento', 'formato', 'conclusao_analise',
+]
+COLUNAS_ITEM = ['codigo', 'descricao', 'ncm', 'cfop', 'valor_total', 'pIPI']
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    chave TEXT PRIMARY KEY,
+    valor TEXT
+);
+CREATE TABLE IF NOT EXISTS documentos (
+    id INTEGER PRIMARY KEY,
+    status_auditoria TEXT,
+    numero TEXT,
+    data_emissao TEXT,
+    emitente_razao_social TEXT,
+    emitente_cnpj TEXT,
+    destinatario_razao_social TEXT,
+    destinatario_cnpj_cpf TEXT,
+    valor_total_nota TEXT,
+    tipo_documento TEXT,
+    formato TEXT,
+    conclusao_analise TEXT,
+    salvo_em TEXT,
+    dados_json TEXT NOT NULL,
+    valor_total_nota_centavos INTEGER,
+    discriminacao_servicos TEXT,
+    erros TEXT,
+    avisos TEXT,
+    data_emissao_dia TEXT,
+    chave_acesso TEXT,
+    hash_conteudo TEXT,
+    emitente_cnpj_digitos TEXT,
+    revisao INTEGER
+);
+CREATE TABLE IF NOT EXISTS itens (
+    id INTEGER PRIMARY KEY,
+    documento_id INTEGER NOT NULL REFERENCES documentos(id) ON DELETE CASCADE,
+    sequencia INTEGER,
+    codigo TEXT,
+    descricao TEXT,
+    ncm TEXT,
+    cfop TEXT,
+    valor_total TEXT,
+    pIPI TEXT,
+    valor_total_centavos INTEGER
+);
+"""
+
+# Colunas acrescentadas depois da primeira versão do esquema: {tabela: {coluna: tipo}}
+COLUNAS_ACRESCENTADAS = {
+    'documentos': {'valor_total_nota_centavos': 'INTEGER', 'discriminacao_servicos': 'TEXT',
+                   'erros': 'TEXT', 'avisos': 'TEXT', 'data_emissao_dia': 'TEXT',
+                   'chave_acesso': 'TEXT', 'hash_conteudo': 'TEXT', 'emitente_cnpj_digitos': 'TEXT',
+                   'revisao': 'INTEGER'},
+    'itens': {'valor_total_centavos': 'INTEGER'},
+}
+
+INDICES = """
+CREATE INDEX IF NOT EXISTS idx_documentos_emitente_cnpj ON documentos(emitente_cnpj);
+CREATE INDEX IF NOT EXISTS idx_documentos_emitente_cnpj_digitos ON documentos(emitente_cnpj_digitos);
+CREATE INDEX IF NOT EXISTS idx_documentos_numero ON documentos(numero);
+CREATE INDEX IF NOT EXISTS idx_documentos_data_emissao ON documentos(data_emissao);
+CREATE INDEX IF NOT EXISTS idx_documentos_status ON documentos(status_auditoria);
+CREATE INDEX IF NOT EXISTS idx_documentos_data_emissao_dia ON documentos(data_emissao_dia);
+CREATE INDEX IF NOT EXISTS idx_documentos_revisao ON documentos(revisao);
+CREATE INDEX IF NOT EXISTS idx_itens_documento ON itens(documento_id);
+CREATE INDEX IF NOT EXISTS idx_itens_cfop ON itens(cfop);
+CREATE INDEX IF NOT EXISTS idx_itens_ncm ON itens(ncm);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_documentos_chave_acesso ON documentos(chave_acesso) WHERE chave_acesso IS NOT NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_documentos_hash_conteudo ON documentos(hash_conteudo) WHERE hash_conteudo IS NOT NULL;
+"""
+
+# Cada documento inserido ou alterado (reauditoria, conclusão pela IA) recebe a
+# próxima revisão do banco: quem lê de forma incremental (exportação Parquet)
+# guarda a última revisão lida e relê só o que foi gravado ou alterado depois
+PROXIMA_REVISAO = "(SELECT COALESCE(MAX(revisao), 0) + 1 FROM documentos)"
+
+_bancos_inicializados = set()
+_lock_inicializacao = threading.Lock()
+
+
+def _inicializar(conn, db_file):
+    """Cria o esquema e executa a migração do JSON legado, uma única vez por processo."""
+    caminho = os.path.abspath(db_file)
+    if caminho in _bancos_inicializados:
+        return
+    with _lock_inicializacao:
+        if caminho in _bancos_inicializados:
+            return
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(ESQUEMA)
+        _atualizar_esquema(conn)
+        conn.executescript(INDICES)
+        json_legado = os.path.join(os.path.dirname(caminho), JSON_LEGADO)
+        migrar_json(conn, json_legado)
+        _bancos_inicializados.add(caminho)
+
+
+def _atualizar_esquema(conn):
+    """
+    Acrescenta as colunas que não existiam em bancos criados por versões
+    anteriores e as preenche a partir do registro completo ('dados_json').
+    """
+    novas = {}
+    for tabela, colunas in COLUNAS_ACRESCENTADAS.items():
+        existentes = {linha[1] for linha in conn.execute(f"PRAGMA table_info({tabela})")}
+        novas[tabela] = [col for col in colunas if col not in existentes]
+        for col in novas[tabela]:
+            conn.execute(f"ALTER TABLE {tabela} ADD COLUMN {col} {colunas[col]}")
+    if not any(novas.values()):
+        return
+
+    with conn:
+        for documento_id, dados_json in conn.execute("SELECT id, dados_json FROM documentos").fetchall():
+            derivadas = _colunas_derivadas(json.loads(dados_json))
+            conn.execute(
+                f"UPDATE documentos SET {', '.join(f'{col} = ?' for col in derivadas)} WHERE id = ?",
+                (*derivadas.values(), documento_id))
+        for item_id, valor_total in conn.execute("SELECT id, valor_total FROM itens").fetchall():
+            conn.execute("UPDATE itens SET valor_total_centavos = ? WHERE id = ?",
+                         (valor_em_centavos(valor_total), item_id))
+        # Documentos gravados mais de uma vez antes dos índices únicos: a chave
+        # fica só no primeiro registro, os repetidos são mantidos sem ela
+        conn.execute("""
+            UPDATE documentos SET chave_acesso = NULL
+            WHERE chave_acesso IS NOT NULL
+              AND id NOT IN (SELECT MIN(id) FROM documentos WHERE chave_acesso IS NOT NULL GROUP BY chave_acesso)""")
+        # Documentos anteriores às revisões: a ordem de gravação
+        conn.execute("UPDATE documentos SET revisao = id WHERE revisao IS NULL")
+
+
+def valor_em_centavos(valor):
+    """
+    Converte um valor monetário (formato pt-BR ou padrão) para centavos inteiros.
+    Retorna None se o valor estiver vazio ou não for numérico.
+    """
+    if valor is None or valor == '':
+        return None
+    valor = str(valor).strip()
+    if ',' in valor and '.' in valor:
+        valor = valor.replace('.', '')
+    valor = valor.replace(',', '.')
+    try:
+        return int((Decimal(valor) * 100).quantize(Decimal('1')))
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def normalizar_data(valor):
+    """
+    Extrai a data (AAAA-MM-DD) de uma data de emissão em formato ISO
+    (ex.: '2024-05-10T10:00:00-03:00') ou pt-BR ('10/05/2024').
+    Retorna None se a data não for reconhecida.
+    """
+    if not valor:
+        return None
+    valor = str(valor).strip()
+    if re.match(r'^\d{4}-\d{2}-\d{2}', valor):
+        return valor[:10]
+    encontrado = re.match(r'^(\d{2})/(\d{2})/(\d{4})', valor)
+    if encontrado:
+        dia, mes, ano = encontrado.groups()
+        return f"{ano}-{mes}-{dia}"
+    return None
+
+
+def somente_digitos(documento):
+    """
+    CPF/CNPJ só com os dígitos, ou None se não houver nenhum. Os lidos de PDF
+    pela IA ficam gravados como vieram (ex.: '12.345.678/0001-90').
+    """
+    if documento is None:
+        return None
+    return ''.join(filter(str.isdigit, str(documento))) or None
+
+
+def _texto_lista(valores):
+    """Junta as mensagens de erro/aviso em um único texto, como exibido no dashboard."""
+    return ", ".join(valores) if isinstance(valores, list) else None
+
+
+def _colunas_derivadas(audit_result):
+    """Calcula, na gravação, as colunas já prontas para o dashboard."""
+    return {
+        'valor_total_nota_centavos': valor_em_centavos(audit_result.get('valor_total_nota')),
+        'discriminacao_servicos': audit_result.get('discriminacao_servicos'),
+        'erros': _texto_lista(audit_result.get('erros_auditoria', [])),
+        'avisos': _texto_lista(audit_result.get('avisos_auditoria', [])),
+        'data_emissao_dia': normalizar_data(audit_result.get('data_emissao')),
+        'chave_acesso': audit_result.get('chave_acesso') or None,
+        'hash_conteudo': audit_result.get('hash_conteudo') or None,
+        'emitente_cnpj_digitos': somente_digitos(audit_result.get('emitente_cnpj')),
+    }
+
+
+@contextmanager
+def conectar(db_file=DB_DOCUMENTOS):
+    """
+    Abre uma conexão com o banco de documentos (modo WAL), garantindo que o
+    esquema exista. Faz commit ao final do bloco ou rollback em caso de erro.
+    """
+    conn = sqlite3.connect(db_file, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("PRAGMA busy_timeout=30000")
+        _inicializar(conn, db_file)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _inserir_documento(conn, audit_result):
+    """
+    Insere um documento auditado e seus itens usando a conexão informada.
+    Um documento já gravado (mesma chave de acesso ou mesmo conteúdo) não é
+    inserido de novo: retorna o id do registro existente.
+    """
+    valores = [audit_result.get(col) for col in COLUNAS_DOCUMENTO]
+    derivadas = _colunas_derivadas(audit_result)
+    colunas = [*COLUNAS_DOCUMENTO, 'salvo_em', 'dados_json', *derivadas]
+    cursor = conn.execute(
+        f"INSERT OR IGNORE INTO documentos ({', '.join(colunas)}, revisao) "
+        f"VALUES ({', '.join('?' * len(colunas))}, {PROXIMA_REVISAO})",
+        [*(str(v) if v is not None else None for v in valores),
+         datetime.now().isoformat(timespec='seconds'),
+         json.dumps(audit_result, ensure_ascii=False),
+         *derivadas.values()],
+    )
+    if cursor.rowcount == 0:
+        return _id_existente(conn, derivadas['chave_acesso'], derivadas['hash_conteudo'])
+    documento_id = cursor.lastrowid
+
+    itens = audit_result.get('itens')
+    if itens and isinstance(itens, list):
+        conn.executemany(
+            f"INSERT INTO itens (documento_id, sequencia, {', '.join(COLUNAS_ITEM)}, valor_total_centavos) "
+            f"VALUES (?, ?, {', '.join('?' * len(COLUNAS_ITEM))}, ?)",
+            [(documento_id, seq, *(item.get(col) for col in COLUNAS_ITEM), valor_em_centavos(item.get('valor_total')))
+             for seq, item in enumerate(itens, 1) if isinstance(item, dict)],
+        )
+    return documento_id
+
+
+def _id_existente(conn, chave_acesso, hash_conteudo):
+    """Id do documento gravado com a chave de acesso ou o hash do conteúdo informados, ou None."""
+    for coluna, valor in (('chave_acesso', chave_acesso), ('hash_conteudo', hash_conteudo)):
+        if valor:
+            linha = conn.execute(f"SELECT id FROM documentos WHERE {coluna} = ?", (valor,)).fetchone()
+            if linha is not None:
+                return linha[0]
+    return None
+
+
+def buscar_documento(chave_acesso=None, hash_conteudo=None, db_file=DB_DOCUMENTOS):
+    """
+    Retorna o registro da auditoria já gravada para a chave de acesso ou o
+    hash do conteúdo (o que for encontrado primeiro), ou None. Usa os índices únicos.
+    """
+    if not chave_acesso and not hash_conteudo:
+        return None
+    with conectar(db_file) as conn:
+        documento_id = _id_existente(conn, chave_acesso, hash_conteudo)
+        if documento_id is None:
+            return None
+        return json.loads(conn.execute("SELECT dados_json FROM documentos WHERE id = ?", (documento_id,)).fetchone()[0])
+
+
+def identificadores_conhecidos(db_file=DB_DOCUMENTOS):
+    """Retorna (chaves de acesso, hashes de conteúdo) de todos os documentos gravados, como conjuntos."""
+    with conectar(db_file) as conn:
+        chaves = {linha[0] for linha in conn.execute("SELECT chave_acesso FROM documentos WHERE chave_acesso IS NOT NULL")}
+        hashes = {linha[0] for linha in conn.execute("SELECT hash_conteudo FROM documentos WHERE hash_conteudo IS NOT NULL")}
+    return chaves, hashes
+
+
+def salvar_documento(audit_result, db_file=DB_DOCUMENTOS):
+    """Salva um documento auditado e retorna o seu id."""
+    with conectar(db_file) as conn:
+        return _inserir_documento(conn, audit_result)
+
+
+def salvar_documentos(audit_results, db_file=DB_DOCUMENTOS):
+    """Salva vários documentos auditados em uma única transação e retorna os ids."""
+    with conectar(db_file) as conn:
+        return [_inserir_documento(conn, audit_result) for audit_result in audit_results]
+
+
+def atualizar_conclusao(documento_id, conclusao, origem, db_file=DB_DOCUMENTOS):
+    """
+    Substitui a conclusão de um documento já salvo (coluna e registro completo).
+    Retorna False se o documento não existir mais.
+    """
+    with conectar(db_file) as conn:
+        linha = conn.execute("SELECT dados_json FROM documentos WHERE id = ?", (documento_id,)).fetchone()
+        if linha is None:
+            return False
+        dados = json.loads(linha[0])
+        dados['conclusao_analise'] = conclusao
+        dados['conclusao_origem'] = origem
+        conn.execute(f"UPDATE documentos SET conclusao_analise = ?, dados_json = ?, revisao = {PROXIMA_REVISAO} "
+                     "WHERE id = ?",
+                     (conclusao, json.dumps(dados, ensure_ascii=False), documento_id))
+    return True
+
+
+def ler_documentos_em_lotes(tamanho_lote=1000, db_file=DB_DOCUMENTOS):
+    """
+    Percorre os documentos gravados em lotes de até 'tamanho_lote' linhas
+    (id, dados_json), na ordem do id. Cada lote é uma consulta paginada pelo id,
+    sem manter a conexão aberta entre os lotes.
+    """
+    ultimo_id = 0
+    while True:
+        with conectar(db_file) as conn:
+            conn.row_factory = None
+            linhas = conn.execute("SELECT id, dados_json FROM documentos WHERE id > ? ORDER BY id LIMIT ?",
+                                  (ultimo_id, tamanho_lote)).fetchall()
+        if not linhas:
+            return
+        yield linhas
+        ultimo_id = linhas[-1][0]
+
+
+def ncms_distintos(db_file=DB_DOCUMENTOS):
+    """Retorna os NCMs distintos informados nos itens de todos os documentos (usa o índice de itens.ncm)."""
+    with conectar(db_file) as conn:
+        return [linha[0] for linha in conn.execute("SELECT DISTINCT ncm FROM itens WHERE ncm IS NOT NULL AND ncm != ''")]
+
+
+def atualizar_auditorias(atualizacoes, db_file=DB_DOCUMENTOS):
+    """
+    Substitui o resultado da auditoria (status, erros, avisos, conclusão e
+    registro completo) de documentos já salvos, em uma única transação.
+    'atualizacoes' é uma lista de (id, audit_result). Os itens não mudam.
+    Retorna a quantidade de documentos atualizados.
+    """
+    with conectar(db_file) as conn:
+        cursor = conn.executemany(
+            "UPDATE documentos SET status_auditoria = ?, conclusao_analise = ?, erros = ?, avisos = ?, dados_json = ?, "
+            f"revisao = {PROXIMA_REVISAO} WHERE id = ?",
+            [(audit_result.get('status_auditoria'), audit_result.get('conclusao_analise'),
+              _texto_lista(audit_result.get('erros_auditoria', [])), _texto_lista(audit_result.get('avisos_auditoria', [])),
+              json.dumps(audit_result, ensure_ascii=False), documento_id)
+             for documento_id, audit_result in atualizacoes])
+        return cursor.rowcount
+
+
+def listar_documentos(db_file=DB_DOCUMENTOS):
+    """Retorna todos os documentos auditados, na ordem em que foram salvos."""
+    with conectar(db_file) as conn:
+        cursor = conn.execute("SELECT dados_json FROM documentos ORDER BY id")
+        return [json.loads(linha[0]) for linha in cursor]
+
+
+# Colunas do dashboard, na ordem exibida (uma linha por item; documentos sem itens geram uma linha)
+COLUNAS_ITENS_PLANOS = [
+    'status_auditoria', 'numero_nota', 'conclusao_analise', 'data_emissao', 'emitente', 'emitente_cnpj',
+    'destinatario', 'destinatario_cnpj_cpf', 'valor_total_nota', 'tipo_documento', 'formato',
+    'discriminacao_servicos', 'erros', 'avisos', 'item_codigo', 'item_descricao', 'item_ncm',
+    'item_cfop', 'item_valor_total',
+]
+
+CONSULTA_ITENS_PLANOS = """
+SELECT d.status_auditoria, d.numero, d.conclusao_analise, d.data_emissao, d.emitente_razao_social,
+       d.emitente_cnpj, d.destinatario_razao_social, d.destinatario_cnpj_cpf,
+       d.valor_total_nota_centavos, d.tipo_documento, d.formato, d.discriminacao_servicos,
+       d.erros, d.avisos, i.codigo, i.descricao, i.ncm, i.cfop,
+       CASE WHEN i.id IS NULL THEN d.valor_total_nota_centavos ELSE i.valor_total_centavos END,
+       d.id
+FROM documentos d
+LEFT JOIN itens i ON i.documento_id = d.id
+WHERE {documentos}
+ORDER BY d.revisao, i.sequencia
+"""
+
+
+def ler_itens_planos(desde_revisao=0, db_file=DB_DOCUMENTOS, limite_documentos=None):
+    """
+    Retorna as linhas achatadas (documento x item) dos documentos gravados ou
+    alterados depois da revisão 'desde_revisao', com os valores em centavos, e
+    a maior revisão lida. Com 'limite_documentos', lê só os próximos documentos
+    (leitura em partes). Cada linha segue COLUNAS_ITENS_PLANOS, seguida do id
+    do documento; um documento alterado volta com o mesmo id.
+    Retorna (linhas, ultima_revisao).
+    """
+    with conectar(db_file) as conn:
+        conn.row_factory = None
+        if limite_documentos:
+            ultima_revisao = conn.execute(
+                "SELECT MAX(revisao) FROM (SELECT revisao FROM documentos WHERE revisao > ? ORDER BY revisao LIMIT ?)",
+                (desde_revisao, limite_documentos)).fetchone()[0]
+        else:
+            ultima_revisao = conn.execute("SELECT MAX(revisao) FROM documentos").fetchone()[0]
+        if ultima_revisao is None or ultima_revisao <= desde_revisao:
+            return [], desde_revisao
+        # Documentos alterados entre as duas consultas ficam com revisão maior: vêm na próxima leitura
+        linhas = conn.execute(CONSULTA_ITENS_PLANOS.format(documentos="d.revisao > ? AND d.revisao <= ?"),
+                              (desde_revisao, ultima_revisao)).fetchall()
+    return linhas, ultima_revisao
+
+
+# --- Consultas do dashboard (filtros, ordenação, paginação e agregações) ---
+
+# Colunas do dashboard que podem ser usadas para ordenar: {coluna: expressão SQL}
+ORDENACOES = {
+    'data_emissao': 'd.data_emissao_dia',
+    'numero_nota': 'd.numero',
+    'emitente': 'd.emitente_razao_social',
+    'status_auditoria': 'd.status_auditoria',
+    'valor_total_nota': 'd.valor_total_nota_centavos',
+    'item_valor_total': 'item_valor_total_centavos',
+}
+
+# Agrupamentos: {nome: expressão SQL do grupo}. O emitente é agrupado pelo CNPJ
+# só com dígitos (o mesmo fornecedor com o CNPJ gravado com e sem pontuação)
+AGRUPAMENTOS = {
+    'status': 'd.status_auditoria',
+    'emitente': 'COALESCE(d.emitente_cnpj_digitos, d.emitente_razao_social)',
+    'mes': 'substr(d.data_emissao_dia, 1, 7)',
+}
+# Rótulo exibido de cada grupo, quando não é o próprio grupo
+ROTULOS_AGRUPAMENTOS = {
+    'emitente': 'COALESCE(MAX(d.emitente_razao_social), {grupo})',
+}
+
+
+def _filtros_sql(filtros):
+    """
+    Traduz os filtros do dashboard em condições SQL sobre documentos ('d') e itens ('i').
+    Filtros aceitos: data_inicio e data_fim (AAAA-MM-DD), emitente_cnpj,
+    status (lista), cfop e ncm (prefixo). Retorna (condicoes_documento, condicoes_item, parametros).
+    """
+    filtros = filtros or {}
+    cond_doc, cond_item, params_doc, params_item = [], [], [], []
+    if filtros.get('data_inicio'):
+        cond_doc.append("d.data_emissao_dia >= ?")
+        params_doc.append(str(filtros['data_inicio']))
+    if filtros.get('data_fim'):
+        cond_doc.append("d.data_emissao_dia <= ?")
+        params_doc.append(str(filtros['data_fim']))
+    if filtros.get('emitente_cnpj'):
+        cond_doc.append("d.emitente_cnpj_digitos = ?")
+        params_doc.append(somente_digitos(filtros['emitente_cnpj']))
+    if filtros.get('status'):
+        cond_doc.append(f"d.status_auditoria IN ({', '.join('?' * len(filtros['status']))})")
+        params_doc.extend(filtros['status'])
+    if filtros.get('cfop'):
+        cond_item.append("i.cfop = ?")
+        params_item.append(str(filtros['cfop']).strip())
+    if filtros.get('ncm'):
+        # GLOB com prefixo numérico aproveita o índice de itens.ncm
+        cond_item.append("i.ncm GLOB ?")
+        params_item.append(''.join(filter(str.isdigit, filtros['ncm'])) + '*')
+    return cond_doc, cond_item, params_doc + params_item
+
+
+def consultar_itens_planos(filtros=None, ordenar_por='data_emissao', decrescente=True,
+                           pagina=1, tamanho_pagina=50, db_file=DB_DOCUMENTOS):
+    """
+    Retorna uma página das linhas achatadas do dashboard que atendem aos filtros,
+    já ordenadas, e o total de linhas. Apenas a página pedida é lida do banco.
+    Cada linha segue COLUNAS_ITENS_PLANOS, seguida do id do documento.
+    Retorna (linhas, total).
+    """
+    cond_doc, cond_item, params = _filtros_sql(filtros)
+    where = ' AND '.join(cond_doc + cond_item) or '1'
+    join = 'JOIN' if cond_item else 'LEFT JOIN'
+    ordem = ORDENACOES.get(ordenar_por, ORDENACOES['data_emissao'])
+    direcao = 'DESC' if decrescente else 'ASC'
+    consulta = f"""
+        SELECT d.status_auditoria, d.numero, d.conclusao_analise, d.data_emissao, d.emitente_razao_social,
+               d.emitente_cnpj, d.destinatario_razao_social, d.destinatario_cnpj_cpf,
+               d.valor_total_nota_centavos, d.tipo_documento, d.formato, d.discriminacao_servicos,
+               d.erros, d.avisos, i.codigo, i.descricao, i.ncm, i.cfop,
+               CASE WHEN i.id IS NULL THEN d.valor_total_nota_centavos ELSE i.valor_total_centavos END
+                   AS item_valor_total_centavos,
+               d.id
+        FROM documentos d
+        {join} itens i ON i.documento_id = d.id
+        WHERE {where}
+        ORDER BY {ordem} {direcao}, d.id {direcao}, i.sequencia
+        LIMIT ? OFFSET ?"""
+    with conectar(db_file) as conn:
+        conn.row_factory = None
+        total = conn.execute(
+            f"SELECT COUNT(*) FROM documentos d {join} itens i ON i.documento_id = d.id WHERE {where}",
+            params).fetchone()[0]
+        linhas = conn.execute(consulta, [*params, tamanho_pagina, (max(pagina, 1) - 1) * tamanho_pagina]).fetchall()
+    return linhas, total
+
+
+def agregar_documentos(agrupar_por, filtros=None, limite=None, db_file=DB_DOCUMENTOS):
+    """
+    Agrega os documentos que atendem aos filtros por 'status', 'emitente' ou 'mes'.
+    Cada documento é contado uma vez, mesmo com vários itens.
+    Retorna uma lista de (grupo, quantidade_documentos, valor_total_centavos).
+    """
+    cond_doc, cond_item, params = _filtros_sql(filtros)
+    if cond_item:
+        cond_doc.append(f"d.id IN (SELECT i.documento_id FROM itens i WHERE {' AND '.join(cond_item)})")
+    where = ' AND '.join(cond_doc) or '1'
+    grupo = AGRUPAMENTOS[agrupar_por]
+    rotulo = ROTULOS_AGRUPAMENTOS.get(agrupar_por, '{grupo}').format(grupo=grupo)
+    ordem = {'mes': 'grupo', 'emitente': 'total DESC'}.get(agrupar_por, 'quantidade DESC')
+    consulta = f"""
+        SELECT {rotulo} AS grupo, COUNT(*) AS quantidade, COALESCE(SUM(d.valor_total_nota_centavos), 0) AS total
+        FROM documentos d
+        WHERE {where}
+        GROUP BY {grupo}
+        ORDER BY {ordem}"""
+    if limite:
+        consulta += f" LIMIT {int(limite)}"
+    with conectar(db_file) as conn:
+        conn.row_factory = None
+        return conn.execute(consulta, params).fetchall()
+
+
+def migrar_json(conn, json_file=JSON_LEGADO):
+    """
+    Importa o antigo 'db_documentos.json' para o banco, uma única vez.
+    Após a importação o arquivo é renomeado para '<nome>.migrado'.
+    Retorna a quantidade de documentos importados.
+    """
+    if not os.path.exists(json_file):
+        return 0
+    if conn.execute("SELECT 1 FROM meta WHERE chave = 'migracao_json'").fetchone():
+        return 0
+
+    try:
+        with open(json_file, 'r', encoding='utf-8') as f:
+            documentos = json.load(f) if os.path.getsize(json_file) > 0 else []
+    except json.JSONDecodeError as e:
+        print(f"Erro ao migrar '{json_file}': arquivo JSON inválido ({e}).")
+        return 0
+
+    documentos = [doc for doc in documentos if isinstance(doc, dict) and doc]
+    with conn:
+        for doc in documentos:
+            _inserir_documento(conn, doc)
+        conn.execute("INSERT INTO meta (chave, valor) VALUES ('migracao_json', ?)",
+                     (datetime.now().isoformat(timespec='seconds'),))
+    os.replace(json_file, json_file + '.migrado')
+    print(f"Migração concluída: {len(documentos)} documentos importados de '{json_file}'.")
+    return len(documentos)
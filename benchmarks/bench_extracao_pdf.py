@@ -0,0 +1,151 @@
+# Arquivo: benchmarks/bench_extracao_pdf.py
+#
+# Mede, por documento, a latência e os tokens enviados ao LLM na extração de PDFs:
+#   - antes: texto de todas as páginas lido em série e enviado inteiro à IA,
+#     pedindo todos os campos;
+#   - depois: texto por página (em paralelo nos PDFs longos), campos detectados
+#     por regras e só os faltantes pedidos à IA, com as páginas que podem contê-los.
+# O LLM é simulado (nenhuma chamada à API): o simulador conta os tokens do prompt
+# e pode aguardar um tempo fixo por chamada (--latencia-llm) para estimar o efeito
+# na latência total. O cache de extrações é desviado para um arquivo temporário.
+#
+# Uso (a partir da raiz do projeto, com OPENAI_API_KEY definida):
+#   python benchmarks/bench_extracao_pdf.py
+#   python benchmarks/bench_extracao_pdf.py --paginas 1 10 40 --latencia-llm 2.5
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+PRIMEIRA_PAGINA = """PREFEITURA MUNICIPAL DE SÃO PAULO
+NOTA FISCAL ELETRÔNICA DE SERVIÇOS - NFS-e
+Número da NFS-e: {numero}
+Data e Hora de Emissão: 10/05/2024 10:00:00
+Código de Verificação: AB12-CD34
+
+PRESTADOR DE SERVIÇOS
+Razão Social: Prestadora de Serviços Ltda
+CNPJ: 11.222.333/0001-81
+Inscrição Municipal: 1.234.567-8
+
+TOMADOR DE SERVIÇOS
+Razão Social: Fulano de Tal
+CPF/CNPJ: 529.982.247-25
+
+Discriminação dos Serviços
+Suporte técnico em informática e manutenção de sistemas
+referente ao mês de maio de 2024.
+
+VALOR TOTAL DA NOTA = R$ 1.500,00
+"""
+
+PAGINA_ANEXO = """RELATÓRIO ANEXO - PÁGINA {pagina}
+Detalhamento de atendimentos realizados no período.
+""" + "\n".join(f"Atendimento {{pagina}}.{i}: chamado aberto, analisado e encerrado pela equipe." for i in range(40))
+
+
+def gerar_pdf(destino, paginas, numero='42', sem_rotulos=False):
+    """Gera uma NFS-e em PDF com a primeira página padrão e páginas de anexo."""
+    import fitz
+
+    doc = fitz.open()
+    texto = PRIMEIRA_PAGINA.format(numero=numero)
+    if sem_rotulos:
+        # Layout sem os rótulos reconhecidos pelas regras: os campos ficam para a IA
+        texto = texto.replace('Número da NFS-e:', 'Nota').replace('Discriminação dos Serviços', 'Descrição')
+    for i in range(paginas):
+        pagina = doc.new_page()
+        conteudo = texto if i == 0 else PAGINA_ANEXO.format(pagina=i + 1)
+        pagina.insert_textbox(fitz.Rect(36, 36, 560, 806), conteudo, fontsize=8)
+    doc.save(destino)
+
+
+def _contador_tokens():
+    """Conta tokens com o tokenizador do modelo, se disponível; senão estima (4 caracteres por token)."""
+    try:
+        import tiktoken
+        codificador = tiktoken.get_encoding('cl100k_base')
+        return (lambda texto: len(codificador.encode(texto))), False
+    except Exception:
+        return (lambda texto: len(texto) // 4), True
+
+
+class LLMSimulado:
+    """Substitui o LLM: registra os tokens de cada prompt e responde um JSON fixo."""
+
+    def __init__(self, contar_tokens, latencia):
+        from langchain_core.runnables import RunnableLambda
+
+        self.contar_tokens = contar_tokens
+        self.latencia = latencia
+        self.chamadas = 0
+        self.tokens = 0
+        self.runnable = RunnableLambda(self._responder)
+
+    def _responder(self, prompt):
+        from langchain_core.messages import AIMessage
+
+        self.chamadas += 1
+        self.tokens += sum(self.contar_tokens(m.content) for m in prompt.to_messages())
+        time.sleep(self.latencia)
+        return AIMessage(content=json.dumps({'numero': '42', 'discriminacao_servicos': 'Suporte técnico'}))
+
+
+def extrair_antes(agente, caminho_arquivo):
+    """Fluxo anterior: texto completo em série e todos os campos pedidos à IA."""
+    import fitz
+
+    with fitz.open(caminho_arquivo) as doc:
+        texto_completo = "".join(page.get_text() for page in doc)
+    return json.loads(agente.extrair_dados_com_ia(texto_completo, agente.get_llm()))
+
+
+def medir(agente, simulador, funcao, caminho_arquivo, repeticoes):
+    import cache_extracao
+
+    cache_extracao.invalidar()
+    funcao(caminho_arquivo)  # aquecimento (imports, pool de processos)
+    simulador.chamadas = simulador.tokens = 0
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        cache_extracao.invalidar()
+        funcao(caminho_arquivo)
+    return {
+        'ms': (time.perf_counter() - inicio) / repeticoes * 1000,
+        'chamadas': simulador.chamadas / repeticoes,
+        'tokens': simulador.tokens / repeticoes,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extração de PDF: texto completo + IA x páginas + regras + IA sob demanda.")
+    parser.add_argument('--paginas', type=int, nargs='*', default=[1, 10, 40], help="Páginas dos PDFs gerados.")
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('--latencia-llm', type=float, default=0.0, help="Segundos simulados por chamada ao LLM.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['AGENTE_FISCAL_CACHE_EXTRACAO'] = os.path.join(tmp, 'cache.db')
+        import agente_fiscal_langchain as agente
+
+        contar_tokens, estimado = _contador_tokens()
+        simulador = LLMSimulado(contar_tokens, args.latencia_llm)
+        agente.llm = simulador.runnable
+
+        print(f"{'documento':<22} {'modo':>7} {'latência (ms)':>14} {'chamadas IA':>12} {'tokens':>8}")
+        for paginas in args.paginas:
+            for sem_rotulos in (False, True):
+                caminho = os.path.join(tmp, f'nfse_{paginas}_{int(sem_rotulos)}.pdf')
+                gerar_pdf(caminho, paginas, sem_rotulos=sem_rotulos)
+                nome = f"{paginas} pág.{' sem rótulos' if sem_rotulos else ''}"
+                for modo, funcao in (('antes', lambda c: extrair_antes(agente, c)), ('depois', agente.ler_dados_pdf)):
+                    r = medir(agente, simulador, funcao, caminho, args.repeticoes)
+                    print(f"{nome:<22} {modo:>7} {r['ms']:>14.1f} {r['chamadas']:>12.1f} {r['tokens']:>8.0f}")
+        if estimado:
+            print("\nTokens estimados (4 caracteres por token): tokenizador do tiktoken indisponível.")
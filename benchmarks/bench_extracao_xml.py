@@ -0,0 +1,227 @@
+# Arquivo: benchmarks/bench_extracao_xml.py
+#
+# Compara a extração de XML com árvore completa (ler_dados_xml) com a extração
+# em streaming (ler_dados_xml_streaming):
+#   1. diferencial: as duas funções devem produzir exatamente a mesma saída para
+#      um conjunto de documentos (NFe, nfeProc, lote com várias NFes, CTe 3.00/4.00,
+#      NFS-e ABRASF 1.00/2.0x, casos sem namespace, campos vazios, comentários e
+#      XML mal formatado);
+#   2. custo por item: busca campo a campo com find e dicionário de namespaces
+#      (como era a extração antes dos esquemas) x XPath compilado do esquema
+#      (esquemas_xml.py), para os mesmos campos e para o bloco de itens completo;
+#   3. desempenho: tempo e pico de memória (RSS) de cada modo em NFes com
+#      muitos itens, cada modo em um subprocesso próprio.
+#
+# Uso (a partir da raiz do projeto, com OPENAI_API_KEY definida):
+#   python benchmarks/bench_extracao_xml.py
+#   python benchmarks/bench_extracao_xml.py --itens 1000 20000 100000
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+NS_NFE = 'http://www.portalfiscal.inf.br/nfe'
+NS_CTE = 'http://www.portalfiscal.inf.br/cte'
+NS_NFSE = 'http://www.abrasf.org.br/nfse.xsd'
+
+def _rss_pico_mb():
+    """Pico de memória residente do processo atual, em MB (Linux reporta em KB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _det(i):
+    ncm = ('01012100', '84713012', '22030000')[i % 3]
+    return (f'<det nItem="{i + 1}"><prod><cProd>P{i}</cProd><xProd>Produto {i}</xProd><NCM>{ncm}</NCM>'
+            f'<CFOP>5102</CFOP><vProd>10.00</vProd></prod><imposto><IPI><IPITrib><pIPI>0.00</pIPI>'
+            f'</IPITrib></IPI></imposto></det>')
+
+def inf_nfe(itens, numero='123', cnpj='11222333000181'):
+    dets = ''.join(_det(i) for i in range(itens))
+    return (f'<infNFe Id="NFe3524051122233300018155001{numero:0>9}1000001234" versao="4.00">'
+            f'<ide><nNF>{numero}</nNF><dhEmi>2024-05-10T10:00:00-03:00</dhEmi></ide>'
+            f'<emit><CNPJ>{cnpj}</CNPJ><xNome>Emitente SA</xNome></emit>'
+            f'<dest><CPF>52998224725</CPF><xNome>Fulano</xNome></dest>{dets}'
+            f'<total><ICMSTot><vNF>{10 * itens:.2f}</vNF></ICMSTot></total></infNFe>')
+
+def gerar_nfe(destino, itens):
+    """Grava um nfeProc com uma NFe de 'itens' itens, escrevendo os det em blocos."""
+    with open(destino, 'w', encoding='utf-8') as f:
+        f.write(f'<?xml version="1.0" encoding="UTF-8"?><nfeProc xmlns="{NS_NFE}" versao="4.00"><NFe>')
+        f.write('<infNFe Id="NFe35240511222333000181550010000001231000001234" versao="4.00">'
+                '<ide><nNF>123</nNF><dhEmi>2024-05-10T10:00:00-03:00</dhEmi></ide>'
+                '<emit><CNPJ>11222333000181</CNPJ><xNome>Emitente SA</xNome></emit>'
+                '<dest><CPF>52998224725</CPF><xNome>Fulano</xNome></dest>')
+        for inicio in range(0, itens, 1000):
+            f.write(''.join(_det(i) for i in range(inicio, min(inicio + 1000, itens))))
+        f.write(f'<total><ICMSTot><vNF>{10 * itens:.2f}</vNF></ICMSTot></total></infNFe></NFe></nfeProc>')
+
+def casos_diferenciais():
+    """Documentos (nome, conteúdo) usados na comparação das duas extrações."""
+    xml = '<?xml version="1.0" encoding="UTF-8"?>'
+    nfe = inf_nfe(3)
+    yield 'nfe', f'{xml}<NFe xmlns="{NS_NFE}">{nfe}</NFe>'
+    yield 'nfeProc', f'{xml}<nfeProc xmlns="{NS_NFE}" versao="4.00"><NFe>{nfe}</NFe><protNFe/></nfeProc>'
+    yield 'lote', (f'{xml}<enviNFe xmlns="{NS_NFE}" versao="4.00"><idLote>1</idLote>'
+                   + ''.join(f'<NFe>{inf_nfe(2, numero=str(n), cnpj="11444777000161")}</NFe>' for n in (7, 8, 9))
+                   + '</enviNFe>')
+    yield 'sem_itens', f'{xml}<NFe xmlns="{NS_NFE}">{inf_nfe(0)}</NFe>'
+    yield 'campos_vazios', f'<NFe xmlns="{NS_NFE}"><infNFe><ide><nNF> </nNF><nCT>9</nCT></ide><emit><CNPJ>1</CNPJ><xNome/></emit><det><prod/></det><det/></infNFe></NFe>'
+    yield 'comentarios', f'<NFe xmlns="{NS_NFE}"><!-- a --><infNFe><ide><nNF>1<!-- b -->2</nNF></ide><emit><CNPJ>1</CNPJ></emit></infNFe></NFe>'
+    yield 'ipi_repetido', (f'<NFe xmlns="{NS_NFE}"><infNFe><ide><nNF>1</nNF></ide><emit><CNPJ>1</CNPJ></emit><det><prod><NCM>1</NCM><NCM>2</NCM></prod>'
+                           f'<imposto><IPI><IPITrib><vIPI>0</vIPI></IPITrib><IPITrib><pIPI>5</pIPI></IPITrib></IPI></imposto><imposto/></det></infNFe></NFe>')
+    yield 'dest_cnpj', nfe.join((f'<NFe xmlns="{NS_NFE}">', '</NFe>')).replace('<CPF>52998224725</CPF>', '<CNPJ>11444777000161</CNPJ>')
+    yield 'outro_namespace', f'<NFe xmlns="{NS_NFE}" xmlns:x="urn:x"><x:ide><x:nNF>5</x:nNF></x:ide>{nfe}</NFe>'
+    yield 'cte', (f'{xml}<cteProc xmlns="{NS_CTE}" versao="4.00"><CTe><infCte versao="4.00"><ide><nCT>321</nCT>'
+                  f'<dhEmi>2024-05-10T10:00:00-03:00</dhEmi></ide><emit><CNPJ>11222333000181</CNPJ><xNome>Transp</xNome></emit>'
+                  f'<dest><CNPJ>11444777000161</CNPJ><xNome>Dest</xNome></dest></infCte></CTe></cteProc>')
+    yield 'cte300', (f'<CTe xmlns="{NS_CTE}"><infCte Id="CTe35240511222333000181570010000003211000003210" versao="3.00">'
+                     f'<ide><CFOP>5353</CFOP><natOp>Frete</natOp><mod>57</mod><serie>1</serie><nCT>321</nCT><dhEmi>2024-05-10T10:00:00-03:00</dhEmi>'
+                     f'<modal>01</modal><tpServ>0</tpServ><UFIni>SP</UFIni><UFFim>RJ</UFFim><toma3><toma>0</toma></toma3></ide>'
+                     f'<emit><CNPJ>11222333000181</CNPJ><IE>1</IE><xNome>Transp</xNome><enderEmit><UF>SP</UF></enderEmit></emit>'
+                     f'<rem><CNPJ>11444777000161</CNPJ><xNome>Rem</xNome></rem><dest><CPF>52998224725</CPF><xNome>Dest</xNome></dest>'
+                     f'<vPrest><vTPrest>150.00</vTPrest><vRec>150.00</vRec></vPrest><imp><ICMS><ICMS00><CST>00</CST><vBC>150.00</vBC>'
+                     f'<pICMS>12.00</pICMS><vICMS>18.00</vICMS></ICMS00></ICMS></imp><infCTeNorm><infCarga><vCarga>1000.00</vCarga>'
+                     f'<proPred>Diversos</proPred></infCarga><infDoc><infNFe><chave>35240511222333000181550010000001231000001234</chave>'
+                     f'</infNFe></infDoc></infCTeNorm></infCte></CTe>')
+    yield 'nfse_abrasf_v1', (f'<CompNfse xmlns="{NS_NFSE}"><Nfse><InfNfse><Numero>42</Numero><CodigoVerificacao>AB12</CodigoVerificacao>'
+                             f'<DataEmissao>2024-05-10T10:00:00</DataEmissao><Servico><Valores><ValorServicos>500.00</ValorServicos>'
+                             f'<ValorIss>25.00</ValorIss><Aliquota>0.05</Aliquota></Valores><ItemListaServico>1.07</ItemListaServico>'
+                             f'<Discriminacao>Suporte técnico</Discriminacao><CodigoMunicipio>3550308</CodigoMunicipio></Servico>'
+                             f'<PrestadorServico><IdentificacaoPrestador><Cnpj>11222333000181</Cnpj><InscricaoMunicipal>123</InscricaoMunicipal>'
+                             f'</IdentificacaoPrestador><RazaoSocial>Prestador Ltda</RazaoSocial></PrestadorServico><TomadorServico>'
+                             f'<IdentificacaoTomador><CpfCnpj><Cpf>52998224725</Cpf></CpfCnpj></IdentificacaoTomador><RazaoSocial>Fulano'
+                             f'</RazaoSocial></TomadorServico></InfNfse></Nfse></CompNfse>')
+    nfse_v2 = (f'<CompNfse><Nfse versao="2.02"><InfNfse><Numero>{{numero}}</Numero><CodigoVerificacao>CD34</CodigoVerificacao>'
+               f'<DataEmissao>2024-06-01T09:00:00</DataEmissao><ValoresNfse><ValorIss>10.00</ValorIss><Aliquota>2.00</Aliquota>'
+               f'</ValoresNfse><PrestadorServico><RazaoSocial>Prestador Ltda</RazaoSocial></PrestadorServico>'
+               f'<DeclaracaoPrestacaoServico><InfDeclaracaoPrestacaoServico><Competencia>2024-06-01</Competencia><Servico><Valores>'
+               f'<ValorServicos>500.00</ValorServicos></Valores><ItemListaServico>01.07</ItemListaServico><Discriminacao>Licença'
+               f'</Discriminacao></Servico><Prestador><CpfCnpj><Cnpj>11222333000181</Cnpj></CpfCnpj></Prestador><Tomador>'
+               f'<IdentificacaoTomador><CpfCnpj><Cnpj>11444777000161</Cnpj></CpfCnpj></IdentificacaoTomador><RazaoSocial>Cliente SA'
+               f'</RazaoSocial></Tomador></InfDeclaracaoPrestacaoServico></DeclaracaoPrestacaoServico></InfNfse></Nfse></CompNfse>')
+    yield 'nfse_abrasf_v2', nfse_v2.format(numero=43).replace('<CompNfse>', f'<CompNfse xmlns="{NS_NFSE}">')
+    yield 'nfse_lote', (f'<ConsultarNfseResposta xmlns="{NS_NFSE}"><ListaNfse>'
+                        + ''.join(nfse_v2.format(numero=n) for n in (44, 45)) + '</ListaNfse></ConsultarNfseResposta>')
+    yield 'sem_namespace', f'<NFe>{nfe}</NFe>'
+    yield 'mal_formatado', f'<NFe xmlns="{NS_NFE}"><infNFe><ide>'
+    yield 'vazio', ''
+
+def verificar_paridade(pasta):
+    """Executa as duas extrações sobre os casos diferenciais. Retorna a lista de divergências."""
+    from agente_fiscal_langchain import ler_dados_xml, ler_dados_xml_streaming
+
+    divergencias = []
+    for nome, conteudo in casos_diferenciais():
+        caminho = os.path.join(pasta, f'{nome}.xml')
+        with open(caminho, 'w', encoding='utf-8') as f:
+            f.write(conteudo)
+        arvore, streaming = ler_dados_xml(caminho), ler_dados_xml_streaming(caminho)
+        # Mensagens de erro de sintaxe do libxml2 variam com o modo de leitura; compara só o tipo
+        if 'erro' in arvore and 'erro' in streaming:
+            arvore, streaming = arvore['erro'].split(':')[0], streaming['erro'].split(':')[0]
+        if arvore != streaming:
+            divergencias.append((nome, arvore, streaming))
+    return divergencias
+
+DET_COMPLETO = (
+    '<det nItem="1"><prod><cProd>P1</cProd><cEAN/><xProd>Produto 1</xProd><NCM>01012100</NCM><CFOP>5102</CFOP>'
+    '<uCom>UN</uCom><qCom>1</qCom><vUnCom>10</vUnCom><vProd>10.00</vProd></prod><imposto><ICMS><ICMS00><orig>0</orig>'
+    '<CST>00</CST><vBC>10</vBC><pICMS>18</pICMS><vICMS>1.8</vICMS></ICMS00></ICMS><IPI><cEnq>999</cEnq><IPITrib>'
+    '<CST>50</CST><pIPI>0.00</pIPI><vIPI>0</vIPI></IPITrib></IPI><PIS><PISAliq><CST>01</CST><pPIS>1.65</pPIS>'
+    '<vPIS>0.1</vPIS></PISAliq></PIS><COFINS><COFINSAliq><CST>01</CST><pCOFINS>7.6</pCOFINS><vCOFINS>0.7</vCOFINS>'
+    '</COFINSAliq></COFINS></imposto></det>'
+)
+
+def medir_custo_por_item(repeticoes=20000):
+    """Retorna [(descrição, campos, microssegundos por item)] para um det completo."""
+    import timeit
+    from lxml import etree
+    from esquemas_xml import ESQUEMAS, NS_NFE as NS, _compilar_bloco, extrair_campos
+
+    det = etree.fromstring(DET_COMPLETO.replace('<det ', f'<det xmlns="{NS}" ', 1))
+    campos = ESQUEMAS['NFE']['itens'][1]
+    legados = {nome: campos[nome] for nome in ('codigo', 'descricao', 'ncm', 'cfop', 'valor_total', 'pIPI')}
+
+    def busca_por_campo(caminhos):
+        ns = {'doc': NS}
+        def get_text(element, path):
+            node = element.find(path, ns) if element is not None else None
+            if node is not None and node.text is not None:
+                return node.text.strip()
+            return None
+        # Caminhos com alternativas ('a | b') não são suportados por find: usa a primeira
+        return {nome: get_text(det, caminho.split(' | ')[0]) for nome, caminho in caminhos.items()}
+
+    resultados = []
+    for descricao, caminhos in (('campos originais', legados), ('bloco completo', campos)):
+        nomes, xpath = _compilar_bloco(caminhos, NS)
+        for modo, funcao in (('find por campo', lambda: busca_por_campo(caminhos)),
+                             ('XPath do esquema', lambda: extrair_campos(nomes, xpath, det))):
+            segundos = timeit.timeit(funcao, number=repeticoes)
+            resultados.append((f'{descricao} / {modo}', len(caminhos), segundos / repeticoes * 1e6))
+    return resultados
+
+def _executar_modo(modo, caminho):
+    """Extrai o arquivo no modo informado e imprime as métricas em JSON."""
+    from agente_fiscal_langchain import ler_dados_xml, ler_dados_xml_streaming
+
+    extrair = ler_dados_xml_streaming if modo == 'streaming' else ler_dados_xml
+    rss_inicial = _rss_pico_mb()
+    inicio = time.perf_counter()
+    dados = extrair(caminho)
+    duracao = time.perf_counter() - inicio
+    print(json.dumps({
+        'modo': modo,
+        'segundos': round(duracao, 3),
+        'rss_pico_mb': round(_rss_pico_mb(), 1),
+        'rss_incremento_mb': round(_rss_pico_mb() - rss_inicial, 1),
+        'itens': len(dados.get('itens', [])),
+    }))
+
+def medir(modo, caminho):
+    saida = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--filho', modo, caminho],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(saida.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extração de XML: árvore completa x streaming (iterparse).")
+    parser.add_argument('--itens', type=int, nargs='*', default=[1000, 20000, 100000],
+                        help="Quantidades de itens (det) das NFes geradas para a medição.")
+    parser.add_argument('--filho', nargs=2, metavar=('MODO', 'ARQUIVO'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.filho:
+        _executar_modo(*args.filho)
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        divergencias = verificar_paridade(tmp)
+        for nome, arvore, streaming in divergencias:
+            print(f"DIVERGÊNCIA em '{nome}':\n  árvore:    {arvore}\n  streaming: {streaming}")
+        print(f"Paridade: {'OK' if not divergencias else f'{len(divergencias)} divergência(s)'}\n")
+
+        print(f"{'extração de um item':<40} {'campos':>6} {'µs/item':>8}")
+        for descricao, campos, microssegundos in medir_custo_por_item():
+            print(f"{descricao:<40} {campos:>6} {microssegundos:>8.1f}")
+        print()
+
+        print(f"{'itens':>8} {'MB':>7} {'modo':>10} {'tempo (s)':>10} {'RSS pico (MB)':>14} {'incremento (MB)':>16}")
+        for itens in args.itens:
+            caminho = os.path.join(tmp, f'nfe_{itens}.xml')
+            gerar_nfe(caminho, itens)
+            tamanho = os.path.getsize(caminho) / 2 ** 20
+            for modo in ('arvore', 'streaming'):
+                r = medir(modo, caminho)
+                print(f"{r['itens']:>8} {tamanho:>7.1f} {r['modo']:>10} {r['segundos']:>10} "
+                      f"{r['rss_pico_mb']:>14} {r['rss_incremento_mb']:>16}")
+
+    sys.exit(1 if divergencias else 0)
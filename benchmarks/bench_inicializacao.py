@@ -0,0 +1,98 @@
+# Arquivo: benchmarks/bench_inicializacao.py
+#
+# Mede o tempo de inicialização, cada cenário em um processo Python novo
+# (importações a frio, como em um worker recém-criado do Streamlit):
+#   - app (dashboard): módulos importados pelo app.py no topo (exceto o próprio
+#     Streamlit) e uma consulta do dashboard, sem usar o agente;
+#   - XML: importação do agente e auditoria de uma NFe, sem LLM;
+#   - primeiro PDF: criação do agente (LangChain, ChatOpenAI e ferramentas), o
+#     que só acontece quando um PDF é analisado;
+#   - antes (tudo no import): o custo que o app pagava a cada processo, com o
+#     agente e a sincronização da TIPI carregados já na importação.
+# Também lista quais módulos pesados cada cenário acabou carregando.
+#
+# Uso (a partir da raiz do projeto):
+#   python benchmarks/bench_inicializacao.py
+#   python benchmarks/bench_inicializacao.py --repeticoes 7
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULOS_PESADOS = ['langchain', 'langchain_openai', 'openai', 'fitz', 'pandas', 'requests', 'bs4', 'lxml']
+
+APP = """
+import agente_fiscal_langchain, dados_dashboard, servico_auditoria, cache_extracao, cache_llm
+dados_dashboard.consultar_pagina(dados_dashboard.ItensPlanos(), tamanho_pagina=50)
+"""
+
+XML = """
+import sys
+sys.path.insert(0, 'benchmarks')
+from bench_extracao_xml import gerar_nfe
+gerar_nfe(CAMINHO_NFE, 5)
+import agente_fiscal_langchain
+agente_fiscal_langchain.auditar_dados_fiscais(agente_fiscal_langchain.ler_dados_xml_streaming(CAMINHO_NFE))
+"""
+
+PRIMEIRO_PDF = """
+import agente_fiscal_langchain
+agente_fiscal_langchain.get_agent_executor()
+"""
+
+ANTES = """
+import agente_fiscal_langchain
+agente_fiscal_langchain.get_agent_executor()
+import extracao_pdf, fitz, dados_dashboard, tipi.sincronizartipi
+"""
+
+CENARIOS = [
+    ('app (dashboard)', APP),
+    ('XML (sem LLM)', XML),
+    ('primeiro PDF (agente)', PRIMEIRO_PDF),
+    ('antes (tudo no import)', ANTES),
+]
+
+MEDIDOR = """
+import json, sys, time, warnings
+warnings.simplefilter('ignore')
+CAMINHO_NFE = {caminho_nfe!r}
+inicio = time.perf_counter()
+{codigo}
+duracao = time.perf_counter() - inicio
+print(json.dumps({{'segundos': duracao, 'modulos': [m for m in {modulos!r} if m in sys.modules]}}))
+"""
+
+
+def medir(codigo, diretorio, caminho_nfe):
+    script = MEDIDOR.format(codigo=codigo, modulos=MODULOS_PESADOS, caminho_nfe=caminho_nfe)
+    env = {**os.environ, 'OPENAI_API_KEY': os.environ.get('OPENAI_API_KEY', 'chave-de-teste'),
+           'PYTHONPATH': RAIZ, 'AGENTE_FISCAL_CACHE_LLM': os.path.join(diretorio, 'cache_llm.db'),
+           'AGENTE_FISCAL_CACHE_EXTRACAO': os.path.join(diretorio, 'cache_extracao.db')}
+    saida = subprocess.run([sys.executable, '-c', script], cwd=diretorio, env=env,
+                           capture_output=True, text=True, check=True).stdout
+    return json.loads(saida.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tempo de inicialização a frio por cenário de uso.")
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # O banco da TIPI e os scripts de benchmark são usados a partir do diretório de trabalho
+        os.symlink(os.path.join(RAIZ, 'tipi'), os.path.join(tmp, 'tipi'))
+        os.symlink(os.path.join(RAIZ, 'benchmarks'), os.path.join(tmp, 'benchmarks'))
+        caminho_nfe = os.path.join(tmp, 'nfe.xml')
+
+        print(f"{'cenário':<24} {'mediana (s)':>12} {'mínimo (s)':>11}  módulos pesados carregados")
+        for nome, codigo in CENARIOS:
+            medidas = [medir(codigo, tmp, caminho_nfe) for _ in range(args.repeticoes)]
+            tempos = [m['segundos'] for m in medidas]
+            print(f"{nome:<24} {statistics.median(tempos):>12.3f} {min(tempos):>11.3f}  {', '.join(medidas[-1]['modulos'])}")
@@ -0,0 +1,320 @@
+# Arquivo: benchmarks/bench_ponta_a_ponta.py
+#
+# Suíte de benchmarks sobre um corpus sintético de NFes/CTes (gerar_corpus.py),
+# para acompanhar regressões de desempenho. Etapas medidas:
+#   - extracao_xml: extrair_dados_xml (leitura em streaming + JSON) por documento;
+#   - consultar_ncm: consulta de cada NCM dos itens na Tabela TIPI;
+#   - validacao_documentos: validar_cnpj/validar_cpf dos emitentes e destinatários;
+#   - auditoria: auditar_dados_fiscais (regras) por documento;
+#   - auditoria_llm_simulado: auditoria + conclusão redigida por um modelo de
+#     chat simulado (sem rede), quando há inconsistências a comentar;
+#   - persistencia: salvar_auditoria por documento, em um banco novo;
+#   - dashboard: montagem da tabela achatada de itens (ItensPlanos.atualizar);
+#   - reauditoria: reauditoria de todo o acervo gravado (reauditoria.py), com
+#     um processo no pool e sem mudanças a gravar (leitura, NCMs e regras);
+#   - exportacao_parquet: exportação completa do acervo gravado para Parquet
+#     (exportacao_parquet.py);
+#   - leitura_parquet: leitura da tabela de itens exportada, inteira, como o
+#     BI a lê (compare com 'dashboard');
+#   - ponta_a_ponta: processar_documento_xml (identificação, extração,
+#     auditoria e gravação) por documento, em um banco novo.
+# As etapas de Parquet só rodam por padrão se o pyarrow estiver instalado.
+# Cada etapa roda em um subprocesso próprio, para que o pico de memória (RSS)
+# de uma não contamine as outras. Para cada etapa são reportados docs/s,
+# operações/s, latência p50/p99 por operação e o pico de RSS.
+# O resultado pode ser salvo em JSON (--salvar) e comparado com uma execução
+# anterior (--comparar): variações piores que a tolerância são apontadas e o
+# script termina com código 1.
+#
+# Uso (a partir da raiz do projeto):
+#   python benchmarks/bench_ponta_a_ponta.py --salvar baseline.json
+#   python benchmarks/bench_ponta_a_ponta.py --comparar baseline.json --tolerancia 15
+#   python benchmarks/bench_ponta_a_ponta.py --documentos 1000 --itens 1 80 --etapas auditoria persistencia
+
+import argparse
+import importlib.util
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from gerar_corpus import MANIFESTO, gerar_corpus
+
+REPETICOES_DASHBOARD = 5
+# Métricas comparadas com a linha de base: (campo, True se maior é melhor)
+METRICAS_COMPARADAS = (('docs_por_segundo', True), ('p50_ms', False), ('p99_ms', False), ('rss_pico_mb', False))
+
+
+def _rss_pico_mb():
+    """Pico de memória residente do processo atual, em MB (Linux reporta em KB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _percentil(valores, p):
+    """Percentil p (0-100) pelo método do posto mais próximo."""
+    ordenados = sorted(valores)
+    if not ordenados:
+        return 0.0
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def _cronometrar(funcao, argumentos):
+    """Executa funcao(a) para cada argumento e retorna a latência de cada chamada, em segundos."""
+    latencias = []
+    for argumento in argumentos:
+        inicio = time.perf_counter()
+        funcao(argumento)
+        latencias.append(time.perf_counter() - inicio)
+    return latencias
+
+
+def _dados_extraidos(caminhos):
+    from agente_fiscal_langchain import ler_dados_xml_streaming
+
+    return [ler_dados_xml_streaming(caminho) for caminho in caminhos]
+
+
+def _auditorias(caminhos):
+    from agente_fiscal_langchain import auditar_dados_fiscais
+
+    return [auditar_dados_fiscais(dados) for dados in _dados_extraidos(caminhos)]
+
+
+# --- Etapas: cada uma recebe os arquivos do corpus e retorna (latências, documentos) ---
+
+def etapa_extracao_xml(caminhos):
+    from agente_fiscal_langchain import extrair_dados_xml
+
+    return _cronometrar(extrair_dados_xml, caminhos), len(caminhos)
+
+
+def etapa_consultar_ncm(caminhos):
+    from tipi.consultartipi import consultar_ncm
+
+    ncms = [item.get('ncm') for dados in _dados_extraidos(caminhos) for item in dados.get('itens', [])]
+    return _cronometrar(lambda ncm: consultar_ncm(ncm, db_file='tipi/tipi.db'), ncms), len(caminhos)
+
+
+def etapa_validacao_documentos(caminhos):
+    from validacao_documentos import validar_cnpj, validar_cpf
+
+    documentos = []
+    for dados in _dados_extraidos(caminhos):
+        for campo in ('emitente_cnpj', 'destinatario_cnpj_cpf', 'remetente_cnpj_cpf'):
+            if dados.get(campo):
+                documentos.append(dados[campo])
+    validar = lambda documento: validar_cnpj(documento) if len(documento) > 11 else validar_cpf(documento)
+    return _cronometrar(validar, documentos), len(caminhos)
+
+
+def etapa_auditoria(caminhos):
+    from agente_fiscal_langchain import auditar_dados_fiscais
+
+    return _cronometrar(auditar_dados_fiscais, _dados_extraidos(caminhos)), len(caminhos)
+
+
+def etapa_auditoria_llm_simulado(caminhos):
+    from langchain_core.language_models import FakeListChatModel
+
+    from agente_fiscal_langchain import auditar_dados_fiscais
+    from conclusao_auditoria import precisa_enriquecer, redigir_conclusao_ia
+
+    modelo = FakeListChatModel(responses=["Conclusão redigida pelo modelo simulado."])
+
+    def auditar(dados):
+        audit_result = auditar_dados_fiscais(dados)
+        if precisa_enriquecer(audit_result):
+            audit_result['conclusao_analise'] = redigir_conclusao_ia(audit_result, modelo)
+
+    return _cronometrar(auditar, _dados_extraidos(caminhos)), len(caminhos)
+
+
+def etapa_persistencia(caminhos):
+    from persistencia import salvar_auditoria
+
+    return _cronometrar(salvar_auditoria, _auditorias(caminhos)), len(caminhos)
+
+
+def etapa_dashboard(caminhos):
+    from dados_dashboard import ItensPlanos
+    from persistencia import salvar_auditorias
+
+    salvar_auditorias(_auditorias(caminhos))
+    # Cada execução monta a tabela do zero, como um processo novo do app
+    latencias = _cronometrar(lambda _: ItensPlanos().atualizar(), range(REPETICOES_DASHBOARD))
+    return latencias, len(caminhos) * REPETICOES_DASHBOARD
+
+
+def etapa_reauditoria(caminhos):
+    from persistencia import salvar_auditorias
+    from reauditoria import reauditar
+
+    salvar_auditorias(_auditorias(caminhos))
+    return _cronometrar(lambda _: reauditar(processos=1), range(1)), len(caminhos)
+
+
+def etapa_exportacao_parquet(caminhos):
+    from exportacao_parquet import exportar
+    from persistencia import salvar_auditorias
+
+    salvar_auditorias(_auditorias(caminhos))
+    return _cronometrar(lambda _: exportar(completo=True), range(1)), len(caminhos)
+
+
+def etapa_leitura_parquet(caminhos):
+    from exportacao_parquet import exportar, ler_exportacao
+    from persistencia import salvar_auditorias
+
+    salvar_auditorias(_auditorias(caminhos))
+    exportar()
+    latencias = _cronometrar(lambda _: ler_exportacao('itens'), range(REPETICOES_DASHBOARD))
+    return latencias, len(caminhos) * REPETICOES_DASHBOARD
+
+
+def etapa_ponta_a_ponta(caminhos):
+    from agente_fiscal_langchain import processar_documento_xml
+
+    return _cronometrar(processar_documento_xml, caminhos), len(caminhos)
+
+
+ETAPAS = {
+    'extracao_xml': etapa_extracao_xml,
+    'consultar_ncm': etapa_consultar_ncm,
+    'validacao_documentos': etapa_validacao_documentos,
+    'auditoria': etapa_auditoria,
+    'auditoria_llm_simulado': etapa_auditoria_llm_simulado,
+    'persistencia': etapa_persistencia,
+    'dashboard': etapa_dashboard,
+    'reauditoria': etapa_reauditoria,
+    'exportacao_parquet': etapa_exportacao_parquet,
+    'leitura_parquet': etapa_leitura_parquet,
+    'ponta_a_ponta': etapa_ponta_a_ponta,
+}
+ETAPAS_PARQUET = ('exportacao_parquet', 'leitura_parquet')
+
+
+def _executar_etapa(etapa, corpus):
+    """Executa a etapa no processo atual e imprime as métricas em JSON."""
+    import warnings
+    warnings.simplefilter('ignore')
+
+    with open(os.path.join(corpus, MANIFESTO), encoding='utf-8') as f:
+        caminhos = [os.path.join(corpus, nome) for nome in json.load(f)['documentos']]
+    inicio = time.perf_counter()
+    latencias, documentos = ETAPAS[etapa](caminhos)
+    segundos = sum(latencias)
+    print(json.dumps({
+        'etapa': etapa,
+        'documentos': documentos,
+        'operacoes': len(latencias),
+        'segundos': round(segundos, 4),
+        'segundos_com_preparo': round(time.perf_counter() - inicio, 4),
+        'docs_por_segundo': round(documentos / segundos, 1) if segundos else 0.0,
+        'ops_por_segundo': round(len(latencias) / segundos, 1) if segundos else 0.0,
+        'p50_ms': round(_percentil(latencias, 50) * 1000, 4),
+        'p99_ms': round(_percentil(latencias, 99) * 1000, 4),
+        'rss_pico_mb': round(_rss_pico_mb(), 1),
+    }))
+
+
+def medir(etapa, corpus, diretorio):
+    """Executa a etapa em um subprocesso novo, com banco e caches próprios em 'diretorio'."""
+    os.makedirs(diretorio)
+    # A auditoria consulta 'tipi/tipi.db' a partir do diretório de trabalho
+    os.symlink(os.path.join(RAIZ, 'tipi'), os.path.join(diretorio, 'tipi'))
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [RAIZ, os.environ.get('PYTHONPATH')])),
+           'AGENTE_FISCAL_CACHE_LLM': '',
+           'AGENTE_FISCAL_CACHE_EXTRACAO': os.path.join(diretorio, 'cache_extracao.db')}
+    saida = subprocess.run([sys.executable, os.path.abspath(__file__), '--filho', etapa, corpus],
+                           cwd=diretorio, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(saida.strip().splitlines()[-1])
+
+
+def comparar(resultado, linha_de_base, tolerancia):
+    """Compara as etapas com a linha de base. Retorna [(etapa, métrica, antes, depois, variação %)] piores que a tolerância."""
+    regressoes = []
+    print(f"\nComparação com a linha de base de {linha_de_base['gerado_em']} (tolerância: {tolerancia:.0f}%):")
+    print(f"{'etapa':<24} {'métrica':<17} {'antes':>10} {'depois':>10} {'variação':>9}")
+    for etapa, atual in resultado['etapas'].items():
+        anterior = linha_de_base['etapas'].get(etapa)
+        if anterior is None:
+            continue
+        for metrica, maior_melhor in METRICAS_COMPARADAS:
+            antes, depois = anterior[metrica], atual[metrica]
+            if not antes:
+                continue
+            variacao = (depois - antes) / antes * 100
+            pior = -variacao if maior_melhor else variacao
+            marca = '  <-- regressão' if pior > tolerancia else ''
+            if marca:
+                regressoes.append((etapa, metrica, antes, depois, variacao))
+            print(f"{etapa:<24} {metrica:<17} {antes:>10} {depois:>10} {variacao:>+8.1f}%{marca}")
+    return regressoes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Suíte de benchmarks ponta a ponta sobre um corpus sintético de NFes/CTes.")
+    parser.add_argument('--corpus', help="Pasta de um corpus já gerado (padrão: gera um corpus temporário).")
+    parser.add_argument('--documentos', type=int, default=300)
+    parser.add_argument('--itens', type=int, nargs=2, default=[1, 30], metavar=('MIN', 'MAX'))
+    parser.add_argument('--semente', type=int, default=42)
+    com_pyarrow = importlib.util.find_spec('pyarrow') is not None
+    parser.add_argument('--etapas', nargs='*', choices=list(ETAPAS),
+                        default=[etapa for etapa in ETAPAS if com_pyarrow or etapa not in ETAPAS_PARQUET])
+    parser.add_argument('--salvar', help="Grava o resultado em JSON (para usar como linha de base).")
+    parser.add_argument('--comparar', help="JSON de uma execução anterior para comparação.")
+    parser.add_argument('--tolerancia', type=float, default=10.0, help="Piora máxima aceita, em %%.")
+    parser.add_argument('--filho', nargs=2, metavar=('ETAPA', 'CORPUS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.filho:
+        _executar_etapa(*args.filho)
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.abspath(args.corpus) if args.corpus else os.path.join(tmp, 'corpus')
+        if not args.corpus:
+            gerar_corpus(corpus, args.documentos, args.itens, semente=args.semente)
+        with open(os.path.join(corpus, MANIFESTO), encoding='utf-8') as f:
+            parametros = json.load(f)['parametros']
+
+        print(f"Corpus: {parametros['documentos']} documentos, {parametros['itens'][0]}-{parametros['itens'][1]} itens por NFe "
+              f"(semente {parametros['semente']})\n")
+        print(f"{'etapa':<24} {'docs/s':>9} {'ops/s':>11} {'p50 (ms)':>10} {'p99 (ms)':>10} {'RSS pico (MB)':>14}")
+        etapas = {}
+        for etapa in args.etapas:
+            r = medir(etapa, corpus, os.path.join(tmp, etapa))
+            etapas[etapa] = r
+            print(f"{etapa:<24} {r['docs_por_segundo']:>9} {r['ops_por_segundo']:>11} {r['p50_ms']:>10.3f} "
+                  f"{r['p99_ms']:>10.3f} {r['rss_pico_mb']:>14}")
+
+    resultado = {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'processadores': os.cpu_count(),
+        'armazenamento': os.getenv('AGENTE_FISCAL_ARMAZENAMENTO', 'sqlite'),
+        'corpus': parametros,
+        'etapas': etapas,
+    }
+    if args.salvar:
+        with open(args.salvar, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=1)
+        print(f"\nResultado gravado em {args.salvar}")
+
+    regressoes = []
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            regressoes = comparar(resultado, json.load(f), args.tolerancia)
+        print(f"\n{len(regressoes)} regressão(ões) acima da tolerância.")
+    sys.exit(1 if regressoes else 0)
@@ -0,0 +1,132 @@
+# Arquivo: benchmarks/bench_servico_auditoria.py
+#
+# Mede a vazão (documentos/s) do processamento de PDFs que dependem do LLM:
+#   - antes: um documento por vez, com chamadas síncronas (ler_dados_pdf + auditar_e_salvar);
+#   - depois: ServicoAuditoria, com vários documentos em andamento e as chamadas
+#     ao LLM limitadas pelo semáforo (--concorrencia-llm).
+# O LLM é um modelo de chat local simulado: responde após uma latência fixa e,
+# opcionalmente, falha com erro 429 (RateLimitError) em uma fração das chamadas,
+# para exercitar as novas tentativas com espera exponencial.
+# Banco de documentos e cache de extrações ficam em um diretório temporário e
+# são esvaziados antes de cada modo (senão os PDFs seriam reconhecidos como já auditados).
+#
+# Uso (a partir da raiz do projeto, com OPENAI_API_KEY definida):
+#   python benchmarks/bench_servico_auditoria.py
+#   python benchmarks/bench_servico_auditoria.py --documentos 40 --latencia-llm 1.0 --taxa-429 0.2
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(RAIZ))
+sys.path.insert(0, RAIZ)
+
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from openai import RateLimitError
+
+from bench_extracao_pdf import gerar_pdf
+
+
+class ModeloSimulado(BaseChatModel):
+    """Modelo de chat local: latência fixa, erro 429 em uma fração das chamadas e resposta JSON fixa."""
+
+    latencia: float = 0.5
+    taxa_429: float = 0.0
+    chamadas: int = 0
+    erros_429: int = 0
+
+    @property
+    def _llm_type(self):
+        return 'modelo-simulado'
+
+    def _resultado(self):
+        self.chamadas += 1
+        if random.random() < self.taxa_429:
+            self.erros_429 += 1
+            requisicao = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')
+            raise RateLimitError('Rate limit reached', response=httpx.Response(429, request=requisicao), body=None)
+        resposta = json.dumps({'numero': '42', 'discriminacao_servicos': 'Suporte técnico'})
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=resposta))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latencia)
+        return self._resultado()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latencia)
+        return self._resultado()
+
+
+def esvaziar_banco():
+    from banco_documentos import conectar
+
+    with conectar() as conn:
+        conn.execute("DELETE FROM itens")
+        conn.execute("DELETE FROM documentos")
+
+
+def processar_em_serie(agente, caminhos):
+    """Fluxo síncrono: um documento por vez; erros 429 derrubam o documento."""
+    resultados = []
+    for caminho in caminhos:
+        resultados.append(agente.auditar_e_salvar(agente.ler_dados_pdf(caminho, paralelo=False)))
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vazão: processamento em série x ServicoAuditoria (LLM simulado).")
+    parser.add_argument('--documentos', type=int, default=20)
+    parser.add_argument('--latencia-llm', type=float, default=0.5, help="Segundos por chamada ao LLM simulado.")
+    parser.add_argument('--taxa-429', type=float, default=0.1, help="Fração das chamadas que falham com 429.")
+    parser.add_argument('--concorrencia-llm', type=int, nargs='*', default=[1, 4, 16])
+    args = parser.parse_args()
+    random.seed(42)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['AGENTE_FISCAL_CACHE_EXTRACAO'] = os.path.join(tmp, 'cache.db')
+        os.chdir(tmp)
+        import agente_fiscal_langchain as agente
+        import cache_extracao
+        from servico_auditoria import CONCLUIDA, ServicoAuditoria
+
+        # PDFs distintos e sem os rótulos das regras: todos precisam do LLM
+        caminhos = []
+        for i in range(args.documentos):
+            caminhos.append(os.path.join(tmp, f'nfse_{i}.pdf'))
+            gerar_pdf(caminhos[-1], 1, numero=str(1000 + i), sem_rotulos=True)
+
+        print(f"{'modo':<28} {'tempo (s)':>10} {'docs/s':>8} {'ok':>5} {'chamadas':>9} {'429':>5}")
+
+        modelo = ModeloSimulado(latencia=args.latencia_llm, taxa_429=args.taxa_429)
+        agente.llm = modelo
+        cache_extracao.invalidar()
+        inicio = time.perf_counter()
+        resultados = processar_em_serie(agente, caminhos)
+        duracao = time.perf_counter() - inicio
+        ok = sum(r['status'] == 'SUCESSO' and r['auditoria'].get('formato') == 'ocr_ia' for r in resultados)
+        print(f"{'em série (síncrono)':<28} {duracao:>10.2f} {len(caminhos) / duracao:>8.1f} {ok:>5} "
+              f"{modelo.chamadas:>9} {modelo.erros_429:>5}")
+
+        for concorrencia in args.concorrencia_llm:
+            modelo = ModeloSimulado(latencia=args.latencia_llm, taxa_429=args.taxa_429)
+            cache_extracao.invalidar()
+            esvaziar_banco()
+            servico = ServicoAuditoria(llm=modelo, concorrencia_llm=concorrencia, espera_inicial=0.2)
+            inicio = time.perf_counter()
+            ids = [servico.submeter(caminho) for caminho in caminhos]
+            servico.aguardar(ids)
+            duracao = time.perf_counter() - inicio
+            e = servico.estatisticas()
+            servico.encerrar()
+            nome = f"serviço (LLM x{concorrencia})"
+            print(f"{nome:<28} {duracao:>10.2f} {len(caminhos) / duracao:>8.1f} {e[CONCLUIDA]:>5} "
+                  f"{modelo.chamadas:>9} {modelo.erros_429:>5}   pico de chamadas simultâneas: {e['llm_pico']}")
@@ -0,0 +1,98 @@
+# Arquivo: benchmarks/bench_tipi_ingest.py
+#
+# Compara a leitura da TIPI via pandas com a leitura em streaming (openpyxl
+# somente leitura). Cada modo roda em um subprocesso próprio para que o pico
+# de memória (RSS) de um não contamine o outro.
+#
+# Uso (a partir da raiz do projeto):
+#   python benchmarks/bench_tipi_ingest.py
+#   python benchmarks/bench_tipi_ingest.py --repeticoes 1 4 8
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+ARQUIVO_PADRAO = os.path.join(RAIZ, 'tipi', 'tipi_download.xlsx')
+
+def _rss_pico_mb():
+    """Pico de memória residente do processo atual, em MB (Linux reporta em KB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def gerar_planilha_ampliada(excel_file, repeticoes, destino):
+    """Gera uma cópia da planilha com as linhas de dados repetidas N vezes."""
+    from openpyxl import Workbook, load_workbook
+
+    origem = load_workbook(excel_file, read_only=True)
+    novo = Workbook(write_only=True)
+    aba = novo.create_sheet(origem.sheetnames[0])
+    linhas = list(origem.worksheets[0].iter_rows(values_only=True))
+    origem.close()
+
+    cabecalho = next(i for i, row in enumerate(linhas[:20]) if any(str(c).strip() == 'NCM' for c in row))
+    for row in linhas[:cabecalho + 1]:
+        aba.append(row)
+    for _ in range(repeticoes):
+        for row in linhas[cabecalho + 1:]:
+            aba.append(row)
+    novo.save(destino)
+    return len(linhas) - cabecalho - 1
+
+def _executar_modo(modo, excel_file):
+    """Executa um modo de ingestão em um banco temporário e imprime as métricas em JSON."""
+    from contextlib import redirect_stdout
+    from tipi.atualizartipi import processar_tipi_para_sqlite
+
+    rss_inicial = _rss_pico_mb()
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull:
+        db_file = os.path.join(tmp, 'tipi.db')
+        inicio = time.perf_counter()
+        with redirect_stdout(devnull):
+            resumo = processar_tipi_para_sqlite(excel_file, db_file=db_file, streaming=(modo == 'streaming'))
+        duracao = time.perf_counter() - inicio
+
+    print(json.dumps({
+        'modo': modo,
+        'segundos': round(duracao, 3),
+        'rss_pico_mb': round(_rss_pico_mb(), 1),
+        'rss_incremento_mb': round(_rss_pico_mb() - rss_inicial, 1),
+        'registros': resumo['inseridos'] if resumo else None,
+    }))
+
+def medir(modo, excel_file):
+    saida = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--filho', modo, excel_file],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(saida.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark da ingestão da TIPI: pandas x streaming.")
+    parser.add_argument('--arquivo', default=ARQUIVO_PADRAO, help="Planilha XLSX da TIPI.")
+    parser.add_argument('--repeticoes', type=int, nargs='*', default=[1],
+                        help="Fatores de ampliação da planilha (repete as linhas de dados).")
+    parser.add_argument('--filho', nargs=2, metavar=('MODO', 'ARQUIVO'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.filho:
+        _executar_modo(*args.filho)
+        sys.exit(0)
+
+    print(f"{'linhas':>8} {'modo':>10} {'tempo (s)':>10} {'RSS pico (MB)':>14} {'incremento (MB)':>16}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for repeticoes in args.repeticoes:
+            arquivo = args.arquivo
+            if repeticoes > 1:
+                arquivo = os.path.join(tmp, f'tipi_x{repeticoes}.xlsx')
+                gerar_planilha_ampliada(args.arquivo, repeticoes, arquivo)
+            linhas = f"x{repeticoes}"
+            for modo in ('pandas', 'streaming'):
+                r = medir(modo, arquivo)
+                print(f"{linhas:>8} {r['modo']:>10} {r['segundos']:>10} {r['rss_pico_mb']:>14} {r['rss_incremento_mb']:>16}")
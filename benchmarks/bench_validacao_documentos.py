@@ -0,0 +1,160 @@
+# Arquivo: benchmarks/bench_validacao_documentos.py
+#
+# Validação de CNPJ/CPF (validacao_documentos.py):
+#   1. equivalência: para documentos gerados aleatoriamente (válidos, com o
+#      dígito verificador alterado, formatados com pontuação, com letras e
+#      espaços, de tamanhos variados, com dígitos repetidos e com dígitos
+#      Unicode), as funções com cache (validar_cnpj/validar_cpf), a validação
+#      em lote (validar_cnpjs/validar_cpfs/validar_cnpjs_cpfs, com lista,
+#      array NumPy e Series) e as funções originais sem cache devem dar
+#      exatamente o mesmo resultado. Valores que não são texto são inválidos em lote;
+#   2. desempenho: validação de muitos documentos que se repetem (poucos
+#      fornecedores e clientes em muitas notas) com a função original, com a
+#      função com cache e em lote.
+#
+# Uso (a partir da raiz do projeto):
+#   python benchmarks/bench_validacao_documentos.py
+#   python benchmarks/bench_validacao_documentos.py --casos 500000 --documentos 1000000 --distintos 2000
+
+import argparse
+import os
+import random
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(RAIZ))
+sys.path.insert(0, RAIZ)
+
+import numpy as np
+import pandas as pd
+
+from gerar_corpus import gerar_cnpj, gerar_cpf
+from validacao_documentos import validar_cnpj, validar_cnpjs, validar_cnpjs_cpfs, validar_cpf, validar_cpfs
+
+ORIGINAL_CNPJ = validar_cnpj.__wrapped__
+ORIGINAL_CPF = validar_cpf.__wrapped__
+# Dígitos que str.isdigit aceita além de 0-9: arábicos, largura total, sobrescritos e devanágari
+DIGITOS_UNICODE = '٠١٢٣٤٥٦٧٨٩０１２３４５６７８９²³¹०१२'
+
+
+def _formatar_cnpj(cnpj):
+    return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
+
+
+def _formatar_cpf(cpf):
+    return f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}"
+
+
+def gerar_caso(rng):
+    """Um documento aleatório de uma das categorias da verificação de equivalência."""
+    tipo = rng.randrange(10)
+    if tipo == 0:
+        return gerar_cnpj(rng, rng.random() < 0.5)
+    if tipo == 1:
+        return gerar_cpf(rng, rng.random() < 0.5)
+    if tipo == 2:
+        return _formatar_cnpj(gerar_cnpj(rng, rng.random() < 0.5))
+    if tipo == 3:
+        return _formatar_cpf(gerar_cpf(rng, rng.random() < 0.5))
+    if tipo == 4:
+        # Dígitos repetidos (todos iguais), com ou sem pontuação
+        documento = rng.choice('0123456789') * rng.choice((11, 14))
+        return _formatar_cnpj(documento) if len(documento) == 14 and rng.random() < 0.5 else documento
+    if tipo == 5:
+        # Qualquer quantidade de dígitos
+        return ''.join(rng.choice('0123456789') for _ in range(rng.randrange(0, 20)))
+    if tipo == 6:
+        # Documento válido com letras, espaços e símbolos no meio
+        documento = list(gerar_cnpj(rng) if rng.random() < 0.5 else gerar_cpf(rng))
+        for _ in range(rng.randrange(1, 4)):
+            documento.insert(rng.randrange(len(documento) + 1), rng.choice(' abcXYZ-./\t#'))
+        return ''.join(documento)
+    if tipo == 7:
+        # Dígito Unicode no lugar de um dígito ASCII
+        documento = list(gerar_cnpj(rng) if rng.random() < 0.5 else gerar_cpf(rng))
+        documento[rng.randrange(len(documento))] = rng.choice(DIGITOS_UNICODE)
+        return ''.join(documento)
+    if tipo == 8:
+        # Texto curto qualquer, inclusive vazio e não ASCII
+        return ''.join(rng.choice('0123456789 .-/aéç٣²') for _ in range(rng.randrange(0, 16)))
+    # Um dígito a mais ou a menos
+    documento = gerar_cnpj(rng) if rng.random() < 0.5 else gerar_cpf(rng)
+    return documento[:-1] if rng.random() < 0.5 else documento + rng.choice('0123456789')
+
+
+def _regra_auditoria(documento):
+    """Escolha entre CNPJ e CPF como na auditoria do CT-e (mais de 11 dígitos: CNPJ)."""
+    return ORIGINAL_CNPJ(documento) if len(''.join(filter(str.isdigit, documento))) > 11 else ORIGINAL_CPF(documento)
+
+
+def verificar_equivalencia(casos, semente):
+    """Retorna a lista de divergências [(função, documento, esperado, obtido)]."""
+    rng = random.Random(semente)
+    documentos = [gerar_caso(rng) for _ in range(casos)]
+    divergencias = []
+
+    for nome, original, com_cache, em_lote in (('cnpj', ORIGINAL_CNPJ, validar_cnpj, validar_cnpjs),
+                                               ('cpf', ORIGINAL_CPF, validar_cpf, validar_cpfs),
+                                               ('cnpj_cpf', _regra_auditoria, None, validar_cnpjs_cpfs)):
+        esperados = [original(documento) for documento in documentos]
+        if com_cache is not None:
+            # Duas passadas: a segunda é respondida pelo cache
+            for _ in range(2):
+                divergencias += [(nome, d, e, o) for d, e, o in zip(documentos, esperados, map(com_cache, documentos))
+                                 if e != o]
+        indice = pd.RangeIndex(10, 10 + 3 * len(documentos), 3)
+        for formato, entrada in (('lista', documentos), ('array', np.array(documentos, dtype=object)),
+                                 ('series', pd.Series(documentos, index=indice))):
+            obtidos = em_lote(entrada)
+            if formato == 'series' and not obtidos.index.equals(indice):
+                divergencias.append((f'{nome}/{formato}', 'índice', 'preservado', 'alterado'))
+            divergencias += [(f'{nome}/{formato}', d, e, bool(o)) for d, e, o in zip(documentos, esperados, list(obtidos))
+                             if e != bool(o)]
+        # Valores que não são texto são inválidos em lote
+        if list(em_lote([None, float('nan'), 12345678000195, b'11222333000181'])) != [False] * 4:
+            divergencias.append((nome, 'não texto', 'inválidos', 'válido'))
+        if len(em_lote([])) != 0:
+            divergencias.append((nome, 'lista vazia', 'vazio', 'não vazio'))
+    return divergencias
+
+
+def medir_desempenho(documentos, distintos, semente):
+    """Retorna [(modo, segundos)] para validar 'documentos' CNPJs sorteados de 'distintos' diferentes."""
+    rng = random.Random(semente)
+    conjunto = [_formatar_cnpj(gerar_cnpj(rng, rng.random() < 0.9)) if rng.random() < 0.3 else gerar_cnpj(rng)
+                for _ in range(distintos)]
+    amostra = [rng.choice(conjunto) for _ in range(documentos)]
+    serie = pd.Series(amostra)
+
+    resultados = []
+    validar_cnpj.cache_clear()
+    for modo, funcao in (('original (um a um)', lambda: [ORIGINAL_CNPJ(d) for d in amostra]),
+                         ('com cache LRU (um a um)', lambda: [validar_cnpj(d) for d in amostra]),
+                         ('em lote (NumPy, Series)', lambda: validar_cnpjs(serie))):
+        inicio = time.perf_counter()
+        funcao()
+        resultados.append((modo, time.perf_counter() - inicio))
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validação de CNPJ/CPF: equivalência e desempenho (original, cache e lote).")
+    parser.add_argument('--casos', type=int, default=100000, help="Documentos aleatórios na verificação de equivalência.")
+    parser.add_argument('--documentos', type=int, default=500000, help="Documentos validados na medição de desempenho.")
+    parser.add_argument('--distintos', type=int, default=1000, help="CNPJs distintos entre os documentos medidos.")
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+
+    divergencias = verificar_equivalencia(args.casos, args.semente)
+    for funcao, documento, esperado, obtido in divergencias[:20]:
+        print(f"DIVERGÊNCIA em {funcao}: {documento!r}: esperado {esperado}, obtido {obtido}")
+    print(f"Equivalência ({args.casos} casos): {'OK' if not divergencias else f'{len(divergencias)} divergência(s)'}\n")
+
+    print(f"{'modo':<26} {'tempo (s)':>10} {'docs/s':>12}")
+    for modo, segundos in medir_desempenho(args.documentos, args.distintos, args.semente):
+        print(f"{modo:<26} {segundos:>10.3f} {args.documentos / segundos:>12,.0f}")
+    info = validar_cnpj.cache_info()
+    print(f"\nCache LRU: {info.hits} acertos, {info.misses} falhas, {info.currsize} de {info.maxsize} entradas")
+
+    sys.exit(1 if divergencias else 0)
@@ -0,0 +1,190 @@
+# Arquivo: benchmarks/gerar_corpus.py
+#
+# Gera um corpus sintético de documentos fiscais para os benchmarks:
+#   - NFes (nfeProc 4.00) com quantidade de itens configurável, NCMs sorteados
+#     da Tabela TIPI (tipi/tipi.db) e alíquota de IPI igual à da tabela;
+#   - CTes (4.00) em uma fração dos documentos;
+#   - CNPJs/CPFs com dígitos verificadores corretos e, em uma fração dos
+#     documentos, com o último dígito alterado (inválidos);
+#   - CFOPs da lista aceita pela auditoria (VALID_CFOP_CODES) e, em uma fração
+#     dos itens, CFOPs fora dela.
+# Cada documento tem uma chave de acesso própria (com dígito verificador), e o
+# corpus é reprodutível pela semente. O manifesto (corpus.json) traz os
+# parâmetros e, por documento, o que a auditoria deve apontar.
+#
+# Uso (a partir da raiz do projeto):
+#   python benchmarks/gerar_corpus.py corpus/ --documentos 1000 --itens 1 40
+#   python benchmarks/gerar_corpus.py corpus/ --fracao-cnpj-invalido 0.2 --fracao-cfop-invalido 0.1 --semente 7
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+NS_NFE = 'http://www.portalfiscal.inf.br/nfe'
+NS_CTE = 'http://www.portalfiscal.inf.br/cte'
+TIPI_DB = os.path.join(RAIZ, 'tipi', 'tipi.db')
+MANIFESTO = 'corpus.json'
+
+# CFOPs existentes, mas fora da lista aceita pela auditoria
+CFOPS_FORA_DA_LISTA = ('5949', '6949', '5910', '6910', '1556', '2556', '5927')
+UFS = (('35', 'SP'), ('33', 'RJ'), ('31', 'MG'), ('41', 'PR'), ('43', 'RS'))
+
+
+def _dv_modulo11(digitos, pesos):
+    resto = sum(int(d) * p for d, p in zip(digitos, pesos)) % 11
+    return '0' if resto < 2 else str(11 - resto)
+
+
+def _invalidar(documento):
+    """Troca o último dígito verificador por outro: o documento passa a ser inválido."""
+    return documento[:-1] + str((int(documento[-1]) + 1) % 10)
+
+
+def gerar_cnpj(rng, valido=True):
+    base = f"{rng.randrange(10 ** 8):08d}0001"
+    base += _dv_modulo11(base, (5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2))
+    cnpj = base + _dv_modulo11(base, (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2))
+    return cnpj if valido else _invalidar(cnpj)
+
+
+def gerar_cpf(rng, valido=True):
+    base = f"{rng.randrange(1, 10 ** 9):09d}"
+    base += str(sum(int(d) * (10 - i) for i, d in enumerate(base)) * 10 % 11 % 10)
+    cpf = base + str(sum(int(d) * (11 - i) for i, d in enumerate(base)) * 10 % 11 % 10)
+    return cpf if valido else _invalidar(cpf)
+
+
+def chave_acesso(codigo_uf, cnpj, modelo, numero, codigo):
+    """Chave de 44 dígitos (cUF, AAMM, CNPJ, modelo, série, número, tpEmis, cNF) com o dígito verificador."""
+    chave = f"{codigo_uf}2405{cnpj}{modelo}001{numero:09d}1{codigo:08d}"
+    pesos = [2, 3, 4, 5, 6, 7, 8, 9] * 6
+    return chave + _dv_modulo11(reversed(chave), pesos)
+
+
+def carregar_ncms(db_file=TIPI_DB):
+    """NCMs completos (8 dígitos) da TIPI com a alíquota: [(ncm, aliquota)]."""
+    with sqlite3.connect(db_file) as conn:
+        linhas = conn.execute("SELECT ncm, aliquota FROM tipi WHERE length(ncm) = 10 AND ex = '' ORDER BY ncm").fetchall()
+    return [(ncm.replace('.', ''), (aliquota or '').strip()) for ncm, aliquota in linhas]
+
+
+def _det(numero_item, ncm, aliquota, cfop, valor):
+    # NT (não tributado) e alíquotas vazias não têm pIPI no documento
+    try:
+        ipi = f'<IPITrib><CST>50</CST><pIPI>{float(aliquota.replace(",", ".")):.2f}</pIPI></IPITrib>'
+    except ValueError:
+        ipi = '<IPINT><CST>53</CST></IPINT>'
+    return (f'<det nItem="{numero_item}"><prod><cProd>P{numero_item:04d}</cProd><xProd>Produto {numero_item}</xProd>'
+            f'<NCM>{ncm}</NCM><CFOP>{cfop}</CFOP><uCom>UN</uCom><qCom>1</qCom><vUnCom>{valor:.2f}</vUnCom>'
+            f'<vProd>{valor:.2f}</vProd></prod><imposto><IPI><cEnq>999</cEnq>{ipi}</IPI></imposto></det>')
+
+
+def gerar_nfe(rng, numero, itens, ncms, cfops_validos, fracao_cfop_invalido, cnpj_valido):
+    """Retorna (xml, esperado) de uma NFe com 'itens' itens."""
+    codigo_uf, uf = rng.choice(UFS)
+    cnpj = gerar_cnpj(rng, cnpj_valido)
+    destinatario = (f'<CPF>{gerar_cpf(rng)}</CPF>' if rng.random() < 0.5 else f'<CNPJ>{gerar_cnpj(rng)}</CNPJ>')
+    chave = chave_acesso(codigo_uf, cnpj, '55', numero, rng.randrange(10 ** 8))
+    dets, total, cfops_invalidos = [], 0.0, 0
+    for i in range(1, itens + 1):
+        ncm, aliquota = rng.choice(ncms)
+        if rng.random() < fracao_cfop_invalido:
+            cfop = rng.choice(CFOPS_FORA_DA_LISTA)
+            cfops_invalidos += 1
+        else:
+            cfop = rng.choice(cfops_validos)
+        valor = round(rng.uniform(1, 5000), 2)
+        total += valor
+        dets.append(_det(i, ncm, aliquota, cfop, valor))
+    xml = (f'<?xml version="1.0" encoding="UTF-8"?><nfeProc xmlns="{NS_NFE}" versao="4.00"><NFe>'
+           f'<infNFe Id="NFe{chave}" versao="4.00"><ide><cUF>{codigo_uf}</cUF><natOp>Venda</natOp><mod>55</mod>'
+           f'<serie>1</serie><nNF>{numero}</nNF><dhEmi>2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T10:00:00-03:00</dhEmi></ide>'
+           f'<emit><CNPJ>{cnpj}</CNPJ><xNome>Emitente {numero} Ltda</xNome><enderEmit><UF>{uf}</UF></enderEmit></emit>'
+           f'<dest>{destinatario}<xNome>Destinatário {numero}</xNome></dest>{"".join(dets)}'
+           f'<total><ICMSTot><vProd>{total:.2f}</vProd><vNF>{total:.2f}</vNF></ICMSTot></total></infNFe></NFe>'
+           f'<protNFe versao="4.00"><infProt><chNFe>{chave}</chNFe><cStat>100</cStat></infProt></protNFe></nfeProc>')
+    esperado = {'tipo': 'NFE', 'chave_acesso': chave, 'itens': itens, 'cnpj_valido': cnpj_valido,
+                'cfops_invalidos': cfops_invalidos}
+    return xml, esperado
+
+
+def gerar_cte(rng, numero, cnpj_valido):
+    """Retorna (xml, esperado) de um CTe 4.00."""
+    codigo_uf, uf = rng.choice(UFS)
+    cnpj = gerar_cnpj(rng, cnpj_valido)
+    chave = chave_acesso(codigo_uf, cnpj, '57', numero, rng.randrange(10 ** 8))
+    valor = round(rng.uniform(50, 3000), 2)
+    xml = (f'<?xml version="1.0" encoding="UTF-8"?><cteProc xmlns="{NS_CTE}" versao="4.00"><CTe>'
+           f'<infCte Id="CTe{chave}" versao="4.00"><ide><cUF>{codigo_uf}</cUF><CFOP>5353</CFOP><natOp>Frete</natOp>'
+           f'<mod>57</mod><serie>1</serie><nCT>{numero}</nCT><dhEmi>2024-{rng.randint(1, 12):02d}-10T10:00:00-03:00</dhEmi>'
+           f'<modal>01</modal><tpServ>0</tpServ><UFIni>{uf}</UFIni><UFFim>SP</UFFim><toma3><toma>0</toma></toma3></ide>'
+           f'<emit><CNPJ>{cnpj}</CNPJ><IE>1</IE><xNome>Transportadora {numero}</xNome><enderEmit><UF>{uf}</UF></enderEmit></emit>'
+           f'<rem><CNPJ>{gerar_cnpj(rng)}</CNPJ><xNome>Remetente</xNome></rem>'
+           f'<dest><CPF>{gerar_cpf(rng)}</CPF><xNome>Destinatário</xNome></dest>'
+           f'<vPrest><vTPrest>{valor:.2f}</vTPrest><vRec>{valor:.2f}</vRec></vPrest></infCte></CTe></cteProc>')
+    return xml, {'tipo': 'CTE', 'chave_acesso': chave, 'itens': 0, 'cnpj_valido': cnpj_valido, 'cfops_invalidos': 0}
+
+
+def gerar_corpus(destino, documentos=200, itens=(1, 30), fracao_cte=0.1, fracao_cnpj_invalido=0.1,
+                 fracao_cfop_invalido=0.05, semente=42, db_file=TIPI_DB):
+    """
+    Grava o corpus na pasta 'destino' e retorna o manifesto
+    ({'parametros', 'documentos': {arquivo: esperado}}), também gravado em corpus.json.
+    """
+    from regras_auditoria import VALID_CFOP_CODES
+
+    rng = random.Random(semente)
+    ncms = carregar_ncms(db_file)
+    cfops_validos = sorted(VALID_CFOP_CODES)
+    os.makedirs(destino, exist_ok=True)
+
+    manifesto = {
+        'parametros': {'documentos': documentos, 'itens': list(itens), 'fracao_cte': fracao_cte,
+                       'fracao_cnpj_invalido': fracao_cnpj_invalido, 'fracao_cfop_invalido': fracao_cfop_invalido,
+                       'semente': semente},
+        'documentos': {},
+    }
+    for numero in range(1, documentos + 1):
+        cnpj_valido = rng.random() >= fracao_cnpj_invalido
+        if rng.random() < fracao_cte:
+            nome = f'cte_{numero:06d}.xml'
+            xml, esperado = gerar_cte(rng, numero, cnpj_valido)
+        else:
+            nome = f'nfe_{numero:06d}.xml'
+            xml, esperado = gerar_nfe(rng, numero, rng.randint(*itens), ncms, cfops_validos,
+                                      fracao_cfop_invalido, cnpj_valido)
+        with open(os.path.join(destino, nome), 'w', encoding='utf-8') as f:
+            f.write(xml)
+        manifesto['documentos'][nome] = esperado
+
+    with open(os.path.join(destino, MANIFESTO), 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=1)
+    return manifesto
+
+
+# --- Execução Principal ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera um corpus sintético de NFes/CTes para os benchmarks.")
+    parser.add_argument('destino', help="Pasta onde os XMLs e o manifesto (corpus.json) serão gravados.")
+    parser.add_argument('--documentos', type=int, default=200)
+    parser.add_argument('--itens', type=int, nargs=2, default=[1, 30], metavar=('MIN', 'MAX'),
+                        help="Faixa da quantidade de itens por NFe.")
+    parser.add_argument('--fracao-cte', type=float, default=0.1)
+    parser.add_argument('--fracao-cnpj-invalido', type=float, default=0.1)
+    parser.add_argument('--fracao-cfop-invalido', type=float, default=0.05, help="Fração dos itens com CFOP fora da lista.")
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+
+    manifesto = gerar_corpus(args.destino, args.documentos, args.itens, args.fracao_cte,
+                             args.fracao_cnpj_invalido, args.fracao_cfop_invalido, args.semente)
+    documentos = manifesto['documentos'].values()
+    print(f"{len(documentos)} documentos gravados em {args.destino} "
+          f"({sum(d['tipo'] == 'CTE' for d in documentos)} CTes, {sum(d['itens'] for d in documentos)} itens, "
+          f"{sum(not d['cnpj_valido'] for d in documentos)} CNPJs inválidos, "
+          f"{sum(d['cfops_invalidos'] for d in documentos)} CFOPs fora da lista).")
@@ -0,0 +1,188 @@
+# Arquivo: cache_extracao.py (Cache persistente das extrações de PDF)
+#
+# Guarda o resultado da extração (texto do PDF + IA) indexado pelo SHA-256 do
+# conteúdo do arquivo e pela versão da extração (prompt e modelo). O mesmo PDF
+# enviado de novo é respondido do cache, sem chamada à API.
+#
+# O cache fica em um banco SQLite limitado em tamanho: ao passar do limite, as
+# entradas usadas há mais tempo são descartadas (LRU). Variáveis de ambiente:
+#   - AGENTE_FISCAL_CACHE_EXTRACAO: arquivo do cache (padrão: cache_extracao.db)
+#   - AGENTE_FISCAL_CACHE_EXTRACAO_MB: tamanho máximo dos resultados, em MB (padrão: 64)
+#
+# Uso (a partir da raiz do projeto):
+#   python cache_extracao.py --estatisticas
+#   python cache_extracao.py --invalidar nota.pdf
+#   python cache_extracao.py --limpar
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+CACHE_EXTRACAO = os.getenv('AGENTE_FISCAL_CACHE_EXTRACAO', 'cache_extracao.db')
+CACHE_EXTRACAO_MAX_BYTES = int(float(os.getenv('AGENTE_FISCAL_CACHE_EXTRACAO_MB', '64')) * 2 ** 20)
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS extracoes (
+    chave TEXT PRIMARY KEY,
+    hash_arquivo TEXT NOT NULL,
+    versao TEXT NOT NULL,
+    dados_json TEXT NOT NULL,
+    tamanho INTEGER NOT NULL,
+    criado_em REAL NOT NULL,
+    ultimo_acesso REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_extracoes_ultimo_acesso ON extracoes(ultimo_acesso);
+CREATE INDEX IF NOT EXISTS idx_extracoes_hash_arquivo ON extracoes(hash_arquivo);
+CREATE TABLE IF NOT EXISTS contadores (
+    nome TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL
+);
+"""
+
+_caches_inicializados = set()
+_lock_inicializacao = threading.Lock()
+
+
+@contextmanager
+def conectar(cache_file=CACHE_EXTRACAO):
+    """Abre uma conexão com o cache (modo WAL), criando o esquema na primeira vez."""
+    conn = sqlite3.connect(cache_file, timeout=30)
+    try:
+        caminho = os.path.abspath(cache_file)
+        if caminho not in _caches_inicializados:
+            with _lock_inicializacao:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(ESQUEMA)
+                _caches_inicializados.add(caminho)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def hash_arquivo(caminho_arquivo):
+    """SHA-256 do conteúdo do arquivo, lido em blocos."""
+    sha = hashlib.sha256()
+    with open(caminho_arquivo, 'rb') as f:
+        for bloco in iter(lambda: f.read(1 << 20), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def versao_extracao(*partes):
+    """
+    Identifica a versão da extração a partir do que influencia o resultado
+    (ex.: texto do prompt e nome do modelo). Mudou uma parte, mudou a versão.
+    """
+    return hashlib.sha256('\x00'.join(map(str, partes)).encode('utf-8')).hexdigest()[:16]
+
+
+def _contar(conn, nome):
+    conn.execute("INSERT INTO contadores (nome, valor) VALUES (?, 1) "
+                 "ON CONFLICT(nome) DO UPDATE SET valor = valor + 1", (nome,))
+
+
+def obter(hash_conteudo, versao, cache_file=CACHE_EXTRACAO):
+    """Retorna os dados em cache para o arquivo e a versão informados, ou None."""
+    chave = f"{hash_conteudo}:{versao}"
+    with conectar(cache_file) as conn:
+        linha = conn.execute("SELECT dados_json FROM extracoes WHERE chave = ?", (chave,)).fetchone()
+        if linha is None:
+            _contar(conn, 'falhas')
+            return None
+        conn.execute("UPDATE extracoes SET ultimo_acesso = ? WHERE chave = ?", (time.time(), chave))
+        _contar(conn, 'acertos')
+    return json.loads(linha[0])
+
+
+def guardar(hash_conteudo, versao, dados, cache_file=CACHE_EXTRACAO, max_bytes=None):
+    """Guarda os dados extraídos e descarta as entradas menos usadas se o cache passar do limite."""
+    max_bytes = CACHE_EXTRACAO_MAX_BYTES if max_bytes is None else max_bytes
+    dados_json = json.dumps(dados, ensure_ascii=False)
+    tamanho = len(dados_json.encode('utf-8'))
+    agora = time.time()
+    with conectar(cache_file) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO extracoes (chave, hash_arquivo, versao, dados_json, tamanho, criado_em, ultimo_acesso) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (f"{hash_conteudo}:{versao}", hash_conteudo, versao, dados_json, tamanho, agora, agora))
+        _descartar_excedente(conn, max_bytes)
+
+
+def _descartar_excedente(conn, max_bytes):
+    """Remove as entradas de acesso mais antigo até o total caber em max_bytes (LRU)."""
+    total = conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM extracoes").fetchone()[0]
+    if total <= max_bytes:
+        return 0
+    removidas = 0
+    for chave, tamanho in conn.execute("SELECT chave, tamanho FROM extracoes ORDER BY ultimo_acesso").fetchall():
+        if total <= max_bytes:
+            break
+        conn.execute("DELETE FROM extracoes WHERE chave = ?", (chave,))
+        total -= tamanho
+        removidas += 1
+    if removidas:
+        conn.execute("INSERT INTO contadores (nome, valor) VALUES ('descartes', ?) "
+                     "ON CONFLICT(nome) DO UPDATE SET valor = valor + excluded.valor", (removidas,))
+    return removidas
+
+
+def invalidar(hash_conteudo=None, cache_file=CACHE_EXTRACAO):
+    """
+    Remove do cache as extrações de um arquivo (pelo SHA-256 do conteúdo), em todas
+    as versões, ou todo o cache se nenhum hash for informado. Retorna quantas entradas saíram.
+    """
+    with conectar(cache_file) as conn:
+        if hash_conteudo is None:
+            removidas = conn.execute("DELETE FROM extracoes").rowcount
+            conn.execute("DELETE FROM contadores")
+        else:
+            removidas = conn.execute("DELETE FROM extracoes WHERE hash_arquivo = ?", (hash_conteudo,)).rowcount
+    return removidas
+
+
+def estatisticas(cache_file=CACHE_EXTRACAO):
+    """Retorna entradas, bytes ocupados, acertos, falhas, descartes e taxa de acerto do cache."""
+    with conectar(cache_file) as conn:
+        entradas, ocupados = conn.execute("SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM extracoes").fetchone()
+        contadores = dict(conn.execute("SELECT nome, valor FROM contadores").fetchall())
+    acertos, falhas = contadores.get('acertos', 0), contadores.get('falhas', 0)
+    return {
+        'entradas': entradas,
+        'bytes': ocupados,
+        'limite_bytes': CACHE_EXTRACAO_MAX_BYTES,
+        'acertos': acertos,
+        'falhas': falhas,
+        'descartes': contadores.get('descartes', 0),
+        'taxa_acerto': acertos / (acertos + falhas) if acertos + falhas else 0.0,
+    }
+
+
+# --- Execução Principal ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manutenção do cache de extrações de PDF.")
+    parser.add_argument('--cache', default=CACHE_EXTRACAO, help="Arquivo SQLite do cache.")
+    grupo = parser.add_mutually_exclusive_group()
+    grupo.add_argument('--estatisticas', action='store_true', help="Mostra ocupação e contadores do cache.")
+    grupo.add_argument('--invalidar', nargs='+', metavar='PDF', help="Remove do cache as extrações destes arquivos.")
+    grupo.add_argument('--limpar', action='store_true', help="Esvazia o cache e zera os contadores.")
+    args = parser.parse_args()
+
+    if args.invalidar:
+        for arquivo in args.invalidar:
+            print(f"{arquivo}: {invalidar(hash_arquivo(arquivo), args.cache)} entrada(s) removida(s).")
+    elif args.limpar:
+        print(f"Cache esvaziado: {invalidar(cache_file=args.cache)} entrada(s) removida(s).")
+    else:
+        e = estatisticas(args.cache)
+        print(f"Entradas:  {e['entradas']}")
+        print(f"Ocupação:  {e['bytes'] / 2 ** 20:.2f} MB de {e['limite_bytes'] / 2 ** 20:.0f} MB")
+        print(f"Acertos:   {e['acertos']}")
+        print(f"Falhas:    {e['falhas']}")
+        print(f"Descartes: {e['descartes']}")
+        print(f"Taxa de acerto: {e['taxa_acerto']:.1%}")
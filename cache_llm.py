@@ -0,0 +1,276 @@
+# Arquivo: cache_llm.py (Cache persistente das respostas do LLM)
+#
+# Com temperatura 0, o mesmo prompt enviado ao mesmo modelo tem a mesma
+# resposta: conclusões de auditoria que se repetem (mesmo fornecedor, mesmos
+# produtos) e perguntas de NCM repetidas são respondidas do cache, sem chamada
+# à API. O cache é ligado ao modelo do agente (parâmetro 'cache' do LangChain)
+# e vale para todas as chamadas feitas por ele, inclusive as do agente.
+# O LangChain só é importado ao criar o cache (criar_cache_llm): estatísticas
+# e manutenção não dependem dele.
+#
+# A chave é o SHA-256 da configuração do modelo (nome, temperatura, ferramentas
+# e demais parâmetros, como serializada pelo LangChain) e das mensagens do
+# prompt normalizadas (tipo da mensagem e conteúdo com espaços colapsados).
+# As entradas expiram após o TTL e, ao passar do limite de tamanho, as usadas
+# há mais tempo são descartadas (LRU). Variáveis de ambiente:
+#   - AGENTE_FISCAL_CACHE_LLM: arquivo do cache (padrão: cache_llm.db; vazio desativa o cache)
+#   - AGENTE_FISCAL_CACHE_LLM_MB: tamanho máximo das respostas, em MB (padrão: 32)
+#   - AGENTE_FISCAL_CACHE_LLM_TTL_HORAS: validade das respostas, em horas (padrão: 168)
+#
+# Uso (a partir da raiz do projeto):
+#   python cache_llm.py --estatisticas
+#   python cache_llm.py --expirar
+#   python cache_llm.py --limpar
+
+import argparse
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+
+import metricas
+
+CACHE_LLM = os.getenv('AGENTE_FISCAL_CACHE_LLM', 'cache_llm.db')
+CACHE_LLM_MAX_BYTES = int(float(os.getenv('AGENTE_FISCAL_CACHE_LLM_MB', '32')) * 2 ** 20)
+CACHE_LLM_TTL = float(os.getenv('AGENTE_FISCAL_CACHE_LLM_TTL_HORAS', '168')) * 3600
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS respostas (
+    chave TEXT PRIMARY KEY,
+    resposta_json TEXT NOT NULL,
+    tamanho INTEGER NOT NULL,
+    criado_em REAL NOT NULL,
+    ultimo_acesso REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_respostas_ultimo_acesso ON respostas(ultimo_acesso);
+CREATE INDEX IF NOT EXISTS idx_respostas_criado_em ON respostas(criado_em);
+CREATE TABLE IF NOT EXISTS contadores (
+    nome TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL
+);
+-- Total de bytes das respostas, mantido a cada gravação e remoção (caches anteriores: calculado uma vez)
+INSERT OR IGNORE INTO contadores (nome, valor) SELECT 'bytes', COALESCE(SUM(tamanho), 0) FROM respostas;
+"""
+
+_caches_inicializados = set()
+_lock_inicializacao = threading.Lock()
+
+
+@contextmanager
+def conectar(cache_file=CACHE_LLM):
+    """Abre uma conexão com o cache (modo WAL), criando o esquema na primeira vez."""
+    conn = sqlite3.connect(cache_file, timeout=30)
+    try:
+        caminho = os.path.abspath(cache_file)
+        if caminho not in _caches_inicializados:
+            with _lock_inicializacao:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(ESQUEMA)
+                _caches_inicializados.add(caminho)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def normalizar_prompt(prompt):
+    """
+    Reduz o prompt serializado pelo LangChain ao que define a resposta: o tipo
+    e o conteúdo de cada mensagem, com os espaços em branco colapsados.
+    Prompts em outro formato são usados como estão.
+    """
+    try:
+        mensagens = json.loads(prompt)
+        return json.dumps([
+            [m['kwargs'].get('type') or m['id'][-1],
+             ' '.join(m['kwargs']['content'].split()) if isinstance(m['kwargs'].get('content'), str)
+             else m['kwargs'].get('content'),
+             m['kwargs'].get('tool_calls'), m['kwargs'].get('tool_call_id')]
+            for m in mensagens
+        ], ensure_ascii=False, sort_keys=True)
+    except (ValueError, TypeError, KeyError, IndexError):
+        return prompt
+
+
+def chave_resposta(prompt, llm_string):
+    """Chave do cache: SHA-256 da configuração do modelo e do prompt normalizado."""
+    return hashlib.sha256(f"{llm_string}\x00{normalizar_prompt(prompt)}".encode('utf-8')).hexdigest()
+
+
+def _somar(conn, nome, quantidade=1):
+    conn.execute("INSERT INTO contadores (nome, valor) VALUES (?, ?) "
+                 "ON CONFLICT(nome) DO UPDATE SET valor = valor + excluded.valor", (nome, quantidade))
+
+
+def _descontar_bytes(conn, condicao, parametros):
+    """Desconta do total de bytes as respostas que atendem à condição; chamada antes de removê-las."""
+    conn.execute("INSERT INTO contadores (nome, valor) "
+                 f"SELECT 'bytes', -COALESCE(SUM(tamanho), 0) FROM respostas WHERE {condicao} "
+                 "ON CONFLICT(nome) DO UPDATE SET valor = valor + excluded.valor", parametros)
+
+
+def _descartar_excedente(conn, max_bytes, lote=64):
+    """
+    Remove as entradas de acesso mais antigo até o total caber em max_bytes (LRU).
+    O total vem do contador 'bytes', e as entradas são lidas pelo índice de
+    último acesso, em lotes, só enquanto o cache estiver acima do limite.
+    """
+    total = conn.execute("SELECT valor FROM contadores WHERE nome = 'bytes'").fetchone()
+    total = total[0] if total else 0
+    removidas = removidos_bytes = 0
+    while total > max_bytes:
+        candidatas = conn.execute("SELECT chave, tamanho FROM respostas ORDER BY ultimo_acesso LIMIT ?",
+                                  (lote,)).fetchall()
+        if not candidatas:
+            break
+        descartadas = []
+        for chave, tamanho in candidatas:
+            if total <= max_bytes:
+                break
+            descartadas.append((chave,))
+            total -= tamanho
+            removidos_bytes += tamanho
+        conn.executemany("DELETE FROM respostas WHERE chave = ?", descartadas)
+        removidas += len(descartadas)
+    if removidas:
+        _somar(conn, 'descartes', removidas)
+        _somar(conn, 'bytes', -removidos_bytes)
+    return removidas
+
+
+def buscar_resposta(chave, ttl=CACHE_LLM_TTL, cache_file=CACHE_LLM):
+    """Resposta serializada guardada para a chave, ou None se não houver ou tiver expirado."""
+    agora = time.time()
+    with conectar(cache_file) as conn:
+        linha = conn.execute("SELECT resposta_json, criado_em FROM respostas WHERE chave = ?", (chave,)).fetchone()
+        if linha is not None and agora - linha[1] > ttl:
+            _descontar_bytes(conn, "chave = ?", (chave,))
+            conn.execute("DELETE FROM respostas WHERE chave = ?", (chave,))
+            _somar(conn, 'expiradas')
+            linha = None
+        if linha is None:
+            _somar(conn, 'falhas')
+            return None
+        conn.execute("UPDATE respostas SET ultimo_acesso = ? WHERE chave = ?", (agora, chave))
+        _somar(conn, 'acertos')
+    return linha[0]
+
+
+def guardar_resposta(chave, resposta_json, max_bytes=CACHE_LLM_MAX_BYTES, cache_file=CACHE_LLM):
+    """Guarda a resposta serializada e descarta as menos usadas se o cache passar do limite."""
+    agora = time.time()
+    tamanho = len(resposta_json.encode('utf-8'))
+    with conectar(cache_file) as conn:
+        # Uma resposta substituída sai do total antes de a nova entrar
+        _descontar_bytes(conn, "chave = ?", (chave,))
+        conn.execute(
+            "INSERT OR REPLACE INTO respostas (chave, resposta_json, tamanho, criado_em, ultimo_acesso) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (chave, resposta_json, tamanho, agora, agora))
+        _somar(conn, 'bytes', tamanho)
+        _descartar_excedente(conn, max_bytes)
+
+
+@functools.lru_cache(maxsize=None)
+def _classe_cache_llm():
+    """Define (uma vez) o cache como subclasse de BaseCache, importando o LangChain só aqui."""
+    from langchain_core.caches import BaseCache
+    from langchain_core.load import dumps, loads
+
+    class CacheLLM(BaseCache):
+        """Cache das respostas do LLM em SQLite, com TTL e limite de tamanho (ver o cabeçalho do módulo)."""
+
+        def __init__(self, cache_file, max_bytes, ttl):
+            self.cache_file = cache_file
+            self.max_bytes = max_bytes
+            self.ttl = ttl
+
+        def lookup(self, prompt, llm_string):
+            resposta_json = buscar_resposta(chave_resposta(prompt, llm_string), self.ttl, self.cache_file)
+            metricas.contar('cache', cache='llm', resultado='falha' if resposta_json is None else 'acerto')
+            if resposta_json is None:
+                return None
+            # A (des)serialização de mensagens do LangChain ainda é marcada como beta
+            with warnings.catch_warnings():
+                warnings.filterwarnings('ignore', message='The function `loads` is in beta')
+                return loads(resposta_json)
+
+        def update(self, prompt, llm_string, return_val):
+            guardar_resposta(chave_resposta(prompt, llm_string), dumps(return_val), self.max_bytes, self.cache_file)
+
+        def clear(self, **kwargs):
+            limpar(self.cache_file)
+
+    return CacheLLM
+
+
+def criar_cache_llm(cache_file=CACHE_LLM, max_bytes=CACHE_LLM_MAX_BYTES, ttl=CACHE_LLM_TTL):
+    """Cria o cache para o parâmetro 'cache' dos modelos de chat do LangChain."""
+    return _classe_cache_llm()(cache_file, max_bytes, ttl)
+
+
+def remover_expiradas(cache_file=CACHE_LLM, ttl=CACHE_LLM_TTL):
+    """Remove as respostas mais antigas que o TTL. Retorna quantas saíram."""
+    limite = time.time() - ttl
+    with conectar(cache_file) as conn:
+        _descontar_bytes(conn, "criado_em < ?", (limite,))
+        removidas = conn.execute("DELETE FROM respostas WHERE criado_em < ?", (limite,)).rowcount
+        if removidas:
+            _somar(conn, 'expiradas', removidas)
+    return removidas
+
+
+def limpar(cache_file=CACHE_LLM):
+    """Esvazia o cache e zera os contadores. Retorna quantas respostas saíram."""
+    with conectar(cache_file) as conn:
+        removidas = conn.execute("DELETE FROM respostas").rowcount
+        conn.execute("DELETE FROM contadores")
+    return removidas
+
+
+def estatisticas(cache_file=CACHE_LLM):
+    """Retorna entradas, bytes ocupados, acertos, falhas, descartes, expiradas e taxa de acerto do cache."""
+    with conectar(cache_file) as conn:
+        entradas, ocupados = conn.execute("SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM respostas").fetchone()
+        contadores = dict(conn.execute("SELECT nome, valor FROM contadores").fetchall())
+    acertos, falhas = contadores.get('acertos', 0), contadores.get('falhas', 0)
+    return {
+        'entradas': entradas,
+        'bytes': ocupados,
+        'limite_bytes': CACHE_LLM_MAX_BYTES,
+        'acertos': acertos,
+        'falhas': falhas,
+        'descartes': contadores.get('descartes', 0),
+        'expiradas': contadores.get('expiradas', 0),
+        'taxa_acerto': acertos / (acertos + falhas) if acertos + falhas else 0.0,
+    }
+
+
+# --- Execução Principal ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manutenção do cache de respostas do LLM.")
+    parser.add_argument('--cache', default=CACHE_LLM or 'cache_llm.db', help="Arquivo SQLite do cache.")
+    grupo = parser.add_mutually_exclusive_group()
+    grupo.add_argument('--estatisticas', action='store_true', help="Mostra ocupação e contadores do cache.")
+    grupo.add_argument('--expirar', action='store_true', help="Remove as respostas mais antigas que o TTL.")
+    grupo.add_argument('--limpar', action='store_true', help="Esvazia o cache e zera os contadores.")
+    args = parser.parse_args()
+
+    if args.expirar:
+        print(f"{remover_expiradas(args.cache)} resposta(s) expirada(s) removida(s).")
+    elif args.limpar:
+        print(f"Cache esvaziado: {limpar(args.cache)} resposta(s) removida(s).")
+    else:
+        e = estatisticas(args.cache)
+        print(f"Entradas:  {e['entradas']}")
+        print(f"Ocupação:  {e['bytes'] / 2 ** 20:.2f} MB de {e['limite_bytes'] / 2 ** 20:.0f} MB")
+        print(f"Acertos:   {e['acertos']}")
+        print(f"Falhas:    {e['falhas']}")
+        print(f"Descartes: {e['descartes']}")
+        print(f"Expiradas: {e['expiradas']}")
+        print(f"Taxa de acerto: {e['taxa_acerto']:.1%}")
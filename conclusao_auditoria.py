@@ -0,0 +1,154 @@
+# Arquivo: conclusao_auditoria.py (Conclusão das auditorias por regras e enriquecimento opcional com IA)
+#
+# A conclusão de cada auditoria é montada a partir dos erros, avisos e
+# informações de NCM já estruturados, sem chamada ao LLM: o resultado é
+# determinístico e fica pronto no momento em que o documento é salvo.
+#
+# Uma conclusão redigida pela IA pode ser pedida como enriquecimento: a chamada
+# ao LLM roda em segundo plano, depois da gravação, e substitui a conclusão do
+# registro salvo quando termina. Variáveis de ambiente:
+#   - AGENTE_FISCAL_CONCLUSAO_IA: '1' ativa o enriquecimento (padrão: desativado)
+#   - AGENTE_FISCAL_CONCLUSAO_IA_WORKERS: chamadas simultâneas ao LLM (padrão: 2)
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import metricas
+from persistencia import atualizar_conclusao
+
+CONCLUSAO_IA = os.getenv('AGENTE_FISCAL_CONCLUSAO_IA', '0').strip().lower() in ('1', 'true', 'sim')
+CONCLUSAO_IA_WORKERS = int(os.getenv('AGENTE_FISCAL_CONCLUSAO_IA_WORKERS', '2'))
+
+CONCLUSAO_SEM_INCONSISTENCIAS = ("Auditoria concluída com sucesso. Nenhuma inconsistência fiscal foi encontrada "
+                                 "e todos os dados parecem estar em conformidade.")
+
+RECOMENDACOES = {
+    'error': "O documento apresenta erros que devem ser corrigidos antes da escrituração.",
+    'warning': "Não foram encontrados erros, mas os avisos acima devem ser revisados antes da escrituração.",
+    'success': "Nenhuma inconsistência fiscal foi encontrada.",
+}
+
+MENSAGENS_CONCLUSAO_IA = [
+    ("system", "Você é um assistente fiscal especialista. Sua tarefa é gerar uma conclusão clara e útil com base nos resultados de uma auditoria de documento fiscal. Analise os erros, avisos e as informações de NCM para gerar a conclusão. Na sua conclusão, além de mencionar os erros e avisos, liste explicitamente a descrição e a alíquota da TIPI para cada NCM encontrado."),
+    ("human", "Por favor, gere uma conclusão para a seguinte auditoria:\n- Erros Encontrados: {erros}\n- Avisos Emitidos: {avisos}\n- Informações de NCM Encontradas: {informacoes_ncm}"),
+]
+
+_executor = None
+_lock_executor = threading.Lock()
+
+
+def _plural(quantidade, singular, plural):
+    return f"{quantidade} {singular if quantidade == 1 else plural}"
+
+
+def _texto_aliquota(aliquota):
+    """'NT' (não tributado) é exibido por extenso; as demais alíquotas, em porcentagem."""
+    return "IPI não tributado (NT)" if str(aliquota).strip().upper() == 'NT' else f"alíquota de IPI {aliquota}%"
+
+
+def agrupar_ncms(informacoes_ncm):
+    """
+    Agrupa as informações de NCM dos itens por código: retorna uma lista de
+    {'ncm', 'descricao', 'aliquota', 'itens'} na ordem em que os NCMs aparecem.
+    """
+    grupos = {}
+    for info in informacoes_ncm:
+        grupo = grupos.setdefault(info['ncm'], {'ncm': info['ncm'], 'descricao': info['descricao'],
+                                                'aliquota': info['aliquota'], 'itens': []})
+        grupo['itens'].append(info['item'])
+    return list(grupos.values())
+
+
+def gerar_conclusao(status, erros, avisos, informacoes_ncm=()):
+    """
+    Monta a conclusão da auditoria (em Markdown) a partir dos resultados estruturados:
+    resumo, erros, avisos, NCMs encontrados na TIPI (um por código) e a recomendação.
+    """
+    if not erros and not avisos and not informacoes_ncm:
+        return CONCLUSAO_SEM_INCONSISTENCIAS
+
+    partes = [f"Auditoria concluída com {_plural(len(erros), 'erro', 'erros')} "
+              f"e {_plural(len(avisos), 'aviso', 'avisos')}."]
+    if erros:
+        partes.append("**Erros encontrados:**\n" + "\n".join(f"- {erro}" for erro in erros))
+    if avisos:
+        partes.append("**Avisos:**\n" + "\n".join(f"- {aviso}" for aviso in avisos))
+    if informacoes_ncm:
+        linhas = [f"- NCM {grupo['ncm']}: {str(grupo['descricao']).strip()} ({_texto_aliquota(grupo['aliquota'])}) — "
+                  f"{_plural(len(grupo['itens']), 'item', 'itens')}: {', '.join(map(str, grupo['itens']))}"
+                  for grupo in agrupar_ncms(informacoes_ncm)]
+        partes.append("**Classificação fiscal (Tabela TIPI):**\n" + "\n".join(linhas))
+    partes.append(RECOMENDACOES[status])
+    return "\n\n".join(partes)
+
+
+def _entradas_conclusao_ia(audit_result):
+    return {
+        'erros': json.dumps(audit_result.get('erros_auditoria', []), ensure_ascii=False),
+        'avisos': json.dumps(audit_result.get('avisos_auditoria', []), ensure_ascii=False),
+        'informacoes_ncm': json.dumps(agrupar_ncms(audit_result.get('informacoes_ncm', [])), ensure_ascii=False),
+    }
+
+
+def precisa_enriquecer(audit_result):
+    """Há o que a IA comentar: a conclusão não é a de auditoria sem inconsistências."""
+    return audit_result.get('conclusao_analise') != CONCLUSAO_SEM_INCONSISTENCIAS
+
+
+def _chain_conclusao_ia(llm):
+    from langchain.prompts import ChatPromptTemplate
+
+    return ChatPromptTemplate.from_messages(MENSAGENS_CONCLUSAO_IA) | llm
+
+
+@metricas.cronometrado('conclusao_ia')
+def redigir_conclusao_ia(audit_result, llm):
+    """Pede ao LLM a conclusão redigida a partir dos erros, avisos e NCMs da auditoria."""
+    return _chain_conclusao_ia(llm).invoke(_entradas_conclusao_ia(audit_result)).content
+
+
+@metricas.cronometrado('conclusao_ia')
+async def aredigir_conclusao_ia(audit_result, llm):
+    """Versão assíncrona de redigir_conclusao_ia (usa ainvoke)."""
+    return (await _chain_conclusao_ia(llm).ainvoke(_entradas_conclusao_ia(audit_result))).content
+
+
+def enriquecer_conclusao(audit_result, referencia, llm):
+    """
+    Gera a conclusão com a IA e a grava no registro já salvo ('referencia' é o
+    retorno de salvar_auditoria). Retorna a nova conclusão, ou None se falhar.
+    """
+    try:
+        conclusao = redigir_conclusao_ia(audit_result, llm)
+        atualizar_conclusao(audit_result, referencia, conclusao, origem='ia')
+        return conclusao
+    except Exception as e:
+        print(f"Falha ao enriquecer a conclusão do documento '{audit_result.get('numero')}': {e}")
+        return None
+
+
+def _enriquecer_com_modelo(audit_result, referencia, obter_llm):
+    """Cria o modelo já na thread do enriquecimento; sem modelo (ex.: sem OPENAI_API_KEY), só registra a falha."""
+    try:
+        llm = obter_llm()
+    except Exception as e:
+        print(f"Falha ao criar o modelo para a conclusão do documento '{audit_result.get('numero')}': {e}")
+        return None
+    return enriquecer_conclusao(audit_result, referencia, llm)
+
+
+def agendar_enriquecimento(audit_result, referencia, obter_llm):
+    """
+    Agenda o enriquecimento da conclusão em segundo plano, se estiver ativado e
+    houver o que comentar. 'obter_llm' cria (ou devolve) o modelo e só é chamado
+    quando a tarefa é agendada. Retorna o Future da tarefa, ou None se não foi agendada.
+    """
+    global _executor
+    if not CONCLUSAO_IA or not precisa_enriquecer(audit_result):
+        return None
+    with _lock_executor:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=CONCLUSAO_IA_WORKERS, thread_name_prefix='conclusao-ia')
+    return _executor.submit(_enriquecer_com_modelo, dict(audit_result), referencia, obter_llm)
@@ -0,0 +1,154 @@
+# Arquivo: dados_dashboard.py (Tabela achatada de itens usada pelo dashboard)
+
+import os
+import threading
+
+import pandas as pd
+
+from banco_documentos import (
+    COLUNAS_ITENS_PLANOS,
+    ORDENACOES,
+    agregar_documentos,
+    consultar_itens_planos,
+    normalizar_data,
+    somente_digitos,
+)
+from persistencia import MODO_ARMAZENAMENTO, ler_itens_planos_desde
+
+COLUNAS_MONETARIAS = ['valor_total_nota', 'item_valor_total']
+COLUNA_DOCUMENTO = '_documento'
+COLUNA_DATA = '_data'
+# CNPJ do emitente só com dígitos, para os filtros e o agrupamento por emitente
+COLUNA_EMITENTE = '_emitente_cnpj'
+COLUNAS_AGREGADO = ['grupo', 'quantidade', 'valor_total']
+
+# Com AGENTE_FISCAL_DASHBOARD_PARQUET=1, o dashboard lê a exportação Parquet
+# (exportacao_parquet.py) em vez do armazenamento, com os dados da última exportação
+DASHBOARD_PARQUET = os.getenv('AGENTE_FISCAL_DASHBOARD_PARQUET', '0').strip().lower() in ('1', 'true', 'sim')
+
+
+def montar_dataframe(linhas):
+    """
+    Monta o DataFrame do dashboard a partir das linhas achatadas.
+    Os valores já chegam em centavos (convertidos na gravação) e são
+    apenas divididos por 100, de forma vetorizada.
+    """
+    df = pd.DataFrame.from_records(linhas, columns=COLUNAS_ITENS_PLANOS + [COLUNA_DOCUMENTO])
+    for col in COLUNAS_MONETARIAS:
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0) / 100
+    df[COLUNA_DATA] = df['data_emissao'].map(normalizar_data)
+    df[COLUNA_EMITENTE] = df['emitente_cnpj'].map(somente_digitos)
+    return df
+
+
+class ItensPlanos:
+    """
+    Mantém em memória a tabela achatada de itens e a estende incrementalmente:
+    a cada atualização só os documentos gravados ou alterados desde a última leitura são lidos.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cursor = None
+        self.df = montar_dataframe([])
+
+    def atualizar(self):
+        """Incorpora os documentos novos e retorna a tabela completa."""
+        with self._lock:
+            linhas, cursor, reiniciado = ler_itens_planos_desde(self._cursor)
+            if reiniciado:
+                self.df = montar_dataframe([])
+            if linhas:
+                novos = montar_dataframe(linhas)
+                # Documentos regravados (diário JSONL) ou alterados (SQLite) substituem as linhas anteriores
+                substituidos = self.df[COLUNA_DOCUMENTO].isin(novos[COLUNA_DOCUMENTO].unique())
+                base = self.df[~substituidos] if substituidos.any() else self.df
+                self.df = pd.concat([base, novos], ignore_index=True) if not base.empty else novos
+            self._cursor = cursor
+            return self.df
+
+
+# --- Consultas do dashboard ---
+# No modo SQLite, filtros, ordenação, paginação e agregações são feitos no banco
+# e só a página visível é carregada. No modo JSONL, as mesmas consultas são
+# aplicadas sobre a tabela incremental em memória (ItensPlanos). Com a
+# exportação Parquet (DASHBOARD_PARQUET), os filtros são aplicados na leitura
+# dos arquivos e as agregações leem só as colunas de que precisam.
+
+def _filtrar(df, filtros):
+    """Aplica os filtros do dashboard (ver banco_documentos._filtros_sql) sobre o DataFrame."""
+    filtros = filtros or {}
+    mascara = pd.Series(True, index=df.index)
+    if filtros.get('data_inicio'):
+        mascara &= df[COLUNA_DATA] >= str(filtros['data_inicio'])
+    if filtros.get('data_fim'):
+        mascara &= df[COLUNA_DATA] <= str(filtros['data_fim'])
+    if filtros.get('emitente_cnpj'):
+        mascara &= df[COLUNA_EMITENTE] == somente_digitos(filtros['emitente_cnpj'])
+    if filtros.get('status'):
+        mascara &= df['status_auditoria'].isin(filtros['status'])
+    if filtros.get('cfop'):
+        mascara &= df['item_cfop'] == str(filtros['cfop']).strip()
+    if filtros.get('ncm'):
+        mascara &= df['item_ncm'].fillna('').str.startswith(''.join(filter(str.isdigit, filtros['ncm'])))
+    return df[mascara]
+
+
+def _itens_filtrados(itens_planos, filtros, colunas=None):
+    """Linhas achatadas que atendem aos filtros: da exportação Parquet (só as 'colunas') ou da tabela em memória."""
+    if DASHBOARD_PARQUET:
+        from exportacao_parquet import ler_exportacao
+        return ler_exportacao('itens', filtros, colunas)
+    return _filtrar(itens_planos.atualizar(), filtros)
+
+
+def _documentos_filtrados(itens_planos, filtros, colunas):
+    """Uma linha por documento que atende aos filtros (na exportação Parquet, sem filtro de item, a tabela de documentos)."""
+    filtros = filtros or {}
+    if DASHBOARD_PARQUET and not filtros.get('cfop') and not filtros.get('ncm'):
+        from exportacao_parquet import ler_exportacao
+        return ler_exportacao('documentos', filtros, colunas)
+    return _itens_filtrados(itens_planos, filtros, colunas).drop_duplicates(subset=[COLUNA_DOCUMENTO])
+
+
+def consultar_pagina(itens_planos, filtros=None, ordenar_por='data_emissao', decrescente=True,
+                     pagina=1, tamanho_pagina=50):
+    """Retorna (DataFrame da página, total de linhas) para os filtros e a ordenação informados."""
+    if MODO_ARMAZENAMENTO == 'sqlite' and not DASHBOARD_PARQUET:
+        linhas, total = consultar_itens_planos(filtros, ordenar_por, decrescente, pagina, tamanho_pagina)
+        return montar_dataframe(linhas), total
+
+    df = _itens_filtrados(itens_planos, filtros)
+    coluna = COLUNA_DATA if ordenar_por not in ORDENACOES or ordenar_por == 'data_emissao' else ordenar_por
+    inicio = (max(pagina, 1) - 1) * tamanho_pagina
+    pagina_df = df.sort_values(coluna, ascending=not decrescente, kind='stable').iloc[inicio:inicio + tamanho_pagina]
+    return pagina_df.reset_index(drop=True), len(df)
+
+
+def agregar(itens_planos, agrupar_por, filtros=None, limite=None):
+    """
+    Agrega os documentos filtrados por 'status', 'emitente' ou 'mes'.
+    Retorna um DataFrame com as colunas grupo, quantidade e valor_total (em reais).
+    """
+    if MODO_ARMAZENAMENTO == 'sqlite' and not DASHBOARD_PARQUET:
+        df = pd.DataFrame.from_records(agregar_documentos(agrupar_por, filtros, limite), columns=COLUNAS_AGREGADO)
+        df['valor_total'] = df['valor_total'] / 100
+        return df
+
+    docs = _documentos_filtrados(itens_planos, filtros, [COLUNA_DOCUMENTO, COLUNA_DATA, COLUNA_EMITENTE,
+                                                         'status_auditoria', 'emitente', 'valor_total_nota'])
+    # Como em banco_documentos.AGRUPAMENTOS: o emitente pelo CNPJ só com dígitos, exibido pela razão social
+    grupos = {
+        'status': docs['status_auditoria'],
+        'emitente': docs[COLUNA_EMITENTE].fillna(docs['emitente']),
+        'mes': docs[COLUNA_DATA].str[:7],
+    }[agrupar_por]
+    df = (docs.groupby(grupos.rename('grupo'), dropna=False)['valor_total_nota']
+          .agg(quantidade='size', valor_total='sum').reset_index())
+    if agrupar_por == 'emitente':
+        df['grupo'] = df['grupo'].map(docs.groupby(grupos)['emitente'].max()).fillna(df['grupo'])
+    if agrupar_por == 'mes':
+        df = df.sort_values('grupo')
+    else:
+        df = df.sort_values('valor_total' if agrupar_por == 'emitente' else 'quantidade', ascending=False)
+    return (df.head(limite) if limite else df).reset_index(drop=True)[COLUNAS_AGREGADO]
@@ -0,0 +1,215 @@
+# Arquivo: diario_documentos.py (Diário append-only dos documentos auditados em JSON Lines)
+
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: o bloqueio entre processos não está disponível
+    fcntl = None
+
+DIARIO_DOCUMENTOS = 'db_documentos.jsonl'
+
+# O fsync é feito em lotes: a cada FSYNC_LOTE registros ou FSYNC_INTERVALO segundos,
+# o que ocorrer primeiro. Os registros pendentes são sincronizados ao encerrar o processo.
+FSYNC_LOTE = 32
+FSYNC_INTERVALO = 1.0
+
+_lock_escrita = threading.Lock()
+_estado = {'caminho': None, 'fd': None, 'pendentes': 0, 'ultimo_fsync': 0.0}
+
+
+def _bloquear(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+
+def _desbloquear(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def _abrir_diario(diario_file):
+    """Abre (ou reutiliza) o descritor do diário em modo O_APPEND."""
+    caminho = os.path.abspath(diario_file)
+    if _estado['caminho'] != caminho or _estado['fd'] is None:
+        _fechar_diario()
+        _estado['fd'] = os.open(caminho, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        _estado['caminho'] = caminho
+    return _estado['fd']
+
+
+def _fechar_diario():
+    if _estado['fd'] is not None:
+        if _estado['pendentes']:
+            os.fsync(_estado['fd'])
+        os.close(_estado['fd'])
+    _estado.update({'caminho': None, 'fd': None, 'pendentes': 0})
+
+
+def chave_registro(registro):
+    """
+    Identifica o documento de um registro. Um registro posterior com a mesma
+    chave substitui o anterior na compactação. Registros sem número nunca são substituídos.
+    """
+    if not registro.get('numero'):
+        return None
+    return (registro.get('tipo_documento'), registro.get('emitente_cnpj'), registro.get('numero'))
+
+
+def registrar_documento(audit_result, diario_file=DIARIO_DOCUMENTOS):
+    """
+    Acrescenta um documento auditado ao diário com uma única escrita O_APPEND,
+    sob bloqueio exclusivo do arquivo. Retorna o offset (em bytes) do registro.
+    """
+    return _acrescentar([audit_result], diario_file)
+
+
+def registrar_documentos(audit_results, diario_file=DIARIO_DOCUMENTOS):
+    """
+    Acrescenta vários documentos ao diário em uma única escrita O_APPEND
+    (e um único fsync). Retorna o offset (em bytes) do primeiro registro.
+    """
+    offset = _acrescentar(audit_results, diario_file)
+    sincronizar_diario()
+    return offset
+
+
+def _acrescentar(audit_results, diario_file):
+    """Grava as linhas dos registros no fim do diário, sob bloqueio exclusivo."""
+    conteudo = b''.join((json.dumps(audit_result, ensure_ascii=False) + '\n').encode('utf-8')
+                        for audit_result in audit_results)
+    with _lock_escrita:
+        while True:
+            fd = _abrir_diario(diario_file)
+            _bloquear(fd)
+            # Se o diário foi compactado (substituído) enquanto esperávamos o bloqueio,
+            # o descritor aponta para o arquivo antigo: reabre e tenta novamente.
+            try:
+                atual = os.stat(_estado['caminho'])
+            except FileNotFoundError:
+                atual = None
+            if atual is not None and atual.st_ino == os.fstat(fd).st_ino:
+                break
+            _desbloquear(fd)
+            _fechar_diario()
+
+        try:
+            offset = os.fstat(fd).st_size
+            escritos = os.write(fd, conteudo)
+            while escritos < len(conteudo):
+                escritos += os.write(fd, conteudo[escritos:])
+            _estado['pendentes'] += len(audit_results)
+            agora = time.monotonic()
+            if _estado['pendentes'] >= FSYNC_LOTE or agora - _estado['ultimo_fsync'] >= FSYNC_INTERVALO:
+                os.fsync(fd)
+                _estado['pendentes'] = 0
+                _estado['ultimo_fsync'] = agora
+        finally:
+            _desbloquear(fd)
+    return offset
+
+
+def sincronizar_diario():
+    """Força o fsync dos registros ainda pendentes."""
+    with _lock_escrita:
+        if _estado['fd'] is not None and _estado['pendentes']:
+            os.fsync(_estado['fd'])
+            _estado['pendentes'] = 0
+            _estado['ultimo_fsync'] = time.monotonic()
+
+
+atexit.register(sincronizar_diario)
+
+
+def ler_diario(diario_file=DIARIO_DOCUMENTOS, cursor=None, limite_bytes=None):
+    """
+    Lê os registros do diário a partir de um cursor (inode, offset) retornado
+    por uma leitura anterior; sem cursor, lê desde o início.
+    Com 'limite_bytes', lê só até esse tamanho (estendido até o fim da linha
+    em andamento), para percorrer diários grandes em blocos.
+    Retorna (registros, novo_cursor, reiniciado). 'reiniciado' indica que o
+    diário foi compactado desde o cursor informado e foi lido desde o início,
+    portanto quem lê deve descartar o que já tinha carregado.
+    Linhas ainda incompletas (escrita em andamento) ficam para a próxima leitura.
+    """
+    if not os.path.exists(diario_file):
+        return [], None, cursor is not None
+
+    with open(diario_file, 'rb') as f:
+        inode = os.fstat(f.fileno()).st_ino
+        reiniciado = cursor is not None and cursor[0] != inode
+        offset = 0 if cursor is None or reiniciado else cursor[1]
+        f.seek(offset)
+        if limite_bytes:
+            conteudo = f.read(limite_bytes)
+            if len(conteudo) == limite_bytes and not conteudo.endswith(b'\n'):
+                conteudo += f.readline()
+        else:
+            conteudo = f.read()
+
+    fim = conteudo.rfind(b'\n') + 1
+    registros = [json.loads(linha) for linha in conteudo[:fim].splitlines() if linha.strip()]
+    return registros, (inode, offset + fim), reiniciado
+
+
+def listar_diario(diario_file=DIARIO_DOCUMENTOS):
+    """Retorna a visão atual do diário: apenas o registro mais recente de cada documento."""
+    registros, _, _ = ler_diario(diario_file)
+    return _remover_substituidos(registros)
+
+
+def _remover_substituidos(registros):
+    """Mantém o último registro de cada chave, na posição em que ele aparece."""
+    ultima_posicao = {}
+    for i, registro in enumerate(registros):
+        chave = chave_registro(registro)
+        if chave is not None:
+            ultima_posicao[chave] = i
+    return [registro for i, registro in enumerate(registros)
+            if (chave := chave_registro(registro)) is None or ultima_posicao[chave] == i]
+
+
+def compactar_diario(diario_file=DIARIO_DOCUMENTOS):
+    """
+    Reescreve o diário mantendo apenas o registro mais recente de cada documento.
+    A troca é atômica (os.replace) e feita sob o mesmo bloqueio dos escritores.
+    Retorna (registros_antes, registros_depois).
+    """
+    if not os.path.exists(diario_file):
+        return 0, 0
+
+    with open(diario_file, 'rb') as original:
+        _bloquear(original.fileno())
+        try:
+            registros = [json.loads(linha) for linha in original.read().splitlines() if linha.strip()]
+            compactados = _remover_substituidos(registros)
+
+            temp_file = diario_file + '.compactando'
+            with open(temp_file, 'wb') as f:
+                for registro in compactados:
+                    f.write((json.dumps(registro, ensure_ascii=False) + '\n').encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, diario_file)
+        finally:
+            _desbloquear(original.fileno())
+    return len(registros), len(compactados)
+
+
+# --- Execução Principal ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manutenção do diário de documentos auditados.")
+    parser.add_argument('--diario', default=DIARIO_DOCUMENTOS, help="Arquivo JSON Lines do diário.")
+    parser.add_argument('--compactar', action='store_true', help="Remove registros substituídos do diário.")
+    args = parser.parse_args()
+
+    if args.compactar:
+        antes, depois = compactar_diario(args.diario)
+        print(f"Diário compactado: {antes} registros -> {depois} registros.")
+    else:
+        parser.print_help()
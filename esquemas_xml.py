@@ -0,0 +1,222 @@
+# Arquivo: esquemas_xml.py (Esquemas declarativos de extração dos XMLs fiscais)
+#
+# Cada tipo de documento (NFe 4.00, CTe 3.00/4.00 e NFS-e no padrão ABRASF) é
+# descrito por blocos: um bloco é um elemento do XML, identificado pelo nome
+# local, e os campos extraídos dele por expressões XPath relativas ao bloco
+# (prefixo 'doc' = namespace do documento). Alternativas entre layouts são
+# escritas como união ('a | b'): vale a primeira que aparecer no documento.
+# O tipo_documento gravado é a chave do esquema, ou 'tipo_documento' se informado.
+#
+# Os blocos de cabeçalho são lidos só na primeira ocorrência; o bloco de itens
+# é lido em todas. Os campos de um bloco não devem depender de blocos internos
+# a ele, que na leitura em streaming já terão sido descartados.
+#
+# Os esquemas são compilados uma única vez, na importação: cada bloco vira um
+# único etree.XPath que devolve todos os seus campos de uma só vez.
+
+from lxml import etree
+
+NS_NFE = 'http://www.portalfiscal.inf.br/nfe'
+NS_CTE = 'http://www.portalfiscal.inf.br/cte'
+NS_NFSE_ABRASF = 'http://www.abrasf.org.br/nfse.xsd'
+
+# tipo_documento das NFS-e, lidas do XML ou do PDF
+TIPO_NFSE = 'NFS-e'
+
+ESQUEMAS = {
+    'NFE': {
+        'namespace': NS_NFE,
+        'cabecalho': {
+            'infNFe': {
+                'chave_acesso': 'substring-after(@Id, "NFe")',
+                'versao_layout': '@versao',
+            },
+            'ide': {
+                'numero': 'doc:nNF',
+                'serie': 'doc:serie',
+                'modelo': 'doc:mod',
+                'data_emissao': 'doc:dhEmi | doc:dEmi',
+                'natureza_operacao': 'doc:natOp',
+                'tipo_operacao': 'doc:tpNF',
+                'destino_operacao': 'doc:idDest',
+                'finalidade': 'doc:finNFe',
+            },
+            'emit': {
+                'emitente_razao_social': 'doc:xNome',
+                'emitente_cnpj': 'doc:CNPJ',
+                'emitente_ie': 'doc:IE',
+                'emitente_uf': 'doc:enderEmit/doc:UF',
+                'emitente_crt': 'doc:CRT',
+            },
+            'dest': {
+                'destinatario_razao_social': 'doc:xNome',
+                'destinatario_cnpj_cpf': 'doc:CNPJ | doc:CPF | doc:idEstrangeiro',
+                'destinatario_ie': 'doc:IE',
+                'destinatario_uf': 'doc:enderDest/doc:UF',
+            },
+            'ICMSTot': {
+                'valor_total_nota': 'doc:vNF',
+                'valor_produtos': 'doc:vProd',
+                'valor_icms': 'doc:vICMS',
+                'valor_icms_st': 'doc:vST',
+                'valor_ipi': 'doc:vIPI',
+                'valor_pis': 'doc:vPIS',
+                'valor_cofins': 'doc:vCOFINS',
+                'valor_frete': 'doc:vFrete',
+                'valor_desconto': 'doc:vDesc',
+            },
+        },
+        'itens': ('det', {
+            'codigo': 'doc:prod/doc:cProd',
+            'descricao': 'doc:prod/doc:xProd',
+            'ncm': 'doc:prod/doc:NCM',
+            'cest': 'doc:prod/doc:CEST',
+            'cfop': 'doc:prod/doc:CFOP',
+            'unidade': 'doc:prod/doc:uCom',
+            'quantidade': 'doc:prod/doc:qCom',
+            'valor_unitario': 'doc:prod/doc:vUnCom',
+            'valor_total': 'doc:prod/doc:vProd',
+            'icms_origem': 'doc:imposto/doc:ICMS/*/doc:orig',
+            'icms_cst': 'doc:imposto/doc:ICMS/*/doc:CST | doc:imposto/doc:ICMS/*/doc:CSOSN',
+            'icms_base': 'doc:imposto/doc:ICMS/*/doc:vBC',
+            'icms_aliquota': 'doc:imposto/doc:ICMS/*/doc:pICMS',
+            'icms_valor': 'doc:imposto/doc:ICMS/*/doc:vICMS',
+            'ipi_cst': 'doc:imposto/doc:IPI/*/doc:CST',
+            'pIPI': 'doc:imposto//doc:IPITrib/doc:pIPI',
+            'ipi_valor': 'doc:imposto//doc:IPITrib/doc:vIPI',
+            'pis_cst': 'doc:imposto/doc:PIS/*/doc:CST',
+            'pis_base': 'doc:imposto/doc:PIS/*/doc:vBC',
+            'pis_aliquota': 'doc:imposto/doc:PIS/*/doc:pPIS',
+            'pis_valor': 'doc:imposto/doc:PIS/*/doc:vPIS',
+            'cofins_cst': 'doc:imposto/doc:COFINS/*/doc:CST',
+            'cofins_base': 'doc:imposto/doc:COFINS/*/doc:vBC',
+            'cofins_aliquota': 'doc:imposto/doc:COFINS/*/doc:pCOFINS',
+            'cofins_valor': 'doc:imposto/doc:COFINS/*/doc:vCOFINS',
+        }),
+    },
+    # CTe 3.00 e 4.00 compartilham o namespace; as diferenças de layout usadas
+    # aqui (tomador em toma3/toma4) são cobertas por alternativas
+    'CTE': {
+        'namespace': NS_CTE,
+        'cabecalho': {
+            'infCte': {
+                'chave_acesso': 'substring-after(@Id, "CTe")',
+                'versao_layout': '@versao',
+            },
+            'ide': {
+                'numero': 'doc:nCT',
+                'serie': 'doc:serie',
+                'modelo': 'doc:mod',
+                'data_emissao': 'doc:dhEmi',
+                'cfop': 'doc:CFOP',
+                'natureza_operacao': 'doc:natOp',
+                'modal': 'doc:modal',
+                'tipo_servico': 'doc:tpServ',
+                'uf_inicio': 'doc:UFIni',
+                'uf_fim': 'doc:UFFim',
+                'municipio_inicio': 'doc:xMunIni',
+                'municipio_fim': 'doc:xMunFim',
+                'tomador': 'doc:toma3/doc:toma | doc:toma4/doc:toma',
+            },
+            'emit': {
+                'emitente_razao_social': 'doc:xNome',
+                'emitente_cnpj': 'doc:CNPJ',
+                'emitente_ie': 'doc:IE',
+                'emitente_uf': 'doc:enderEmit/doc:UF',
+            },
+            'rem': {
+                'remetente_razao_social': 'doc:xNome',
+                'remetente_cnpj_cpf': 'doc:CNPJ | doc:CPF',
+            },
+            'dest': {
+                'destinatario_razao_social': 'doc:xNome',
+                'destinatario_cnpj_cpf': 'doc:CNPJ | doc:CPF',
+            },
+            'vPrest': {
+                'valor_total_nota': 'doc:vTPrest',
+                'valor_receber': 'doc:vRec',
+            },
+            'imp': {
+                'icms_cst': 'doc:ICMS/*/doc:CST',
+                'icms_base': 'doc:ICMS/*/doc:vBC',
+                'icms_aliquota': 'doc:ICMS/*/doc:pICMS',
+                'valor_icms': 'doc:ICMS/*/doc:vICMS',
+            },
+            'infCarga': {
+                'valor_carga': 'doc:vCarga',
+                'produto_predominante': 'doc:proPred',
+            },
+        },
+    },
+    # ABRASF 1.00 (Servico/PrestadorServico/TomadorServico em InfNfse) e 2.0x
+    # (dentro de DeclaracaoPrestacaoServico/InfDeclaracaoPrestacaoServico)
+    'NFSE': {
+        'tipo_documento': TIPO_NFSE,
+        'namespace': NS_NFSE_ABRASF,
+        'cabecalho': {
+            'InfNfse': {
+                'numero': 'doc:Numero',
+                'codigo_verificacao': 'doc:CodigoVerificacao',
+                'data_emissao': 'doc:DataEmissao',
+                'competencia': 'doc:Competencia | .//doc:InfDeclaracaoPrestacaoServico/doc:Competencia',
+                'emitente_razao_social': 'doc:PrestadorServico/doc:RazaoSocial',
+                'emitente_cnpj': ('.//doc:IdentificacaoPrestador/doc:Cnpj | .//doc:IdentificacaoPrestador/doc:CpfCnpj/doc:Cnpj'
+                                  ' | .//doc:Prestador/doc:CpfCnpj/doc:Cnpj'),
+                'emitente_inscricao_municipal': './/doc:IdentificacaoPrestador/doc:InscricaoMunicipal | .//doc:Prestador/doc:InscricaoMunicipal',
+                'destinatario_razao_social': './/doc:TomadorServico/doc:RazaoSocial | .//doc:Tomador/doc:RazaoSocial',
+                'destinatario_cnpj_cpf': './/doc:IdentificacaoTomador/doc:CpfCnpj/doc:Cnpj | .//doc:IdentificacaoTomador/doc:CpfCnpj/doc:Cpf',
+                'valor_total_nota': './/doc:Servico/doc:Valores/doc:ValorServicos',
+                'valor_iss': './/doc:ValorIss',
+                'aliquota_iss': './/doc:Servico/doc:Valores/doc:Aliquota | doc:ValoresNfse/doc:Aliquota',
+                'item_lista_servico': './/doc:Servico/doc:ItemListaServico',
+                'codigo_municipio': './/doc:Servico/doc:CodigoMunicipio',
+                'discriminacao_servicos': './/doc:Servico/doc:Discriminacao',
+            },
+        },
+    },
+}
+
+# Separa os campos no resultado do XPath de um bloco (caractere de uso privado,
+# que não aparece em documentos fiscais)
+_SEPARADOR = '\ue000'
+
+
+def _compilar_bloco(campos, namespace):
+    """Compila os campos de um bloco em um único XPath: retorna (nomes, xpath)."""
+    expressao = f',"{_SEPARADOR}",'.join(f'string({caminho})' for caminho in campos.values())
+    if len(campos) > 1:
+        expressao = f'concat({expressao})'
+    return tuple(campos), etree.XPath(expressao, namespaces={'doc': namespace})
+
+
+def _compilar(tipo_documento, esquema):
+    namespace = esquema['namespace']
+    compilado = {
+        'tipo_documento': esquema.get('tipo_documento', tipo_documento),
+        'namespace': namespace,
+        # {tag (notação {namespace}nome): (nome do bloco, campos, xpath)}
+        'cabecalho': {f'{{{namespace}}}{bloco}': (bloco, *_compilar_bloco(campos, namespace))
+                      for bloco, campos in esquema['cabecalho'].items()},
+        'itens': None,
+    }
+    if 'itens' in esquema:
+        bloco, campos = esquema['itens']
+        compilado['itens'] = (f'{{{namespace}}}{bloco}', *_compilar_bloco(campos, namespace))
+    return compilado
+
+
+ESQUEMAS_COMPILADOS = {esquema['namespace']: _compilar(tipo, esquema) for tipo, esquema in ESQUEMAS.items()}
+
+# Nomes locais de todos os blocos, para filtrar os eventos da leitura em streaming
+TAGS_BLOCOS = sorted({bloco for esquema in ESQUEMAS.values()
+                      for bloco in [*esquema['cabecalho'], *esquema.get('itens', ())[:1]]})
+
+
+def esquema_do_documento(root):
+    """Retorna o esquema compilado correspondente ao namespace da raiz, ou None."""
+    return ESQUEMAS_COMPILADOS.get(etree.QName(root).namespace)
+
+
+def extrair_campos(nomes, xpath, elemento):
+    """Avalia o XPath de um bloco e retorna {campo: valor} só com os campos preenchidos."""
+    return {nome: valor for nome, valor in zip(nomes, map(str.strip, xpath(elemento).split(_SEPARADOR))) if valor}
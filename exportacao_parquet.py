@@ -0,0 +1,263 @@
+# Arquivo: exportacao_parquet.py (Exportação colunar das auditorias em Parquet)
+#
+# Grava os documentos auditados e a tabela achatada de itens do dashboard (a
+# mesma de dados_dashboard.montar_dataframe, com os valores em reais) em
+# Parquet, particionados por mês de emissão no formato hive
+# (ex.: itens/mes=2024-05/lote-000003-0.parquet), para o BI ler só as colunas
+# e os meses de que precisa, sem carregar o acervo inteiro:
+#   - itens/:      uma linha por item (documentos sem itens geram uma linha);
+#   - documentos/: uma linha por documento, com as colunas do documento.
+# Documentos sem data de emissão reconhecida ficam na partição mes=sem-data.
+#
+# A exportação é incremental: cada execução lê só os documentos gravados ou
+# alterados desde a anterior (o cursor fica em _exportacao.json, no diretório
+# da exportação) e acrescenta um arquivo novo (um lote) em cada mês que recebeu
+# documentos, sem reescrever os arquivos existentes. Um documento regravado no
+# diário JSONL ou alterado no SQLite (conclusão pela IA, reauditoria: o cursor
+# é a revisão do banco) volta em um lote posterior; na leitura
+# (ler_exportacao) vale o lote mais recente de cada documento. A exportação é
+# refeita do zero quando o diário é compactado, o modo de armazenamento muda
+# ou as colunas exportadas mudam (VERSAO_EXPORTACAO).
+#
+# O pyarrow é uma dependência opcional, importada só ao exportar ou ler.
+# Variável de ambiente:
+#   - AGENTE_FISCAL_PARQUET: diretório da exportação (padrão: exportacao_parquet)
+#
+# Uso (a partir da raiz do projeto):
+#   python exportacao_parquet.py
+#   python exportacao_parquet.py --completo    (refaz a exportação do zero)
+
+import argparse
+import functools
+import json
+import operator
+import os
+import shutil
+import time
+
+import pandas as pd
+
+from banco_documentos import COLUNAS_ITENS_PLANOS, somente_digitos
+from dados_dashboard import COLUNA_DATA, COLUNA_DOCUMENTO, COLUNA_EMITENTE, COLUNAS_MONETARIAS, montar_dataframe
+from persistencia import MODO_ARMAZENAMENTO, ler_itens_planos_desde
+
+DIRETORIO_PARQUET = os.getenv('AGENTE_FISCAL_PARQUET', 'exportacao_parquet')
+ARQUIVO_ESTADO = '_exportacao.json'
+# Versão das colunas exportadas: exportações de outra versão são refeitas do zero
+VERSAO_EXPORTACAO = 2
+
+COLUNA_LOTE = '_lote'
+COLUNA_MES = 'mes'
+SEM_DATA = 'sem-data'
+COLUNAS_DOCUMENTOS = [coluna for coluna in COLUNAS_ITENS_PLANOS if not coluna.startswith('item_')]
+TABELAS = {'itens': COLUNAS_ITENS_PLANOS, 'documentos': COLUNAS_DOCUMENTOS}
+
+
+def _pyarrow():
+    """Importa o pyarrow (opcional), com uma mensagem clara se ele não estiver instalado."""
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+    except ImportError:
+        raise ImportError("A exportação Parquet requer o pacote pyarrow (pip install pyarrow).") from None
+    return pa, pc, ds
+
+
+def _esquema(tabela):
+    """Esquema fixo de cada tabela: os lotes são lidos juntos, mesmo com colunas todas vazias em algum deles."""
+    pa, _, _ = _pyarrow()
+    campos = [(coluna, pa.float64() if coluna in COLUNAS_MONETARIAS else pa.string()) for coluna in TABELAS[tabela]]
+    campos += [(COLUNA_DOCUMENTO, pa.string()), (COLUNA_DATA, pa.string()), (COLUNA_EMITENTE, pa.string()),
+               (COLUNA_LOTE, pa.int64()), (COLUNA_MES, pa.string())]
+    return pa.schema(campos)
+
+
+def _particionamento():
+    pa, _, ds = _pyarrow()
+    return ds.partitioning(pa.schema([(COLUNA_MES, pa.string())]), flavor='hive')
+
+
+def _como_texto(valor):
+    # Campos lidos por OCR/IA podem vir como número (ex.: o número da nota)
+    return valor if valor is None or isinstance(valor, str) else str(valor)
+
+
+# --- Exportação ---
+
+def _ler_estado(diretorio):
+    try:
+        with open(os.path.join(diretorio, ARQUIVO_ESTADO), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _gravar_estado(diretorio, estado):
+    """Grava o cursor da exportação; a troca do arquivo é atômica (os.replace)."""
+    caminho = os.path.join(diretorio, ARQUIVO_ESTADO)
+    with open(caminho + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(estado, f)
+    os.replace(caminho + '.tmp', caminho)
+
+
+def _limpar(diretorio):
+    """Remove as tabelas exportadas (só os diretórios de TABELAS), para refazer a exportação."""
+    for tabela in TABELAS:
+        shutil.rmtree(os.path.join(diretorio, tabela), ignore_errors=True)
+
+
+def _escrever_lote(diretorio, df, lote):
+    """
+    Grava as linhas de um lote (DataFrame de montar_dataframe) nas duas tabelas,
+    em um arquivo novo por mês. Retorna (documentos, meses) do lote.
+    """
+    pa, _, ds = _pyarrow()
+    df[COLUNA_DOCUMENTO] = df[COLUNA_DOCUMENTO].map(str)
+    df[COLUNA_LOTE] = lote
+    df[COLUNA_MES] = df[COLUNA_DATA].str[:7].fillna(SEM_DATA)
+    documentos = df.drop_duplicates(subset=[COLUNA_DOCUMENTO])
+
+    for tabela, dados in (('itens', df), ('documentos', documentos)):
+        esquema = _esquema(tabela)
+        dados = dados[esquema.names].copy()
+        for coluna in esquema.names:
+            if dados[coluna].dtype == object:
+                dados[coluna] = dados[coluna].map(_como_texto)
+        # 'overwrite_or_ignore': os arquivos dos lotes anteriores ficam; um lote
+        # interrompido antes de gravar o cursor é regravado com os mesmos nomes
+        ds.write_dataset(pa.Table.from_pandas(dados, schema=esquema, preserve_index=False),
+                         os.path.join(diretorio, tabela), format='parquet', partitioning=_particionamento(),
+                         basename_template=f'lote-{lote:06d}-{{i}}.parquet',
+                         existing_data_behavior='overwrite_or_ignore')
+    return len(documentos), set(documentos[COLUNA_MES])
+
+
+def exportar(diretorio=None, completo=False, lote_documentos=50000):
+    """
+    Exporta para Parquet os documentos gravados ou alterados desde a exportação anterior
+    (ou todos, com 'completo'), em lotes de até 'lote_documentos' documentos
+    no SQLite. Retorna o relatório da execução.
+    """
+    _pyarrow()
+    diretorio = diretorio or DIRETORIO_PARQUET
+    os.makedirs(diretorio, exist_ok=True)
+    inicio = time.perf_counter()
+
+    estado = _ler_estado(diretorio) or {}
+    refeita = completo or estado.get('modo') != MODO_ARMAZENAMENTO or estado.get('versao') != VERSAO_EXPORTACAO
+    if refeita:
+        _limpar(diretorio)
+    cursor = None if refeita else estado.get('cursor')
+    lote = estado.get('lote', 0)
+
+    documentos = linhas_exportadas = 0
+    meses = set()
+    while True:
+        linhas, cursor_lido, reiniciado = ler_itens_planos_desde(cursor, limite_documentos=lote_documentos)
+        if reiniciado:
+            # O diário foi compactado desde a última exportação: ele é lido desde o início
+            _limpar(diretorio)
+            refeita = True
+        if linhas:
+            lote += 1
+            documentos_lote, meses_lote = _escrever_lote(diretorio, montar_dataframe(linhas), lote)
+            documentos += documentos_lote
+            linhas_exportadas += len(linhas)
+            meses |= meses_lote
+        cursor = cursor_lido
+        _gravar_estado(diretorio, {'modo': MODO_ARMAZENAMENTO, 'versao': VERSAO_EXPORTACAO, 'cursor': cursor,
+                                   'lote': lote})
+        # O diário é lido até o fim de uma vez
+        if not linhas or MODO_ARMAZENAMENTO == 'jsonl':
+            break
+
+    duracao = time.perf_counter() - inicio
+    return {
+        'diretorio': diretorio,
+        'documentos': documentos,
+        'linhas': linhas_exportadas,
+        'meses': sorted(meses),
+        'refeita': refeita,
+        'lote': lote,
+        'duracao': duracao,
+        'docs_por_segundo': documentos / duracao if duracao else 0.0,
+    }
+
+
+def imprimir_relatorio(relatorio):
+    print(f"\nExportação em:          {relatorio['diretorio']}" + (" (refeita do zero)" if relatorio['refeita'] else ""))
+    print(f"Documentos exportados:  {relatorio['documentos']}")
+    print(f"Linhas de itens:        {relatorio['linhas']}")
+    if relatorio['meses']:
+        print(f"Meses com dados novos:  {', '.join(relatorio['meses'])}")
+    print(f"Duração:                {relatorio['duracao']:.2f}s ({relatorio['docs_por_segundo']:.1f} docs/s)")
+
+
+# --- Leitura (dashboard e BI) ---
+
+def _filtro(filtros, tabela):
+    """
+    Traduz os filtros do dashboard (ver dados_dashboard._filtrar) em uma
+    expressão do pyarrow. O período também restringe a partição 'mes', para
+    os meses fora dele nem serem abertos. Retorna None se não houver filtros.
+    """
+    _, pc, ds = _pyarrow()
+    filtros = filtros or {}
+    if (filtros.get('cfop') or filtros.get('ncm')) and tabela != 'itens':
+        raise ValueError("Os filtros de CFOP e NCM exigem a tabela de itens.")
+    condicoes = []
+    if filtros.get('data_inicio'):
+        condicoes += [ds.field(COLUNA_MES) >= str(filtros['data_inicio'])[:7],
+                      ds.field(COLUNA_DATA) >= str(filtros['data_inicio'])]
+    if filtros.get('data_fim'):
+        condicoes += [ds.field(COLUNA_MES) <= str(filtros['data_fim'])[:7],
+                      ds.field(COLUNA_DATA) <= str(filtros['data_fim'])]
+    if filtros.get('emitente_cnpj'):
+        condicoes.append(ds.field(COLUNA_EMITENTE) == somente_digitos(filtros['emitente_cnpj']))
+    if filtros.get('status'):
+        condicoes.append(ds.field('status_auditoria').isin(list(filtros['status'])))
+    if filtros.get('cfop'):
+        condicoes.append(ds.field('item_cfop') == str(filtros['cfop']).strip())
+    if filtros.get('ncm'):
+        condicoes.append(pc.starts_with(ds.field('item_ncm'), ''.join(filter(str.isdigit, filtros['ncm']))))
+    return functools.reduce(operator.and_, condicoes) if condicoes else None
+
+
+def ler_exportacao(tabela='itens', filtros=None, colunas=None, diretorio=None):
+    """
+    Lê uma tabela da exportação ('itens' ou 'documentos') como DataFrame, com
+    os filtros do dashboard aplicados na leitura (partições, estatísticas dos
+    arquivos e colunas filtradas) e só as 'colunas' pedidas (padrão: as da
+    tabela, o documento, a data e o CNPJ do emitente só com dígitos). De cada
+    documento vale o lote mais recente.
+    """
+    _, _, ds = _pyarrow()
+    esquema = _esquema(tabela)
+    colunas = list(colunas or TABELAS[tabela] + [COLUNA_DOCUMENTO, COLUNA_DATA, COLUNA_EMITENTE])
+    caminho = os.path.join(diretorio or DIRETORIO_PARQUET, tabela)
+    if not os.path.isdir(caminho):
+        return pd.DataFrame(columns=colunas)
+    dataset = ds.dataset(caminho, schema=esquema, format='parquet', partitioning=_particionamento())
+
+    # Documentos regravados ou alterados aparecem em mais de um lote: basta ler as duas colunas de controle
+    lotes = dataset.to_table(columns=[COLUNA_DOCUMENTO, COLUNA_LOTE]).to_pandas().drop_duplicates()
+    substituidos = lotes[COLUNA_DOCUMENTO].duplicated().any()
+    leitura = list(dict.fromkeys(colunas + ([COLUNA_DOCUMENTO, COLUNA_LOTE] if substituidos else [])))
+
+    df = dataset.to_table(columns=leitura, filter=_filtro(filtros, tabela)).to_pandas()
+    if substituidos:
+        ultimo_lote = lotes.groupby(COLUNA_DOCUMENTO)[COLUNA_LOTE].max()
+        df = df[df[COLUNA_LOTE] == df[COLUNA_DOCUMENTO].map(ultimo_lote)]
+    return df[colunas].reset_index(drop=True)
+
+
+# --- Execução Principal ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta as auditorias gravadas para Parquet, particionado por mês de emissão.")
+    parser.add_argument('--diretorio', default=None, help="Diretório da exportação (padrão: AGENTE_FISCAL_PARQUET ou exportacao_parquet).")
+    parser.add_argument('--completo', action='store_true', help="Refaz a exportação do zero (ex.: para descartar os lotes substituídos).")
+    parser.add_argument('--lote', type=int, default=50000, help="Documentos lidos e gravados por lote (SQLite).")
+    args = parser.parse_args()
+
+    imprimir_relatorio(exportar(args.diretorio, args.completo, args.lote))
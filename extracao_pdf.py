@@ -0,0 +1,162 @@
+# Arquivo: extracao_pdf.py (Texto dos PDFs por página e detecção de campos por regras)
+#
+# O texto é extraído página a página; PDFs com muitas páginas são divididos em
+# blocos de páginas processados em um pool de processos (o PyMuPDF não libera
+# o GIL, então threads não paralelizam a extração).
+#
+# Antes de recorrer à IA, os campos da NFS-e são procurados no texto com
+# expressões regulares. Só os campos que faltarem são pedidos ao LLM, e só com
+# os trechos das páginas que podem contê-los.
+
+import atexit
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+# PDFs com menos páginas que isto são lidos no próprio processo
+MIN_PAGINAS_PARALELO = 8
+PAGINAS_POR_TAREFA = 4
+# Máximo de páginas enviadas ao LLM para completar os campos faltantes
+MAX_PAGINAS_IA = 4
+
+# Campos pedidos na extração, com os nomes usados no JSON devolvido pela IA
+CAMPOS_PDF = ('cnpj_emitente', 'destinatario_cnpj_cpf', 'numero', 'data_emissao',
+              'valor_total_nota', 'discriminacao_servicos')
+
+# Expressões que localizam cada campo (o primeiro grupo é o valor)
+PADROES_CAMPOS = {
+    'numero': [
+        re.compile(r'N[úu]mero\s+d[ao]\s+(?:NFS-?e|Nota(?:\s+Fiscal)?)\s*[:\-]?\s*(\d+)', re.IGNORECASE),
+        re.compile(r'(?:NFS-?e|Nota\s+Fiscal)\s*(?:N[º°o]\.?|N[úu]mero)\s*[:\-]?\s*(\d+)', re.IGNORECASE),
+    ],
+    'data_emissao': [
+        re.compile(r'Data\s+(?:e\s+Hora\s+)?(?:d[ae]\s+)?Emiss[ãa]o(?:\s+da\s+(?:NFS-?e|Nota))?\s*[:\-]?\s*'
+                   r'(\d{2}/\d{2}/\d{4}(?:\s+\d{2}:\d{2}(?::\d{2})?)?)', re.IGNORECASE),
+    ],
+    'valor_total_nota': [
+        re.compile(r'Valor\s+(?:Total|L[íi]quido)(?:\s+d[ao]s?\s+(?:Nota|NFS-?e|Servi[çc]os))?\s*[:=\-]?\s*'
+                   r'(?:R\$)?\s*(\d{1,3}(?:\.\d{3})*,\d{2})', re.IGNORECASE),
+    ],
+    'discriminacao_servicos': [
+        re.compile(r'Discrimina[çc][ãa]o\s+d[ao]s?\s+Servi[çc]os?\s*[:\-]?\s*(.+?)'
+                   r'(?=\n\s*\n|\n\s*(?:Valor\s+Total|VALOR\s+TOTAL|C[óo]digo\s+do\s+Servi[çc]o)|\Z)',
+                   re.IGNORECASE | re.DOTALL),
+    ],
+}
+
+# CPF/CNPJ rotulados ("CNPJ: ...", "CPF/CNPJ: ...") e os títulos das seções de prestador e tomador
+PADRAO_DOCUMENTO = re.compile(r'\b(?:CPF\s*/\s*CNPJ|CNPJ\s*/\s*CPF|CNPJ|CPF)\s*[:\-]?\s*(\d[\d./\-]{10,18}\d)', re.IGNORECASE)
+PADRAO_SECAO_PRESTADOR = re.compile(r'PRESTADOR|EMITENTE', re.IGNORECASE)
+PADRAO_SECAO_TOMADOR = re.compile(r'TOMADOR|DESTINAT[ÁA]RIO', re.IGNORECASE)
+
+# Palavras que indicam em que páginas procurar um campo que as regras não encontraram
+PALAVRAS_CHAVE_CAMPOS = {
+    'cnpj_emitente': re.compile(r'CNPJ|PRESTADOR|EMITENTE', re.IGNORECASE),
+    'destinatario_cnpj_cpf': re.compile(r'CPF|CNPJ|TOMADOR|DESTINAT', re.IGNORECASE),
+    'numero': re.compile(r'N[úu]mero|N[º°]', re.IGNORECASE),
+    'data_emissao': re.compile(r'Emiss[ãa]o|\d{2}/\d{2}/\d{4}', re.IGNORECASE),
+    'valor_total_nota': re.compile(r'Valor|R\$', re.IGNORECASE),
+    'discriminacao_servicos': re.compile(r'Discrimina|Servi[çc]o', re.IGNORECASE),
+}
+
+# Revisão da detecção por regras: incrementar quando a lógica mudar sem mudar os
+# padrões acima, para que as extrações em cache feitas com a anterior sejam refeitas
+REVISAO_DETECCAO = 2
+
+
+def versao_deteccao():
+    """Partes da detecção por regras que influenciam o resultado (para a versão do cache de extração)."""
+    padroes = [padrao for lista in PADROES_CAMPOS.values() for padrao in lista]
+    padroes += [PADRAO_DOCUMENTO, PADRAO_SECAO_PRESTADOR, PADRAO_SECAO_TOMADOR, *PALAVRAS_CHAVE_CAMPOS.values()]
+    return (REVISAO_DETECCAO, *(f"{padrao.flags}:{padrao.pattern}" for padrao in padroes))
+
+
+_pool = None
+
+
+def _obter_pool():
+    """Pool de processos compartilhado entre as extrações (criado na primeira vez)."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+        atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+    return _pool
+
+
+def _textos_intervalo(caminho_arquivo, inicio, fim):
+    """Texto das páginas [inicio, fim) do PDF. Executado nos processos do pool."""
+    import fitz  # PyMuPDF
+
+    with fitz.open(caminho_arquivo) as doc:
+        return [doc[i].get_text() for i in range(inicio, fim)]
+
+
+def extrair_textos_paginas(caminho_arquivo, paralelo=True):
+    """
+    Retorna a lista com o texto de cada página do PDF. Com 'paralelo', páginas
+    suficientes e mais de um núcleo, os blocos de páginas são extraídos no pool de processos.
+    """
+    import fitz  # PyMuPDF (importado só quando há PDF a ler)
+
+    with fitz.open(caminho_arquivo) as doc:
+        if not paralelo or doc.page_count < MIN_PAGINAS_PARALELO or (os.cpu_count() or 1) < 2:
+            return [pagina.get_text() for pagina in doc]
+        total = doc.page_count
+
+    pool = _obter_pool()
+    tarefas = [pool.submit(_textos_intervalo, caminho_arquivo, inicio, min(inicio + PAGINAS_POR_TAREFA, total))
+               for inicio in range(0, total, PAGINAS_POR_TAREFA)]
+    return [texto for tarefa in tarefas for texto in tarefa.result()]
+
+
+def _detectar_documentos(texto):
+    """
+    Localiza CPF/CNPJ rotulados e os atribui ao prestador (emitente) e ao tomador
+    pela seção em que aparecem; sem a seção do tomador, o primeiro CNPJ da seção
+    do prestador é o do emitente e o documento seguinte é o do tomador.
+    Documentos antes da seção do prestador (ex.: CNPJ da prefeitura no cabeçalho)
+    são ignorados; sem essa seção, o emitente fica para a IA.
+    """
+    campos = {}
+    secao_prestador = PADRAO_SECAO_PRESTADOR.search(texto)
+    secao_tomador = PADRAO_SECAO_TOMADOR.search(texto, secao_prestador.end() if secao_prestador else 0)
+    for encontrado in PADRAO_DOCUMENTO.finditer(texto):
+        digitos = re.sub(r'\D', '', encontrado.group(1))
+        if len(digitos) not in (11, 14):
+            continue
+        if secao_tomador is not None and encontrado.start() > secao_tomador.start():
+            campos.setdefault('destinatario_cnpj_cpf', digitos)
+        elif secao_prestador is None or encontrado.start() < secao_prestador.start():
+            continue
+        elif 'cnpj_emitente' not in campos and len(digitos) == 14:
+            campos['cnpj_emitente'] = digitos
+        elif secao_tomador is None and digitos != campos.get('cnpj_emitente'):
+            campos.setdefault('destinatario_cnpj_cpf', digitos)
+    return campos
+
+
+def detectar_campos(textos_paginas):
+    """
+    Procura os campos da NFS-e no texto das páginas com regras fixas.
+    Retorna {campo: valor} só com os campos encontrados.
+    """
+    texto = '\n'.join(textos_paginas)
+    campos = _detectar_documentos(texto)
+    for campo, padroes in PADROES_CAMPOS.items():
+        for padrao in padroes:
+            encontrado = padrao.search(texto)
+            if encontrado and encontrado.group(1).strip():
+                campos[campo] = ' '.join(encontrado.group(1).split()) if campo == 'discriminacao_servicos' \
+                    else encontrado.group(1).strip()
+                break
+    return campos
+
+
+def selecionar_trechos(textos_paginas, campos_faltantes):
+    """
+    Junta só as páginas que podem conter os campos faltantes (pelas palavras-chave),
+    até MAX_PAGINAS_IA. Se nenhuma página tiver indício, usa as primeiras páginas.
+    """
+    padroes = [PALAVRAS_CHAVE_CAMPOS[campo] for campo in campos_faltantes]
+    paginas = [texto for texto in textos_paginas if any(p.search(texto) for p in padroes)]
+    return '\n'.join((paginas or textos_paginas)[:MAX_PAGINAS_IA])
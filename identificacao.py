@@ -0,0 +1,36 @@
+# Arquivo: identificacao.py (Identificação dos documentos para detectar duplicatas)
+#
+# Um documento é identificado pela chave de acesso de 44 dígitos (atributo Id de
+# infNFe/infCte, quando existe) e pelo SHA-256 do conteúdo do arquivo. Os dois
+# são obtidos em uma única leitura do arquivo, sem interpretar o XML: a chave é
+# procurada no início do arquivo, onde fica o infNFe/infCte. Assim um documento
+# já auditado é reconhecido antes da extração, mesmo que tenha sido baixado de
+# novo com outro conteúdo (ex.: NFe avulsa e nfeProc com protocolo).
+
+import hashlib
+import re
+
+# Id="NFe<44 dígitos>" ou Id="CTe<44 dígitos>"
+PADRAO_CHAVE_ACESSO = re.compile(rb'\bId\s*=\s*["\'](?:NFe|CTe)(\d{44})["\']')
+# Bytes do início do arquivo em que a chave é procurada
+LIMITE_BUSCA_CHAVE = 64 * 1024
+TAMANHO_BLOCO = 1 << 20
+
+
+def identificar_arquivo(caminho_arquivo):
+    """
+    Lê o arquivo uma vez e retorna {'hash_conteudo': SHA-256 do conteúdo,
+    'chave_acesso': chave de 44 dígitos ou None (PDFs, NFS-e, XMLs sem Id)}.
+    """
+    sha = hashlib.sha256()
+    inicio = b''
+    with open(caminho_arquivo, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_BLOCO), b''):
+            sha.update(bloco)
+            if len(inicio) < LIMITE_BUSCA_CHAVE:
+                inicio += bloco[:LIMITE_BUSCA_CHAVE - len(inicio)]
+    encontrada = PADRAO_CHAVE_ACESSO.search(inicio)
+    return {
+        'hash_conteudo': sha.hexdigest(),
+        'chave_acesso': encontrada.group(1).decode('ascii') if encontrada else None,
+    }
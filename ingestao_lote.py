@@ -0,0 +1,192 @@
+# Arquivo: ingestao_lote.py (Ingestão em lote de documentos fiscais)
+#
+# Processa uma pasta, um arquivo .zip ou um padrão glob de XMLs (NFe/CTe) e PDFs
+# (NFS-e) em um pool de processos e grava os resultados em lotes no banco.
+# Documentos já gravados (mesma chave de acesso ou mesmo conteúdo, ver
+# identificacao.py) e repetidos dentro da própria entrada são pulados antes
+# da extração.
+#
+# Uso (a partir da raiz do projeto):
+#   python ingestao_lote.py notas/ --processos 8
+#   python ingestao_lote.py fechamento_mensal.zip "entrada/**/*.xml" --lote 500
+
+import argparse
+import glob
+import os
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import metricas
+from identificacao import identificar_arquivo
+from persistencia import identificadores_conhecidos, salvar_auditorias
+
+EXTENSOES = ('.xml', '.pdf')
+ETAPAS = ('identificacao', 'extracao', 'auditoria', 'gravacao')
+
+# Chaves de acesso e hashes já gravados, recebidos por cada processo do pool
+_conhecidos = {'chaves': set(), 'hashes': set()}
+
+
+def coletar_arquivos(entradas, pasta_temporaria):
+    """
+    Expande as entradas (pastas, arquivos .zip ou padrões glob) na lista de
+    arquivos XML/PDF a processar. Os .zip são extraídos na pasta temporária.
+    """
+    arquivos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            for raiz, _, nomes in os.walk(entrada):
+                arquivos.extend(os.path.join(raiz, nome) for nome in sorted(nomes)
+                                if nome.lower().endswith(EXTENSOES))
+        elif os.path.isfile(entrada) and zipfile.is_zipfile(entrada):
+            destino = os.path.join(pasta_temporaria, f"{len(arquivos)}_{os.path.basename(entrada)}")
+            with zipfile.ZipFile(entrada) as zf:
+                for membro in zf.namelist():
+                    if membro.lower().endswith(EXTENSOES):
+                        arquivos.append(zf.extract(membro, destino))
+        else:
+            arquivos.extend(caminho for caminho in sorted(glob.glob(entrada, recursive=True))
+                            if caminho.lower().endswith(EXTENSOES))
+    return list(dict.fromkeys(arquivos))
+
+
+def _inicializar_processo(chaves, hashes):
+    _conhecidos['chaves'] = chaves
+    _conhecidos['hashes'] = hashes
+
+
+def _processar_arquivo(caminho_arquivo):
+    """
+    Executado nos processos do pool: identifica, extrai e audita um documento,
+    sem gravar. Retorna {'arquivo', 'auditoria', 'erro' ou 'duplicado',
+    'tempos': {etapa: segundos}}; documentos já gravados não são extraídos.
+    Cada processo também grava o rastro do documento no log de métricas.
+    """
+    with metricas.documento(os.path.basename(caminho_arquivo)):
+        return _identificar_e_auditar(caminho_arquivo)
+
+
+def _identificar_e_auditar(caminho_arquivo):
+    tempos = {}
+    try:
+        inicio = time.perf_counter()
+        identificacao = identificar_arquivo(caminho_arquivo)
+        tempos['identificacao'] = time.perf_counter() - inicio
+        if identificacao['chave_acesso'] in _conhecidos['chaves'] or \
+                identificacao['hash_conteudo'] in _conhecidos['hashes']:
+            return {'arquivo': caminho_arquivo, 'duplicado': True, 'tempos': tempos}
+
+        import agente_fiscal_langchain as agente
+
+        inicio = time.perf_counter()
+        if caminho_arquivo.lower().endswith('.xml'):
+            dados = agente.ler_dados_xml_streaming(caminho_arquivo)
+        else:
+            dados = agente.ler_dados_pdf(caminho_arquivo, paralelo=False,
+                                         hash_conteudo=identificacao['hash_conteudo'])
+        dados = agente.com_identificacao(dados, identificacao)
+        tempos['extracao'] = time.perf_counter() - inicio
+        if 'erro' in dados:
+            return {'arquivo': caminho_arquivo, 'erro': dados['erro'], 'tempos': tempos}
+
+        inicio = time.perf_counter()
+        auditoria = agente.auditar_dados_fiscais(dados)
+        tempos['auditoria'] = time.perf_counter() - inicio
+        return {'arquivo': caminho_arquivo, 'auditoria': auditoria, 'tempos': tempos}
+    except Exception as e:
+        return {'arquivo': caminho_arquivo, 'erro': f"{type(e).__name__}: {e}", 'tempos': tempos}
+
+
+def ingerir(entradas, processos=None, tamanho_lote=200):
+    """
+    Processa todos os documentos das entradas em paralelo e grava os resultados
+    no banco em transações de até 'tamanho_lote' documentos.
+    Retorna o relatório da execução (totais, vazão, tempos por etapa, duplicados e falhas).
+    """
+    inicio = time.perf_counter()
+    tempos = {etapa: [] for etapa in ETAPAS}
+    falhas = []
+    duplicados = []
+    processados = 0
+    pendentes = []
+    chaves, hashes = identificadores_conhecidos()
+
+    def _gravar():
+        nonlocal processados
+        if not pendentes:
+            return
+        inicio_gravacao = time.perf_counter()
+        salvar_auditorias(pendentes)
+        tempos['gravacao'].append(time.perf_counter() - inicio_gravacao)
+        processados += len(pendentes)
+        pendentes.clear()
+
+    with tempfile.TemporaryDirectory() as pasta_temporaria:
+        arquivos = coletar_arquivos(entradas, pasta_temporaria)
+        processos = processos or os.cpu_count() or 1
+        chunksize = max(1, min(64, len(arquivos) // (processos * 4)))
+
+        with ProcessPoolExecutor(max_workers=processos, initializer=_inicializar_processo,
+                                 initargs=(chaves, hashes)) as pool:
+            for resultado in pool.map(_processar_arquivo, arquivos, chunksize=chunksize):
+                for etapa, segundos in resultado['tempos'].items():
+                    tempos[etapa].append(segundos)
+                if 'erro' in resultado:
+                    falhas.append((resultado['arquivo'], resultado['erro']))
+                    continue
+                auditoria = resultado.get('auditoria')
+                # Repetidos dentro da própria entrada só são reconhecidos aqui, após a extração
+                if resultado.get('duplicado') or auditoria.get('chave_acesso') in chaves \
+                        or auditoria['hash_conteudo'] in hashes:
+                    duplicados.append(resultado['arquivo'])
+                    continue
+                if auditoria.get('chave_acesso'):
+                    chaves.add(auditoria['chave_acesso'])
+                hashes.add(auditoria['hash_conteudo'])
+                pendentes.append(auditoria)
+                if len(pendentes) >= tamanho_lote:
+                    _gravar()
+            _gravar()
+
+    duracao = time.perf_counter() - inicio
+    return {
+        'arquivos': len(arquivos),
+        'processados': processados,
+        'duplicados': duplicados,
+        'falhas': falhas,
+        'duracao': duracao,
+        'docs_por_segundo': processados / duracao if duracao else 0.0,
+        'processos': processos,
+        'tempos': {etapa: {'total': sum(valores), 'media': sum(valores) / len(valores) if valores else 0.0,
+                           'chamadas': len(valores)}
+                   for etapa, valores in tempos.items()},
+    }
+
+
+def imprimir_relatorio(relatorio):
+    print(f"\nArquivos encontrados: {relatorio['arquivos']}")
+    print(f"Documentos gravados:  {relatorio['processados']}")
+    print(f"Já auditados:         {len(relatorio['duplicados'])}")
+    print(f"Falhas:               {len(relatorio['falhas'])}")
+    print(f"Duração:              {relatorio['duracao']:.2f}s com {relatorio['processos']} processos")
+    print(f"Vazão:                {relatorio['docs_por_segundo']:.1f} docs/s")
+    print("\nTempo por etapa (soma entre os processos / média por chamada):")
+    for etapa, t in relatorio['tempos'].items():
+        print(f"  {etapa:<13} {t['total']:>9.2f}s  {t['media'] * 1000:>9.1f} ms  ({t['chamadas']} chamadas)")
+    if relatorio['falhas']:
+        print("\nFalhas:")
+        for arquivo, erro in relatorio['falhas']:
+            print(f"  {arquivo}: {erro}")
+
+
+# --- Execução Principal ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingestão em lote de XMLs (NFe/CTe) e PDFs (NFS-e).")
+    parser.add_argument('entradas', nargs='+', help="Pastas, arquivos .zip ou padrões glob (ex.: 'notas/**/*.xml').")
+    parser.add_argument('--processos', type=int, default=None, help="Número de processos (padrão: núcleos da máquina).")
+    parser.add_argument('--lote', type=int, default=200, help="Documentos gravados por transação.")
+    args = parser.parse_args()
+
+    imprimir_relatorio(ingerir(args.entradas, args.processos, args.lote))
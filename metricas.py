@@ -0,0 +1,338 @@
+# Arquivo: metricas.py (Tempos por etapa e contadores do pipeline de auditoria)
+#
+# Instrumentação leve, só com a biblioteca padrão, para saber para onde foi o
+# tempo de uma análise: leitura do PDF, parsing do XML, consultas à TIPI,
+# chamadas ao LLM, gravação, etc.
+#   - etapa(nome) / @cronometrado(nome): mede a duração de uma etapa. As
+#     etapas podem ser aninhadas (ex.: 'consulta_ncm' dentro de 'auditoria');
+#   - contar(nome, quantidade, **rotulos): contadores (tokens do LLM, acertos
+#     dos caches, consultas de NCM por documento...);
+#   - documento(nome): agrupa as etapas e contadores de um documento e, ao
+#     final, grava uma linha no log JSON (uma por documento);
+#   - criar_manipulador_tokens(): callback do LangChain que conta os tokens
+#     informados pela API em cada chamada ao LLM.
+# As métricas do processo podem ser exportadas no formato texto do Prometheus
+# (exportar_prometheus, ou servir_prometheus para expor /metrics) e os tempos
+# recentes resumidos em p50/p95 por etapa (resumo_etapas), como no painel
+# "Performance" do app. Variáveis de ambiente:
+#   - AGENTE_FISCAL_METRICAS_LOG: log JSON Lines por documento (padrão: metricas.jsonl; vazio desativa)
+#   - AGENTE_FISCAL_METRICAS_LOG_MB: tamanho do log antes da rotação para .1, em MB (padrão: 10)
+#   - AGENTE_FISCAL_METRICAS_JANELA: medições recentes guardadas por etapa para os percentis (padrão: 500)
+#
+# Uso (a partir da raiz do projeto), para resumir o log de qualquer processo
+# (app, serviço, ingestão em lote):
+#   python metricas.py
+#   python metricas.py --ultimos 2000 --log metricas.jsonl
+
+import argparse
+import contextvars
+import functools
+import inspect
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICAS_LOG = os.getenv('AGENTE_FISCAL_METRICAS_LOG', 'metricas.jsonl')
+METRICAS_LOG_MAX_BYTES = int(float(os.getenv('AGENTE_FISCAL_METRICAS_LOG_MB', '10')) * 2 ** 20)
+METRICAS_JANELA = int(os.getenv('AGENTE_FISCAL_METRICAS_JANELA', '500'))
+
+PREFIXO = 'agente_fiscal'
+# Limites (em segundos) dos buckets do histograma de duração das etapas
+LIMITES_HISTOGRAMA = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_lock_log = threading.Lock()
+# etapa -> {'recentes': deque, 'contagem', 'soma', 'buckets'}
+_duracoes = {}
+# (nome, ((rótulo, valor), ...)) -> valor
+_contadores = {}
+# Rastro do documento em processamento no contexto atual (thread ou tarefa asyncio)
+_documento_atual = contextvars.ContextVar('documento_atual', default=None)
+
+
+def _nome_contador(nome, rotulos):
+    """Nome do contador no log por documento: 'tokens_llm' + rótulos -> 'tokens_llm_prompt'."""
+    return nome + ''.join(f'_{valor}' for _, valor in rotulos)
+
+
+def registrar_duracao(etapa, segundos):
+    """Registra uma medição da etapa (e a soma no documento em processamento, se houver)."""
+    with _lock:
+        serie = _duracoes.get(etapa)
+        if serie is None:
+            serie = _duracoes[etapa] = {'recentes': deque(maxlen=METRICAS_JANELA), 'contagem': 0, 'soma': 0.0,
+                                        'buckets': [0] * len(LIMITES_HISTOGRAMA)}
+        serie['recentes'].append(segundos)
+        serie['contagem'] += 1
+        serie['soma'] += segundos
+        for i, limite in enumerate(LIMITES_HISTOGRAMA):
+            if segundos <= limite:
+                serie['buckets'][i] += 1
+        rastro = _documento_atual.get()
+        if rastro is not None:
+            rastro['etapas'][etapa] = rastro['etapas'].get(etapa, 0.0) + segundos
+
+
+def contar(nome, quantidade=1, **rotulos):
+    """Soma 'quantidade' ao contador (e ao do documento em processamento, se houver)."""
+    rotulos = tuple(sorted(rotulos.items()))
+    with _lock:
+        _contadores[(nome, rotulos)] = _contadores.get((nome, rotulos), 0) + quantidade
+        rastro = _documento_atual.get()
+        if rastro is not None:
+            chave = _nome_contador(nome, rotulos)
+            rastro['contadores'][chave] = rastro['contadores'].get(chave, 0) + quantidade
+
+
+@contextmanager
+def etapa(nome):
+    """Mede a duração do bloco como uma execução da etapa 'nome'."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_duracao(nome, time.perf_counter() - inicio)
+
+
+def cronometrado(nome):
+    """Decorador: mede cada chamada da função (síncrona ou assíncrona) como a etapa 'nome'."""
+    def decorador(funcao):
+        if inspect.iscoroutinefunction(funcao):
+            @functools.wraps(funcao)
+            async def envoltorio_assincrono(*args, **kwargs):
+                with etapa(nome):
+                    return await funcao(*args, **kwargs)
+            return envoltorio_assincrono
+
+        @functools.wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            with etapa(nome):
+                return funcao(*args, **kwargs)
+        return envoltorio
+    return decorador
+
+
+@contextmanager
+def documento(nome):
+    """
+    Agrupa as etapas e contadores do bloco no rastro do documento 'nome' e,
+    ao final, grava o rastro no log JSON. Dentro de outro documento (ex.: uma
+    ferramenta chamada durante a análise de um PDF), soma no de fora.
+    """
+    externo = _documento_atual.get()
+    if externo is not None:
+        yield externo
+        return
+
+    rastro = {'documento': nome, 'etapas': {}, 'contadores': {}}
+    token = _documento_atual.set(rastro)
+    inicio = time.perf_counter()
+    situacao = 'ok'
+    try:
+        yield rastro
+    except BaseException:
+        situacao = 'erro'
+        raise
+    finally:
+        _documento_atual.reset(token)
+        duracao = time.perf_counter() - inicio
+        registrar_duracao('documento', duracao)
+        rastro.update({
+            'momento': datetime.now().isoformat(timespec='seconds'),
+            'situacao': situacao,
+            'duracao': round(duracao, 6),
+            'etapas': {nome_etapa: round(segundos, 6) for nome_etapa, segundos in rastro['etapas'].items()},
+        })
+        _gravar_log(rastro)
+
+
+def _gravar_log(rastro, log_file=None):
+    log_file = METRICAS_LOG if log_file is None else log_file
+    if not log_file:
+        return
+    linha = json.dumps(rastro, ensure_ascii=False) + '\n'
+    with _lock_log:
+        try:
+            if os.path.getsize(log_file) > METRICAS_LOG_MAX_BYTES:
+                os.replace(log_file, log_file + '.1')
+        except OSError:
+            pass
+        with open(log_file, 'a', encoding='utf-8') as f:
+            f.write(linha)
+
+
+def ler_log(limite=100, log_file=METRICAS_LOG):
+    """Últimos 'limite' registros do log por documento (o mais recente por último), lendo só o fim do arquivo."""
+    if not log_file or not os.path.exists(log_file):
+        return []
+    with open(log_file, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        fim = f.tell()
+        bloco = 64 * 1024
+        while True:
+            inicio = max(0, fim - bloco)
+            f.seek(inicio)
+            linhas = f.read(fim - inicio).splitlines()
+            if inicio == 0 or len(linhas) > limite:
+                break
+            bloco *= 2
+    if inicio > 0:
+        linhas = linhas[1:]  # a primeira pode estar cortada
+    registros = []
+    for linha in linhas[-limite:]:
+        try:
+            registros.append(json.loads(linha))
+        except ValueError:
+            continue
+    return registros
+
+
+def _percentil(ordenados, p):
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)] if ordenados else 0.0
+
+
+def resumo_etapas():
+    """Por etapa: chamadas (desde o início do processo), média e p50/p95 das medições recentes, em ms."""
+    with _lock:
+        series = {nome: (sorted(serie['recentes']), serie['contagem'], serie['soma']) for nome, serie in _duracoes.items()}
+    return [{
+        'etapa': nome,
+        'chamadas': contagem,
+        'media_ms': soma / contagem * 1000,
+        'p50_ms': _percentil(recentes, 50) * 1000,
+        'p95_ms': _percentil(recentes, 95) * 1000,
+        'total_s': soma,
+    } for nome, (recentes, contagem, soma) in sorted(series.items())]
+
+
+def resumir_log(registros):
+    """Como resumo_etapas, mas a partir dos registros do log por documento (p50/p95 por documento)."""
+    por_etapa = {}
+    for registro in registros:
+        por_etapa.setdefault('documento', []).append(registro['duracao'])
+        for nome, segundos in registro['etapas'].items():
+            por_etapa.setdefault(nome, []).append(segundos)
+    return [{
+        'etapa': nome,
+        'chamadas': len(valores),
+        'media_ms': sum(valores) / len(valores) * 1000,
+        'p50_ms': _percentil(sorted(valores), 50) * 1000,
+        'p95_ms': _percentil(sorted(valores), 95) * 1000,
+        'total_s': sum(valores),
+    } for nome, valores in sorted(por_etapa.items())]
+
+
+def contadores():
+    """Valores atuais dos contadores, pelo nome usado no log ('tokens_llm_prompt', 'cache_llm_acerto', ...)."""
+    with _lock:
+        return {_nome_contador(nome, rotulos): valor for (nome, rotulos), valor in sorted(_contadores.items())}
+
+
+def _rotulos_prometheus(rotulos):
+    if not rotulos:
+        return ''
+    escapar = lambda valor: str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{nome}="{escapar(valor)}"' for nome, valor in rotulos) + '}'
+
+
+def exportar_prometheus():
+    """Métricas do processo no formato texto do Prometheus (exposition format 0.0.4)."""
+    with _lock:
+        duracoes = {nome: (list(serie['buckets']), serie['contagem'], serie['soma']) for nome, serie in _duracoes.items()}
+        valores = dict(_contadores)
+
+    linhas = [f'# HELP {PREFIXO}_etapa_segundos Duração das etapas do pipeline de auditoria.',
+              f'# TYPE {PREFIXO}_etapa_segundos histogram']
+    for nome, (buckets, contagem, soma) in sorted(duracoes.items()):
+        for limite, quantidade in zip(LIMITES_HISTOGRAMA, buckets):
+            linhas.append(f'{PREFIXO}_etapa_segundos_bucket{_rotulos_prometheus((("etapa", nome), ("le", f"{limite:g}")))} {quantidade}')
+        linhas.append(f'{PREFIXO}_etapa_segundos_bucket{_rotulos_prometheus((("etapa", nome), ("le", "+Inf")))} {contagem}')
+        linhas.append(f'{PREFIXO}_etapa_segundos_sum{_rotulos_prometheus((("etapa", nome),))} {soma}')
+        linhas.append(f'{PREFIXO}_etapa_segundos_count{_rotulos_prometheus((("etapa", nome),))} {contagem}')
+
+    for nome in sorted({nome for nome, _ in valores}):
+        linhas.append(f'# TYPE {PREFIXO}_{nome}_total counter')
+        for (nome_contador, rotulos), valor in sorted(valores.items()):
+            if nome_contador == nome:
+                linhas.append(f'{PREFIXO}_{nome}_total{_rotulos_prometheus(rotulos)} {valor}')
+    return '\n'.join(linhas) + '\n'
+
+
+class _RespostaPrometheus(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        corpo = exportar_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def servir_prometheus(porta, endereco='127.0.0.1'):
+    """Expõe GET /metrics em uma thread de segundo plano. Retorna o servidor (use shutdown() para parar)."""
+    servidor = ThreadingHTTPServer((endereco, porta), _RespostaPrometheus)
+    threading.Thread(target=servidor.serve_forever, name='metricas-prometheus', daemon=True).start()
+    return servidor
+
+
+@functools.lru_cache(maxsize=None)
+def _classe_manipulador_tokens():
+    """Define (uma vez) o callback de tokens como subclasse do LangChain, importando-o só aqui."""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class ManipuladorTokens(BaseCallbackHandler):
+        """Conta as respostas do LLM e os tokens informados pela API (respostas do cache não trazem uso)."""
+
+        run_inline = True
+
+        def on_llm_end(self, response, **kwargs):
+            contar('respostas_llm')
+            uso = (response.llm_output or {}).get('token_usage') or {}
+            for tipo in ('prompt', 'completion'):
+                if uso.get(f'{tipo}_tokens'):
+                    contar('tokens_llm', uso[f'{tipo}_tokens'], tipo=tipo)
+
+    return ManipuladorTokens
+
+
+def criar_manipulador_tokens():
+    """Callback para o parâmetro 'callbacks' dos modelos de chat do LangChain."""
+    return _classe_manipulador_tokens()()
+
+
+# --- Execução Principal ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resumo (p50/p95 por etapa) do log de métricas por documento.")
+    parser.add_argument('--log', default=METRICAS_LOG or 'metricas.jsonl', help="Arquivo JSON Lines do log.")
+    parser.add_argument('--ultimos', type=int, default=500, help="Quantidade de documentos mais recentes considerados.")
+    args = parser.parse_args()
+
+    registros = ler_log(args.ultimos, args.log)
+    if not registros:
+        print(f"Nenhum registro em {args.log}.")
+    else:
+        print(f"{len(registros)} documento(s), de {registros[0]['momento']} a {registros[-1]['momento']}\n")
+        print(f"{'etapa':<22} {'chamadas':>9} {'média (ms)':>11} {'p50 (ms)':>10} {'p95 (ms)':>10} {'total (s)':>10}")
+        for r in resumir_log(registros):
+            print(f"{r['etapa']:<22} {r['chamadas']:>9} {r['media_ms']:>11.1f} {r['p50_ms']:>10.1f} "
+                  f"{r['p95_ms']:>10.1f} {r['total_s']:>10.2f}")
+        totais = {}
+        for registro in registros:
+            for nome, valor in registro['contadores'].items():
+                totais[nome] = totais.get(nome, 0) + valor
+        if totais:
+            print("\nContadores:")
+            for nome, valor in sorted(totais.items()):
+                print(f"  {nome:<28} {valor}")
@@ -0,0 +1,262 @@
+# Arquivo: persistencia.py (Camada de persistência das auditorias)
+#
+# O modo de armazenamento é escolhido pela variável de ambiente
+# AGENTE_FISCAL_ARMAZENAMENTO:
+#   - 'sqlite' (padrão): banco SQLite indexado (banco_documentos.py)
+#   - 'jsonl': diário append-only em JSON Lines (diario_documentos.py)
+
+import os
+import threading
+
+from banco_documentos import (
+    atualizar_auditorias as atualizar_auditorias_banco,
+    atualizar_conclusao as atualizar_conclusao_documento,
+    buscar_documento,
+    identificadores_conhecidos as identificadores_banco,
+    ler_documentos_em_lotes,
+    ler_itens_planos,
+    listar_documentos,
+    ncms_distintos,
+    salvar_documento,
+    salvar_documentos,
+    valor_em_centavos,
+)
+from diario_documentos import chave_registro, ler_diario, listar_diario, registrar_documento, registrar_documentos
+
+MODO_ARMAZENAMENTO = os.getenv('AGENTE_FISCAL_ARMAZENAMENTO', 'sqlite').strip().lower()
+
+if MODO_ARMAZENAMENTO not in ('sqlite', 'jsonl'):
+    raise ValueError(f"Modo de armazenamento '{MODO_ARMAZENAMENTO}' inválido. Use 'sqlite' ou 'jsonl'.")
+
+# Tamanho de cada leitura ao percorrer o diário inteiro (reauditoria)
+BYTES_POR_LEITURA_DIARIO = 8 * 1024 * 1024
+
+
+def salvar_auditoria(audit_result):
+    """
+    Persiste o resultado de uma auditoria no modo de armazenamento configurado.
+    Um documento já gravado (mesma chave de acesso ou mesmo conteúdo) não é gravado de novo.
+    """
+    if MODO_ARMAZENAMENTO == 'jsonl':
+        if buscar_auditoria(audit_result.get('chave_acesso'), audit_result.get('hash_conteudo')) is not None:
+            return None
+        return registrar_documento(_com_valores_em_centavos(audit_result))
+    return salvar_documento(audit_result)
+
+
+def salvar_auditorias(audit_results):
+    """Persiste vários resultados de auditoria de uma só vez (uma transação ou uma escrita no diário)."""
+    if not audit_results:
+        return []
+    if MODO_ARMAZENAMENTO == 'jsonl':
+        novos = [r for r in audit_results
+                 if buscar_auditoria(r.get('chave_acesso'), r.get('hash_conteudo')) is None]
+        return registrar_documentos([_com_valores_em_centavos(r) for r in novos]) if novos else None
+    return salvar_documentos(audit_results)
+
+
+# --- Detecção de documentos já auditados ---
+# No SQLite, as consultas usam os índices únicos de chave de acesso e hash do
+# conteúdo. No diário JSONL, um índice em memória é estendido incrementalmente
+# a cada consulta, lendo só o que foi gravado desde a anterior.
+
+_indice_diario = {'cursor': None, 'chaves': {}, 'hashes': {}}
+_lock_indice_diario = threading.Lock()
+
+
+def _atualizar_indice_diario():
+    registros, cursor, reiniciado = ler_diario(cursor=_indice_diario['cursor'])
+    if reiniciado:
+        _indice_diario['chaves'].clear()
+        _indice_diario['hashes'].clear()
+    for registro in registros:
+        # Registros posteriores (ex.: conclusão enriquecida) substituem os anteriores
+        if registro.get('chave_acesso'):
+            _indice_diario['chaves'][registro['chave_acesso']] = registro
+        if registro.get('hash_conteudo'):
+            _indice_diario['hashes'][registro['hash_conteudo']] = registro
+    _indice_diario['cursor'] = cursor
+
+
+def buscar_auditoria(chave_acesso=None, hash_conteudo=None):
+    """Retorna a auditoria já gravada para a chave de acesso ou o hash do conteúdo, ou None."""
+    if not chave_acesso and not hash_conteudo:
+        return None
+    if MODO_ARMAZENAMENTO == 'jsonl':
+        with _lock_indice_diario:
+            _atualizar_indice_diario()
+            return _indice_diario['chaves'].get(chave_acesso) or _indice_diario['hashes'].get(hash_conteudo)
+    return buscar_documento(chave_acesso, hash_conteudo)
+
+
+def identificadores_conhecidos():
+    """Retorna (chaves de acesso, hashes de conteúdo) dos documentos já gravados."""
+    if MODO_ARMAZENAMENTO == 'jsonl':
+        with _lock_indice_diario:
+            _atualizar_indice_diario()
+            return set(_indice_diario['chaves']), set(_indice_diario['hashes'])
+    return identificadores_banco()
+
+
+def atualizar_conclusao(audit_result, referencia, conclusao, origem):
+    """
+    Substitui a conclusão de uma auditoria já salva. 'referencia' é o retorno de
+    salvar_auditoria (id no SQLite). No diário, o registro é regravado com a mesma
+    chave e substitui o anterior; registros sem chave não podem ser atualizados.
+    Retorna True se a conclusão foi gravada.
+    """
+    if MODO_ARMAZENAMENTO == 'jsonl':
+        if chave_registro(audit_result) is None:
+            return False
+        registrar_documento(_com_valores_em_centavos({**audit_result, 'conclusao_analise': conclusao,
+                                                      'conclusao_origem': origem}))
+        return True
+    return atualizar_conclusao_documento(referencia, conclusao, origem)
+
+
+# --- Reauditoria do acervo (ver reauditoria.py) ---
+
+def acervo_para_reauditoria(tamanho_lote=1000):
+    """
+    Prepara a leitura de todas as auditorias gravadas. Retorna (ncms, lotes):
+    os NCMs distintos informados nos itens e um iterador de lotes de até
+    'tamanho_lote' pares (referencia, registro). No SQLite, a referência é o id
+    e o registro é o texto JSON ainda não decodificado; no diário, a referência
+    é None e o registro é o dicionário mais recente de cada documento.
+    O diário é percorrido em blocos, sem carregá-lo inteiro: uma passada coleta
+    os NCMs e a posição do registro mais recente de cada chave, e os lotes são
+    lidos em uma segunda passada, que para no fim do diário visto na primeira
+    (os registros regravados pela reauditoria não são lidos de novo).
+    """
+    if MODO_ARMAZENAMENTO == 'jsonl':
+        ultima_posicao = {}
+        ncms = {}
+        total = 0
+        for total, registro in enumerate(_percorrer_diario(), start=1):
+            chave = chave_registro(registro)
+            if chave is not None:
+                ultima_posicao[chave] = total - 1
+            for item in registro.get('itens') or []:
+                if isinstance(item, dict) and item.get('ncm'):
+                    ncms[item['ncm']] = None
+        return list(ncms), _lotes_do_diario(ultima_posicao, total, tamanho_lote)
+    return ncms_distintos(), ler_documentos_em_lotes(tamanho_lote)
+
+
+def _percorrer_diario():
+    """Gera os registros do diário na ordem gravada, lendo-o em blocos de BYTES_POR_LEITURA_DIARIO."""
+    cursor = None
+    while True:
+        registros, novo_cursor, reiniciado = ler_diario(cursor=cursor, limite_bytes=BYTES_POR_LEITURA_DIARIO)
+        if reiniciado:
+            raise RuntimeError("O diário foi compactado durante a leitura do acervo. Execute a reauditoria novamente.")
+        if novo_cursor == cursor:
+            return
+        yield from registros
+        cursor = novo_cursor
+
+
+def _lotes_do_diario(ultima_posicao, total, tamanho_lote):
+    """Lotes com os 'total' primeiros registros do diário, sem os substituídos por outro com a mesma chave."""
+    lote = []
+    for posicao, registro in enumerate(_percorrer_diario()):
+        if posicao >= total:
+            break
+        chave = chave_registro(registro)
+        if chave is None or ultima_posicao.get(chave) == posicao:
+            lote.append((None, registro))
+            if len(lote) == tamanho_lote:
+                yield lote
+                lote = []
+    if lote:
+        yield lote
+
+
+def atualizar_auditorias(atualizacoes):
+    """
+    Regrava o resultado de auditorias já salvas. 'atualizacoes' é uma lista de
+    (referencia, audit_result), com a referência de acervo_para_reauditoria.
+    No diário, os registros são regravados com a mesma chave e substituem os
+    anteriores; registros sem chave não podem ser atualizados.
+    Retorna a quantidade de auditorias atualizadas.
+    """
+    if not atualizacoes:
+        return 0
+    if MODO_ARMAZENAMENTO == 'jsonl':
+        registros = [_com_valores_em_centavos(audit_result) for _, audit_result in atualizacoes
+                     if chave_registro(audit_result) is not None]
+        if registros:
+            registrar_documentos(registros)
+        return len(registros)
+    return atualizar_auditorias_banco(atualizacoes)
+
+
+def _com_valores_em_centavos(audit_result):
+    """Acrescenta ao registro do diário os valores monetários já convertidos para centavos."""
+    registro = dict(audit_result)
+    registro['valor_total_nota_centavos'] = valor_em_centavos(registro.get('valor_total_nota'))
+    itens = registro.get('itens')
+    if itens and isinstance(itens, list):
+        registro['itens'] = [
+            {**item, 'valor_total_centavos': valor_em_centavos(item.get('valor_total'))}
+            if isinstance(item, dict) else item
+            for item in itens
+        ]
+    return registro
+
+
+def _centavos(registro, campo_centavos, campo_texto):
+    """Lê o valor em centavos gravado no registro, ou converte o texto (registros antigos)."""
+    if campo_centavos in registro:
+        return registro[campo_centavos]
+    return valor_em_centavos(registro.get(campo_texto))
+
+
+def _achatar_registro(registro):
+    """Gera as linhas do dashboard (uma por item) de um registro do diário, como em ler_itens_planos."""
+    valor_nota = _centavos(registro, 'valor_total_nota_centavos', 'valor_total_nota')
+    base = (
+        registro.get('status_auditoria'), registro.get('numero'), registro.get('conclusao_analise'),
+        registro.get('data_emissao'), registro.get('emitente_razao_social'), registro.get('emitente_cnpj'),
+        registro.get('destinatario_razao_social'), registro.get('destinatario_cnpj_cpf'), valor_nota,
+        registro.get('tipo_documento'), registro.get('formato'), registro.get('discriminacao_servicos'),
+        ", ".join(registro.get('erros_auditoria', [])), ", ".join(registro.get('avisos_auditoria', [])),
+    )
+    itens = registro.get('itens', [])
+    if itens and isinstance(itens, list):
+        return [base + (item.get('codigo'), item.get('descricao'), item.get('ncm'), item.get('cfop'),
+                        _centavos(item, 'valor_total_centavos', 'valor_total'))
+                for item in itens]
+    return [base + (None, None, None, None, valor_nota)]
+
+
+def ler_itens_planos_desde(cursor=None, limite_documentos=None):
+    """
+    Lê as linhas achatadas do dashboard (ver banco_documentos.COLUNAS_ITENS_PLANOS)
+    apenas dos documentos gravados depois do cursor de uma leitura anterior.
+    Cada linha traz, ao final, a chave do documento: um documento lido de novo
+    com a mesma chave substitui as linhas anteriores (regravado no diário JSONL,
+    ou alterado no SQLite, onde o cursor é a revisão do banco).
+    No SQLite, 'limite_documentos' limita a leitura aos próximos documentos;
+    o diário é sempre lido até o fim.
+    Retorna (linhas, novo_cursor, reiniciado).
+    """
+    if MODO_ARMAZENAMENTO == 'jsonl':
+        registros, novo_cursor, reiniciado = ler_diario(cursor=cursor)
+        offset = cursor[1] if cursor and not reiniciado else 0
+        linhas = []
+        for i, registro in enumerate(registros):
+            chave = chave_registro(registro)
+            chave = '|'.join(map(str, chave)) if chave is not None else f"{offset}:{i}"
+            linhas.extend(linha + (chave,) for linha in _achatar_registro(registro))
+        return linhas, novo_cursor, reiniciado
+
+    linhas, ultima_revisao = ler_itens_planos(desde_revisao=cursor or 0, limite_documentos=limite_documentos)
+    return linhas, ultima_revisao, False
+
+
+def listar_auditorias():
+    """Retorna todos os documentos auditados no modo de armazenamento configurado."""
+    if MODO_ARMAZENAMENTO == 'jsonl':
+        return listar_diario()
+    return listar_documentos()
@@ -0,0 +1,208 @@
+# Arquivo: reauditoria.py (Reauditoria em lote do acervo de documentos)
+#
+# Quando a Tabela TIPI muda (alíquotas ou NCMs novos) ou a lista de CFOPs
+# válidos (VALID_CFOP_CODES) é alterada, as auditorias gravadas ficam
+# desatualizadas. Este módulo aplica de novo as regras de auditoria aos dados
+# extraídos já gravados, sem reabrir os arquivos nem chamar o LLM:
+#   - os NCMs distintos de todo o acervo são resolvidos na TIPI uma única vez,
+#     antes de começar, e enviados a cada processo do pool;
+#   - os documentos são lidos em lotes e reauditados em um pool de processos,
+#     com as regras (regras_auditoria.py) avaliadas coluna a coluna sobre o lote;
+#   - só os documentos cujo resultado mudou (status, erros, avisos ou a
+#     descrição/alíquota dos NCMs citada na conclusão) são regravados com a
+#     conclusão por regras refeita, em uma transação por lote;
+#   - registros gravados antes dos códigos de regra, com o mesmo resultado,
+#     recebem apenas os achados: a conclusão gravada (inclusive a da IA) fica.
+#
+# Uso (a partir da raiz do projeto):
+#   python reauditoria.py --processos 8
+#   python reauditoria.py --simular    (apenas conta o que mudaria)
+
+import argparse
+import collections
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from tipi.consultartipi import consultar_ncms
+from persistencia import acervo_para_reauditoria, atualizar_auditorias
+from regras_auditoria import avaliar, avaliar_lote, grupo_documento, informacoes_ncm, resumir_achados
+
+# NCMs do acervo já resolvidos na TIPI, recebidos por cada processo do pool
+_ncms = {}
+
+
+def _dados_extraidos(registro):
+    import agente_fiscal_langchain as agente
+
+    return {campo: valor for campo, valor in registro.items() if campo not in agente.CAMPOS_AUDITORIA}
+
+
+def _ncms_citados(informacoes):
+    """NCM, descrição e alíquota de cada item citado na conclusão (o código do item não conta)."""
+    return [(info.get('ncm'), info.get('descricao'), info.get('aliquota')) for info in informacoes or []
+            if isinstance(info, dict)]
+
+
+def _novo_registro(registro, dados, achados, ncms):
+    """
+    Novo registro da auditoria a partir dos achados, como (registro, refeito),
+    ou None se o registro gravado continua o mesmo. Se o status, os erros, os
+    avisos ou a descrição/alíquota dos NCMs citados mudaram, a auditoria é refeita com a
+    conclusão por regras ('refeito' verdadeiro). Se só os achados diferem
+    (registros gravados antes dos códigos de regra), eles são preenchidos e a
+    conclusão gravada, inclusive a da IA, é mantida.
+    """
+    import agente_fiscal_langchain as agente
+
+    status, erros, avisos = resumir_achados(achados)
+    informacoes = informacoes_ncm(dados, ncms) if grupo_documento(dados) == 'NFE' else []
+    mudou = (status, erros, avisos) != (
+        registro.get('status_auditoria'), registro.get('erros_auditoria'), registro.get('avisos_auditoria'))
+    # Registros sem 'informacoes_ncm' (anteriores a ela) não mudam só por não tê-la
+    if not mudou and 'informacoes_ncm' in registro:
+        mudou = _ncms_citados(informacoes) != _ncms_citados(registro['informacoes_ncm'])
+    if mudou:
+        return agente.montar_auditoria(dados, status, erros, avisos, informacoes, achados), True
+    if achados != registro.get('achados_auditoria'):
+        return {**registro, 'achados_auditoria': achados}, False
+    return None
+
+
+def reauditar_registro(registro, ncms):
+    """
+    Aplica de novo as regras de auditoria a um registro gravado, com os NCMs
+    já resolvidos em 'ncms'. Retorna (novo registro, refeito) como em
+    _novo_registro, ou None se nada mudou.
+    """
+    dados = _dados_extraidos(registro)
+    return _novo_registro(registro, dados, avaliar(dados, ncms), ncms)
+
+
+def _inicializar_processo(ncms):
+    _ncms.clear()
+    _ncms.update(ncms)
+
+
+def _reauditar_lote(lote):
+    """
+    Executado nos processos do pool: reaudita um lote de (referencia, registro),
+    com as regras avaliadas coluna a coluna sobre todos os documentos do lote.
+    Retorna (documentos lidos, [(referencia, status anterior, novo registro, refeito)], [(referencia, erro)]).
+    """
+    alterados = []
+    falhas = []
+    lidos = []
+    for referencia, registro in lote:
+        try:
+            registro = json.loads(registro) if isinstance(registro, str) else registro
+            lidos.append((referencia, registro, _dados_extraidos(registro)))
+        except Exception as e:
+            falhas.append((referencia, f"{type(e).__name__}: {e}"))
+
+    for (referencia, registro, dados), achados in zip(lidos, avaliar_lote([dados for _, _, dados in lidos], _ncms)):
+        try:
+            if isinstance(achados, Exception):
+                raise achados
+            resultado = _novo_registro(registro, dados, achados, _ncms)
+            if resultado is not None:
+                alterados.append((referencia, registro.get('status_auditoria'), *resultado))
+        except Exception as e:
+            falhas.append((referencia if referencia is not None else registro.get('numero'), f"{type(e).__name__}: {e}"))
+    return len(lote), alterados, falhas
+
+
+def reauditar(processos=None, tamanho_lote=1000, simular=False, tipi_db=None):
+    """
+    Reaudita todos os documentos gravados em paralelo e regrava apenas os que
+    mudaram. Com 'simular', nada é gravado. Retorna o relatório da execução
+    (totais, vazão, mudanças de status e falhas).
+    """
+    import agente_fiscal_langchain as agente
+
+    inicio = time.perf_counter()
+    ncms_acervo, lotes = acervo_para_reauditoria(tamanho_lote)
+    ncms = consultar_ncms(ncms_acervo, db_file=tipi_db or agente.TIPI_DB)
+    tempo_ncms = time.perf_counter() - inicio
+
+    lidos = alterados = preenchidos = atualizados = 0
+    mudancas_status = collections.Counter()
+    falhas = []
+    processos = processos or os.cpu_count() or 1
+
+    def _registrar(resultado):
+        nonlocal lidos, alterados, preenchidos, atualizados
+        quantidade, alterados_lote, falhas_lote = resultado
+        lidos += quantidade
+        falhas.extend(falhas_lote)
+        for _, status_anterior, novo, refeito in alterados_lote:
+            if refeito:
+                alterados += 1
+                mudancas_status[(status_anterior, novo['status_auditoria'])] += 1
+            else:
+                preenchidos += 1
+        if not simular:
+            atualizados += atualizar_auditorias([(referencia, novo) for referencia, _, novo, _ in alterados_lote])
+
+    # Poucos lotes em andamento por vez: o acervo não é carregado inteiro na memória
+    with ProcessPoolExecutor(max_workers=processos, initializer=_inicializar_processo, initargs=(ncms,)) as pool:
+        pendentes = collections.deque()
+        for lote in lotes:
+            pendentes.append(pool.submit(_reauditar_lote, lote))
+            if len(pendentes) >= processos * 2:
+                _registrar(pendentes.popleft().result())
+        while pendentes:
+            _registrar(pendentes.popleft().result())
+
+    duracao = time.perf_counter() - inicio
+    return {
+        'documentos': lidos,
+        'alterados': alterados,
+        'achados_preenchidos': preenchidos,
+        'atualizados': atualizados,
+        'simulacao': simular,
+        'ncms_distintos': len(ncms),
+        'ncms_nao_encontrados': sum(1 for resultado in ncms.values() if resultado is None),
+        'tempo_ncms': tempo_ncms,
+        'mudancas_status': dict(mudancas_status),
+        'falhas': falhas,
+        'duracao': duracao,
+        'docs_por_segundo': lidos / duracao if duracao else 0.0,
+        'processos': processos,
+    }
+
+
+def imprimir_relatorio(relatorio):
+    print(f"\nDocumentos reauditados: {relatorio['documentos']}")
+    print(f"Com resultado alterado: {relatorio['alterados']}")
+    print(f"Só achados preenchidos: {relatorio['achados_preenchidos']}")
+    if relatorio['simulacao']:
+        print("Atualizados:            nenhum (simulação)")
+    else:
+        print(f"Atualizados:            {relatorio['atualizados']}")
+    print(f"Falhas:                 {len(relatorio['falhas'])}")
+    print(f"NCMs distintos:         {relatorio['ncms_distintos']} ({relatorio['ncms_nao_encontrados']} fora da TIPI), "
+          f"resolvidos em {relatorio['tempo_ncms']:.2f}s")
+    print(f"Duração:                {relatorio['duracao']:.2f}s com {relatorio['processos']} processos")
+    print(f"Vazão:                  {relatorio['docs_por_segundo']:.1f} docs/s")
+    if relatorio['mudancas_status']:
+        print("\nMudanças de status (anterior -> novo):")
+        for (anterior, novo), quantidade in sorted(relatorio['mudancas_status'].items(), key=lambda par: -par[1]):
+            print(f"  {anterior} -> {novo}: {quantidade}")
+    if relatorio['falhas']:
+        print("\nFalhas:")
+        for referencia, erro in relatorio['falhas']:
+            print(f"  {referencia}: {erro}")
+
+
+# --- Execução Principal ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reaudita os documentos gravados com a TIPI e as regras atuais.")
+    parser.add_argument('--processos', type=int, default=None, help="Número de processos (padrão: núcleos da máquina).")
+    parser.add_argument('--lote', type=int, default=1000, help="Documentos por lote (leitura, processamento e gravação).")
+    parser.add_argument('--simular', action='store_true', help="Apenas conta os documentos que mudariam, sem gravar.")
+    parser.add_argument('--tipi', default=None, help="Banco SQLite da TIPI (padrão: tipi/tipi.db).")
+    args = parser.parse_args()
+
+    imprimir_relatorio(reauditar(args.processos, args.lote, args.simular, args.tipi))
@@ -0,0 +1,627 @@
+# Arquivo: regras_auditoria.py (Registro das regras de auditoria)
+#
+# Cada verificação da auditoria é uma regra registrada com @regra: um código
+# (ex.: 'NFE.CFOP_FORA_DA_LISTA'), a severidade ('erro' ou 'aviso'), o modelo
+# da mensagem, os grupos de documento a que se aplica (NFE, CTE, NFSE), o
+# escopo ('item' ou 'documento') e as colunas que lê.
+#
+# As regras rodam por coluna: para um documento, ou para um lote de
+# documentos, cada coluna (ex.: o CFOP de todos os itens) é montada uma única
+# vez, na primeira leitura, cada regra percorre só as colunas de que precisa e
+# devolve as linhas que falharam; a mensagem só é montada para essas linhas.
+# As regras de cada grupo são compiladas (como montar cada coluna lida,
+# inclusive as derivadas, e a ordem dos achados) na primeira avaliação e
+# recompiladas quando uma regra nova é registrada.
+# Para acrescentar uma regra:
+#
+#     @regra('NFE.CEST_AUSENTE', AVISO, "CEST não informado.", escopo=ITEM, campos=('cest',))
+#     def _cest_ausente(c, contexto):
+#         return ((linha, {}) for linha, cest in enumerate(c['cest']) if not cest)
+#
+# Cada achado é {'regra', 'severidade', 'item' (posição do item ou None),
+# 'mensagem'}. Os achados de um documento seguem a ordem das mensagens da
+# auditoria: regras de documento de início, itens (na ordem dos itens, e em
+# cada item na ordem de registro das regras) e regras de documento de fim.
+
+import threading
+from decimal import Decimal, InvalidOperation
+from itertools import repeat
+from operator import itemgetter
+
+from validacao_documentos import validar_cnpj, validar_cnpjs, validar_cnpjs_cpfs, validar_cpf
+
+ERRO = 'erro'
+AVISO = 'aviso'
+ITEM = 'item'
+DOCUMENTO = 'documento'
+# Fases das regras de documento: achados antes ou depois dos achados dos itens
+INICIO = 0
+FIM = 2
+_FASE_ITENS = 1
+
+# Colunas de item que repetem um campo do documento em cada item (ex.: 'documento.tipo_operacao')
+PREFIXO_DOCUMENTO = 'documento.'
+# Valor de uma coluna derivada que não pôde ser convertido
+INVALIDO = object()
+# A partir de quantos documentos os CNPJs/CPFs de uma coluna são validados em lote (NumPy)
+LOTE_MINIMO_VALIDACAO = 256
+TOLERANCIA = Decimal('0.01')
+# Alíquotas distintas (texto -> Decimal) guardadas por processo
+CACHE_ALIQUOTAS = 4096
+
+VALID_CFOP_CODES = frozenset({"6102", "1101", "1102", "1201", "1202", "1401", "1403", "1904", "1916", "2101", "2102", "2201", "2202", "2401", "2403", "2904", "2916", "3101", "3102", "3201", "3202", "5101", "5102", "5116", "5117", "5401", "5403", "5405", "5656", "5904", "5929", "6101", "6108", "6401", "6403", "6404", "6656", "6904", "6929", "7101", "7102", "7127"})
+
+# Tipo de operação da NF-e, por (tpNF, idDest): primeiro dígito do CFOP e descrição
+OPERACOES_NFE = {
+    ('0', '1'): ('1', 'entrada interna'),
+    ('0', '2'): ('2', 'entrada interestadual'),
+    ('0', '3'): ('3', 'entrada do exterior'),
+    ('1', '1'): ('5', 'saída interna'),
+    ('1', '2'): ('6', 'saída interestadual'),
+    ('1', '3'): ('7', 'saída para o exterior'),
+}
+# Tabelas de CFOPs válidos por tipo de operação, montadas a partir da lista geral
+CFOPS_POR_OPERACAO = {operacao: frozenset(cfop for cfop in VALID_CFOP_CODES if cfop[:1] == digito)
+                      for operacao, (digito, _) in OPERACOES_NFE.items()}
+
+
+def para_decimal(valor):
+    """Converte uma string para Decimal, tratando formatos pt-BR e padrão."""
+    if not valor:
+        return Decimal('0.0')
+    if type(valor) is str and ',' not in valor:
+        return Decimal(valor)  # formato padrão (o do XML): nada a trocar
+    valor = str(valor).strip()
+    if ',' in valor and '.' in valor:
+        valor = valor.replace('.', '')
+    valor = valor.replace(',', '.')
+    return Decimal(valor)
+
+
+def grupo_documento(dados):
+    """Grupo de regras do documento: 'NFSE' (também PDFs lidos por OCR/IA), 'CTE' ou 'NFE'."""
+    # 'NFSE': NFS-e em XML gravadas antes de o tipo ser unificado com o do PDF ('NFS-e')
+    if dados.get('formato') in ('ocr', 'ocr_ia') or dados.get('tipo_documento') in ('NFS-e', 'NFSE'):
+        return 'NFSE'
+    if dados.get('tipo_documento') == 'CTE':
+        return 'CTE'
+    return 'NFE'
+
+
+# --- Registro e compilação ---
+
+_regras = []
+_derivadas = {}  # {nome: (colunas de que depende, função)}
+_planos = {}  # {grupo: regras compiladas}
+_aliquotas = {}  # {alíquota em texto (ou par de alíquotas): Decimal (ou par)}, ver _aliquota
+_lock_registro = threading.Lock()
+
+
+def regra(codigo, severidade, mensagem, grupos=('NFE',), escopo=DOCUMENTO, campos=(), campos_itens=(), fase=INICIO):
+    """
+    Registra uma regra de auditoria. A função recebe (colunas, contexto) e
+    devolve os pares (linha, valores da mensagem) que falharam: no escopo
+    'item', a linha é a posição na coluna de itens; no escopo 'documento', a
+    posição do documento. Uma regra de documento pode ler colunas de itens
+    ('campos_itens', em contexto['colunas_itens']), agrupadas por documento
+    com contexto['faixas'].
+    """
+    def registrar(funcao):
+        with _lock_registro:
+            if any(r['codigo'] == codigo for r in _regras):
+                raise ValueError(f"A regra '{codigo}' já está registrada.")
+            _regras.append({'codigo': codigo, 'severidade': severidade, 'mensagem': mensagem,
+                            'grupos': tuple(grupos), 'escopo': escopo, 'campos': tuple(campos),
+                            'campos_itens': tuple(campos_itens), 'fase': fase, 'ordem': len(_regras),
+                            'funcao': funcao})
+            _planos.clear()
+        return funcao
+    return registrar
+
+
+def coluna_derivada(nome, campos):
+    """Registra uma coluna de itens calculada a partir de outras (ex.: valores já convertidos para Decimal)."""
+    def registrar(funcao):
+        with _lock_registro:
+            _derivadas[nome] = (tuple(campos), funcao)
+            _planos.clear()
+        return funcao
+    return registrar
+
+
+def listar_regras(grupo=None):
+    """Retorna as regras registradas (código, severidade, mensagem, grupos e escopo), na ordem de registro."""
+    return [{campo: r[campo] for campo in ('codigo', 'severidade', 'mensagem', 'grupos', 'escopo')}
+            for r in _regras if grupo is None or grupo in r['grupos']]
+
+
+def _coluna_repetida(campo):
+    """Campo do documento repetido em cada linha de item (ex.: 'documento.tipo_operacao')."""
+    campo = campo[len(PREFIXO_DOCUMENTO):]
+
+    def construir(c, contexto):
+        valores = [dados.get(campo) for dados in contexto['documentos']]
+        return [valores[posicao] for posicao in contexto['documento_da_linha']]
+    return construir
+
+
+def _compilar(grupo):
+    regras = [r for r in _regras if grupo in r['grupos']]
+    de_item = [r for r in regras if r['escopo'] == ITEM]
+    de_documento = sorted((r for r in regras if r['escopo'] == DOCUMENTO), key=lambda r: (r['fase'], r['ordem']))
+
+    colunas = {campo for r in de_item for campo in r['campos']}
+    colunas.update(campo for r in de_documento for campo in r['campos_itens'])
+    pendentes = [campo for campo in colunas if campo in _derivadas]
+    while pendentes:
+        for campo in _derivadas[pendentes.pop()][0]:
+            if campo not in colunas:
+                colunas.add(campo)
+                if campo in _derivadas:
+                    pendentes.append(campo)
+
+    construtores_item = {}
+    for campo in colunas:
+        if campo in _derivadas:
+            construtores_item[campo] = _derivadas[campo][1]
+        elif campo.startswith(PREFIXO_DOCUMENTO):
+            construtores_item[campo] = _coluna_repetida(campo)
+        else:
+            construtores_item[campo] = campo
+    return {
+        'itens': de_item,
+        'documentos': de_documento,
+        'colunas_item': construtores_item,
+        'colunas_documento': {campo: campo for r in de_documento for campo in r['campos']},
+    }
+
+
+class _Colunas(dict):
+    """
+    Colunas de um lote, cada uma montada na primeira vez em que uma regra (ou
+    outra coluna) a lê: as colunas de uma regra que sai cedo (ex.: impostos que
+    o XML não traz) nem chegam a ser montadas. Cada coluna vem de um campo das
+    linhas (itens ou documentos), quando o construtor é o nome do campo, ou de
+    uma função (colunas derivadas e campos do documento repetidos nos itens).
+    """
+    __slots__ = ('linhas', 'construtores', 'contexto')
+
+    def __init__(self, linhas, construtores, contexto):
+        super().__init__()
+        self.linhas = linhas
+        self.construtores = construtores
+        self.contexto = contexto
+
+    def __missing__(self, nome):
+        construtor = self.construtores[nome]
+        if type(construtor) is str:
+            valores = list(map(dict.get, self.linhas, repeat(construtor)))
+        else:
+            valores = construtor(self, self.contexto)
+        self[nome] = valores
+        return valores
+
+
+def _plano(grupo):
+    plano = _planos.get(grupo)
+    if plano is None:
+        with _lock_registro:
+            plano = _planos.get(grupo) or _compilar(grupo)
+            _planos[grupo] = plano
+    return plano
+
+
+# --- Avaliação ---
+
+def _avaliar_grupo(plano, documentos, ncms):
+    """Avalia as regras compiladas de um grupo sobre documentos desse grupo; retorna os achados de cada um."""
+    itens, faixas, documento_da_linha = [], [], []
+    for posicao, dados in enumerate(documentos):
+        lista = dados.get('itens') or []
+        faixas.append((len(itens), len(itens) + len(lista)))
+        itens.extend(lista)
+        documento_da_linha.extend([posicao] * len(lista))
+
+    contexto = {'ncms': ncms, 'documentos': documentos, 'itens': itens, 'faixas': faixas,
+                'documento_da_linha': documento_da_linha}
+    colunas = contexto['colunas_itens'] = _Colunas(itens, plano['colunas_item'], contexto)
+    colunas_documento = _Colunas(documentos, plano['colunas_documento'], contexto)
+
+    achados = [[] for _ in documentos]
+    for r in plano['itens']:
+        for linha, valores in r['funcao'](colunas, contexto):
+            posicao = documento_da_linha[linha]
+            numero = linha - faixas[posicao][0] + 1
+            prefixo = f"Item {numero} ({itens[linha].get('codigo', 'S/C')}) - "
+            achados[posicao].append(((_FASE_ITENS, numero, r['ordem']),
+                                     {'regra': r['codigo'], 'severidade': r['severidade'], 'item': numero,
+                                      'mensagem': prefixo + r['mensagem'].format(**valores)}))
+    for r in plano['documentos']:
+        for posicao, valores in r['funcao'](colunas_documento, contexto):
+            achados[posicao].append(((r['fase'], 0, r['ordem']),
+                                     {'regra': r['codigo'], 'severidade': r['severidade'], 'item': None,
+                                      'mensagem': r['mensagem'].format(**valores)}))
+    for lista in achados:
+        if len(lista) > 1:
+            lista.sort(key=itemgetter(0))
+    return [[achado for _, achado in lista] for lista in achados]
+
+
+def avaliar(dados, ncms=None):
+    """
+    Avalia as regras para um documento e retorna a lista de achados. 'ncms' é
+    o dicionário {ncm informado: resultado de consultar_ncm} com os NCMs dos itens.
+    """
+    return _avaliar_grupo(_plano(grupo_documento(dados)), [dados], ncms or {})[0]
+
+
+def avaliar_lote(documentos, ncms=None):
+    """
+    Avalia as regras para vários documentos de uma vez, coluna a coluna em
+    cada grupo de documento. Retorna, na ordem dos documentos, a lista de
+    achados de cada um ou a exceção levantada ao avaliá-lo.
+    """
+    ncms = ncms or {}
+    resultados = [None] * len(documentos)
+    por_grupo = {}
+    for posicao, dados in enumerate(documentos):
+        por_grupo.setdefault(grupo_documento(dados), []).append(posicao)
+
+    for grupo, posicoes in por_grupo.items():
+        plano = _plano(grupo)
+        lote = [documentos[posicao] for posicao in posicoes]
+        try:
+            achados = _avaliar_grupo(plano, lote, ncms)
+        except Exception:
+            # Algum documento tem dados que uma regra não aceita: avalia um a um para isolá-lo
+            achados = []
+            for dados in lote:
+                try:
+                    achados.append(_avaliar_grupo(plano, [dados], ncms)[0])
+                except Exception as e:
+                    achados.append(e)
+        for posicao, achados_documento in zip(posicoes, achados):
+            resultados[posicao] = achados_documento
+    return resultados
+
+
+def resumir_achados(achados):
+    """Retorna (status, mensagens de erro, mensagens de aviso) a partir dos achados de um documento."""
+    erros = [achado['mensagem'] for achado in achados if achado['severidade'] == ERRO]
+    avisos = [achado['mensagem'] for achado in achados if achado['severidade'] == AVISO]
+    return ('error' if erros else ('warning' if avisos else 'success')), erros, avisos
+
+
+def informacoes_ncm(dados, ncms):
+    """Descrição e alíquota da TIPI de cada item com NCM encontrado, para a conclusão da auditoria."""
+    informacoes = []
+    for item in dados.get('itens') or []:
+        resultado = ncms.get(item.get('ncm')) if item.get('ncm') else None
+        if resultado:
+            # O código vem como None ou número em JSON do agente e em registros antigos
+            informacoes.append({'item': str(item.get('codigo') or 'S/C'), 'ncm': resultado['ncm_encontrado'],
+                                'descricao': resultado['descricao'], 'aliquota': resultado['aliquota']})
+    return informacoes
+
+
+def _validos(valores, validar_um, validar_em_lote):
+    """Valida uma coluna de CNPJs/CPFs: um a um (com cache) ou, em lotes grandes, de uma vez (NumPy)."""
+    if len(valores) >= LOTE_MINIMO_VALIDACAO:
+        return validar_em_lote(valores).tolist()
+    return [isinstance(valor, str) and validar_um(valor) for valor in valores]
+
+
+def _cnpj_ou_cpf(documento):
+    return validar_cnpj(documento) if len(documento) > 11 else validar_cpf(documento)
+
+
+def _vazia(valores):
+    """A coluna não foi informada em nenhuma linha (ex.: impostos que o XML não traz)."""
+    return valores.count(None) == len(valores)
+
+
+def _decimais(valores, ausente=None, converter=para_decimal):
+    if ausente is None and _vazia(valores):
+        return valores  # coluna não informada em nenhum item (ex.: impostos fora do XML)
+    resultado = []
+    for valor in valores:
+        if valor is None:
+            resultado.append(ausente)
+            continue
+        try:
+            resultado.append(converter(valor))
+        except (InvalidOperation, TypeError):
+            resultado.append(INVALIDO)
+    return resultado
+
+
+# --- Colunas derivadas dos itens ---
+
+@coluna_derivada('tipi', campos=('ncm',))
+def _coluna_tipi(c, contexto):
+    """Resultado da consulta de cada NCM na TIPI (contexto['ncms']), ou None."""
+    ncms = contexto['ncms']
+    return [ncms.get(ncm) if ncm else None for ncm in c['ncm']]
+
+
+def _aliquota(valor):
+    """
+    para_decimal com cache, para alíquotas (texto ou par de textos, como no
+    IPI do documento e da TIPI): as mesmas se repetem em quase todos os itens.
+    Só textos vão para o cache (10, 10.0 e True seriam a mesma chave).
+    """
+    if type(valor) is tuple:
+        if not all(type(parte) is str for parte in valor):
+            return tuple(map(para_decimal, valor))
+    elif type(valor) is not str:
+        return para_decimal(valor)
+    decimal = _aliquotas.get(valor)
+    if decimal is None:
+        if len(_aliquotas) >= CACHE_ALIQUOTAS:
+            _aliquotas.clear()
+        decimal = tuple(map(para_decimal, valor)) if type(valor) is tuple else para_decimal(valor)
+        _aliquotas[valor] = decimal
+    return decimal
+
+
+@coluna_derivada('ipi', campos=('pIPI', 'tipi'))
+def _coluna_ipi(c, contexto):
+    """(alíquota do documento, alíquota da TIPI) dos itens com NCM encontrado e pIPI informado; INVALIDO se não converter."""
+    resultado = []
+    for pipi, tipi in zip(c['pIPI'], c['tipi']):
+        if not tipi or pipi is None:
+            resultado.append(None)
+            continue
+        try:
+            resultado.append(_aliquota((pipi, tipi.get('aliquota', '0'))))
+        except (InvalidOperation, TypeError):
+            resultado.append(INVALIDO)
+    return resultado
+
+
+@coluna_derivada('valor_total_decimal', campos=('valor_total',))
+def _coluna_valor_total(c, contexto):
+    return _decimais(c['valor_total'], ausente=Decimal('0.0'))
+
+
+def _registrar_coluna_decimal(campo):
+    converter = _aliquota if campo.endswith('_aliquota') else para_decimal
+    coluna_derivada(f'{campo}_decimal', campos=(campo,))(lambda c, contexto: _decimais(c[campo], converter=converter))
+
+
+for _campo in ('icms_base', 'icms_aliquota', 'icms_valor', 'ipi_valor', 'pis_base', 'pis_aliquota', 'pis_valor',
+               'cofins_base', 'cofins_aliquota', 'cofins_valor'):
+    _registrar_coluna_decimal(_campo)
+
+
+# --- Regras de NF-e (e as comuns a NF-e e CT-e) ---
+
+@regra('NFE.NUMERO_AUSENTE', ERRO, "Número do documento não informado.", campos=('numero',))
+@regra('CTE.NUMERO_AUSENTE', ERRO, "Número do documento não informado.", grupos=('CTE',), campos=('numero',))
+def _numero_ausente(c, contexto):
+    return ((posicao, {}) for posicao, numero in enumerate(c['numero']) if not numero)
+
+
+@regra('NFE.CNPJ_EMITENTE', ERRO, "CNPJ do emitente '{cnpj}' é inválido ou não informado.", campos=('emitente_cnpj',))
+@regra('CTE.CNPJ_EMITENTE', ERRO, "CNPJ do emitente '{cnpj}' é inválido ou não informado.", grupos=('CTE',),
+       campos=('emitente_cnpj',))
+def _cnpj_emitente(c, contexto):
+    validos = _validos(c['emitente_cnpj'], validar_cnpj, validar_cnpjs)
+    return ((posicao, {'cnpj': contexto['documentos'][posicao].get('emitente_cnpj', '')})
+            for posicao, (cnpj, valido) in enumerate(zip(c['emitente_cnpj'], validos)) if not cnpj or not valido)
+
+
+@regra('NFE.SEM_ITENS', AVISO, "O documento não contém itens.")
+def _sem_itens(c, contexto):
+    return ((posicao, {}) for posicao, (inicio, fim) in enumerate(contexto['faixas']) if inicio == fim)
+
+
+@regra('NFE.NCM_AUSENTE', ERRO, "NCM não informado.", escopo=ITEM, campos=('ncm',))
+def _ncm_ausente(c, contexto):
+    return ((linha, {}) for linha, ncm in enumerate(c['ncm']) if not ncm)
+
+
+@regra('NFE.NCM_DESCONHECIDO', ERRO, "NCM '{ncm}' é inválido ou não foi encontrado na Tabela TIPI.", escopo=ITEM,
+       campos=('ncm', 'tipi'))
+def _ncm_desconhecido(c, contexto):
+    return ((linha, {'ncm': ncm}) for linha, (ncm, tipi) in enumerate(zip(c['ncm'], c['tipi'])) if ncm and not tipi)
+
+
+@regra('NFE.IPI_DIVERGENTE', AVISO, "Alíquota de IPI ({documento}%) diverge da Tabela TIPI ({tipi}%).", escopo=ITEM,
+       campos=('ipi',))
+def _ipi_divergente(c, contexto):
+    return ((linha, {'documento': ipi[0], 'tipi': ipi[1]}) for linha, ipi in enumerate(c['ipi'])
+            if ipi is not None and ipi is not INVALIDO and ipi[0] != ipi[1])
+
+
+@regra('NFE.IPI_INVALIDO', AVISO, "Não foi possível validar a alíquota de IPI. Valor inválido no documento.",
+       escopo=ITEM, campos=('ipi',))
+def _ipi_invalido(c, contexto):
+    return ((linha, {}) for linha, ipi in enumerate(c['ipi']) if ipi is INVALIDO)
+
+
+@regra('NFE.CFOP_FORA_DA_LISTA', AVISO, "CFOP '{cfop}' não consta na lista de códigos válidos.", escopo=ITEM,
+       campos=('cfop',))
+def _cfop_fora_da_lista(c, contexto):
+    itens = contexto['itens']
+    return ((linha, {'cfop': itens[linha].get('cfop', '')}) for linha, cfop in enumerate(c['cfop'])
+            if not cfop or cfop not in VALID_CFOP_CODES)
+
+
+@regra('NFE.CFOP_OPERACAO', AVISO, "CFOP '{cfop}' não corresponde a uma operação de {operacao} "
+                                  "(esperado CFOP iniciado em {digito}).",
+       escopo=ITEM, campos=('cfop', 'documento.tipo_operacao', 'documento.destino_operacao'))
+def _cfop_operacao(c, contexto):
+    if _vazia(c['documento.tipo_operacao']):
+        return
+    # Só os CFOPs da lista geral: os demais já são apontados por NFE.CFOP_FORA_DA_LISTA
+    for linha, (cfop, tipo, destino) in enumerate(zip(c['cfop'], c['documento.tipo_operacao'],
+                                                      c['documento.destino_operacao'])):
+        operacao = (tipo, destino)
+        if cfop in VALID_CFOP_CODES and operacao in CFOPS_POR_OPERACAO and cfop not in CFOPS_POR_OPERACAO[operacao]:
+            digito, descricao = OPERACOES_NFE[operacao]
+            yield linha, {'cfop': cfop, 'operacao': descricao, 'digito': digito}
+
+
+def _registrar_calculo_imposto(imposto, prefixo):
+    """Regra de item: o valor do imposto destacado deve ser base × alíquota (quando os três forem informados)."""
+    informado = f'{prefixo}_valor'
+    base, aliquota, valor = f'{prefixo}_base_decimal', f'{prefixo}_aliquota_decimal', f'{informado}_decimal'
+
+    @regra(f'NFE.{imposto}_CALCULO', AVISO, f"{imposto} destacado ({{valor}}) difere de base × alíquota ({{calculado}}).",
+           escopo=ITEM, campos=(informado, base, aliquota, valor))
+    def _calculo_imposto(c, contexto):
+        if _vazia(c[informado]):
+            return
+        for linha, (b, a, v) in enumerate(zip(c[base], c[aliquota], c[valor])):
+            if b is None or a is None or v is None or INVALIDO in (b, a, v):
+                continue
+            calculado = (b * a / 100).quantize(TOLERANCIA)
+            if abs(calculado - v) > TOLERANCIA:
+                yield linha, {'valor': v, 'calculado': calculado}
+
+
+for _imposto, _prefixo in (('ICMS', 'icms'), ('PIS', 'pis'), ('COFINS', 'cofins')):
+    _registrar_calculo_imposto(_imposto, _prefixo)
+
+
+@regra('NFE.VALOR_ITEM_INVALIDO', ERRO, "Contém valor total inválido.", escopo=ITEM, campos=('valor_total_decimal',))
+def _valor_item_invalido(c, contexto):
+    return ((linha, {}) for linha, valor in enumerate(c['valor_total_decimal']) if valor is INVALIDO)
+
+
+@regra('NFE.SOMA_ITENS', ERRO, "A soma dos itens ({soma:.2f}) difere do valor total da nota ({total:.2f}).",
+       campos=('valor_total_nota',), campos_itens=('valor_total_decimal',), fase=FIM)
+def _soma_itens(c, contexto):
+    valores = contexto['colunas_itens']['valor_total_decimal']
+    for posicao, (total, (inicio, fim)) in enumerate(zip(c['valor_total_nota'], contexto['faixas'])):
+        soma = sum((valor for valor in valores[inicio:fim] if valor is not INVALIDO), Decimal('0.00'))
+        total = para_decimal(total)
+        if abs(soma - total) > TOLERANCIA:
+            yield posicao, {'soma': soma, 'total': total}
+
+
+def _registrar_total_imposto(imposto, campo_total, campo_item):
+    """Regra de documento: o total do imposto na nota deve ser a soma dos valores dos itens (quando informado)."""
+    coluna = f'{campo_item}_decimal'
+
+    @regra(f'NFE.TOTAL_{imposto}', AVISO, f"Total de {imposto} da nota ({{total:.2f}}) difere da soma dos itens ({{soma:.2f}}).",
+           campos=(campo_total,), campos_itens=(coluna,), fase=FIM)
+    def _total_imposto(c, contexto):
+        if _vazia(c[campo_total]):
+            return
+        valores = contexto['colunas_itens'][coluna]
+        for posicao, (total, (inicio, fim)) in enumerate(zip(c[campo_total], contexto['faixas'])):
+            if total is None:
+                continue
+            try:
+                total = para_decimal(total)
+            except InvalidOperation:
+                continue
+            soma = sum((valor for valor in valores[inicio:fim] if valor is not None and valor is not INVALIDO),
+                       Decimal('0.00'))
+            if abs(soma - total) > TOLERANCIA:
+                yield posicao, {'total': total, 'soma': soma}
+
+
+for _imposto, _campo_total, _campo_item in (('ICMS', 'valor_icms', 'icms_valor'), ('IPI', 'valor_ipi', 'ipi_valor'),
+                                            ('PIS', 'valor_pis', 'pis_valor'), ('COFINS', 'valor_cofins', 'cofins_valor')):
+    _registrar_total_imposto(_imposto, _campo_total, _campo_item)
+
+
+# --- Regras de NFS-e (XML ABRASF e PDFs lidos por OCR/IA) ---
+
+@regra('NFSE.CNPJ_EMITENTE_AUSENTE', ERRO, "CNPJ do emitente não informado.", grupos=('NFSE',),
+       campos=('emitente_cnpj',))
+def _nfse_cnpj_emitente_ausente(c, contexto):
+    return ((posicao, {}) for posicao, cnpj in enumerate(c['emitente_cnpj']) if not cnpj)
+
+
+@regra('NFSE.CNPJ_EMITENTE', ERRO, "CNPJ do emitente '{cnpj}' é inválido.", grupos=('NFSE',), campos=('emitente_cnpj',))
+def _nfse_cnpj_emitente(c, contexto):
+    validos = _validos(c['emitente_cnpj'], validar_cnpj, validar_cnpjs)
+    return ((posicao, {'cnpj': cnpj}) for posicao, (cnpj, valido) in enumerate(zip(c['emitente_cnpj'], validos))
+            if cnpj and not valido)
+
+
+@regra('NFSE.TOMADOR_AUSENTE', AVISO, "CPF/CNPJ do destinatário (tomador) não informado.", grupos=('NFSE',),
+       campos=('destinatario_cnpj_cpf',))
+def _nfse_tomador_ausente(c, contexto):
+    return ((posicao, {}) for posicao, documento in enumerate(c['destinatario_cnpj_cpf']) if not documento)
+
+
+def _tomadores(c, cnpj):
+    """Posições e documentos dos tomadores informados que são CNPJ (mais de 11 dígitos) ou CPF."""
+    return [(posicao, documento) for posicao, documento in enumerate(c['destinatario_cnpj_cpf'])
+            if documento and (len(''.join(filter(str.isdigit, documento))) > 11) == cnpj]
+
+
+@regra('NFSE.CNPJ_TOMADOR', ERRO, "CNPJ do destinatário '{documento}' é inválido.", grupos=('NFSE',),
+       campos=('destinatario_cnpj_cpf',))
+def _nfse_cnpj_tomador(c, contexto):
+    tomadores = _tomadores(c, cnpj=True)
+    validos = _validos([documento for _, documento in tomadores], validar_cnpj, validar_cnpjs)
+    return ((posicao, {'documento': documento}) for (posicao, documento), valido in zip(tomadores, validos) if not valido)
+
+
+@regra('NFSE.CPF_TOMADOR', ERRO, "CPF do destinatário '{documento}' é inválido.", grupos=('NFSE',),
+       campos=('destinatario_cnpj_cpf',))
+def _nfse_cpf_tomador(c, contexto):
+    tomadores = _tomadores(c, cnpj=False)
+    validos = [validar_cpf(documento) for _, documento in tomadores]
+    return ((posicao, {'documento': documento}) for (posicao, documento), valido in zip(tomadores, validos) if not valido)
+
+
+@regra('NFSE.NUMERO_AUSENTE', ERRO, "Número da nota não informado.", grupos=('NFSE',), campos=('numero',))
+def _nfse_numero_ausente(c, contexto):
+    return ((posicao, {}) for posicao, numero in enumerate(c['numero']) if not numero)
+
+
+@regra('NFSE.DATA_EMISSAO_AUSENTE', AVISO, "Data de emissão não informada.", grupos=('NFSE',), campos=('data_emissao',))
+def _nfse_data_emissao_ausente(c, contexto):
+    return ((posicao, {}) for posicao, data in enumerate(c['data_emissao']) if not data)
+
+
+@regra('NFSE.VALOR_TOTAL_AUSENTE', ERRO, "Valor total da nota não informado.", grupos=('NFSE',),
+       campos=('valor_total_nota',))
+def _nfse_valor_total_ausente(c, contexto):
+    return ((posicao, {}) for posicao, valor in enumerate(c['valor_total_nota']) if not valor)
+
+
+@regra('NFSE.DISCRIMINACAO_AUSENTE', AVISO, "Discriminação dos serviços não informada ou vazia.", grupos=('NFSE',),
+       campos=('discriminacao_servicos',))
+def _nfse_discriminacao_ausente(c, contexto):
+    return ((posicao, {}) for posicao, texto in enumerate(c['discriminacao_servicos']) if not texto)
+
+
+# --- Regras de CT-e ---
+
+def _registrar_participante_cte(papel, campo, sufixo):
+    """Regras do remetente/destinatário do CT-e: CPF/CNPJ não informado (aviso) ou inválido (erro)."""
+
+    @regra(f'CTE.{sufixo}_AUSENTE', AVISO, f"CPF/CNPJ do {papel} não informado.", grupos=('CTE',), campos=(campo,))
+    def _participante_ausente(c, contexto):
+        return ((posicao, {}) for posicao, valor in enumerate(c[campo]) if not ''.join(filter(str.isdigit, valor or '')))
+
+    @regra(f'CTE.{sufixo}', ERRO, f"CPF/CNPJ do {papel} '{{documento}}' é inválido.", grupos=('CTE',), campos=(campo,))
+    def _participante_invalido(c, contexto):
+        informados = [(posicao, digitos) for posicao, valor in enumerate(c[campo])
+                      if (digitos := ''.join(filter(str.isdigit, valor or '')))]
+        validos = _validos([digitos for _, digitos in informados], _cnpj_ou_cpf, validar_cnpjs_cpfs)
+        return ((posicao, {'documento': c[campo][posicao]}) for (posicao, _), valido in zip(informados, validos)
+                if not valido)
+
+
+_registrar_participante_cte('remetente', 'remetente_cnpj_cpf', 'REMETENTE')
+_registrar_participante_cte('destinatário', 'destinatario_cnpj_cpf', 'DESTINATARIO')
+
+
+@regra('CTE.VALOR_TOTAL_AUSENTE', ERRO, "Valor total da prestação não informado.", grupos=('CTE',),
+       campos=('valor_total_nota',))
+def _cte_valor_total_ausente(c, contexto):
+    return ((posicao, {}) for posicao, valor in enumerate(c['valor_total_nota']) if not valor)
+
+
+@regra('CTE.DATA_EMISSAO_AUSENTE', AVISO, "Data de emissão não informada.", grupos=('CTE',), campos=('data_emissao',))
+def _cte_data_emissao_ausente(c, contexto):
+    return ((posicao, {}) for posicao, data in enumerate(c['data_emissao']) if not data)
@@ -0,0 +1,315 @@
+# Arquivo: servico_auditoria.py (Serviço assíncrono de processamento de documentos)
+#
+# Processa vários documentos ao mesmo tempo em um laço asyncio próprio, rodando
+# em uma thread de fundo: o app (ou um script) submete arquivos a uma fila e
+# consulta a situação de cada tarefa sem bloquear.
+#
+# Leitura de arquivos, regras, auditoria e gravação rodam em threads
+# (asyncio.to_thread); as chamadas ao LLM usam ainvoke e passam por um semáforo
+# que limita quantas ficam em andamento. Erros temporários da API (limite de
+# requisições, tempo esgotado, falha de conexão, erro 5xx) são repetidos com
+# espera exponencial, respeitando o cabeçalho Retry-After quando presente.
+#
+# Variáveis de ambiente:
+#   - AGENTE_FISCAL_LLM_CONCORRENCIA: chamadas simultâneas ao LLM (padrão: 4)
+#   - AGENTE_FISCAL_DOCUMENTOS_CONCORRENCIA: documentos em processamento ao mesmo tempo (padrão: 16)
+#   - AGENTE_FISCAL_LLM_TENTATIVAS: tentativas por chamada ao LLM (padrão: 5)
+#   - AGENTE_FISCAL_TAREFAS_GUARDADAS: tarefas terminadas mantidas para consulta (padrão: 1000)
+#
+# Uso (a partir da raiz do projeto):
+#   python servico_auditoria.py notas/*.xml notas/*.pdf --concorrencia-llm 8
+
+import argparse
+import asyncio
+import collections
+import functools
+import os
+import random
+import threading
+import time
+import uuid
+
+import metricas
+
+CONCORRENCIA_LLM = int(os.getenv('AGENTE_FISCAL_LLM_CONCORRENCIA', '4'))
+CONCORRENCIA_DOCUMENTOS = int(os.getenv('AGENTE_FISCAL_DOCUMENTOS_CONCORRENCIA', '16'))
+TENTATIVAS_LLM = int(os.getenv('AGENTE_FISCAL_LLM_TENTATIVAS', '5'))
+TAREFAS_GUARDADAS = int(os.getenv('AGENTE_FISCAL_TAREFAS_GUARDADAS', '1000'))
+ESPERA_INICIAL = 1.0
+ESPERA_MAXIMA = 60.0
+
+
+# Situações de uma tarefa
+NA_FILA, PROCESSANDO, CONCLUIDA, FALHOU = 'na_fila', 'processando', 'concluida', 'falhou'
+
+
+@functools.lru_cache(maxsize=None)
+def erros_temporarios():
+    """Erros da API que valem uma nova tentativa (o cliente da OpenAI é importado só aqui)."""
+    from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+    return (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+
+def _espera_sugerida(erro):
+    """Segundos pedidos pela API no cabeçalho Retry-After do erro, se houver."""
+    resposta = getattr(erro, 'response', None)
+    try:
+        return float(resposta.headers['retry-after'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class ServicoAuditoria:
+    """
+    Fila de documentos processados concorrentemente por um laço asyncio em
+    segundo plano. 'llm' é o modelo de chat usado nas extrações e conclusões
+    (padrão: o do agente); qualquer modelo do LangChain com ainvoke serve.
+    Só as 'tarefas_guardadas' tarefas terminadas mais recentes ficam disponíveis
+    para consulta; as mais antigas são descartadas.
+    """
+
+    def __init__(self, llm=None, concorrencia_llm=CONCORRENCIA_LLM, concorrencia_documentos=CONCORRENCIA_DOCUMENTOS,
+                 tentativas=TENTATIVAS_LLM, espera_inicial=ESPERA_INICIAL, espera_maxima=ESPERA_MAXIMA,
+                 tarefas_guardadas=TAREFAS_GUARDADAS):
+        self.llm = llm
+        self.concorrencia_llm = concorrencia_llm
+        self.tentativas = tentativas
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+        self.tarefas_guardadas = tarefas_guardadas
+        self._tarefas = {}
+        self._concluidas = {}
+        self._terminadas = collections.deque()
+        self._descartadas = collections.Counter()
+        self._enriquecimentos = set()
+        self._lock = threading.Lock()
+        self._contadores = {'chamadas_llm': 0, 'novas_tentativas': 0, 'llm_em_andamento': 0, 'llm_pico': 0}
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='servico-auditoria', daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._iniciar(concorrencia_documentos), self._loop).result()
+
+    async def _iniciar(self, concorrencia_documentos):
+        self._semaforo_llm = asyncio.Semaphore(self.concorrencia_llm)
+        self._fila = asyncio.Queue()
+        self._trabalhadores = [asyncio.create_task(self._trabalhar()) for _ in range(concorrencia_documentos)]
+
+    # --- Interface síncrona (app e scripts) ---
+
+    def submeter(self, caminho_arquivo, nome=None):
+        """
+        Coloca um arquivo (XML ou PDF) na fila e retorna o id da tarefa. 'nome' é o
+        nome exibido do documento (padrão: o nome do arquivo).
+        """
+        id_tarefa = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._tarefas[id_tarefa] = {
+                'id': id_tarefa,
+                'arquivo': caminho_arquivo,
+                'nome': nome or os.path.basename(caminho_arquivo),
+                'situacao': NA_FILA,
+                'enviada_em': time.time(),
+                'iniciada_em': None,
+                'concluida_em': None,
+                'resultado': None,
+                'erro': None,
+            }
+            self._concluidas[id_tarefa] = threading.Event()
+        self._loop.call_soon_threadsafe(self._fila.put_nowait, id_tarefa)
+        return id_tarefa
+
+    def situacao(self, id_tarefa):
+        """Cópia do estado da tarefa (situação, horários, resultado ou erro), ou None (inexistente ou já descartada)."""
+        with self._lock:
+            tarefa = self._tarefas.get(id_tarefa)
+            return dict(tarefa) if tarefa else None
+
+    def tarefas(self):
+        """Cópias de todas as tarefas, na ordem de envio."""
+        with self._lock:
+            return [dict(tarefa) for tarefa in self._tarefas.values()]
+
+    def aguardar(self, ids_tarefas=None, timeout=None):
+        """Bloqueia até as tarefas informadas (ou todas) terminarem. Retorna False se o tempo acabar."""
+        with self._lock:
+            # Tarefas já descartadas terminaram
+            eventos = [self._concluidas[i] for i in (ids_tarefas or list(self._concluidas)) if i in self._concluidas]
+        limite = None if timeout is None else time.monotonic() + timeout
+        for evento in eventos:
+            restante = None if limite is None else max(0.0, limite - time.monotonic())
+            if not evento.wait(restante):
+                return False
+        return True
+
+    def estatisticas(self):
+        """Tarefas por situação (inclusive as já descartadas) e contadores das chamadas ao LLM."""
+        with self._lock:
+            por_situacao = {s: self._descartadas[s] for s in (NA_FILA, PROCESSANDO, CONCLUIDA, FALHOU)}
+            for tarefa in self._tarefas.values():
+                por_situacao[tarefa['situacao']] += 1
+            return {**por_situacao, **self._contadores}
+
+    def encerrar(self):
+        """Aguarda os enriquecimentos pendentes, cancela os trabalhadores e para o laço de eventos."""
+        async def _parar():
+            await asyncio.gather(*self._enriquecimentos, return_exceptions=True)
+            for trabalhador in self._trabalhadores:
+                trabalhador.cancel()
+            await asyncio.gather(*self._trabalhadores, return_exceptions=True)
+        asyncio.run_coroutine_threadsafe(_parar(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    # --- Processamento (no laço de eventos) ---
+
+    def _atualizar(self, id_tarefa, **campos):
+        with self._lock:
+            self._tarefas[id_tarefa].update(campos)
+
+    async def _trabalhar(self):
+        while True:
+            id_tarefa = await self._fila.get()
+            self._atualizar(id_tarefa, situacao=PROCESSANDO, iniciada_em=time.time())
+            try:
+                resultado = await self.processar(self._tarefas[id_tarefa]['arquivo'])
+                falhou = resultado['status'] != 'SUCESSO'
+                self._atualizar(id_tarefa, situacao=FALHOU if falhou else CONCLUIDA, resultado=resultado,
+                                erro=resultado['mensagem'] if falhou else None, concluida_em=time.time())
+            except Exception as e:
+                self._atualizar(id_tarefa, situacao=FALHOU, erro=str(e), concluida_em=time.time())
+            finally:
+                self._concluidas[id_tarefa].set()
+                self._descartar_terminadas(id_tarefa)
+                self._fila.task_done()
+
+    def _descartar_terminadas(self, id_tarefa):
+        """Registra a tarefa terminada e descarta as mais antigas além de 'tarefas_guardadas'."""
+        with self._lock:
+            self._terminadas.append(id_tarefa)
+            while len(self._terminadas) > self.tarefas_guardadas:
+                antiga = self._terminadas.popleft()
+                self._descartadas[self._tarefas.pop(antiga)['situacao']] += 1
+                del self._concluidas[antiga]
+
+    def _modelo(self):
+        if self.llm is None:
+            import agente_fiscal_langchain as agente
+            return agente.get_llm()
+        return self.llm
+
+    async def chamar_llm(self, chamada, *args):
+        """
+        Executa 'await chamada(*args)' dentro do limite de chamadas simultâneas,
+        repetindo com espera exponencial (com jitter) os erros temporários da API.
+        """
+        for tentativa in range(1, self.tentativas + 1):
+            inicio_espera = time.perf_counter()
+            async with self._semaforo_llm:
+                metricas.registrar_duracao('espera_llm', time.perf_counter() - inicio_espera)
+                with self._lock:
+                    self._contadores['chamadas_llm'] += 1
+                    self._contadores['llm_em_andamento'] += 1
+                    self._contadores['llm_pico'] = max(self._contadores['llm_pico'], self._contadores['llm_em_andamento'])
+                try:
+                    return await chamada(*args)
+                except erros_temporarios() as e:
+                    if tentativa == self.tentativas:
+                        raise
+                    espera = _espera_sugerida(e)
+                finally:
+                    with self._lock:
+                        self._contadores['llm_em_andamento'] -= 1
+            if espera is None:
+                espera = random.uniform(0, min(self.espera_maxima, self.espera_inicial * 2 ** (tentativa - 1)))
+            with self._lock:
+                self._contadores['novas_tentativas'] += 1
+            metricas.contar('novas_tentativas_llm')
+            await asyncio.sleep(espera)
+
+    async def processar(self, caminho_arquivo):
+        """
+        Extrai, audita e salva um documento, como processar_documento_xml no app,
+        e retorna o mesmo dicionário de auditar_e_salvar. Documentos já auditados
+        (mesma chave de acesso ou conteúdo) devolvem o resultado gravado. PDFs
+        passam pela leitura por regras e só os campos faltantes vão ao LLM.
+        Os tempos das etapas vão para o rastro do documento (ver metricas.py).
+        """
+        with metricas.documento(os.path.basename(caminho_arquivo)):
+            return await self._processar(caminho_arquivo)
+
+    async def _processar(self, caminho_arquivo):
+        import agente_fiscal_langchain as agente
+        from conclusao_auditoria import CONCLUSAO_IA
+        from identificacao import identificar_arquivo
+
+        with metricas.etapa('identificacao'):
+            identificacao = await asyncio.to_thread(identificar_arquivo, caminho_arquivo)
+            duplicado = await asyncio.to_thread(agente.auditoria_existente, identificacao)
+        if duplicado is not None:
+            metricas.contar('documentos_duplicados')
+            return duplicado
+
+        # O modelo só é criado quando o LLM é chamado: XMLs sem enriquecimento não precisam da chave nem do LangChain
+        if caminho_arquivo.lower().endswith('.pdf'):
+            try:
+                leitura = await asyncio.to_thread(agente.iniciar_leitura_pdf, caminho_arquivo, False,
+                                                  identificacao['hash_conteudo'])
+                resposta_ia = None
+                if leitura['faltantes']:
+                    resposta_ia = await self.chamar_llm(agente.aextrair_dados_com_ia, leitura['trechos'],
+                                                        self._modelo(), leitura['faltantes'])
+                dados = await asyncio.to_thread(agente.concluir_leitura_pdf, leitura, resposta_ia)
+            except Exception as e:
+                dados = {"erro": f"Falha ao processar PDF: {e}"}
+        else:
+            dados = await asyncio.to_thread(agente.ler_dados_xml_streaming, caminho_arquivo)
+        dados = agente.com_identificacao(dados, identificacao)
+
+        resultado = await asyncio.to_thread(agente.auditar_e_salvar, dados, False)
+        if CONCLUSAO_IA and resultado['status'] == 'SUCESSO':
+            # Não atrasa a conclusão da tarefa: o enriquecimento segue no laço de eventos
+            enriquecimento = asyncio.create_task(self._enriquecer(resultado['auditoria'], resultado['referencia']))
+            self._enriquecimentos.add(enriquecimento)
+            enriquecimento.add_done_callback(self._enriquecimentos.discard)
+        return resultado
+
+    async def _enriquecer(self, audit_result, referencia):
+        """Conclusão com IA (assíncrona), gravada sobre a conclusão por regras já salva."""
+        from conclusao_auditoria import aredigir_conclusao_ia, precisa_enriquecer
+        from persistencia import atualizar_conclusao
+
+        if not precisa_enriquecer(audit_result):
+            return
+        try:
+            conclusao = await self.chamar_llm(aredigir_conclusao_ia, audit_result, self._modelo())
+            await asyncio.to_thread(atualizar_conclusao, audit_result, referencia, conclusao, 'ia')
+        except Exception as e:
+            print(f"Falha ao enriquecer a conclusão do documento '{audit_result.get('numero')}': {e}")
+
+
+# --- Execução Principal ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Processa documentos fiscais concorrentemente (XML e PDF).")
+    parser.add_argument('arquivos', nargs='+', help="Arquivos XML/PDF a processar.")
+    parser.add_argument('--concorrencia-llm', type=int, default=CONCORRENCIA_LLM, help="Chamadas simultâneas ao LLM.")
+    parser.add_argument('--concorrencia-documentos', type=int, default=CONCORRENCIA_DOCUMENTOS,
+                        help="Documentos em processamento ao mesmo tempo.")
+    args = parser.parse_args()
+
+    # Todas as tarefas ficam guardadas para o relatório final
+    servico = ServicoAuditoria(concorrencia_llm=args.concorrencia_llm,
+                               concorrencia_documentos=args.concorrencia_documentos,
+                               tarefas_guardadas=max(TAREFAS_GUARDADAS, len(args.arquivos)))
+    inicio = time.perf_counter()
+    ids = [servico.submeter(arquivo) for arquivo in args.arquivos]
+    servico.aguardar(ids)
+    duracao = time.perf_counter() - inicio
+    for tarefa in servico.tarefas():
+        detalhe = tarefa['resultado']['auditoria']['status_auditoria'] if tarefa['situacao'] == CONCLUIDA else tarefa['erro']
+        print(f"{tarefa['arquivo']}: {tarefa['situacao']} ({detalhe})")
+    e = servico.estatisticas()
+    print(f"\n{len(ids)} documento(s) em {duracao:.2f}s | concluídas: {e[CONCLUIDA]} | falhas: {e[FALHOU]} | "
+          f"chamadas ao LLM: {e['chamadas_llm']} | novas tentativas: {e['novas_tentativas']}")
+    servico.encerrar()
@@ -0,0 +1,35 @@
+# Arquivo: tests/conftest.py (Configuração comum dos testes)
+#
+# Os módulos do projeto são importados da raiz do repositório. A auditoria
+# consulta 'tipi/tipi.db' e grava bancos e logs a partir do diretório de
+# trabalho: o fixture 'diretorio_trabalho' roda o teste em uma pasta
+# temporária com a TIPI do projeto; 'diario' troca o armazenamento para o
+# diário JSONL.
+
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, 'benchmarks'))
+
+
+@pytest.fixture
+def diretorio_trabalho(tmp_path, monkeypatch):
+    os.symlink(os.path.join(RAIZ, 'tipi'), tmp_path / 'tipi')
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def diario(diretorio_trabalho, monkeypatch):
+    import dados_dashboard
+    import persistencia
+
+    for modulo in (persistencia, dados_dashboard):
+        monkeypatch.setattr(modulo, 'MODO_ARMAZENAMENTO', 'jsonl')
+    # Blocos pequenos: o diário é percorrido em várias leituras
+    monkeypatch.setattr(persistencia, 'BYTES_POR_LEITURA_DIARIO', 256)
+    monkeypatch.setattr(persistencia, '_indice_diario', {'cursor': None, 'chaves': {}, 'hashes': {}})
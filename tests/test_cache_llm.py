@@ -0,0 +1,116 @@
+# Arquivo: tests/test_cache_llm.py
+#
+# Expiração (TTL) e descarte das respostas usadas há mais tempo (LRU) no cache
+# do LLM, com um relógio controlado pelo teste. O total de bytes mantido no
+# contador deve sempre bater com a soma das respostas guardadas.
+
+import os
+import types
+import warnings
+
+import pytest
+
+import cache_llm
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr(cache_llm, 'time', types.SimpleNamespace(time=lambda: agora[0]))
+    return agora
+
+
+@pytest.fixture
+def cache_file(tmp_path):
+    return str(tmp_path / 'cache_llm.db')
+
+
+def _bytes(cache_file):
+    with cache_llm.conectar(cache_file) as conn:
+        contador = conn.execute("SELECT valor FROM contadores WHERE nome = 'bytes'").fetchone()
+    assert contador[0] == cache_llm.estatisticas(cache_file)['bytes']
+    return contador[0]
+
+
+def test_resposta_expira_depois_do_ttl(relogio, cache_file):
+    cache_llm.guardar_resposta('a', 'resposta a', cache_file=cache_file)
+
+    relogio[0] += 3599
+    assert cache_llm.buscar_resposta('a', ttl=3600, cache_file=cache_file) == 'resposta a'
+    relogio[0] += 2
+    assert cache_llm.buscar_resposta('a', ttl=3600, cache_file=cache_file) is None
+
+    e = cache_llm.estatisticas(cache_file)
+    assert (e['entradas'], e['expiradas'], e['acertos'], e['falhas']) == (0, 1, 1, 1)
+    assert _bytes(cache_file) == 0
+
+
+def test_remover_expiradas(relogio, cache_file):
+    cache_llm.guardar_resposta('antiga', 'resposta antiga', cache_file=cache_file)
+    relogio[0] += 100
+    cache_llm.guardar_resposta('nova', 'resposta nova', cache_file=cache_file)
+
+    relogio[0] += 50
+    assert cache_llm.remover_expiradas(cache_file, ttl=120) == 1
+    assert cache_llm.buscar_resposta('nova', ttl=120, cache_file=cache_file) == 'resposta nova'
+    assert _bytes(cache_file) == len('resposta nova')
+
+
+def test_limite_descarta_as_usadas_ha_mais_tempo(relogio, cache_file):
+    for chave in 'abc':
+        relogio[0] += 1
+        cache_llm.guardar_resposta(chave, chave * 10, max_bytes=30, cache_file=cache_file)
+    relogio[0] += 1
+    assert cache_llm.buscar_resposta('a', cache_file=cache_file) == 'a' * 10
+
+    relogio[0] += 1
+    cache_llm.guardar_resposta('d', 'd' * 10, max_bytes=30, cache_file=cache_file)
+
+    assert cache_llm.buscar_resposta('b', cache_file=cache_file) is None
+    for chave in 'acd':
+        assert cache_llm.buscar_resposta(chave, cache_file=cache_file) == chave * 10
+    assert cache_llm.estatisticas(cache_file)['descartes'] == 1
+    assert _bytes(cache_file) == 30
+
+
+def test_descarte_em_varios_lotes(relogio, cache_file):
+    for i in range(10):
+        relogio[0] += 1
+        cache_llm.guardar_resposta(str(i), 'x' * 10, cache_file=cache_file)
+
+    with cache_llm.conectar(cache_file) as conn:
+        assert cache_llm._descartar_excedente(conn, 25, lote=3) == 8
+    with cache_llm.conectar(cache_file) as conn:
+        assert [linha[0] for linha in conn.execute("SELECT chave FROM respostas ORDER BY chave")] == ['8', '9']
+    assert _bytes(cache_file) == 20
+
+
+def test_resposta_substituida_conta_uma_vez(relogio, cache_file):
+    cache_llm.guardar_resposta('a', 'curta', cache_file=cache_file)
+    cache_llm.guardar_resposta('a', 'resposta mais longa', cache_file=cache_file)
+
+    assert _bytes(cache_file) == len('resposta mais longa')
+    cache_llm.limpar(cache_file)
+    cache_llm.guardar_resposta('b', 'outra', cache_file=cache_file)
+    assert _bytes(cache_file) == len('outra')
+
+
+def test_cache_anterior_ao_contador(relogio, cache_file):
+    cache_llm.guardar_resposta('a', 'resposta a', cache_file=cache_file)
+    with cache_llm.conectar(cache_file) as conn:
+        conn.execute("DELETE FROM contadores WHERE nome = 'bytes'")
+    cache_llm._caches_inicializados.discard(os.path.abspath(cache_file))
+
+    assert _bytes(cache_file) == len('resposta a')
+
+
+def test_lookup_sem_aviso_de_beta(cache_file):
+    pytest.importorskip('langchain_core')
+    from langchain_core.outputs import Generation
+
+    cache = cache_llm.criar_cache_llm(cache_file)
+    cache.update('prompt', 'modelo', [Generation(text='resposta')])
+    with warnings.catch_warnings(record=True) as avisos:
+        warnings.simplefilter('always')
+        assert cache.lookup('prompt', 'modelo') == [Generation(text='resposta')]
+    assert not [aviso for aviso in avisos if 'beta' in str(aviso.message)]
@@ -0,0 +1,36 @@
+# Arquivo: tests/test_conclusao_auditoria.py
+#
+# Conclusão por regras com itens cujo código não é texto (None ou número),
+# comuns no JSON do agente e em registros antigos.
+
+import pytest
+
+from conclusao_auditoria import gerar_conclusao
+
+NCM_CONHECIDO = '01012100'
+
+
+def _nfe(codigo):
+    return {
+        'tipo_documento': 'NFE', 'numero': '1', 'emitente_cnpj': '11222333000181', 'valor_total_nota': '10.00',
+        'itens': [{'codigo': codigo, 'ncm': NCM_CONHECIDO, 'cfop': '5102', 'valor_total': '10.00'}],
+    }
+
+
+@pytest.mark.parametrize('codigo, esperado', [(None, 'S/C'), (123, '123'), ('', 'S/C'), ('A-1', 'A-1')])
+def test_auditoria_com_codigo_do_item_fora_do_texto(diretorio_trabalho, codigo, esperado):
+    import agente_fiscal_langchain as agente
+
+    auditoria = agente.auditar_dados_fiscais(_nfe(codigo))
+
+    assert [info['item'] for info in auditoria['informacoes_ncm']] == [esperado]
+    assert f"1 item: {esperado}" in auditoria['conclusao_analise']
+
+
+def test_conclusao_de_registro_antigo_com_codigo_none_ou_numero():
+    informacoes = [{'item': None, 'ncm': '0101.21.00', 'descricao': 'Cavalos', 'aliquota': '0'},
+                   {'item': 7, 'ncm': '0101.21.00', 'descricao': 'Cavalos', 'aliquota': '0'}]
+
+    conclusao = gerar_conclusao('success', [], [], informacoes)
+
+    assert "2 itens: None, 7" in conclusao
@@ -0,0 +1,82 @@
+# Arquivo: tests/test_dados_dashboard.py
+#
+# Filtro e agrupamento por emitente com o CNPJ gravado com e sem pontuação
+# (os lidos de PDF pela IA ficam como vieram), no SQLite, no diário JSONL e na
+# exportação Parquet.
+
+import sqlite3
+
+import pytest
+
+NFE = {'tipo_documento': 'NFE', 'numero': '1', 'emitente_razao_social': 'Fornecedor SA',
+       'emitente_cnpj': '11222333000181', 'data_emissao': '2024-05-10T10:00:00-03:00', 'valor_total_nota': '100.00',
+       'status_auditoria': 'success', 'erros_auditoria': [], 'avisos_auditoria': [],
+       'itens': [{'codigo': 'A', 'ncm': '01012100', 'cfop': '5102', 'valor_total': '100.00'}]}
+NFSE_PDF = {'tipo_documento': 'NFS-e', 'formato': 'ocr_ia', 'numero': '2', 'emitente_cnpj': '11.222.333/0001-81',
+            'data_emissao': '11/05/2024', 'valor_total_nota': '50,00', 'status_auditoria': 'success',
+            'erros_auditoria': [], 'avisos_auditoria': []}
+OUTRO = {**NFE, 'numero': '3', 'emitente_razao_social': 'Outro Ltda', 'emitente_cnpj': '11444777000161'}
+
+
+def _salvar_acervo():
+    import persistencia
+
+    for auditoria in (NFE, NFSE_PDF, OUTRO):
+        persistencia.salvar_auditoria(dict(auditoria))
+
+
+def _verificar_emitente():
+    from dados_dashboard import ItensPlanos, agregar, consultar_pagina
+
+    itens_planos = ItensPlanos()
+    pagina, total = consultar_pagina(itens_planos, {'emitente_cnpj': '11.222.333/0001-81'})
+    assert total == 2
+    assert sorted(pagina['numero_nota']) == ['1', '2']
+
+    _, total = consultar_pagina(itens_planos, {'emitente_cnpj': '11222333000181'})
+    assert total == 2
+
+    por_emitente = agregar(itens_planos, 'emitente')
+    assert list(por_emitente['grupo']) == ['Fornecedor SA', 'Outro Ltda']
+    assert list(por_emitente['quantidade']) == [2, 1]
+    assert list(por_emitente['valor_total']) == [150.0, 100.0]
+
+
+def test_emitente_com_e_sem_pontuacao_no_sqlite(diretorio_trabalho):
+    _salvar_acervo()
+    _verificar_emitente()
+
+
+def test_emitente_com_e_sem_pontuacao_no_diario(diario):
+    _salvar_acervo()
+    _verificar_emitente()
+
+
+def test_coluna_do_cnpj_preenchida_em_banco_anterior(diretorio_trabalho, monkeypatch):
+    import banco_documentos
+
+    _salvar_acervo()
+    # Banco de uma versão anterior: sem a coluna, que é criada e preenchida na próxima conexão
+    with sqlite3.connect(banco_documentos.DB_DOCUMENTOS) as conn:
+        conn.execute("DROP INDEX idx_documentos_emitente_cnpj_digitos")
+        conn.execute("ALTER TABLE documentos DROP COLUMN emitente_cnpj_digitos")
+    monkeypatch.setattr(banco_documentos, '_bancos_inicializados', set())
+
+    with banco_documentos.conectar() as conn:
+        valores = [linha[0] for linha in conn.execute("SELECT emitente_cnpj_digitos FROM documentos ORDER BY id")]
+        indices = [linha[1] for linha in conn.execute("PRAGMA index_list(documentos)")]
+    assert valores == ['11222333000181', '11222333000181', '11444777000161']
+    assert 'idx_documentos_emitente_cnpj_digitos' in indices
+    _verificar_emitente()
+
+
+def test_emitente_com_e_sem_pontuacao_na_exportacao_parquet(diretorio_trabalho, monkeypatch):
+    pytest.importorskip('pyarrow')
+    import dados_dashboard
+    import exportacao_parquet
+
+    monkeypatch.setattr(exportacao_parquet, 'DIRETORIO_PARQUET', str(diretorio_trabalho / 'parquet'))
+    monkeypatch.setattr(dados_dashboard, 'DASHBOARD_PARQUET', True)
+    _salvar_acervo()
+    exportacao_parquet.exportar()
+    _verificar_emitente()
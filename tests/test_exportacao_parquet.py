@@ -0,0 +1,61 @@
+# Arquivo: tests/test_exportacao_parquet.py
+#
+# Exportação incremental de documentos alterados no SQLite depois de
+# exportados (conclusão pela IA e reauditoria): a execução seguinte os
+# exporta de novo, sem --completo, e a leitura fica com a versão alterada.
+
+import pytest
+
+NFE = {'tipo_documento': 'NFE', 'numero': '1', 'emitente_razao_social': 'Fornecedor SA',
+       'emitente_cnpj': '11222333000181', 'data_emissao': '2024-05-10T10:00:00-03:00', 'valor_total_nota': '100.00',
+       'status_auditoria': 'success', 'conclusao_analise': 'Sem apontamentos.',
+       'erros_auditoria': [], 'avisos_auditoria': [],
+       'itens': [{'codigo': 'A', 'ncm': '01012100', 'cfop': '5102', 'valor_total': '100.00'}]}
+OUTRA = {**NFE, 'numero': '2', 'valor_total_nota': '50.00',
+         'itens': [{'codigo': 'B', 'ncm': '01012100', 'cfop': '5102', 'valor_total': '50.00'}]}
+
+
+@pytest.fixture
+def exportacao(diretorio_trabalho, monkeypatch):
+    pytest.importorskip('pyarrow')
+    import exportacao_parquet
+
+    monkeypatch.setattr(exportacao_parquet, 'DIRETORIO_PARQUET', str(diretorio_trabalho / 'parquet'))
+    return exportacao_parquet
+
+
+def _documentos(exportacao):
+    df = exportacao.ler_exportacao('documentos', colunas=['numero_nota', 'status_auditoria', 'conclusao_analise'])
+    return {linha.numero_nota: (linha.status_auditoria, linha.conclusao_analise) for linha in df.itertuples()}
+
+
+def test_documentos_alterados_voltam_na_exportacao_seguinte(exportacao):
+    import persistencia
+
+    referencia = persistencia.salvar_auditoria(dict(NFE))
+    outra = persistencia.salvar_auditoria(dict(OUTRA))
+    assert exportacao.exportar()['documentos'] == 2
+    assert exportacao.exportar()['documentos'] == 0
+
+    persistencia.atualizar_conclusao(dict(NFE), referencia, 'Conclusão da IA.', 'ia')
+    relatorio = exportacao.exportar()
+    assert (relatorio['documentos'], relatorio['refeita']) == (1, False)
+    assert _documentos(exportacao)['1'] == ('success', 'Conclusão da IA.')
+
+    persistencia.atualizar_auditorias([(outra, {**OUTRA, 'status_auditoria': 'error',
+                                                'conclusao_analise': 'Reauditada.'})])
+    assert exportacao.exportar()['documentos'] == 1
+    assert _documentos(exportacao) == {'1': ('success', 'Conclusão da IA.'), '2': ('error', 'Reauditada.')}
+
+
+def test_leitura_em_partes_inclui_os_alterados(diretorio_trabalho):
+    import persistencia
+
+    referencia = persistencia.salvar_auditoria(dict(NFE))
+    persistencia.salvar_auditoria(dict(OUTRA))
+    _, cursor, _ = persistencia.ler_itens_planos_desde(None)
+
+    persistencia.atualizar_conclusao(dict(NFE), referencia, 'Conclusão da IA.', 'ia')
+    linhas, cursor, _ = persistencia.ler_itens_planos_desde(cursor, limite_documentos=1)
+    assert [linha[-1] for linha in linhas] == [referencia]
+    assert persistencia.ler_itens_planos_desde(cursor, limite_documentos=1)[0] == []
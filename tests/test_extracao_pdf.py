@@ -0,0 +1,40 @@
+# Arquivo: tests/test_extracao_pdf.py
+#
+# Detecção por regras dos CPF/CNPJ da NFS-e no texto do PDF.
+
+from extracao_pdf import detectar_campos
+
+LAYOUT_PADRAO = """PREFEITURA MUNICIPAL DE SÃO PAULO
+CNPJ: 46.395.000/0001-39
+NOTA FISCAL ELETRÔNICA DE SERVIÇOS - NFS-e
+Número da NFS-e: 1234
+Data e Hora de Emissão: 05/03/2024 10:15:00
+PRESTADOR DE SERVIÇOS
+CPF/CNPJ: 11.222.333/0001-81
+Razão Social: Empresa Prestadora Ltda
+TOMADOR DE SERVIÇOS
+CPF/CNPJ: 123.456.789-09
+Discriminação dos Serviços: Consultoria
+VALOR TOTAL DA NOTA = R$ 1.500,00
+"""
+
+
+def test_cnpj_do_cabecalho_nao_e_o_do_emitente():
+    campos = detectar_campos([LAYOUT_PADRAO])
+
+    assert campos['cnpj_emitente'] == '11222333000181'
+    assert campos['destinatario_cnpj_cpf'] == '12345678909'
+    assert campos['numero'] == '1234'
+
+
+def test_sem_secoes_o_emitente_fica_para_a_ia():
+    campos = detectar_campos(["Nota Fiscal Nº 77\nCNPJ: 11.222.333/0001-81\n"])
+
+    assert 'cnpj_emitente' not in campos
+    assert 'destinatario_cnpj_cpf' not in campos
+
+
+def test_sem_secao_do_tomador_o_documento_seguinte_e_o_dele():
+    campos = detectar_campos(["CNPJ: 46.395.000/0001-39\nEMITENTE\nCNPJ: 11.222.333/0001-81\nCPF: 123.456.789-09\n"])
+
+    assert (campos['cnpj_emitente'], campos['destinatario_cnpj_cpf']) == ('11222333000181', '12345678909')
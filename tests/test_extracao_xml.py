@@ -0,0 +1,60 @@
+# Arquivo: tests/test_extracao_xml.py
+#
+# Diferencial: a extração em streaming (ler_dados_xml_streaming) deve produzir
+# exatamente a mesma saída que a extração com a árvore completa (ler_dados_xml).
+
+import pytest
+
+from bench_extracao_xml import casos_diferenciais, gerar_nfe
+from gerar_corpus import gerar_corpus
+
+
+def _comparar(caminho):
+    from agente_fiscal_langchain import ler_dados_xml, ler_dados_xml_streaming
+
+    arvore, streaming = ler_dados_xml(caminho), ler_dados_xml_streaming(caminho)
+    if 'erro' in arvore and 'erro' in streaming:
+        # As mensagens do lxml citam a posição do erro, que difere entre os dois parsers
+        arvore, streaming = arvore['erro'].split(':')[0], streaming['erro'].split(':')[0]
+    assert streaming == arvore
+
+
+@pytest.mark.parametrize('nome, conteudo', list(casos_diferenciais()), ids=[nome for nome, _ in casos_diferenciais()])
+def test_casos_de_borda(tmp_path, nome, conteudo):
+    caminho = tmp_path / f'{nome}.xml'
+    caminho.write_text(conteudo, encoding='utf-8')
+    _comparar(str(caminho))
+
+
+@pytest.mark.parametrize('semente', [3, 17, 2024])
+def test_corpus_gerado(tmp_path, semente):
+    manifesto = gerar_corpus(tmp_path, documentos=25, itens=(0, 40), fracao_cte=0.3, fracao_cnpj_invalido=0.2,
+                             semente=semente)
+    assert manifesto['documentos']
+    for nome in manifesto['documentos']:
+        _comparar(str(tmp_path / nome))
+
+
+def test_nfe_com_muitos_itens(tmp_path):
+    from agente_fiscal_langchain import ler_dados_xml_streaming
+
+    caminho = str(tmp_path / 'nfe_grande.xml')
+    gerar_nfe(caminho, 5000)
+    _comparar(caminho)
+    assert len(ler_dados_xml_streaming(caminho)['itens']) == 5000
+
+
+def test_nfse_do_xml_e_do_pdf_com_o_mesmo_tipo(diretorio_trabalho):
+    import agente_fiscal_langchain as agente
+    from esquemas_xml import TIPO_NFSE
+    from regras_auditoria import grupo_documento
+
+    caminho = diretorio_trabalho / 'nfse.xml'
+    caminho.write_text(dict(casos_diferenciais())['nfse_abrasf_v2'], encoding='utf-8')
+    do_xml = agente.ler_dados_xml_streaming(str(caminho))
+    leitura = {'hash': 'h' * 64, 'dados': {'cnpj_emitente': '11222333000181', 'numero': '43'}, 'faltantes': [],
+               'trechos': None, 'em_cache': False}
+    do_pdf = agente.concluir_leitura_pdf(leitura)
+
+    assert do_xml['tipo_documento'] == do_pdf['tipo_documento'] == TIPO_NFSE
+    assert grupo_documento(do_xml) == grupo_documento(do_pdf) == 'NFSE'
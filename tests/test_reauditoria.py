@@ -0,0 +1,95 @@
+# Arquivo: tests/test_reauditoria.py
+#
+# Reauditoria do acervo: só o que mudou é regravado, e registros antigos sem
+# achados recebem os achados sem perder a conclusão gravada.
+
+import pytest
+
+from test_conclusao_auditoria import _nfe
+
+
+@pytest.fixture
+def acervo(diretorio_trabalho):
+    import agente_fiscal_langchain as agente
+    import persistencia
+
+    def _salvar(**campos):
+        auditoria = {**agente.auditar_dados_fiscais(_nfe('A-1')), **campos}
+        auditoria = {campo: valor for campo, valor in auditoria.items() if valor is not None}
+        persistencia.salvar_auditoria(auditoria)
+        return auditoria
+
+    return _salvar
+
+
+def _gravados():
+    import persistencia
+
+    return persistencia.listar_auditorias()
+
+
+def test_registro_atual_nao_e_regravado(acervo):
+    from reauditoria import reauditar
+
+    acervo()
+    relatorio = reauditar(processos=1)
+
+    assert (relatorio['documentos'], relatorio['alterados'], relatorio['achados_preenchidos']) == (1, 0, 0)
+
+
+def test_registro_sem_achados_mantem_conclusao_da_ia(acervo):
+    from reauditoria import reauditar
+
+    gravado = acervo(achados_auditoria=None, conclusao_analise='Conclusão da IA.', conclusao_origem='ia')
+    relatorio = reauditar(processos=1)
+
+    assert (relatorio['alterados'], relatorio['achados_preenchidos'], relatorio['atualizados']) == (0, 1, 1)
+    [registro] = _gravados()
+    assert registro['conclusao_analise'] == 'Conclusão da IA.'
+    assert registro['conclusao_origem'] == 'ia'
+    assert registro['status_auditoria'] == gravado['status_auditoria']
+    assert 'achados_auditoria' in registro
+
+
+def test_resultado_alterado_refaz_a_conclusao(acervo):
+    from reauditoria import reauditar
+
+    gravado = acervo(status_auditoria='error', erros_auditoria=['Erro antigo.'], conclusao_origem='ia')
+    relatorio = reauditar(processos=1)
+
+    assert (relatorio['alterados'], relatorio['achados_preenchidos']) == (1, 0)
+    [registro] = _gravados()
+    assert registro['conclusao_origem'] == 'regras'
+    assert registro['erros_auditoria'] != gravado['erros_auditoria']
+
+
+def test_registro_anterior_a_informacoes_ncm_nao_e_regravado(acervo):
+    from reauditoria import reauditar
+
+    acervo(informacoes_ncm=None, conclusao_origem='ia')
+    relatorio = reauditar(processos=1)
+
+    assert (relatorio['alterados'], relatorio['achados_preenchidos']) == (0, 0)
+    assert _gravados()[0]['conclusao_origem'] == 'ia'
+
+
+def test_diario_percorrido_em_blocos_so_com_o_registro_mais_recente(diario, acervo):
+    import persistencia
+    from reauditoria import reauditar
+
+    for numero in range(1, 6):
+        acervo(numero=str(numero), status_auditoria='error')
+    # Documento regravado: só o registro mais recente é reauditado
+    anterior = acervo(numero='3', status_auditoria='error')
+    persistencia.atualizar_conclusao(anterior, None, 'Conclusão da IA.', 'ia')
+
+    ncms, lotes = persistencia.acervo_para_reauditoria(tamanho_lote=2)
+    assert ncms == ['01012100']
+    assert [len(lote) for lote in lotes] == [2, 2, 1]
+
+    relatorio = reauditar(processos=1, tamanho_lote=2)
+
+    assert (relatorio['documentos'], relatorio['alterados'], relatorio['atualizados']) == (5, 5, 5)
+    gravados = _gravados()
+    assert sorted(registro['numero'] for registro in gravados) == ['1', '2', '3', '4', '5']
+    assert all(registro['conclusao_origem'] == 'regras' for registro in gravados)
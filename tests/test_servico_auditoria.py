@@ -0,0 +1,76 @@
+# Arquivo: tests/test_servico_auditoria.py
+#
+# O modelo de chat só é criado quando o LLM é de fato chamado: XMLs são
+# processados sem OPENAI_API_KEY e sem LangChain.
+
+import pytest
+
+from gerar_corpus import gerar_corpus
+
+
+def _sem_modelo():
+    raise AssertionError("O modelo não deveria ser criado.")
+
+
+@pytest.fixture
+def corpus(diretorio_trabalho):
+    manifesto = gerar_corpus(diretorio_trabalho / 'corpus', documentos=4, itens=(1, 3), fracao_cte=0.5, semente=7)
+    return sorted(str(diretorio_trabalho / 'corpus' / nome) for nome in manifesto['documentos'])
+
+
+def test_servico_processa_xml_sem_criar_o_modelo(corpus, monkeypatch):
+    import agente_fiscal_langchain as agente
+    from servico_auditoria import CONCLUIDA, ServicoAuditoria
+
+    monkeypatch.setattr(agente, 'get_llm', _sem_modelo)
+    servico = ServicoAuditoria()
+    try:
+        ids = [servico.submeter(arquivo) for arquivo in corpus]
+        assert servico.aguardar(ids, timeout=60)
+        assert [servico.situacao(i)['situacao'] for i in ids] == [CONCLUIDA] * len(ids)
+    finally:
+        servico.encerrar()
+
+
+def test_auditar_e_salvar_sem_enriquecimento_nao_cria_o_modelo(corpus, monkeypatch):
+    import agente_fiscal_langchain as agente
+
+    monkeypatch.setattr(agente, 'get_llm', _sem_modelo)
+    resultado = agente.auditar_e_salvar(agente.ler_dados_xml_streaming(corpus[0]))
+
+    assert resultado['status'] == 'SUCESSO'
+
+
+def test_enriquecimento_sem_modelo_mantem_a_conclusao_por_regras(diretorio_trabalho, monkeypatch, capsys):
+    import conclusao_auditoria
+
+    monkeypatch.setattr(conclusao_auditoria, 'CONCLUSAO_IA', True)
+    auditoria = {'numero': '9', 'conclusao_analise': 'Erro no item 1.'}
+
+    def _sem_chave():
+        raise ValueError("A variável de ambiente OPENAI_API_KEY não foi encontrada.")
+
+    tarefa = conclusao_auditoria.agendar_enriquecimento(auditoria, None, _sem_chave)
+
+    assert tarefa.result(timeout=10) is None
+    assert 'OPENAI_API_KEY' in capsys.readouterr().out
+
+
+def test_tarefas_terminadas_alem_do_limite_sao_descartadas(corpus, monkeypatch):
+    import agente_fiscal_langchain as agente
+    from servico_auditoria import CONCLUIDA, ServicoAuditoria
+
+    monkeypatch.setattr(agente, 'get_llm', _sem_modelo)
+    servico = ServicoAuditoria(concorrencia_documentos=1, tarefas_guardadas=2)
+    try:
+        # Todas com o mesmo nome exibido, vindo de 'nome' e não do arquivo
+        ids = [servico.submeter(arquivo, nome='nota.xml') for arquivo in corpus]
+        assert servico.aguardar(ids, timeout=60)
+
+        assert [tarefa['id'] for tarefa in servico.tarefas()] == ids[-2:]
+        assert all(tarefa['nome'] == 'nota.xml' for tarefa in servico.tarefas())
+        assert servico.situacao(ids[0]) is None
+        assert servico.aguardar(ids, timeout=1)
+        assert servico.estatisticas()[CONCLUIDA] == len(ids)
+    finally:
+        servico.encerrar()
@@ -0,0 +1,135 @@
+# Arquivo: tests/test_sincronizar_tipi.py
+#
+# Sincronização da TIPI contra um servidor HTTP local, que publica a página
+# com o link do XLSX e responde 304 quando o ETag enviado é o atual: baixa e
+# aplica só quando há mudança, e só as linhas alteradas chegam ao banco.
+
+import http.server
+import io
+import sqlite3
+import threading
+
+import pytest
+
+from tipi.sincronizartipi import sincronizar_tipi
+
+LINHAS = [
+    ('01.01', '', 'Cavalos, asininos e muares, vivos.', ''),
+    ('0101.21.00', '', '-- Reprodutores de raça pura', '0'),
+    ('0101.29.00', '', '-- Outros', '0'),
+    ('2203.00.00', '', 'Cervejas de malte.', '6,5'),
+    ('2203.00.00', '01', 'Em garrafas de vidro', '3,9'),
+]
+
+
+def _planilha(linhas):
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['TABELA DE INCIDÊNCIA DO IMPOSTO SOBRE PRODUTOS INDUSTRIALIZADOS'])
+    ws.append(['NCM', 'EX', 'DESCRIÇÃO', 'ALÍQUOTA (%)'])
+    for linha in linhas:
+        ws.append(list(linha))
+    arquivo = io.BytesIO()
+    wb.save(arquivo)
+    return arquivo.getvalue()
+
+
+@pytest.fixture
+def servidor(monkeypatch):
+    """Publica {'xlsx': bytes, 'etag': str}; 'downloads' conta as respostas 200 do XLSX."""
+    publicado = {'xlsx': _planilha(LINHAS), 'etag': '"v1"', 'downloads': 0}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/tipi':
+                self._responder(200, b'<html><body><a href="/arquivos/tipi.xlsx">TIPI</a></body></html>',
+                                {'Content-Type': 'text/html; charset=utf-8'})
+            elif self.path == '/arquivos/tipi.xlsx':
+                if self.headers.get('If-None-Match') == publicado['etag']:
+                    self._responder(304, b'', {'ETag': publicado['etag']})
+                else:
+                    publicado['downloads'] += 1
+                    self._responder(200, publicado['xlsx'], {'ETag': publicado['etag']})
+            else:
+                self._responder(404, b'', {})
+
+        def _responder(self, status, corpo, cabecalhos):
+            self.send_response(status)
+            for nome, valor in cabecalhos.items():
+                self.send_header(nome, valor)
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass
+
+    monkeypatch.setenv('NO_PROXY', '127.0.0.1')
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    publicado['page_url'] = f'http://127.0.0.1:{httpd.server_address[1]}/tipi'
+    yield publicado
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def sincronizar(servidor, tmp_path):
+    arquivos = {'xlsx_file': str(tmp_path / 'tipi.xlsx'), 'db_file': str(tmp_path / 'tipi.db'),
+                'estado_file': str(tmp_path / 'tipi_estado.json')}
+    return lambda: sincronizar_tipi(page_url=servidor['page_url'], **arquivos)
+
+
+def _tabela(tmp_path):
+    with sqlite3.connect(tmp_path / 'tipi.db') as conn:
+        return {linha[0]: linha[1:] for linha in conn.execute("SELECT ncm_ex, descricao, aliquota FROM tipi")}
+
+
+def test_primeira_sincronizacao_grava_a_tabela(sincronizar, servidor, tmp_path):
+    resultado = sincronizar()
+
+    assert resultado == {'status': 'atualizado', 'inseridos': 5, 'atualizados': 0, 'removidos': 0}
+    assert _tabela(tmp_path)['2203.00.00|01'] == ('Em garrafas de vidro', '3,9')
+    assert (tmp_path / 'tipi.xlsx').read_bytes() == servidor['xlsx']
+    assert not (tmp_path / 'tipi.novo.xlsx').exists()
+
+
+def test_servidor_sem_mudanca_responde_304(sincronizar, servidor):
+    sincronizar()
+
+    assert sincronizar() == {'status': 'nao_modificado'}
+    assert servidor['downloads'] == 1
+
+
+def test_mesmo_conteudo_com_outro_etag_nao_e_processado(sincronizar, servidor, tmp_path):
+    sincronizar()
+    with sqlite3.connect(tmp_path / 'tipi.db') as conn:
+        conn.execute("UPDATE tipi SET aliquota = 'alterada localmente'")
+
+    servidor['etag'] = '"v2"'
+    assert sincronizar() == {'status': 'sem_alteracoes'}
+    assert servidor['downloads'] == 2
+    # O banco não foi tocado, e o novo ETag foi guardado para a próxima requisição condicional
+    assert set(aliquota for _, aliquota in _tabela(tmp_path).values()) == {'alterada localmente'}
+    assert sincronizar() == {'status': 'nao_modificado'}
+
+
+def test_linha_alterada_gera_um_update(sincronizar, servidor, tmp_path):
+    sincronizar()
+
+    alteradas = [*LINHAS[:3], ('2203.00.00', '', 'Cervejas de malte.', '7'), LINHAS[4]]
+    servidor.update(xlsx=_planilha(alteradas), etag='"v2"')
+    assert sincronizar() == {'status': 'atualizado', 'inseridos': 0, 'atualizados': 1, 'removidos': 0}
+    assert _tabela(tmp_path)['2203.00.00|'] == ('Cervejas de malte.', '7')
+
+
+def test_linha_removida_gera_um_delete(sincronizar, servidor, tmp_path):
+    sincronizar()
+
+    servidor.update(xlsx=_planilha(LINHAS[:4]), etag='"v2"')
+    assert sincronizar() == {'status': 'atualizado', 'inseridos': 0, 'atualizados': 0, 'removidos': 1}
+    assert '2203.00.00|01' not in _tabela(tmp_path)
+    assert len(_tabela(tmp_path)) == 4
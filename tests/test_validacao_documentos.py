@@ -0,0 +1,102 @@
+# Arquivo: tests/test_validacao_documentos.py
+#
+# Equivalência, em casos aleatórios com semente fixa, entre as funções com
+# cache, a validação em lote (lista, array NumPy e Series) e as funções
+# originais sem cache (__wrapped__).
+
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bench_validacao_documentos import DIGITOS_UNICODE, gerar_caso
+from gerar_corpus import gerar_cnpj, gerar_cpf
+from validacao_documentos import (TAMANHO_MAXIMO_LOTE, validar_cnpj, validar_cnpjs, validar_cnpjs_cpfs, validar_cpf,
+                                  validar_cpfs)
+
+ORIGINAL_CNPJ = validar_cnpj.__wrapped__
+ORIGINAL_CPF = validar_cpf.__wrapped__
+NAO_TEXTO = (None, float('nan'), np.nan, 11222333000181, 52998224725.0, b'11222333000181', ['11222333000181'])
+
+
+def _cnpj_ou_cpf(documento):
+    """Escolha da auditoria do CT-e: mais de 11 dígitos, CNPJ; caso contrário, CPF."""
+    if len(''.join(filter(str.isdigit, documento))) > 11:
+        return ORIGINAL_CNPJ(documento)
+    return ORIGINAL_CPF(documento)
+
+
+def _longo(rng):
+    """Documento válido ou não cercado de pontuação até passar de TAMANHO_MAXIMO_LOTE caracteres."""
+    documento = gerar_cnpj(rng, rng.random() < 0.5) if rng.random() < 0.5 else gerar_cpf(rng, rng.random() < 0.5)
+    enchimento = rng.randrange(TAMANHO_MAXIMO_LOTE - len(documento) + 1, 2 * TAMANHO_MAXIMO_LOTE)
+    esquerda = rng.randrange(enchimento + 1)
+    return rng.choice(' .-/') * esquerda + documento + rng.choice(' .-/') * (enchimento - esquerda)
+
+
+def _unicode(rng):
+    """Documento com um ou mais dígitos Unicode no lugar de dígitos ASCII."""
+    documento = list(gerar_cnpj(rng) if rng.random() < 0.5 else gerar_cpf(rng))
+    for _ in range(rng.randrange(1, 3)):
+        documento[rng.randrange(len(documento))] = rng.choice(DIGITOS_UNICODE)
+    return ''.join(documento)
+
+
+def _casos(semente, quantidade=3000):
+    rng = random.Random(semente)
+    casos = []
+    for _ in range(quantidade):
+        sorteio = rng.random()
+        if sorteio < 0.05:
+            casos.append(rng.choice(NAO_TEXTO))
+        elif sorteio < 0.1:
+            casos.append(_longo(rng))
+        elif sorteio < 0.15:
+            casos.append(_unicode(rng))
+        else:
+            casos.append(gerar_caso(rng))
+    return casos
+
+
+EM_LOTE = [('cnpj', ORIGINAL_CNPJ, validar_cnpjs), ('cpf', ORIGINAL_CPF, validar_cpfs),
+           ('cnpj_cpf', _cnpj_ou_cpf, validar_cnpjs_cpfs)]
+
+
+@pytest.mark.parametrize('semente', [1, 22, 333])
+@pytest.mark.parametrize('original, com_cache', [(ORIGINAL_CNPJ, validar_cnpj), (ORIGINAL_CPF, validar_cpf)],
+                         ids=['cnpj', 'cpf'])
+def test_funcao_com_cache_igual_a_original(semente, original, com_cache):
+    textos = [caso for caso in _casos(semente) if isinstance(caso, str)]
+    esperados = [original(texto) for texto in textos]
+
+    # A segunda passada é respondida pelo cache
+    for _ in range(2):
+        assert [com_cache(texto) for texto in textos] == esperados
+
+
+@pytest.mark.parametrize('semente', [1, 22, 333])
+@pytest.mark.parametrize('formato', ['lista', 'array', 'series'])
+@pytest.mark.parametrize('nome, original, em_lote', EM_LOTE, ids=[nome for nome, _, _ in EM_LOTE])
+def test_validacao_em_lote_igual_a_original(semente, formato, nome, original, em_lote):
+    casos = _casos(semente)
+    esperados = [isinstance(caso, str) and original(caso) for caso in casos]
+    indice = pd.RangeIndex(10, 10 + 3 * len(casos), 3)
+    entrada = {'lista': casos, 'array': np.array(casos, dtype=object),
+               'series': pd.Series(casos, index=indice, dtype=object, name='documento')}[formato]
+
+    obtidos = em_lote(entrada)
+
+    if formato == 'series':
+        assert isinstance(obtidos, pd.Series)
+        assert obtidos.index.equals(indice) and obtidos.name == 'documento'
+    else:
+        assert isinstance(obtidos, np.ndarray) and obtidos.dtype == bool
+    assert [bool(valor) for valor in obtidos] == esperados
+
+
+@pytest.mark.parametrize('em_lote', [validar_cnpjs, validar_cpfs, validar_cnpjs_cpfs])
+def test_lote_vazio_ou_so_com_valores_que_nao_sao_texto(em_lote):
+    assert len(em_lote([])) == 0
+    assert len(em_lote(pd.Series([], dtype=object))) == 0
+    assert not em_lote(list(NAO_TEXTO)).any()
@@ -5,43 +5,65 @@ import re
 import pandas as pd
 import sqlite3
 import os
+from itertools import islice
 
-def baixar_tipi_xlsx(output_filename="tipi_download.xlsx"):
+TIPI_PAGE_URL = "https://www.gov.br/receitafederal/pt-br/acesso-a-informacao/legislacao/tipi-tabela-de-incidencia-do-imposto-sobre-produtos-industrializados"
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+TIPI_COLUNAS = ['ncm_ex', 'ncm', 'ex', 'descricao', 'aliquota']
+
+# Filtra apenas linhas que parecem ser NCMs (remove títulos de seção)
+NCM_REGEX = re.compile(r'^\d{2,4}(\.\d{2}(\.\d{2})?(\.\d{2})?)?$')
+
+# Valores que o pandas interpreta como nulos ao ler o Excel (mantidos na leitura em streaming)
+VALORES_NULOS = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+                 '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'}
+
+def encontrar_link_tipi_xlsx(page_url=TIPI_PAGE_URL, headers=HEADERS):
+    """
+    Acessa a página da Receita Federal e retorna a URL absoluta do
+    arquivo XLSX da TIPI, ou None se o link não for encontrado.
+    """
+    print(f"Acessando a página: {page_url}")
+    response = requests.get(page_url, headers=headers, timeout=20)
+    response.raise_for_status()
+
+    soup = BeautifulSoup(response.text, "html.parser")
+
+    print("Procurando por um link de download do arquivo XLSX da TIPI...")
+    
+    link_tag = soup.find('a', href=re.compile(r"tipi.*\.xlsx", re.IGNORECASE))
+    
+    if not link_tag:
+        print("Tentativa 1 falhou. Tentativa 2: Procurando por qualquer link que termine com '.xlsx'...")
+        link_tag = soup.find('a', href=re.compile(r"\.xlsx$", re.IGNORECASE))
+
+    if not link_tag:
+        print("Erro: Não foi possível encontrar o link para o arquivo XLSX.")
+        return None
+
+    file_href = link_tag.get('href')
+    absolute_file_url = urljoin(page_url, file_href)
+    
+    print(f"Link encontrado: {absolute_file_url}")
+    return absolute_file_url
+
+def baixar_tipi_xlsx(output_filename="tipi_download.xlsx", page_url=TIPI_PAGE_URL):
     """
     Realiza o web scraping da página da Receita Federal para baixar
     o arquivo XLSX da TIPI, procurando pelo link do arquivo.
     """
     
-    page_url = "https://www.gov.br/receitafederal/pt-br/acesso-a-informacao/legislacao/tipi-tabela-de-incidencia-do-imposto-sobre-produtos-industrializados"
-    
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
+    headers = HEADERS
 
     try:
-        print(f"Acessando a página: {page_url}")
-        response = requests.get(page_url, headers=headers, timeout=20)
-        response.raise_for_status()
-
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        print("Procurando por um link de download do arquivo XLSX da TIPI...")
-        
-        link_tag = soup.find('a', href=re.compile(r"tipi.*\.xlsx", re.IGNORECASE))
-        
-        if not link_tag:
-            print("Tentativa 1 falhou. Tentativa 2: Procurando por qualquer link que termine com '.xlsx'...")
-            link_tag = soup.find('a', href=re.compile(r"\.xlsx$", re.IGNORECASE))
-
-        if not link_tag:
-            print("Erro: Não foi possível encontrar o link para o arquivo XLSX.")
+        absolute_file_url = encontrar_link_tipi_xlsx(page_url, headers)
+        if not absolute_file_url:
             return None
 
-        file_href = link_tag.get('href')
-        absolute_file_url = urljoin(page_url, file_href)
-        
-        print(f"Link encontrado: {absolute_file_url}")
-
         print(f"Baixando o arquivo como '{output_filename}'...")
         file_response = requests.get(absolute_file_url, headers=headers, timeout=60)
         file_response.raise_for_status()
@@ -62,106 +84,250 @@ def baixar_tipi_xlsx(output_filename="tipi_download.xlsx"):
         print(f"Ocorreu um erro inesperado durante o download: {e}")
         return None
 
-def processar_tipi_para_sqlite(excel_file, db_file="tipi.db", table_name='tipi'):
+def ler_tipi_xlsx(excel_file):
     """
-    Lê o arquivo XLSX da TIPI, limpa os dados e salva em SQLite.
+    Lê o arquivo XLSX da TIPI e retorna um DataFrame limpo com as colunas
+    de TIPI_COLUNAS, ou None se o arquivo não tiver o formato esperado.
     (Versão com tratamento de erro de nome de coluna)
     """
-    print(f"\nIniciando o processamento do arquivo: {excel_file}")
+    # --- 1. Encontrar a linha do cabeçalho ---
+    df_header_find = pd.read_excel(excel_file, nrows=20, header=None)
+    header_row = -1
+    for i, row in df_header_find.iterrows():
+        if any(str(cell).strip() == 'NCM' for cell in row):
+            header_row = i
+            break
+    if header_row == -1:
+        print("Erro: Não foi possível encontrar a linha de cabeçalho 'NCM'.")
+        return None
+    print(f"Cabeçalho 'NCM' encontrado na linha {header_row}.")
+
+    # --- 2. Ler os dados reais ---
+    # Lê o excel a partir da linha de cabeçalho correta
+    df = pd.read_excel(excel_file, header=header_row)
+    
+    print(f"Colunas originais encontradas: {list(df.columns)}")
+
+    # --- 3. Limpar e Renomear Colunas (MÉTODO CORRIGIDO) ---
+    # Limpa espaços em branco dos nomes das colunas
+    df.columns = df.columns.str.strip()
+    
+    # Mapeamento robusto (procura por nomes que *contenham* o texto)
+    rename_map = {}
+    for col in df.columns:
+        col_upper = str(col).upper()
+        if 'NCM' in col_upper:
+            rename_map[col] = 'ncm'
+        elif 'DESCRIÇÃO' in col_upper: # 'DESCRIÇÃO' ou 'DESCRIÇAO'
+            rename_map[col] = 'descricao'
+        elif 'EX' == col_upper: # 'EX' é curto, melhor ser exato
+            rename_map[col] = 'ex'
+        elif 'ALÍQUOTA' in col_upper: # 'ALÍQUOTA (%)'
+            rename_map[col] = 'aliquota'
+    
+    df = df.rename(columns=rename_map)
+
+    # --- 4. Verificação pós-renomeação ---
+    required_cols = ['ncm', 'descricao', 'aliquota']
+    if not all(col in df.columns for col in required_cols):
+        print(f"Erro: Falha ao renomear colunas. Colunas necessárias não encontradas.")
+        print(f"Colunas encontradas após tentativa de renomear: {list(df.columns)}")
+        print(f"Colunas necessárias: {required_cols}")
+        return None
+
+    # --- 5. Limpar os Dados ---
+    # Agora podemos aplicar os tipos e limpar os dados
+    df['ncm'] = df['ncm'].astype(str).str.strip()
+    df['descricao'] = df['descricao'].astype(str)
+    df['aliquota'] = df['aliquota'].fillna('').astype(str).str.strip()
+    
+    if 'ex' in df.columns:
+        df['ex'] = df['ex'].fillna('').astype(str).str.strip()
+    else:
+        df['ex'] = '' # Cria a coluna 'ex' vazia se ela não existir
+
+    # Remove linhas onde ncm ou descricao são nulos
+    df = df.dropna(subset=['ncm', 'descricao'])
+
+    # Filtra apenas linhas que parecem ser NCMs (remove títulos de seção)
+    df = df[df['ncm'].str.match(NCM_REGEX)]
 
+    print(f"Dados processados. Total de {len(df)} registros NCM válidos encontrados.")
+
+    df['ncm_ex'] = df['ncm'] + '|' + df['ex']
+    
+    # Reordenar colunas para garantir 'ncm_ex' primeiro
+    return df[TIPI_COLUNAS]
+
+def _mapear_colunas(cabecalho):
+    """
+    Mapeia os nomes do cabeçalho para as colunas da TIPI, com as mesmas regras
+    de `ler_tipi_xlsx`. Retorna {nome_da_coluna: índice_na_linha}.
+    """
+    mapa = {}
+    for i, celula in enumerate(cabecalho):
+        col_upper = str(celula).strip().upper() if celula is not None else ''
+        if 'NCM' in col_upper:
+            nome = 'ncm'
+        elif 'DESCRIÇÃO' in col_upper: # 'DESCRIÇÃO' ou 'DESCRIÇAO'
+            nome = 'descricao'
+        elif 'EX' == col_upper: # 'EX' é curto, melhor ser exato
+            nome = 'ex'
+        elif 'ALÍQUOTA' in col_upper: # 'ALÍQUOTA (%)'
+            nome = 'aliquota'
+        else:
+            continue
+        mapa.setdefault(nome, i)
+    return mapa
+
+def _normalizar_celula(valor):
+    """Converte o valor da célula como o pandas faz: nulos viram None e floats inteiros viram int."""
+    if valor is None or (isinstance(valor, str) and valor in VALORES_NULOS):
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    return valor
+
+def ler_tipi_xlsx_streaming(excel_file):
+    """
+    Lê o arquivo XLSX da TIPI em modo somente leitura, linha a linha, sem montar
+    DataFrames. Detecta o cabeçalho durante a leitura e gera tuplas
+    (ncm_ex, ncm, ex, descricao, aliquota) já limpas e filtradas.
+    O consumo de memória não cresce com o tamanho da planilha.
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(excel_file, read_only=True, data_only=True)
     try:
-        # --- 1. Encontrar a linha do cabeçalho ---
-        df_header_find = pd.read_excel(excel_file, nrows=20, header=None)
-        header_row = -1
-        for i, row in df_header_find.iterrows():
+        linhas = wb.worksheets[0].iter_rows(values_only=True)
+
+        # --- 1. Encontrar a linha do cabeçalho (nas primeiras 20 linhas) ---
+        colunas = None
+        for i, row in enumerate(islice(linhas, 20)):
             if any(str(cell).strip() == 'NCM' for cell in row):
-                header_row = i
+                colunas = _mapear_colunas(row)
+                print(f"Cabeçalho 'NCM' encontrado na linha {i}.")
                 break
-        if header_row == -1:
-            print("Erro: Não foi possível encontrar a linha de cabeçalho 'NCM'.")
-            return
-        print(f"Cabeçalho 'NCM' encontrado na linha {header_row}.")
-
-        # --- 2. Ler os dados reais ---
-        # Lê o excel a partir da linha de cabeçalho correta
-        df = pd.read_excel(excel_file, header=header_row)
-        
-        print(f"Colunas originais encontradas: {list(df.columns)}")
-
-        # --- 3. Limpar e Renomear Colunas (MÉTODO CORRIGIDO) ---
-        # Limpa espaços em branco dos nomes das colunas
-        df.columns = df.columns.str.strip()
-        
-        # Mapeamento robusto (procura por nomes que *contenham* o texto)
-        rename_map = {}
-        for col in df.columns:
-            col_upper = str(col).upper()
-            if 'NCM' in col_upper:
-                rename_map[col] = 'ncm'
-            elif 'DESCRIÇÃO' in col_upper: # 'DESCRIÇÃO' ou 'DESCRIÇAO'
-                rename_map[col] = 'descricao'
-            elif 'EX' == col_upper: # 'EX' é curto, melhor ser exato
-                rename_map[col] = 'ex'
-            elif 'ALÍQUOTA' in col_upper: # 'ALÍQUOTA (%)'
-                rename_map[col] = 'aliquota'
-        
-        df = df.rename(columns=rename_map)
-
-        # --- 4. Verificação pós-renomeação ---
+        if colunas is None:
+            raise ValueError("Não foi possível encontrar a linha de cabeçalho 'NCM'.")
+
         required_cols = ['ncm', 'descricao', 'aliquota']
-        if not all(col in df.columns for col in required_cols):
-            print(f"Erro: Falha ao renomear colunas. Colunas necessárias não encontradas.")
-            print(f"Colunas encontradas após tentativa de renomear: {list(df.columns)}")
-            print(f"Colunas necessárias: {required_cols}")
-            return
-
-        # --- 5. Limpar os Dados ---
-        # Agora podemos aplicar os tipos e limpar os dados
-        df['ncm'] = df['ncm'].astype(str).str.strip()
-        df['descricao'] = df['descricao'].astype(str)
-        df['aliquota'] = df['aliquota'].fillna('').astype(str).str.strip()
-        
-        if 'ex' in df.columns:
-            df['ex'] = df['ex'].fillna('').astype(str).str.strip()
-        else:
-            df['ex'] = '' # Cria a coluna 'ex' vazia se ela não existir
+        if not all(col in colunas for col in required_cols):
+            raise ValueError(f"Colunas necessárias não encontradas: {required_cols}")
+
+        i_ncm, i_desc, i_aliq = colunas['ncm'], colunas['descricao'], colunas['aliquota']
+        i_ex = colunas.get('ex')
 
-        # Remove linhas onde ncm ou descricao são nulos
-        df = df.dropna(subset=['ncm', 'descricao'])
+        # --- 2. Limpar e filtrar cada linha conforme é lida ---
+        for row in linhas:
+            if len(row) <= i_ncm:
+                continue
+            ncm = _normalizar_celula(row[i_ncm])
+            ncm = 'nan' if ncm is None else str(ncm).strip()
+            if not NCM_REGEX.match(ncm):
+                continue
+            descricao = _normalizar_celula(row[i_desc]) if i_desc < len(row) else None
+            aliquota = _normalizar_celula(row[i_aliq]) if i_aliq < len(row) else None
+            ex = _normalizar_celula(row[i_ex]) if i_ex is not None and i_ex < len(row) else None
 
-        # Filtra apenas linhas que parecem ser NCMs (remove títulos de seção)
-        df = df[df['ncm'].str.match(r'^\d{2,4}(\.\d{2}(\.\d{2})?(\.\d{2})?)?$')]
+            descricao = 'nan' if descricao is None else str(descricao)
+            aliquota = '' if aliquota is None else str(aliquota).strip()
+            ex = '' if ex is None else str(ex).strip()
+            yield (f"{ncm}|{ex}", ncm, ex, descricao, aliquota)
+    finally:
+        wb.close()
 
-        print(f"Dados processados. Total de {len(df)} registros NCM válidos encontrados.")
+def gravar_tipi_sqlite(linhas, db_file="tipi.db", table_name='tipi', tamanho_lote=5000):
+    """
+    Aplica as linhas (ncm_ex, ncm, ex, descricao, aliquota) na tabela da TIPI
+    de forma incremental: só as linhas inseridas, alteradas ou removidas são
+    escritas, tudo em uma única transação. A tabela nunca deixa de existir
+    para quem estiver lendo o banco durante a atualização.
+    Retorna um dicionário com a contagem de inseridos, atualizados e removidos.
+    """
+    conn = sqlite3.connect(db_file)
+    conn.isolation_level = None  # Controle manual da transação
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS "{table_name}" (
+                "ncm_ex" TEXT PRIMARY KEY,
+                "ncm" TEXT,
+                "ex" TEXT,
+                "descricao" TEXT,
+                "aliquota" TEXT
+            )""")
+        conn.execute("DROP TABLE IF EXISTS temp.tipi_nova")
+        conn.execute("CREATE TEMP TABLE tipi_nova (ncm_ex TEXT PRIMARY KEY, ncm TEXT, ex TEXT, descricao TEXT, aliquota TEXT)")
+        linhas = iter(linhas)
+        while True:
+            lote = list(islice(linhas, tamanho_lote))
+            if not lote:
+                break
+            conn.executemany("INSERT OR REPLACE INTO temp.tipi_nova VALUES (?, ?, ?, ?, ?)", lote)
+
+        removidos = conn.execute(f"""
+            DELETE FROM "{table_name}"
+            WHERE ncm_ex NOT IN (SELECT ncm_ex FROM temp.tipi_nova)""").rowcount
+        atualizados = conn.execute(f"""
+            UPDATE "{table_name}" SET (ncm, ex, descricao, aliquota) = (
+                SELECT n.ncm, n.ex, n.descricao, n.aliquota FROM temp.tipi_nova n
+                WHERE n.ncm_ex = "{table_name}".ncm_ex)
+            WHERE EXISTS (
+                SELECT 1 FROM temp.tipi_nova n
+                WHERE n.ncm_ex = "{table_name}".ncm_ex
+                  AND (n.ncm IS NOT "{table_name}".ncm OR n.ex IS NOT "{table_name}".ex
+                       OR n.descricao IS NOT "{table_name}".descricao
+                       OR n.aliquota IS NOT "{table_name}".aliquota))""").rowcount
+        inseridos = conn.execute(f"""
+            INSERT INTO "{table_name}" (ncm_ex, ncm, ex, descricao, aliquota)
+            SELECT n.ncm_ex, n.ncm, n.ex, n.descricao, n.aliquota FROM temp.tipi_nova n
+            WHERE NOT EXISTS (SELECT 1 FROM "{table_name}" t WHERE t.ncm_ex = n.ncm_ex)""").rowcount
+
+        conn.execute("DROP TABLE temp.tipi_nova")
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return {'inseridos': inseridos, 'atualizados': atualizados, 'removidos': removidos}
+
+def processar_tipi_para_sqlite(excel_file, db_file="tipi.db", table_name='tipi', streaming=True):
+    """
+    Lê o arquivo XLSX da TIPI, limpa os dados e salva em SQLite.
+    Por padrão usa a leitura em streaming (`ler_tipi_xlsx_streaming`);
+    com streaming=False usa a leitura via pandas (`ler_tipi_xlsx`).
+    Retorna o resumo das alterações aplicadas, ou None em caso de falha.
+    """
+    print(f"\nIniciando o processamento do arquivo: {excel_file}")
+
+    try:
+        if streaming:
+            linhas = ler_tipi_xlsx_streaming(excel_file)
+        else:
+            final_df = ler_tipi_xlsx(excel_file)
+            if final_df is None:
+                return None
+            linhas = final_df.itertuples(index=False, name=None)
 
         # --- 6. Salvar em Banco de Dados SQLite ---
         print(f"Salvando em banco de dados SQLite '{db_file}'...")
-        conn = sqlite3.connect(db_file)
-        
-        df['ncm_ex'] = df['ncm'] + '|' + df['ex']
-        
-        # Reordenar colunas para garantir 'ncm_ex' primeiro
-        cols_to_save = ['ncm_ex', 'ncm', 'ex', 'descricao', 'aliquota']
-        final_df = df[[col for col in cols_to_save if col in df.columns]]
-
-        final_df.to_sql(table_name, conn, if_exists='replace', index=False, dtype={
-            'ncm_ex': 'TEXT PRIMARY KEY',
-            'ncm': 'TEXT',
-            'ex': 'TEXT',
-            'descricao': 'TEXT',
-            'aliquota': 'TEXT'
-        })
-        conn.close()
-        print(f"Banco de dados SQLite salvo com sucesso na tabela '{table_name}'.")
+        resumo = gravar_tipi_sqlite(linhas, db_file, table_name)
+        print(f"Banco de dados SQLite salvo com sucesso na tabela '{table_name}'. "
+              f"Inseridos: {resumo['inseridos']}, atualizados: {resumo['atualizados']}, removidos: {resumo['removidos']}.")
+        return resumo
 
     except FileNotFoundError:
         print(f"Erro: Arquivo '{excel_file}' não encontrado.")
     except KeyError as e:
         print(f"Erro de Chave (KeyError): {e}. Isso indica que uma coluna esperada não foi encontrada.")
-        if 'df' in locals():
-            print(f"Colunas disponíveis no DataFrame: {list(df.columns)}")
+    except ValueError as e:
+        print(f"Erro: {e}")
     except Exception as e:
         print(f"Ocorreu um erro inesperado durante o processamento: {e}")
+    return None
 
 # --- Execução Principal ---
 if __name__ == "__main__":
@@ -171,4 +337,4 @@ if __name__ == "__main__":
     if arquivo_excel_baixado and os.path.exists(arquivo_excel_baixado):
         processar_tipi_para_sqlite(arquivo_excel_baixado, db_file="tipi.db")
     else:
-        print("Processamento falhou, pois o download não foi concluído.")
\ No newline at end of file
+        print("Processamento falhou, pois o download não foi concluído.")
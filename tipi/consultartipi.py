@@ -1,56 +1,142 @@
+import os
 import sqlite3
+import threading
+
+# Índice da TIPI em memória, compartilhado por todo o processo.
+# Chave: caminho absoluto do banco -> (assinatura do arquivo, índice)
+_indices_tipi = {}
+_lock_indices = threading.Lock()
+
+
+def _assinatura_arquivo(db_file):
+    """
+    Retorna a assinatura (mtime, tamanho) do banco e do seu arquivo WAL, se houver.
+    Qualquer escrita feita por `processar_tipi_para_sqlite` altera essa assinatura.
+    """
+    st = os.stat(db_file)
+    assinatura = (st.st_mtime_ns, st.st_size)
+    wal_file = db_file + '-wal'
+    if os.path.exists(wal_file):
+        st_wal = os.stat(wal_file)
+        assinatura += (st_wal.st_mtime_ns, st_wal.st_size)
+    return assinatura
+
+
+def _carregar_indice(db_file):
+    """
+    Lê a tabela 'tipi' inteira de uma só vez e monta o índice em memória.
+    O índice é um dicionário 'NCM|EX' -> (ncm, descricao, aliquota, ex),
+    a mesma chave usada pela coluna 'ncm_ex' do banco.
+    """
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+    try:
+        cursor = conn.execute("SELECT ncm_ex, ncm, descricao, aliquota, ex FROM tipi")
+        return {linha[0]: linha[1:] for linha in cursor}
+    finally:
+        conn.close()
+
+
+def obter_indice_tipi(db_file='tipi.db'):
+    """
+    Retorna o índice da TIPI para o banco informado, carregando-o na primeira
+    chamada e recarregando-o automaticamente quando o arquivo do banco muda.
+    """
+    caminho = os.path.abspath(db_file)
+    assinatura = _assinatura_arquivo(caminho)
+    entrada = _indices_tipi.get(caminho)
+    if entrada is not None and entrada[0] == assinatura:
+        return entrada[1]
+
+    with _lock_indices:
+        entrada = _indices_tipi.get(caminho)
+        if entrada is not None and entrada[0] == assinatura:
+            return entrada[1]
+        indice = _carregar_indice(caminho)
+        _indices_tipi[caminho] = (assinatura, indice)
+        return indice
+
+
+def limpar_cache_tipi():
+    """Descarta todos os índices carregados, forçando a releitura do banco."""
+    with _lock_indices:
+        _indices_tipi.clear()
+
+
+def _formatar_ncm(ncm_codigo):
+    """Normaliza um NCM de 8 dígitos para o formato XXXX.XX.XX."""
+    ncm_digits = ''.join(filter(str.isdigit, str(ncm_codigo)))
+    if len(ncm_digits) == 8:
+        return f"{ncm_digits[:4]}.{ncm_digits[4:6]}.{ncm_digits[6:]}"
+    return ncm_codigo
+
+
+def _resolver_ncm(indice, ncm_formatado):
+    """
+    Busca o NCM no índice e, se não encontrar, sobe para o NCM "pai"
+    (removendo o último nível após o ponto) até achar o prefixo mais longo.
+    """
+    while True:
+        # A chave de busca é 'NCM|EX'. Para um NCM principal, o EX é ''.
+        resultado = indice.get(f"{ncm_formatado}|")
+        if resultado:
+            return resultado
+        if '.' not in ncm_formatado:
+            return None
+        ncm_formatado = ncm_formatado.rsplit('.', 1)[0]
+
+
+def _montar_resultado(ncm_consultado, resultado):
+    """Monta o dicionário de retorno da consulta a partir da linha do índice."""
+    if not resultado:
+        return None
+    return {
+        "ncm_consultado": ncm_consultado,
+        "ncm_encontrado": resultado[0],
+        "descricao": resultado[1],
+        "aliquota": resultado[2],
+        "ex": resultado[3]
+    }
+
 
 def consultar_ncm(ncm_codigo, db_file='tipi.db', original_ncm=None):
     """
-    Consulta a alíquota de um NCM no banco de dados SQLite.
+    Consulta a alíquota de um NCM na Tabela TIPI.
     Normaliza o NCM para o formato XXXX.XX.XX e, se não encontrar,
     busca o NCM "pai" recursivamente.
+    A consulta é feita no índice em memória, carregado uma única vez por processo.
     """
-    # Normaliza o código NCM para garantir que esteja no formato com pontos
-    ncm_digits = ''.join(filter(str.isdigit, str(ncm_codigo)))
-    
-    # A lógica de busca recursiva depende do formato com pontos.
-    # Formatamos o NCM de 8 dígitos. Códigos menores (pais) já estarão 
-    # no formato correto nas chamadas recursivas subsequentes.
-    if len(ncm_digits) == 8:
-        ncm_formatado = f"{ncm_digits[:4]}.{ncm_digits[4:6]}.{ncm_digits[6:]}"
-    else:
-        ncm_formatado = ncm_codigo
+    ncm_formatado = _formatar_ncm(ncm_codigo)
 
     if original_ncm is None:
         original_ncm = ncm_formatado # Armazena o NCM formatado para referência
 
-    conn = None
     try:
-        conn = sqlite3.connect(db_file)
-        cursor = conn.cursor()
+        indice = obter_indice_tipi(db_file)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Erro ao consultar o SQLite: {e}")
+        return None
 
-        # A chave de busca é 'NCM|EX'. Para um NCM principal, o EX é ''.
-        ncm_ex_key = f"{ncm_formatado}|"
-        
-        query = "SELECT ncm, descricao, aliquota, ex FROM tipi WHERE ncm_ex = ?"
-        cursor.execute(query, (ncm_ex_key,))
-        resultado = cursor.fetchone()
+    return _montar_resultado(original_ncm, _resolver_ncm(indice, ncm_formatado))
 
-        if resultado:
-            return {
-                "ncm_consultado": original_ncm,
-                "ncm_encontrado": resultado[0],
-                "descricao": resultado[1],
-                "aliquota": resultado[2],
-                "ex": resultado[3]
-            }
-        else:
-            # Se não encontrou, tenta buscar o NCM "pai"
-            if '.' in ncm_formatado:
-                ncm_pai = ncm_formatado.rsplit('.', 1)[0]
-                return consultar_ncm(ncm_pai, db_file, original_ncm)
-            else:
-                return None
-
-    except sqlite3.Error as e:
+
+def consultar_ncms(codigos, db_file='tipi.db'):
+    """
+    Consulta vários NCMs de uma só vez (por exemplo, todos os itens de uma nota).
+    Remove duplicatas, resolve cada código distinto uma única vez no índice
+    e retorna um dicionário {codigo_informado: resultado de consultar_ncm}.
+    """
+    codigos_unicos = list(dict.fromkeys(c for c in codigos if c))
+    if not codigos_unicos:
+        return {}
+
+    try:
+        indice = obter_indice_tipi(db_file)
+    except (sqlite3.Error, OSError) as e:
         print(f"Erro ao consultar o SQLite: {e}")
-        return None
-    finally:
-        if conn:
-            conn.close()
\ No newline at end of file
+        return {codigo: None for codigo in codigos_unicos}
+
+    resultados = {}
+    for codigo in codigos_unicos:
+        ncm_formatado = _formatar_ncm(codigo)
+        resultados[codigo] = _montar_resultado(ncm_formatado, _resolver_ncm(indice, ncm_formatado))
+    return resultados
@@ -0,0 +1,149 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+
+from tipi.atualizartipi import (
+    HEADERS,
+    TIPI_PAGE_URL,
+    encontrar_link_tipi_xlsx,
+    processar_tipi_para_sqlite,
+)
+
+def carregar_estado(estado_file):
+    """Lê o estado da última sincronização (URL, ETag, Last-Modified e hash do XLSX)."""
+    if not os.path.exists(estado_file):
+        return {}
+    try:
+        with open(estado_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError):
+        return {}
+
+def salvar_estado(estado_file, estado):
+    """Grava o estado da sincronização de forma atômica."""
+    temp_file = estado_file + '.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(estado, f, indent=4, ensure_ascii=False)
+    os.replace(temp_file, estado_file)
+
+def baixar_tipi_condicional(output_filename, estado, page_url=TIPI_PAGE_URL):
+    """
+    Baixa o XLSX da TIPI usando requisição condicional (If-None-Match /
+    If-Modified-Since) com base no estado da última sincronização.
+    Retorna um dicionário com 'status' ('nao_modificado' ou 'baixado'),
+    'url', 'etag', 'last_modified' e 'sha256', ou None em caso de falha.
+    """
+    try:
+        url = encontrar_link_tipi_xlsx(page_url, HEADERS)
+        if not url:
+            return None
+
+        headers = dict(HEADERS)
+        if estado.get('url') == url:
+            if estado.get('etag'):
+                headers['If-None-Match'] = estado['etag']
+            if estado.get('last_modified'):
+                headers['If-Modified-Since'] = estado['last_modified']
+
+        file_response = requests.get(url, headers=headers, timeout=60)
+        if file_response.status_code == 304:
+            print("A Tabela TIPI não foi modificada desde a última sincronização.")
+            return {'status': 'nao_modificado', 'url': url,
+                    'etag': estado.get('etag'), 'last_modified': estado.get('last_modified'),
+                    'sha256': estado.get('sha256')}
+        file_response.raise_for_status()
+
+        # Grava em arquivo temporário; o XLSX anterior só é substituído após o processamento
+        with open(output_filename, 'wb') as f:
+            f.write(file_response.content)
+
+        return {'status': 'baixado', 'url': url,
+                'etag': file_response.headers.get('ETag'),
+                'last_modified': file_response.headers.get('Last-Modified'),
+                'sha256': hashlib.sha256(file_response.content).hexdigest()}
+
+    except requests.exceptions.Timeout:
+        print("Erro: A requisição demorou muito para responder (timeout).")
+        return None
+    except requests.exceptions.RequestException as e:
+        print(f"Ocorreu um erro de rede ou HTTP durante o download: {e}")
+        return None
+    except Exception as e:
+        print(f"Ocorreu um erro inesperado durante o download: {e}")
+        return None
+
+def sincronizar_tipi(xlsx_file="tipi/tipi_download.xlsx", db_file="tipi/tipi.db",
+                     estado_file="tipi/tipi_estado.json", page_url=TIPI_PAGE_URL):
+    """
+    Sincroniza a Tabela TIPI local com a publicada pela Receita Federal.
+    O arquivo só é processado se o servidor indicar mudança e o hash do
+    conteúdo for diferente do último processado; nesse caso apenas as linhas
+    alteradas são aplicadas no banco.
+    Retorna um dicionário com o 'status' da sincronização e o resumo das alterações.
+    """
+    estado = carregar_estado(estado_file)
+    temp_file = os.path.splitext(xlsx_file)[0] + '.novo.xlsx'
+
+    download = baixar_tipi_condicional(temp_file, estado, page_url)
+    if download is None:
+        return {'status': 'falha'}
+
+    try:
+        if download['status'] == 'nao_modificado':
+            return {'status': 'nao_modificado'}
+
+        if download['sha256'] == estado.get('sha256') and os.path.exists(db_file):
+            print("O conteúdo da Tabela TIPI é idêntico ao da última sincronização.")
+            estado.update({k: download[k] for k in ('url', 'etag', 'last_modified')})
+            salvar_estado(estado_file, estado)
+            return {'status': 'sem_alteracoes'}
+
+        resumo = processar_tipi_para_sqlite(temp_file, db_file=db_file)
+        if resumo is None:
+            return {'status': 'falha'}
+
+        os.replace(temp_file, xlsx_file)
+        estado.update({k: download[k] for k in ('url', 'etag', 'last_modified', 'sha256')})
+        estado['sincronizado_em'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        salvar_estado(estado_file, estado)
+        return {'status': 'atualizado', **resumo}
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+def iniciar_sincronizacao_em_segundo_plano(intervalo_segundos=None, **kwargs):
+    """
+    Executa `sincronizar_tipi` em uma thread daemon, sem bloquear quem chamou.
+    Se `intervalo_segundos` for informado, repete a sincronização periodicamente.
+    """
+    def _executar():
+        while True:
+            try:
+                resultado = sincronizar_tipi(**kwargs)
+                print(f"Sincronização da Tabela TIPI: {resultado}")
+            except Exception as e:
+                print(f"Ocorreu um erro inesperado na sincronização da TIPI: {e}")
+            if not intervalo_segundos:
+                break
+            time.sleep(intervalo_segundos)
+
+    thread = threading.Thread(target=_executar, name="sincronizacao-tipi", daemon=True)
+    thread.start()
+    return thread
+
+# --- Execução Principal (ex.: agendada via cron) ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sincroniza a Tabela TIPI local com a publicada pela Receita Federal.")
+    parser.add_argument('--xlsx', default="tipi/tipi_download.xlsx", help="Arquivo XLSX local da TIPI.")
+    parser.add_argument('--db', default="tipi/tipi.db", help="Banco SQLite da TIPI.")
+    parser.add_argument('--estado', default="tipi/tipi_estado.json", help="Arquivo de estado da sincronização.")
+    parser.add_argument('--url', default=TIPI_PAGE_URL, help="Página que contém o link do XLSX da TIPI.")
+    args = parser.parse_args()
+
+    resultado = sincronizar_tipi(args.xlsx, args.db, args.estado, args.url)
+    print(f"Resultado da sincronização: {resultado}")
@@ -0,0 +1,174 @@
+# Arquivo: validacao_documentos.py (Validação de CNPJ e CPF)
+#
+# Duas formas de validar os dígitos verificadores, com o mesmo resultado:
+#   - validar_cnpj / validar_cpf: um documento por vez, usadas na auditoria de
+#     cada nota. Os mesmos fornecedores e clientes se repetem em milhares de
+#     documentos, então o resultado fica em um cache LRU por processo
+#     (a função original, sem cache, fica em validar_cnpj.__wrapped__);
+#   - validar_cnpjs / validar_cpfs / validar_cnpjs_cpfs: validação em lote de
+#     uma lista, array NumPy ou Series do pandas, com os dígitos verificadores
+#     calculados de uma vez para todas as linhas (NumPy), para a ingestão em
+#     lote e a reauditoria do acervo. O NumPy só é importado nessas funções.
+# A equivalência entre as formas é conferida por
+# tests/test_validacao_documentos.py. Variável de ambiente:
+#   - AGENTE_FISCAL_CACHE_VALIDACAO: documentos guardados no cache LRU de cada função (padrão: 8192)
+
+import functools
+import os
+
+CACHE_VALIDACAO = int(os.getenv('AGENTE_FISCAL_CACHE_VALIDACAO', '8192'))
+
+PESOS_CNPJ_DV1 = (5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
+PESOS_CNPJ_DV2 = (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
+PESOS_CPF_DV1 = (10, 9, 8, 7, 6, 5, 4, 3, 2)
+PESOS_CPF_DV2 = (11, 10, 9, 8, 7, 6, 5, 4, 3, 2)
+
+
+@functools.lru_cache(maxsize=CACHE_VALIDACAO)
+def validar_cnpj(cnpj: str) -> bool:
+    cnpj = ''.join(filter(str.isdigit, cnpj))
+    if len(cnpj) != 14 or len(set(cnpj)) == 1:
+        return False
+    try:
+        pesos = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+        soma = sum(int(d) * p for d, p in zip(cnpj[:12], pesos))
+        resto = soma % 11
+        dv1 = 0 if resto < 2 else 11 - resto
+        if dv1 != int(cnpj[12]): return False
+        pesos = [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+        soma = sum(int(d) * p for d, p in zip(cnpj[:13], pesos))
+        resto = soma % 11
+        dv2 = 0 if resto < 2 else 11 - resto
+        if dv2 != int(cnpj[13]): return False
+        return True
+    except (ValueError, IndexError): return False
+
+
+@functools.lru_cache(maxsize=CACHE_VALIDACAO)
+def validar_cpf(cpf: str) -> bool:
+    cpf = ''.join(filter(str.isdigit, cpf))
+    if len(cpf) != 11 or len(set(cpf)) == 1: return False
+    try:
+        soma = sum(int(cpf[i]) * (10 - i) for i in range(9))
+        resto = (soma * 10) % 11
+        if resto == 10: resto = 0
+        if resto != int(cpf[9]): return False
+        soma = sum(int(cpf[i]) * (11 - i) for i in range(10))
+        resto = (soma * 10) % 11
+        if resto == 10: resto = 0
+        if resto != int(cpf[10]): return False
+        return True
+    except (ValueError, IndexError): return False
+
+
+# --- Validação em lote (NumPy) ---
+# Os textos viram uma matriz de code points (uma linha por documento): os
+# dígitos de cada linha são localizados, contados e extraídos sem laço em Python.
+
+# Textos mais longos que isso (raros) são validados um a um, para a matriz não crescer
+TAMANHO_MAXIMO_LOTE = 64
+
+
+def _preparar(valores):
+    """
+    Converte as entradas em (lista de textos, matriz de code points, máscara das
+    linhas a validar uma a uma). Valores que não são texto viram texto vazio
+    (inválidos); textos com caracteres não ASCII ou longos demais são validados
+    um a um, pela função original (dígitos Unicode são tratados como nela).
+    """
+    import numpy as np
+
+    textos = [valor if isinstance(valor, str) else '' for valor in valores]
+    um_a_um = np.fromiter((len(texto) > TAMANHO_MAXIMO_LOTE or not texto.isascii() for texto in textos),
+                          dtype=bool, count=len(textos))
+    no_lote = [texto if not separado else '' for texto, separado in zip(textos, um_a_um)]
+    matriz = np.array(no_lote or [''], dtype=str)
+    largura = max(1, matriz.dtype.itemsize // 4)
+    codigos = matriz.view(np.uint32).reshape(len(matriz), largura)[:len(textos)]
+    return textos, codigos, um_a_um
+
+
+def _digitos(codigos, tamanho):
+    """Matriz (linhas x tamanho) com os dígitos das linhas que têm exatamente 'tamanho' dígitos, e a máscara dessas linhas."""
+    import numpy as np
+
+    e_digito = (codigos >= ord('0')) & (codigos <= ord('9'))
+    mascara = e_digito.sum(axis=1) == tamanho
+    # Cada linha selecionada tem exatamente 'tamanho' dígitos: a seleção sai na ordem das linhas
+    matriz = (codigos[mascara][e_digito[mascara]] - ord('0')).astype(np.int64).reshape(-1, tamanho)
+    return matriz, mascara
+
+
+def _todos_iguais(matriz):
+    return (matriz == matriz[:, :1]).all(axis=1)
+
+
+def _dv_cnpj(matriz, pesos):
+    import numpy as np
+
+    resto = matriz[:, :len(pesos)] @ np.array(pesos) % 11
+    return np.where(resto < 2, 0, 11 - resto)
+
+
+def _dv_cpf(matriz, pesos):
+    import numpy as np
+
+    resto = (matriz[:, :len(pesos)] @ np.array(pesos)) * 10 % 11
+    return np.where(resto == 10, 0, resto)
+
+
+def _cnpjs_validos(matriz):
+    return ((_dv_cnpj(matriz, PESOS_CNPJ_DV1) == matriz[:, 12]) & (_dv_cnpj(matriz, PESOS_CNPJ_DV2) == matriz[:, 13])
+            & ~_todos_iguais(matriz))
+
+
+def _cpfs_validos(matriz):
+    return ((_dv_cpf(matriz, PESOS_CPF_DV1) == matriz[:, 9]) & (_dv_cpf(matriz, PESOS_CPF_DV2) == matriz[:, 10])
+            & ~_todos_iguais(matriz))
+
+
+def _validar_em_lote(valores, regras, validar_um):
+    """'regras': [(quantidade de dígitos, validação da matriz)]; 'validar_um': função original, para as linhas um a um."""
+    import numpy as np
+
+    textos, codigos, um_a_um = _preparar(valores)
+    validos = np.zeros(len(textos), dtype=bool)
+    for tamanho, validar_matriz in regras:
+        matriz, mascara = _digitos(codigos, tamanho)
+        validos[mascara] = validar_matriz(matriz)
+    for i in np.flatnonzero(um_a_um):
+        validos[i] = validar_um(textos[i])
+    # Series na entrada: Series na saída, com o mesmo índice
+    if type(valores).__name__ == 'Series':
+        import pandas as pd
+        return pd.Series(validos, index=valores.index, name=valores.name)
+    return validos
+
+
+def _cnpj_ou_cpf(documento):
+    """Como a auditoria escolhe a validação: CNPJ se houver mais de 11 dígitos, CPF caso contrário."""
+    if len(''.join(filter(str.isdigit, documento))) > 11:
+        return validar_cnpj.__wrapped__(documento)
+    return validar_cpf.__wrapped__(documento)
+
+
+def validar_cnpjs(valores):
+    """
+    Valida vários CNPJs de uma vez (lista, array NumPy ou Series). Retorna um
+    array de booleanos (ou Series com o mesmo índice), igual a aplicar
+    validar_cnpj em cada texto; valores que não são texto (None, NaN) são inválidos.
+    """
+    return _validar_em_lote(valores, [(14, _cnpjs_validos)], validar_cnpj.__wrapped__)
+
+
+def validar_cpfs(valores):
+    """Como validar_cnpjs, para CPFs (igual a aplicar validar_cpf em cada texto)."""
+    return _validar_em_lote(valores, [(11, _cpfs_validos)], validar_cpf.__wrapped__)
+
+
+def validar_cnpjs_cpfs(valores):
+    """
+    Valida documentos que podem ser CNPJ ou CPF, como a auditoria: CNPJ se
+    tiverem mais de 11 dígitos, CPF caso contrário.
+    """
+    return _validar_em_lote(valores, [(14, _cnpjs_validos), (11, _cpfs_validos)], _cnpj_ou_cpf)